@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for DAP message reading
+Compares the old byte-at-a-time reader (one executor hop per message)
+with the buffered asyncio framing reader in DAPProtocol
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from adapter.dap_protocol import DAPProtocol
+
+
+MESSAGE_COUNT = 20000
+
+
+def make_payload(count: int) -> bytes:
+    """Build a burst of DAP requests similar to a stop (stackTrace/scopes/variables)."""
+    commands = ["stackTrace", "scopes", "variables", "setBreakpoints"]
+    frames = []
+    for seq in range(1, count + 1):
+        body = json.dumps({
+            "seq": seq,
+            "type": "request",
+            "command": commands[seq % len(commands)],
+            "arguments": {"threadId": 1, "startFrame": 0, "levels": 20},
+        }).encode("utf-8")
+        frames.append(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    return b"".join(frames)
+
+
+def legacy_read_message(stream):
+    """Reader as it was before: headers byte by byte, body by exact read."""
+    headers_bytes = b''
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            return None
+        headers_bytes += byte
+        if headers_bytes.endswith(b'\r\n\r\n'):
+            break
+
+    headers = {}
+    for line in headers_bytes[:-4].decode('utf-8').split('\r\n'):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip()] = value.strip()
+
+    content_length = int(headers['Content-Length'])
+    body_bytes = b''
+    while len(body_bytes) < content_length:
+        chunk = stream.read(content_length - len(body_bytes))
+        if not chunk:
+            break
+        body_bytes += chunk
+    return json.loads(body_bytes.decode('utf-8'))
+
+
+def start_writer(payload: bytes) -> int:
+    """Feed payload into a fresh pipe from a background thread, return the read end."""
+    read_fd, write_fd = os.pipe()
+
+    def write_all():
+        with open(write_fd, "wb") as f:
+            f.write(payload)
+
+    threading.Thread(target=write_all, daemon=True).start()
+    return read_fd
+
+
+async def bench_legacy(payload: bytes) -> int:
+    read_fd = start_writer(payload)
+    loop = asyncio.get_running_loop()
+    count = 0
+    with open(read_fd, "rb") as stream:
+        while True:
+            message = await loop.run_in_executor(None, legacy_read_message, stream)
+            if message is None:
+                break
+            count += 1
+    return count
+
+
+async def bench_buffered(payload: bytes) -> int:
+    read_fd = start_writer(payload)
+    saved_stdin = sys.stdin
+    sys.stdin = open(read_fd, "r")
+    try:
+        protocol = DAPProtocol()
+        await protocol.open()
+        count = 0
+        while await protocol.read_message() is not None:
+            count += 1
+        return count
+    finally:
+        sys.stdin.close()
+        sys.stdin = saved_stdin
+
+
+def run(name: str, bench, payload: bytes):
+    start = time.perf_counter()
+    count = asyncio.run(bench(payload))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {count:>7} msgs  {elapsed * 1000:>9.1f} ms  "
+          f"{count / elapsed:>10.0f} msg/s  {len(payload) / elapsed / 1e6:>7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else MESSAGE_COUNT
+    payload = make_payload(count)
+    print(f"Payload: {count} frames, {len(payload)} bytes")
+    run("legacy", bench_legacy, payload)
+    run("buffered", bench_buffered, payload)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark for per-message debug adapter overhead at each log level
+Runs main.py with INK_DEBUG_LOG_LEVEL set, sends a burst of stop-time
+requests (threads/stackTrace/scopes/variables) over stdin and times the
+responses, from the first to the last
+
+Usage: python bench_logging.py [messages]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+
+MAIN = Path(__file__).parent / "main.py"
+LEVELS = ["debug", "info", "warning", "off"]
+COMMANDS = ["threads", "stackTrace", "scopes", "variables"]
+
+
+def make_payload(count: int) -> bytes:
+    frames = []
+    for seq in range(1, count + 2):
+        command = COMMANDS[seq % len(COMMANDS)] if seq <= count else "disconnect"
+        body = json.dumps({
+            "seq": seq,
+            "type": "request",
+            "command": command,
+            "arguments": {"threadId": 1, "variablesReference": 1, "frameId": 0},
+        }).encode("utf-8")
+        frames.append(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    return b"".join(frames)
+
+
+async def read_message(stdout: asyncio.StreamReader) -> dict:
+    """Next DAP frame, skipping anything else written to stdout."""
+    length = 0
+    while True:
+        line = await stdout.readline()
+        if not line:
+            raise EOFError("Debug adapter exited")
+        if line.startswith(b"Content-Length:"):
+            length = int(line.split(b":")[1])
+        elif line == b"\r\n" and length:
+            return json.loads(await stdout.readexactly(length))
+
+
+async def measure(level: str, payload: bytes, count: int) -> float:
+    """Seconds per request at one log level."""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(MAIN),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        env=dict(os.environ, INK_DEBUG_LOG_LEVEL=level),
+        limit=1024 * 1024
+    )
+    process.stdin.write(payload)
+
+    first = None
+    responses = 0
+    while responses <= count:
+        message = await read_message(process.stdout)
+        if message.get("type") == "response":
+            if first is None:
+                first = time.perf_counter()
+            responses += 1
+    elapsed = time.perf_counter() - first
+
+    process.stdin.close()
+    await process.wait()
+    return elapsed / (count - 1)
+
+
+async def run(count: int):
+    payload = make_payload(count)
+    print(f"{count} requests per run through main.py")
+    for level in LEVELS:
+        per_message = await measure(level, payload, count)
+        print(f"{level:<8} {per_message * 1e6:>8.1f} us/request")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    asyncio.run(run(count))
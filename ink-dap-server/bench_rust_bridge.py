@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark for RustBridge round-trips per stop
+Fetches the state a stop needs (state, stack, scopes, variables) one call
+at a time, as pipelined concurrent calls, and as one JSON-RPC batch
+
+Usage: python bench_rust_bridge.py [stops] [latency_ms] [host:port]
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from bridge.rust_bridge import RustBridge, RustError
+
+
+STOP_CALLS = [
+    ("getState", {}),
+    ("stackTrace", {"startFrame": 0, "levels": 20}),
+    ("scopes", {"frameId": 0}),
+    ("variables", {"variablesReference": 1}),
+]
+
+
+class CountingBridge(RustBridge):
+    """RustBridge that counts the messages it writes."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = 0
+
+    async def _send(self, payload):
+        self.messages += 1
+        await super()._send(payload)
+
+
+async def mock_sandbox(latency: float):
+    """
+    Newline-delimited JSON-RPC server answering every call with a small
+    result, each response delayed by latency to stand in for the link.
+    """
+    loop = asyncio.get_running_loop()
+
+    def answer(request):
+        return {"jsonrpc": "2.0", "result": {"method": request["method"]}, "id": request["id"]}
+
+    async def client(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            request = json.loads(line)
+            if isinstance(request, list):
+                response = [answer(item) for item in request]
+            else:
+                response = answer(request)
+            data = json.dumps(response).encode() + b"\n"
+            loop.call_later(latency, writer.write, data)
+        writer.close()
+
+    return await asyncio.start_server(client, "127.0.0.1", 0)
+
+
+async def sequential(bridge: RustBridge):
+    for method, params in STOP_CALLS:
+        try:
+            await bridge.call_method(method, params)
+        except RustError:
+            pass
+
+
+async def pipelined(bridge: RustBridge):
+    await asyncio.gather(
+        *(bridge.call_method(method, params) for method, params in STOP_CALLS),
+        return_exceptions=True
+    )
+
+
+async def batched(bridge: RustBridge):
+    await bridge.call_batch(STOP_CALLS, return_exceptions=True)
+
+
+async def run(stops: int, latency: float, address):
+    server = None
+    if address is None:
+        server = await mock_sandbox(latency)
+        host, port = server.sockets[0].getsockname()[:2]
+        print(f"Mock sandbox on {host}:{port}, {latency * 1000:.1f} ms per response")
+    else:
+        host, port = address
+        print(f"Sandbox at {host}:{port}")
+
+    bridge = CountingBridge()
+    await bridge.start(host, port)
+    if not bridge.is_connected:
+        print("Could not connect")
+        return
+
+    print(f"{stops} stops, {len(STOP_CALLS)} calls per stop")
+    for name, fetch in (("sequential", sequential), ("pipelined", pipelined), ("batch", batched)):
+        bridge.messages = 0
+        start = time.perf_counter()
+        for _ in range(stops):
+            await fetch(bridge)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<11} {elapsed / stops * 1000:>8.2f} ms/stop  "
+            f"{bridge.messages / stops:>4.1f} messages/stop"
+        )
+
+    bridge.connection_task.cancel()
+    bridge.writer.close()
+    await bridge.writer.wait_closed()
+    await asyncio.sleep(latency + 0.01)
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == "__main__":
+    # Unknown methods on a real sandbox answer with errors; keep them quiet
+    logging.getLogger("InkDebugAdapter").setLevel(logging.CRITICAL)
+
+    stops = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.001
+    address = None
+    if len(sys.argv) > 3:
+        host, _, port = sys.argv[3].rpartition(":")
+        address = (host, int(port))
+    asyncio.run(run(stops, latency, address))
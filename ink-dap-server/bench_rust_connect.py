@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark for launch-to-first-stop time
+A mock sandbox comes up some time after launch and stops as soon as it is
+initialized; compares the old fixed 5 s reconnect interval with 0.5 s
+polling against the event-driven connection with exponential backoff
+
+Usage: python bench_rust_connect.py [delay_ms ...]
+"""
+
+import asyncio
+import json
+import logging
+import socket
+import sys
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from bridge.rust_bridge import RustBridge
+
+
+class LegacyBridge(RustBridge):
+    """Connection handling as it was before: poll every 0.5 s, retry every 5 s."""
+
+    async def start(self, host: str = "localhost", port: int = 9229, timeout: float = 10.0) -> bool:
+        self.host = host
+        self.port = port
+        self.connection_task = asyncio.create_task(self._connection_loop())
+        for _ in range(int(timeout / 0.5)):
+            if self.is_connected:
+                return True
+            await asyncio.sleep(0.5)
+        return False
+
+    async def _connection_loop(self):
+        while True:
+            if not self.is_connected:
+                try:
+                    reader, writer = await asyncio.open_connection(self.host, self.port)
+                    self.reader, self.writer = reader, writer
+                    asyncio.create_task(self._read_responses(reader, writer, self.framing))
+                    self.disconnected.clear()
+                    self.connected.set()
+                    self._dispatch_event("connected", {})
+                except OSError:
+                    pass
+            await asyncio.sleep(5.0)
+
+
+async def mock_sandbox(port: int):
+    """Sandbox that reports a stop right after it is initialized."""
+
+    async def client(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            request = json.loads(line)
+            writer.write(json.dumps({"jsonrpc": "2.0", "result": {}, "id": request["id"]}).encode() + b"\n")
+            if request["method"] == "initialize":
+                stopped = {"jsonrpc": "2.0", "method": "stopped", "params": {"reason": "breakpoint", "pc": 0}}
+                writer.write(json.dumps(stopped).encode() + b"\n")
+        writer.close()
+
+    return await asyncio.start_server(client, "127.0.0.1", port)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def launch_to_first_stop(bridge_class, delay: float) -> float:
+    port = free_port()
+    bridge = bridge_class()
+    first_stop = asyncio.get_running_loop().create_future()
+
+    async def on_event(method, params):
+        # The old adapter initialized the sandbox on connect; RustBridge
+        # now does so itself before reporting the connection
+        if method == "connected" and bridge_class is LegacyBridge:
+            await bridge.call_method("initialize", {"path": "contract.polkavm"})
+        elif method == "stopped" and not first_stop.done():
+            first_stop.set_result(time.perf_counter())
+
+    bridge.subscribe(on_event)
+
+    async def sandbox_later():
+        await asyncio.sleep(delay)
+        return await mock_sandbox(port)
+
+    launched = time.perf_counter()
+    server_task = asyncio.create_task(sandbox_later())
+    await bridge.start("127.0.0.1", port, timeout=30.0)
+    stopped = await first_stop
+
+    bridge.connection_task.cancel()
+    await bridge.shutdown()
+    server = await server_task
+    server.close()
+    await server.wait_closed()
+    return stopped - launched
+
+
+async def run(delays):
+    print(f"{'sandbox delay':>14} {'legacy':>10} {'backoff':>10}")
+    for delay in delays:
+        legacy = await launch_to_first_stop(LegacyBridge, delay)
+        current = await launch_to_first_stop(RustBridge, delay)
+        print(f"{delay * 1000:>11.0f} ms {legacy * 1000:>7.0f} ms {current * 1000:>7.0f} ms")
+
+
+if __name__ == "__main__":
+    logging.getLogger("InkDebugAdapter").setLevel(logging.CRITICAL)
+    delays = [float(arg) / 1000 for arg in sys.argv[1:]] or [0.0, 0.1, 0.5, 2.0]
+    asyncio.run(run(delays))
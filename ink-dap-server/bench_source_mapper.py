@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark for SourceMapper debug info loading
+Compares the old readelf subprocess + regex path with the in-process
+DWARF line-program decoder, then times function scope queries
+
+Usage: python bench_source_mapper.py <contract.elf> [repeat]
+"""
+
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping.map_cache import SourceMapCache
+from mapping.source_mapper import SourceMapper
+
+
+def legacy_load(elf_path: str) -> dict:
+    """Loader as it was before: readelf --debug-dump=decodedline and a regex per line."""
+    result = subprocess.run(
+        ["readelf", "--debug-dump=decodedline", elf_path],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    mappings = {}
+    pattern = r'(\S+\.rs)\s+(\d+)\s+0x([0-9a-fA-F]+)'
+    for line in result.stdout.split('\n'):
+        match = re.search(pattern, line)
+        if match:
+            mappings[(match.group(1), int(match.group(2)))] = int(match.group(3), 16)
+    return mappings
+
+
+def mapped_lines(mapper: SourceMapper) -> set:
+    """(file name, line) pairs the mapper has code for, like the readelf keys."""
+    return {
+        (path.rsplit('/', 1)[-1], line)
+        for path, file_lines in mapper.file_index.items()
+        for line in file_lines.lines
+    }
+
+
+def decoder_load(elf_path: str) -> set:
+    mapper = SourceMapper()
+    mapper.load_debug_info(elf_path)
+    return mapped_lines(mapper)
+
+
+def cached_load(elf_path: str, cache_dir: str) -> set:
+    mapper = SourceMapper(SourceMapCache(cache_dir))
+    mapper.load_debug_info(elf_path)
+    return mapped_lines(mapper)
+
+
+def scope_queries(elf_path: str):
+    """Time point and batch scope lookups at every instruction boundary of the line table."""
+    mapper = SourceMapper()
+    mapper.load_debug_info(elf_path)
+    index = mapper.scope_index
+    pcs = sorted(set(mapper.line_table.addresses))
+    start = time.perf_counter()
+    frames = sum(len(mapper.frames_at(pc)) for pc in pcs)
+    point_time = time.perf_counter() - start
+    start = time.perf_counter()
+    index.functions_many(pcs)
+    batch_time = time.perf_counter() - start
+    return len(index), len(pcs), frames, point_time, batch_time
+
+
+def best_of(fn, elf_path: str, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(elf_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    elf_path = sys.argv[1]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(f"ELF: {elf_path} ({Path(elf_path).stat().st_size} bytes), best of {repeat}")
+
+    legacy_time, legacy = best_of(legacy_load, elf_path, repeat)
+    print(f"readelf   {legacy_time * 1000:>9.1f} ms  {len(legacy):>8} mappings")
+
+    decoder_time, decoded = best_of(decoder_load, elf_path, repeat)
+    print(f"decoder   {decoder_time * 1000:>9.1f} ms  {len(decoded):>8} mappings")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cached_load(elf_path, cache_dir)
+        cached_time, _ = best_of(lambda path: cached_load(path, cache_dir), elf_path, repeat)
+    print(f"cached    {cached_time * 1000:>9.1f} ms  (warm source-map cache)")
+
+    # readelf only reports file names; compare the keys both paths can see
+    # (line 0 marks compiler-generated code and is not mapped)
+    missing = sum(1 for key in legacy if key[1] != 0 and key not in decoded)
+    print(f"speedup   {legacy_time / decoder_time:>9.1f}x  {missing} readelf mappings not found by decoder")
+
+    scopes, pcs, frames, point_time, batch_time = scope_queries(elf_path)
+    print(f"scopes    {scopes:>9} scopes, {frames / max(pcs, 1):.2f} frames per PC")
+    print(f"frames_at {point_time * 1e6 / max(pcs, 1):>9.2f} us/PC  functions_many {batch_time * 1e9 / max(pcs, 1):.0f} ns/PC")
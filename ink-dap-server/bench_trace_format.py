@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the block-compressed execution trace format
+Re-encodes recorded traces (INK_DEBUG_TRACE, e.g. from a DRink test run) as
+raw records and as blocks, and reports the compression ratio, full decode
+throughput and single-step random access time
+
+Usage: python bench_trace_format.py [trace ...]
+Without traces, a synthetic 1M-step run is used.
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from tracing.trace_store import TraceStore, open_block_trace
+
+
+RANDOM_STEPS = 1000
+
+
+def synthetic_trace(steps: int = 1_000_000, seed: int = 7) -> TraceStore:
+    """
+    Contract-like PC stream: runs of 2-4 byte instructions ending in a loop
+    back edge, a call, a return or a fall through, with a host call every
+    few hundred steps and gas charged per instruction.
+    """
+    rng = np.random.default_rng(seed)
+    functions = np.sort(rng.choice(np.arange(0, 200_000, 16), 400, replace=False))
+
+    pcs = np.empty(steps, dtype=np.uint32)
+    pc, calls, i = int(functions[0]), [], 0
+    while i < steps:
+        length = min(int(rng.integers(3, 12)), steps - i)
+        sizes = rng.choice([2, 3, 4], length)
+        pcs[i:i + length] = pc + np.cumsum(sizes) - sizes
+        pc += int(sizes.sum())
+        i += length
+
+        branch = rng.random()
+        if branch < 0.3:
+            pc -= int(sizes[:max(1, length // 2)].sum())
+        elif branch < 0.4:
+            calls.append(pc)
+            pc = int(rng.choice(functions))
+        elif branch < 0.5 and calls:
+            pc = calls.pop()
+
+    host_calls = np.zeros(steps, dtype=np.uint32)
+    marked = np.arange(rng.integers(100, 300), steps, 250)
+    host_calls[marked] = rng.integers(1, 60, len(marked))
+    used = np.ones(steps, dtype=np.int64)
+    used[marked] += rng.integers(1_000, 50_000, len(marked))
+    gas = 10_000_000_000 - np.cumsum(used)
+    return TraceStore(pcs, host_calls, gas)
+
+
+def measure(name: str, store: TraceStore):
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path = str(Path(tmp) / "trace.raw")
+        blocks_path = str(Path(tmp) / "trace.blocks")
+        store.save(raw_path, blocks=False)
+        store.save(blocks_path)
+        raw_size = Path(raw_path).stat().st_size
+        blocks_size = Path(blocks_path).stat().st_size
+
+        start = time.perf_counter()
+        raw = TraceStore.load(raw_path)
+        raw_pcs = np.array(raw.pcs)
+        raw_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decoded = TraceStore.load(blocks_path)
+        decode_time = time.perf_counter() - start
+        assert np.array_equal(decoded.pcs, raw_pcs)
+
+        reader = open_block_trace(blocks_path)
+        targets = np.random.default_rng(0).integers(0, len(reader), RANDOM_STEPS)
+        start = time.perf_counter()
+        for step in targets:
+            reader.pc_at(int(step))
+        seek_time = (time.perf_counter() - start) / RANDOM_STEPS
+
+    steps = len(store)
+    print(f"{name}: {steps} steps, gas={store.has_gas}")
+    print(f"  raw      {raw_size:>12} bytes  {raw_size / steps:6.2f} B/step  load {raw_time * 1000:8.1f} ms")
+    print(f"  blocks   {blocks_size:>12} bytes  {blocks_size / steps:6.2f} B/step  "
+          f"decode {decode_time * 1000:6.1f} ms ({steps / decode_time / 1e6:.1f} M steps/s)")
+    print(f"  ratio    {raw_size / blocks_size:.1f}x, random step {seek_time * 1e6:.0f} us")
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        measure("synthetic", synthetic_trace())
+        return
+    for path in paths:
+        measure(path, TraceStore.load(path))
+
+
+if __name__ == "__main__":
+    main()
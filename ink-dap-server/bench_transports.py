@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark for per-step round-trip latency over each sandbox transport
+Spawns a sandbox through RustBridge once per transport (TCP, Unix domain
+socket, inherited pipe pair) and times sequential calls
+
+By default the sandbox is a minimal JSON-RPC echo server in this script that
+reads the same INK_DEBUG_RPC_* variables as ink-debug-rpc; pass a command
+to benchmark a real sandbox instead
+
+Usage: python bench_transports.py [calls] [-- sandbox command ...]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from bridge.rust_bridge import RustBridge
+from bridge.transport import (
+    FDS_ENV, HOST_ENV, PORT_ENV, SOCKET_ENV, TRANSPORT_ENV,
+    PipeTransport, TcpTransport, UnixTransport, default_socket_path,
+)
+
+
+async def serve_from_env():
+    """Echo sandbox: answer every request on the transport from the environment."""
+
+    async def client(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            request = json.loads(line)
+            response = {"jsonrpc": "2.0", "result": {}, "id": request["id"]}
+            writer.write(json.dumps(response).encode() + b"\n")
+        writer.close()
+
+    kind = os.environ.get(TRANSPORT_ENV, "tcp")
+    if kind == "pipe":
+        read_fd, write_fd = (int(fd) for fd in os.environ[FDS_ENV].split(","))
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), open(read_fd, 'rb', buffering=0))
+        transport, protocol = await loop.connect_write_pipe(
+            lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), open(write_fd, 'wb', buffering=0)
+        )
+        await client(reader, asyncio.StreamWriter(transport, protocol, reader, loop))
+        return
+
+    if kind == "unix":
+        server = await asyncio.start_unix_server(client, os.environ[SOCKET_ENV])
+    else:
+        server = await asyncio.start_server(client, os.environ[HOST_ENV], int(os.environ[PORT_ENV]))
+    async with server:
+        await server.serve_forever()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def measure(transport, command, calls: int):
+    bridge = RustBridge(transport)
+    await bridge.spawn(command)
+    if not await bridge.start():
+        print(f"{transport.name:<6} could not connect")
+        await bridge.shutdown()
+        return
+
+    # Warm up, then time one call at a time as a debugger step would
+    for _ in range(100):
+        await bridge.call_method("initialize", {})
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await bridge.call_method("initialize", {})
+        samples.append(time.perf_counter() - start)
+    await bridge.shutdown()
+
+    samples.sort()
+    median = samples[len(samples) // 2] * 1e6
+    p99 = samples[int(len(samples) * 0.99)] * 1e6
+    mean = sum(samples) / len(samples) * 1e6
+    print(f"{transport.name:<6} {mean:>9.1f} us {median:>9.1f} us {p99:>9.1f} us")
+
+
+async def run(calls: int, command):
+    if command is None:
+        command = [sys.executable, __file__, "--serve"]
+    print(f"{calls} sequential calls per transport, sandbox: {' '.join(command)}")
+    print(f"{'':<6} {'mean':>12} {'median':>12} {'p99':>12}")
+
+    socket_path = default_socket_path()
+    for transport in (TcpTransport("127.0.0.1", free_port()), UnixTransport(socket_path), PipeTransport()):
+        await measure(transport, command, calls)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        asyncio.run(serve_from_env())
+        sys.exit(0)
+
+    # Keep the sandbox's own output and our reconnect warnings out of the table
+    logging.getLogger("InkDebugAdapter").setLevel(logging.CRITICAL)
+
+    args = sys.argv[1:]
+    command = None
+    if "--" in args:
+        command = args[args.index("--") + 1:]
+        args = args[:args.index("--")]
+    calls = int(args[0]) if args else 5000
+    asyncio.run(run(calls, command))
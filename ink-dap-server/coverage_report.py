@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Headless line coverage for Ink! v6 contracts
+Turns the execution traces recorded by a test run (INK_DEBUG_TRACE) into
+lcov and Cobertura reports, for CI
+
+Usage: python coverage_report.py --elf contract.elf [--lcov coverage.info]
+                                 [--cobertura coverage.xml] trace|directory ...
+Directories are searched recursively for trace files.
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping.map_cache import SourceMapCache
+from mapping.source_mapper import SourceMapper
+from tracing.coverage import CoverageCollector, summary, to_cobertura, to_lcov
+from tracing.trace_store import TraceError, read_header
+
+
+def find_traces(paths):
+    """Trace files among paths, directories searched recursively."""
+    for path in map(Path, paths):
+        if not path.is_dir():
+            yield path
+            continue
+        for candidate in sorted(path.rglob("*")):
+            if not candidate.is_file():
+                continue
+            try:
+                read_header(str(candidate))
+            except (TraceError, OSError):
+                continue
+            yield candidate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Line coverage from Ink! execution traces")
+    parser.add_argument("traces", nargs="+", help="trace files or directories of trace files")
+    parser.add_argument("--elf", required=True, help="unstripped contract ELF the traces were recorded with")
+    parser.add_argument("--lcov", help="write an lcov tracefile here")
+    parser.add_argument("--cobertura", help="write a Cobertura XML report here")
+    parser.add_argument("--test-name", default="", help="lcov test name (TN:)")
+    parser.add_argument("--address-offset", type=lambda value: int(value, 0), default=0,
+                        help="runtime address minus ELF address of the traced code")
+    parser.add_argument("--verbose", action="store_true", help="log progress to stderr")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+
+    start = time.perf_counter()
+    mapper = SourceMapper(SourceMapCache())
+    mapper.load_debug_info(args.elf)
+    if args.address_offset:
+        mapper.apply_address_offset(args.address_offset)
+
+    collector = CoverageCollector(mapper)
+    for path in find_traces(args.traces):
+        try:
+            collector.add_trace(str(path))
+        except TraceError as e:
+            print(f"Skipping {path}: {e}", file=sys.stderr)
+    if not collector.traces:
+        print("No execution traces found", file=sys.stderr)
+        sys.exit(1)
+
+    report = collector.report()
+    if args.lcov:
+        Path(args.lcov).write_text(to_lcov(report, args.test_name))
+    if args.cobertura:
+        Path(args.cobertura).write_text(to_cobertura(report))
+
+    hit, valid = summary(report)
+    percent = 100 * hit / valid if valid else 100
+    print(f"{collector.traces} traces, {collector.steps} steps: "
+          f"{hit}/{valid} lines covered ({percent:.1f}%) in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
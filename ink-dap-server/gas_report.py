@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Gas report of Ink! v6 contract runs
+Attributes the gas (as Weight ref_time when known) of recorded execution
+traces (INK_DEBUG_TRACE with gas) to source lines, functions and host calls
+
+Usage: python gas_report.py --elf contract.elf [--json report.json] [--top N] trace ...
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping.map_cache import SourceMapCache
+from mapping.source_mapper import SourceMapper
+from tracing.gas_report import GasAttribution
+from tracing.trace_store import TraceError
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gas attribution from Ink! execution traces")
+    parser.add_argument("traces", nargs="+", help="trace files recorded with gas, one report each")
+    parser.add_argument("--elf", required=True, help="unstripped contract ELF the traces were recorded with")
+    parser.add_argument("--json", help="write the full reports here, a list with one per trace")
+    parser.add_argument("--top", type=int, default=20, help="rows of the line, function and host call tables")
+    parser.add_argument("--address-offset", type=lambda value: int(value, 0), default=0,
+                        help="runtime address minus ELF address of the traced code")
+    parser.add_argument("--verbose", action="store_true", help="log progress to stderr")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+
+    mapper = SourceMapper(SourceMapCache())
+    mapper.load_debug_info(args.elf)
+    if args.address_offset:
+        mapper.apply_address_offset(args.address_offset)
+
+    reports = []
+    for path in args.traces:
+        start = time.perf_counter()
+        try:
+            attribution = GasAttribution.from_trace(path, mapper)
+        except (TraceError, OSError) as e:
+            print(f"Skipping {path}: {e}", file=sys.stderr)
+            continue
+        report = attribution.to_json()
+        report["trace"] = path
+        reports.append(report)
+        print(f"{path} ({time.perf_counter() - start:.2f} s): {attribution.format(args.top)}\n")
+    if not reports:
+        print("No gas recorded in the traces", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -19,8 +19,9 @@ sys.path.insert(0, str(src_path))
 def main():
     """Main entry point for the debug adapter."""
 
-    # Setup logging first (will create debug_adapter.log)
-    from utils.logger import setup_logger
+    # Setup logging first (will create debug_adapter.log); the level comes
+    # from INK_DEBUG_LOG_LEVEL until launch.json sets "logLevel"
+    from utils.logger import setup_logger, shutdown_logging
     logger = setup_logger("InkDebugAdapter")
 
     logger.info("=" * 60)
@@ -87,6 +88,7 @@ def main():
         sys.exit(1)
     finally:
         logger.info("Debug adapter main() function ended")
+        shutdown_logging()
 
 
 if __name__ == "__main__":
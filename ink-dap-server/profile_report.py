@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Instruction profile of Ink! v6 contract runs
+Turns recorded execution traces (INK_DEBUG_TRACE) into hot-spot tables,
+collapsed stacks for flamegraphs and speedscope profiles
+
+Usage: python profile_report.py --elf contract.elf [--collapsed out.folded]
+                                [--speedscope out.speedscope.json] [--top N] trace ...
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping.map_cache import SourceMapCache
+from mapping.source_mapper import SourceMapper
+from tracing.profiler import Profiler, to_collapsed, to_speedscope
+from tracing.trace_store import TraceError
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instruction profile from Ink! execution traces")
+    parser.add_argument("traces", nargs="+", help="trace files, profiled as one run each after the other")
+    parser.add_argument("--elf", required=True, help="unstripped contract ELF the traces were recorded with")
+    parser.add_argument("--collapsed", help="write collapsed stacks here (flamegraph.pl, inferno)")
+    parser.add_argument("--speedscope", help="write a speedscope profile here")
+    parser.add_argument("--top", type=int, default=20, help="rows of the function and line tables")
+    parser.add_argument("--address-offset", type=lambda value: int(value, 0), default=0,
+                        help="runtime address minus ELF address of the traced code")
+    parser.add_argument("--verbose", action="store_true", help="log progress to stderr")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+
+    start = time.perf_counter()
+    mapper = SourceMapper(SourceMapCache())
+    mapper.load_debug_info(args.elf)
+    if args.address_offset:
+        mapper.apply_address_offset(args.address_offset)
+
+    profiler = Profiler(mapper)
+    for path in args.traces:
+        try:
+            profiler.add_trace(path)
+        except (TraceError, OSError) as e:
+            print(f"Skipping {path}: {e}", file=sys.stderr)
+    if not profiler.steps:
+        print("No steps profiled", file=sys.stderr)
+        sys.exit(1)
+
+    if args.collapsed:
+        Path(args.collapsed).write_text(to_collapsed(profiler))
+    if args.speedscope:
+        Path(args.speedscope).write_text(to_speedscope(profiler, Path(args.traces[0]).name))
+
+    total = profiler.steps
+    print(f"{total} steps profiled in {time.perf_counter() - start:.2f} s\n")
+    print(f"{'inclusive':>12} {'%':>6} {'exclusive':>12} {'%':>6} {'calls':>9}  function")
+    for cost in profiler.function_costs()[:args.top]:
+        print(f"{cost.inclusive:>12} {100 * cost.inclusive / total:6.2f} "
+              f"{cost.exclusive:>12} {100 * cost.exclusive / total:6.2f} {cost.calls:>9}  {cost.name}")
+    print(f"\n{'instructions':>12} {'%':>6}  line")
+    for cost in profiler.line_costs()[:args.top]:
+        print(f"{cost.instructions:>12} {100 * cost.instructions / total:6.2f}  {cost.path}:{cost.line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,36 @@ Debug Adapter Protocol (DAP) implementation
 Handles low-level DAP message reading and writing
 """
 
+import asyncio
 import json
-import sys
 import os
+import stat
+import sys
 from typing import Dict, Any, Optional
 import logging
+from .output import OutputAggregator
+
+
+# Upper bound for a single read from stdin
+READ_CHUNK_SIZE = 64 * 1024
+
+# Queued output above which producers are asked to wait, and the level at
+# which they are released again
+WRITE_HIGH_WATER = 1024 * 1024
+WRITE_LOW_WATER = 256 * 1024
+
+
+class _StdoutPipeProtocol(asyncio.streams.FlowControlMixin):
+    """Write pipe protocol that reports when the transport has shut down."""
+
+    def __init__(self, loop=None):
+        super().__init__(loop)
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        if not self.closed.done():
+            self.closed.set_result(None)
 
 
 class DAPProtocol:
@@ -16,6 +41,19 @@ class DAPProtocol:
     def __init__(self):
         self.logger = logging.getLogger("InkDebugAdapter.DAPProtocol")
         self._sequence = 1
+        self._buffer = bytearray()
+        self._stream_reader: Optional[asyncio.StreamReader] = None
+
+        # Outgoing frames, written in seq order by _write_loop
+        self._write_queue: asyncio.Queue = asyncio.Queue()
+        self._stream_writer: Optional[asyncio.StreamWriter] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._pending_bytes = 0
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+        # Debug Console text, sent in batches (see send_output)
+        self._output = OutputAggregator(self._send_output_event)
 
         # Set stdin to non-blocking mode on Windows
         if sys.platform == 'win32':
@@ -23,86 +61,209 @@ class DAPProtocol:
             msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
             msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
 
-    def read_message(self) -> Optional[Dict[str, Any]]:
+    async def open(self):
         """
-        Read a DAP message from stdin.
+        Attach the framing reader to stdin and start the writer task.
+
+        When stdin/stdout are pipes or sockets (the normal case when VS Code
+        spawns the adapter) asyncio streams are connected to them directly.
+        Otherwise (Windows, TTY, redirected file) they are accessed in large
+        chunks through the default executor, so there is still only one
+        thread hop per chunk rather than per message.
+        """
+        loop = asyncio.get_running_loop()
+
+        if self._is_pipe(sys.stdin.fileno()):
+            reader = asyncio.StreamReader(limit=READ_CHUNK_SIZE)
+            pipe = open(sys.stdin.fileno(), 'rb', buffering=0, closefd=False)
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+            self._stream_reader = reader
+            self.logger.info("Reading DAP messages from stdin pipe via asyncio")
+        else:
+            self._stream_reader = None
+            self.logger.info("stdin is not a pipe, reading DAP messages in executor chunks")
+
+        if self._is_pipe(sys.stdout.fileno()):
+            sys.stdout.flush()
+            pipe = open(sys.stdout.fileno(), 'wb', buffering=0, closefd=False)
+            transport, protocol = await loop.connect_write_pipe(_StdoutPipeProtocol, pipe)
+            self._stream_writer = asyncio.StreamWriter(transport, protocol, None, loop)
+            self.logger.info("Writing DAP messages to stdout pipe via asyncio")
+        else:
+            self._stream_writer = None
+            self.logger.info("stdout is not a pipe, writing DAP messages in executor batches")
+
+        self._writer_task = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        """Flush all queued messages and stop the writer task."""
+        if self._writer_task is None:
+            return
+
+        self._output.flush()
+        await self._write_queue.join()
+        self._writer_task.cancel()
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+        self._writer_task = None
+
+        if self._stream_writer is not None:
+            # drain() only waits for the high-water mark; the transport
+            # finishes writing its buffer before connection_lost
+            self._stream_writer.close()
+            await self._stream_writer.transport.get_protocol().closed
+            self._stream_writer = None
+
+    @staticmethod
+    def _is_pipe(fd: int) -> bool:
+        """Whether fd can be driven by an asyncio pipe transport."""
+        if sys.platform == 'win32':
+            return False
+        mode = os.fstat(fd).st_mode
+        return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)
+
+    async def read_message(self) -> Optional[Dict[str, Any]]:
+        """
+        Read the next DAP message from stdin.
 
         DAP messages format:
         Content-Length: <length>\r\n
         \r\n
         <json-content>
+
+        Returns None once stdin is closed.
         """
-        try:
-            # Read headers byte by byte until we find \r\n\r\n
-            headers_bytes = b''
-            while True:
-                byte = sys.stdin.buffer.read(1)
-                if not byte:
-                    return None
-                headers_bytes += byte
-                if headers_bytes.endswith(b'\r\n\r\n'):
-                    break
-
-            # Parse headers
-            headers_str = headers_bytes[:-4].decode('utf-8')  # Remove \r\n\r\n
-            headers = {}
-            for line in headers_str.split('\r\n'):
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    headers[key.strip()] = value.strip()
-
-            # Get content length
-            if 'Content-Length' not in headers:
-                self.logger.error("No Content-Length header found")
+        while True:
+            message = self._parse_frame()
+            if message is not None:
+                return message
+
+            chunk = await self._read_chunk()
+            if not chunk:
+                if self._buffer:
+                    self.logger.error(f"stdin closed with {len(self._buffer)} unparsed bytes")
                 return None
+            self._buffer += chunk
 
-            content_length = int(headers['Content-Length'])
+    async def _read_chunk(self) -> bytes:
+        """Read whatever stdin has available, up to READ_CHUNK_SIZE bytes."""
+        if self._stream_reader is not None:
+            return await self._stream_reader.read(READ_CHUNK_SIZE)
 
-            # Read exact number of bytes for body
-            body_bytes = b''
-            while len(body_bytes) < content_length:
-                chunk = sys.stdin.buffer.read(content_length - len(body_bytes))
-                if not chunk:
-                    break
-                body_bytes += chunk
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, os.read, sys.stdin.fileno(), READ_CHUNK_SIZE)
 
-            if len(body_bytes) < content_length:
-                self.logger.error(f"Expected {content_length} bytes, got {len(body_bytes)}")
+    def _parse_frame(self) -> Optional[Dict[str, Any]]:
+        """
+        Pop one complete frame off the input buffer.
+
+        Returns None if the buffer does not hold a complete frame yet.
+        Malformed frames are logged and skipped.
+        """
+        buffer = self._buffer
+        while True:
+            header_end = buffer.find(b'\r\n\r\n')
+            if header_end < 0:
                 return None
 
-            # Parse JSON
-            body_str = body_bytes.decode('utf-8')
-            message = json.loads(body_str)
-            self.logger.debug(f"Received: {message}")
-            return message
+            content_length = None
+            for line in bytes(buffer[:header_end]).split(b'\r\n'):
+                key, sep, value = line.partition(b':')
+                if sep and key.strip() == b'Content-Length':
+                    try:
+                        content_length = int(value.strip())
+                    except ValueError:
+                        pass
 
-        except Exception as e:
-            self.logger.error(f"Error reading message: {e}", exc_info=True)
-            return None
+            body_start = header_end + 4
+            if content_length is None:
+                self.logger.error("No Content-Length header found, dropping header block")
+                del buffer[:body_start]
+                continue
+
+            body_end = body_start + content_length
+            if len(buffer) < body_end:
+                return None
+
+            body = bytes(buffer[body_start:body_end])
+            del buffer[:body_end]
+
+            try:
+                message = json.loads(body)
+            except ValueError as e:
+                self.logger.error(f"Error decoding message body: {e}")
+                continue
+
+            self.logger.debug("Received: %s", message)
+            return message
 
     def send_message(self, message: Dict[str, Any]):
-        """Send a DAP message to stdout."""
-        try:
-            # Convert to JSON
-            body = json.dumps(message, separators=(',', ':'))
-            body_bytes = body.encode('utf-8')
+        """
+        Queue a DAP message for stdout.
 
-            # Create header
-            header = f"Content-Length: {len(body_bytes)}\r\n\r\n"
-            header_bytes = header.encode('ascii')
+        Never blocks: the frame is serialized here and written by the writer
+        task, so messages go out strictly in the order they were sent (and
+        therefore by seq). Producers that can wait should await
+        wait_writable() to respect backpressure from a slow client.
+        """
+        try:
+            body_bytes = json.dumps(message, separators=(',', ':')).encode('utf-8')
+            frame = b'Content-Length: %d\r\n\r\n' % len(body_bytes) + body_bytes
 
-            # Write header and body
-            sys.stdout.buffer.write(header_bytes)
-            sys.stdout.buffer.write(body_bytes)
-            sys.stdout.buffer.flush()
+            self._write_queue.put_nowait(frame)
+            self._pending_bytes += len(frame)
+            if self._pending_bytes > WRITE_HIGH_WATER:
+                self._writable.clear()
 
-            self.logger.debug(f"Sent: {message}")
+            self.logger.debug("Sent: %s", message)
 
         except Exception as e:
             self.logger.error(f"Error sending message: {e}", exc_info=True)
 
-    def send_response(self, request: Dict[str, Any], body: Optional[Dict[str, Any]] = None, success: bool = True):
-        """Send a response to a DAP request."""
+    async def wait_writable(self):
+        """Wait until queued output has dropped below the low-water mark."""
+        await self._writable.wait()
+
+    async def _write_loop(self):
+        """Write queued frames, coalescing everything ready into one write/flush."""
+        while True:
+            frames = [await self._write_queue.get()]
+            while not self._write_queue.empty():
+                frames.append(self._write_queue.get_nowait())
+
+            data = b''.join(frames)
+            try:
+                await self._write(data)
+            except Exception as e:
+                self.logger.error(f"Error writing {len(frames)} messages: {e}", exc_info=True)
+            finally:
+                self._pending_bytes -= len(data)
+                if self._pending_bytes <= WRITE_LOW_WATER:
+                    self._writable.set()
+                for _ in frames:
+                    self._write_queue.task_done()
+
+    async def _write(self, data: bytes):
+        """Write a batch of frames to stdout."""
+        if self._stream_writer is not None:
+            self._stream_writer.write(data)
+            await self._stream_writer.drain()
+            return
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write_stdout, data)
+
+    @staticmethod
+    def _write_stdout(data: bytes):
+        """Blocking stdout write, only run in the executor."""
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    def send_response(self, request: Dict[str, Any], body: Optional[Dict[str, Any]] = None, success: bool = True,
+                      message: Optional[str] = None):
+        """Send a response to a DAP request; message is shown to the user on failure."""
         response = {
             "seq": self._next_seq(),
             "type": "response",
@@ -114,13 +275,19 @@ class DAPProtocol:
         if body is not None:
             response["body"] = body
 
+        if message is not None:
+            response["message"] = message
+
         if not success and body is None:
             response["body"] = {}
 
         self.send_message(response)
 
     def send_event(self, event: str, body: Optional[Dict[str, Any]] = None):
-        """Send a DAP event."""
+        """Send a DAP event, after any output buffered before it."""
+        if event != "output" and self._output.pending:
+            self._output.flush()
+
         message = {
             "seq": self._next_seq(),
             "type": "event",
@@ -133,14 +300,21 @@ class DAPProtocol:
         self.send_message(message)
 
     def send_output(self, text: str, category: str = "console"):
-            """Send output to VS Code Debug Console via DAP output event."""
-            if not text.endswith('\n'):
-                text += '\n'
-
-            self.send_event("output", {
-                "category": category,
-                "output": text
-            })
+        """
+        Send output to VS Code Debug Console via DAP output events.
+
+        Text is buffered per category and goes out as one event per category
+        every few milliseconds, rather than one event per line.
+        """
+        if not text.endswith('\n'):
+            text += '\n'
+        self._output.write(text, category)
+
+    def _send_output_event(self, category: str, text: str):
+        self.send_event("output", {
+            "category": category,
+            "output": text
+        })
 
     def _next_seq(self) -> int:
         """Get next sequence number."""
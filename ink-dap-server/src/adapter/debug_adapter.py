@@ -8,11 +8,62 @@ import sys
 import json
 import logging
 import threading
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from .dap_protocol import DAPProtocol
 import time
 import asyncio
 from bridge.rust_bridge import RustBridge
+from bridge.transport import transport_from_config
+from mapping.map_cache import SourceMapCache
+from mapping.scope_index import ScopeFrame
+from mapping.source_mapper import SourceMapper
+from tracing.trace_config import trace_env
+from utils.logger import set_log_level
+
+
+# How a request is ordered against the others (see DebugAdapter._schedule).
+# PRIORITY requests start at once. SESSION requests (setup, breakpoints,
+# teardown) run one after another, as do EXECUTION requests, which also
+# wait for the SESSION requests before them. INSPECTION requests wait for
+# both but run concurrently with each other.
+PRIORITY_LANE = "priority"
+SESSION_LANE = "session"
+EXECUTION_LANE = "execution"
+INSPECTION_LANE = "inspection"
+
+REQUEST_LANES = {
+    "pause": PRIORITY_LANE,
+    "initialize": SESSION_LANE,
+    "launch": SESSION_LANE,
+    "setBreakpoints": SESSION_LANE,
+    "configurationDone": SESSION_LANE,
+    "terminate": SESSION_LANE,
+    "disconnect": SESSION_LANE,
+    "continue": EXECUTION_LANE,
+    "next": EXECUTION_LANE,
+    "stepIn": EXECUTION_LANE,
+    "stepOut": EXECUTION_LANE,
+    "stepBack": EXECUTION_LANE,
+    "reverseContinue": EXECUTION_LANE,
+    "breakpointLocations": INSPECTION_LANE,
+    "threads": INSPECTION_LANE,
+    "stackTrace": INSPECTION_LANE,
+    "scopes": INSPECTION_LANE,
+    "variables": INSPECTION_LANE,
+    "evaluate": INSPECTION_LANE,
+}
+
+# launch.json "consoleVerbosity": the least severe log_to_console level shown
+# in the Debug Console. Everything still goes to debug_adapter.log
+CONSOLE_VERBOSITY = {
+    "quiet": logging.WARNING,
+    "normal": logging.INFO,
+    "verbose": logging.DEBUG,
+}
+DEFAULT_CONSOLE_VERBOSITY = "normal"
+
+# variablesReference of the Registers scope
+REGISTERS_REFERENCE = 1
 
 
 class DebugAdapter:
@@ -23,12 +74,43 @@ class DebugAdapter:
         self.protocol = DAPProtocol()
         self.is_running = False
         self.rust_bridge = None
+        self.source_mapper = SourceMapper(SourceMapCache())
 
         # Track debug state
         self.is_initialized = False
         self.is_configured = False
         self.breakpoints = {}
+        self._breakpoint_id = 1
         self.current_thread_id = 1
+        # PC the contract is stopped at, from the last 'stopped' notification
+        # or the history step being looked at
+        self.stopped_pc = None
+        # Execution history pushed by a recording sandbox (ExecutionHistory),
+        # the step the sandbox is stopped at and its registers there
+        self.history = None
+        self.live_step = None
+        self.live_registers = None
+        # History step shown instead of the live one after stepping back
+        self.cursor = None
+        # Shadow call stack: PC of the call instruction of every frame below
+        # the innermost one, outermost first, kept up to date by the changes
+        # each 'stopped' notification carries
+        self.call_sites: List[int] = []
+        self.program = None
+        # Execution trace file reported by the sandbox when the run ended
+        self.trace_path = None
+        # refTimePerFuel and hostCallNames of the recorded gas, for gas reports
+        self.gas_info = {}
+        # Set at launch, cleared once the first stop is reported
+        self._launch_time = None
+        # Adapter messages below this level stay out of the Debug Console
+        self.console_level = CONSOLE_VERBOSITY[DEFAULT_CONSOLE_VERBOSITY]
+
+        # Task of every request not answered yet, by seq
+        self._requests: Dict[int, asyncio.Task] = {}
+        # Latest request of each serialized lane, the next one waits for it
+        self._lane_tails: Dict[str, asyncio.Task] = {}
+        self._reader_task = None
 
         # DAP capabilities
         self.capabilities = {
@@ -36,7 +118,7 @@ class DebugAdapter:
             "supportsFunctionBreakpoints": False,
             "supportsConditionalBreakpoints": False,
             "supportsEvaluateForHovers": True,
-            "supportsStepBack": False,
+            "supportsStepBack": True,
             "supportsSetVariable": False,
             "supportsRestartFrame": False,
             "supportsStepInTargetsRequest": False,
@@ -47,7 +129,7 @@ class DebugAdapter:
             "supportsValueFormattingOptions": True,
             "supportsExceptionInfoRequest": False,
             "supportTerminateDebuggee": True,
-            "supportsDelayedStackTraceLoading": False,
+            "supportsDelayedStackTraceLoading": True,
             "supportsLoadedSourcesRequest": False,
             "supportsLogPoints": False,
             "supportsTerminateThreadsRequest": False,
@@ -56,52 +138,119 @@ class DebugAdapter:
             "supportsDataBreakpoints": False,
             "supportsReadMemoryRequest": False,
             "supportsDisassembleRequest": False,
-            "supportsCancelRequest": False,
-            "supportsBreakpointLocationsRequest": False,
+            "supportsCancelRequest": True,
+            "supportsBreakpointLocationsRequest": True,
         }
 
         self.logger.info("Debug adapter initialized")
 
     def log_to_console(self, message: str, level: str = "INFO"):
-        """Send log message to VS Code Debug Console."""
-        formatted_msg = f"[{level}] {message}"
-        self.protocol.send_output(formatted_msg, category="console")
-        # Также пишем в файл
-        if level == "ERROR":
-            self.logger.error(message)
-        elif level == "WARNING":
-            self.logger.warning(message)
-        else:
-            self.logger.info(message)
-
+        """
+        Log a message, and show it in the VS Code Debug Console if the
+        console verbosity includes level ("DEBUG" is adapter internals).
+        """
+        severity = logging.getLevelName(level)
+        if not isinstance(severity, int):
+            severity = logging.INFO
+        self.logger.log(severity, message)
+        if severity >= self.console_level:
+            self.protocol.send_output(f"[{level}] {message}", category="console")
 
     async def run(self):
         """Main loop for the debug adapter - async version."""
         self.is_running = True
         self.logger.info("Debug adapter started, waiting for DAP messages...")
-        self.log_to_console("Debug adapter started, waiting for DAP messages...")
+        self.log_to_console("Debug adapter started, waiting for DAP messages...", "DEBUG")
 
-        # Start reading in separate task
-        await self._read_loop()
+        await self.protocol.open()
+        self._reader_task = asyncio.create_task(self._read_loop())
+        try:
+            # Ends at EOF, or when stop() cancels the reader
+            await asyncio.wait({self._reader_task})
+        finally:
+            # Requests already read are still answered
+            if self._requests:
+                await asyncio.wait(list(self._requests.values()))
+            # Deliver everything still queued (e.g. the disconnect response)
+            await self.protocol.close()
 
     async def _read_loop(self):
         """Async loop for reading DAP messages."""
-        loop = asyncio.get_event_loop()
-
         while self.is_running:
             try:
+                # Stop taking new requests while VS Code is not reading our output
+                await self.protocol.wait_writable()
+
                 self.logger.debug("Waiting for DAP message...")
-                # Read synchronously in executor
-                message = await loop.run_in_executor(None, self.protocol.read_message)
-                if message:
-                    self.logger.info(f"Received DAP message: {message.get('command', 'unknown')}")
-                    self.log_to_console(f"Received DAP message: {message.get('command', 'unknown')}")
-                    await self._handle_message(message)
+                message = await self.protocol.read_message()
+                if message is None:
+                    self.logger.info("stdin closed, stopping debug adapter")
+                    self.stop()
+                    break
+
+                command = message.get('command', 'unknown')
+                self.logger.debug("Received DAP message: %s", command)
+                # Echoing every request to the Debug Console is for debugging the adapter
+                if self.console_level <= logging.DEBUG:
+                    self.protocol.send_output(f"[DEBUG] Received DAP message: {command}", category="console")
+                if message.get("type") == "request" and message.get("command") == "cancel":
+                    # Must not wait behind the request it cancels
+                    self._handle_cancel(message)
                 else:
-                    self.logger.debug("No message received, continuing...")
+                    self._schedule(message)
             except Exception as e:
                 self.logger.error(f"Error in main loop: {e}", exc_info=True)
 
+    def _schedule(self, message: Dict[str, Any]):
+        """Start a task for one message, to run once the requests it must follow are done."""
+        seq = message.get("seq")
+        lane = REQUEST_LANES.get(message.get("command"), SESSION_LANE)
+        if lane == PRIORITY_LANE:
+            after = []
+        elif lane == SESSION_LANE:
+            after = [self._lane_tails.get(SESSION_LANE)]
+        else:
+            after = [self._lane_tails.get(SESSION_LANE), self._lane_tails.get(EXECUTION_LANE)]
+        after = [task for task in after if task is not None and not task.done()]
+
+        task = asyncio.create_task(self._run_request(message, after))
+        if lane in (SESSION_LANE, EXECUTION_LANE):
+            self._lane_tails[lane] = task
+        self._requests[seq] = task
+
+        def finished(_):
+            if self._requests.get(seq) is task:
+                del self._requests[seq]
+
+        task.add_done_callback(finished)
+
+    async def _run_request(self, message: Dict[str, Any], after: List[asyncio.Task]):
+        """Lifecycle of one request: wait for its predecessors, handle it, or answer 'cancelled'."""
+        seq = message.get("seq")
+        try:
+            if after:
+                await asyncio.wait(after)
+            await self._handle_message(message)
+        except asyncio.CancelledError:
+            self.logger.info(f"Request #{seq} cancelled")
+            self.protocol.send_response(message, success=False, message="cancelled")
+
+    def _handle_cancel(self, request: Dict[str, Any]):
+        """
+        Handle 'cancel' request.
+
+        A request still waiting for its turn is answered 'cancelled' without
+        being handled; a running one is interrupted, which also cancels its
+        call to the sandbox. Progress ids are not used by this adapter.
+        """
+        request_id = request.get("arguments", {}).get("requestId")
+        task = self._requests.get(request_id)
+        if task is not None and not task.done():
+            self.logger.info(f"Cancelling request #{request_id}")
+            task.cancel()
+        # Cancelling a request that has already finished is not an error
+        self.protocol.send_response(request)
+
     async def _handle_message(self, message: Dict[str, Any]):
         """Handle a DAP message."""
         msg_type = message.get("type")
@@ -116,22 +265,26 @@ class DebugAdapter:
         command = request.get("command")
         seq = request.get("seq", 0)
 
-        self.logger.info(f"Handling request #{seq}: {command}")
+        self.logger.debug("Handling request #%s: %s", seq, command)
 
         # Route to appropriate handler
         handlers = {
             "initialize": self._handle_initialize,
             "launch": self._handle_launch,
             "setBreakpoints": self._handle_set_breakpoints,
+            "breakpointLocations": self._handle_breakpoint_locations,
             "configurationDone": self._handle_configuration_done,
             "threads": self._handle_threads,
             "stackTrace": self._handle_stack_trace,
             "scopes": self._handle_scopes,
             "variables": self._handle_variables,
+            "evaluate": self._handle_evaluate,
             "continue": self._handle_continue,
             "next": self._handle_next,
             "stepIn": self._handle_step_in,
             "stepOut": self._handle_step_out,
+            "stepBack": self._handle_step_back,
+            "reverseContinue": self._handle_reverse_continue,
             "pause": self._handle_pause,
             "terminate": self._handle_terminate,
             "disconnect": self._handle_disconnect,
@@ -141,7 +294,7 @@ class DebugAdapter:
         if handler:
             try:
                 await handler(request)
-                self.logger.info(f"Successfully handled {command}")
+                self.logger.debug("Successfully handled %s", command)
             except Exception as e:
                 self.logger.error(f"Error handling {command}: {e}", exc_info=True)
                 self.protocol.send_response(request, success=False)
@@ -152,14 +305,14 @@ class DebugAdapter:
     async def _handle_initialize(self, request: Dict[str, Any]):
         """Handle 'initialize' request."""
         self.logger.info("Initializing debug adapter...")
-        self.log_to_console("Initializing debug adapter...")
+        self.log_to_console("Initializing debug adapter...", "DEBUG")
 
         try:
             # Send capabilities
             self.logger.info("Sending capabilities to VS Code...")
             self.protocol.send_response(request, body=self.capabilities)
             self.logger.info("Capabilities sent successfully")
-            self.log_to_console("Capabilities sent successfully")
+            self.log_to_console("Capabilities sent successfully", "DEBUG")
 
             # Mark as initialized
             self.is_initialized = True
@@ -169,7 +322,7 @@ class DebugAdapter:
             self.logger.info("Sending 'initialized' event to VS Code...")
             self.protocol.send_event("initialized")
             self.logger.info("'Initialized' event sent successfully")
-            self.log_to_console("'Initialized' event sent successfully")
+            self.log_to_console("'Initialized' event sent successfully", "DEBUG")
 
         except Exception as e:
             self.logger.error(f"Error in initialize: {e}", exc_info=True)
@@ -178,6 +331,16 @@ class DebugAdapter:
     async def _handle_launch(self, request: Dict[str, Any]):
         """Handle 'launch' request."""
         args = request.get("arguments", {})
+
+        # Adapter log level for the rest of the session
+        log_level = args.get("logLevel")
+        if log_level is not None and not set_log_level("InkDebugAdapter", log_level):
+            self.logger.warning(f"Ignoring invalid logLevel: {log_level}")
+        verbosity = args.get("consoleVerbosity", DEFAULT_CONSOLE_VERBOSITY)
+        if verbosity in CONSOLE_VERBOSITY:
+            self.console_level = CONSOLE_VERBOSITY[verbosity]
+        else:
+            self.logger.warning(f"Ignoring invalid consoleVerbosity: {verbosity}")
         self.logger.info(f"Launch request with args: {args}")
 
         # Get contract path
@@ -188,26 +351,68 @@ class DebugAdapter:
             return
 
         self.logger.info(f"Launching debugger for contract: {program}")
+        self._launch_time = time.perf_counter()
         self.log_to_console(f"Launching debugger for contract: {program}")
 
-        # Initialize Rust bridge
-        self.logger.info("Initializing Rust bridge...")
-        self.rust_bridge = RustBridge()
+        # Load line info from the unstripped contract ELF, if given
+        elf_path = args.get("elf")
+        if elf_path:
+            try:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self.source_mapper.load_debug_info, elf_path)
+                await self._resolve_pending_breakpoints()
+            except Exception as e:
+                self.logger.warning(f"Could not load debug info from {elf_path}: {e}")
+                self.log_to_console(f"Could not load debug info from {elf_path}: {e}", "WARNING")
+        else:
+            self.logger.warning("No 'elf' in launch arguments, source mapping disabled")
 
+        # Initialize Rust bridge; it initializes the sandbox with the program
+        # on every (re)connect, then _on_rust_connected installs breakpoints
+        sandbox = args.get("sandbox", {})
         try:
-            self.logger.info("Starting Rust bridge connection...")
-            await self.rust_bridge.start()
+            transport = transport_from_config(sandbox)
+        except ValueError as e:
+            self.logger.error(f"Invalid sandbox configuration: {e}")
+            self.protocol.send_response(request, success=False, message=str(e))
+            return
 
-            # Initialize with contract path
-            self.logger.info(f"Sending initialize to Rust with program: {program}")
-            result = await self.rust_bridge.call_method("initialize", {
-                "path": program
-            })
-            self.logger.info(f"Rust initialized successfully: {result}")
+        command = sandbox.get("command")
+        if not transport.reconnectable and not command:
+            # Nobody else can hand the sandbox our end of the pipes
+            message = f"Sandbox transport '{transport.name}' requires 'sandbox.command'"
+            self.logger.error(message)
+            self.protocol.send_response(request, success=False, message=message)
+            return
 
-        except Exception as e:
-            self.logger.warning(f"Rust bridge connection failed (continuing work): {e}")
-            # Don't interrupt DAP server work if Rust is unavailable
+        self.logger.info(f"Initializing Rust bridge over {transport}...")
+        self.program = program
+        self.rust_bridge = RustBridge(transport, initialize_params={"path": program})
+        self.rust_bridge.subscribe(self._on_rust_event)
+
+        if command:
+            env = dict(sandbox.get("env") or {})
+            env.update(trace_env(sandbox.get("trace") or {}))
+            try:
+                await self.rust_bridge.spawn(command, cwd=sandbox.get("cwd"), env=env)
+            except OSError as e:
+                self.logger.error(f"Could not start sandbox {command}: {e}")
+                self.protocol.send_response(request, success=False, message=f"Could not start sandbox: {e}")
+                return
+
+        self.logger.info("Starting Rust bridge connection...")
+        try:
+            started = await self.rust_bridge.start()
+        except ConnectionError as e:
+            # Only transports that cannot reconnect give up
+            self.logger.error(f"Could not connect to sandbox: {e}")
+            self.protocol.send_response(request, success=False, message=str(e))
+            await self.rust_bridge.shutdown()
+            self.rust_bridge = None
+            return
+        if not started:
+            # Don't interrupt DAP server work if Rust is unavailable yet
+            self.logger.warning("Rust bridge not connected yet, will keep retrying in the background")
 
         self.protocol.send_response(request)
         self.stop_on_entry = args.get("stopOnEntry", False)
@@ -215,47 +420,168 @@ class DebugAdapter:
         self.log_to_console("Launch completed")
 
     async def _handle_set_breakpoints(self, request: Dict[str, Any]):
-        """Handle 'setBreakpoints' request."""
+        """
+        Handle 'setBreakpoints' request.
+
+        VS Code always sends the complete list for a source, so the list is
+        diffed against the previous one and only added and removed
+        breakpoints are sent to Rust. Breakpoints keep their id for as long
+        as their requested line stays in the list.
+        """
         args = request.get("arguments", {})
         source = args.get("source", {})
         source_path = source.get("path", "")
-        breakpoints = args.get("breakpoints", [])
+        requested_lines = [bp.get("line") for bp in args.get("breakpoints", [])]
 
-        self.logger.info(f"Setting {len(breakpoints)} breakpoints in {source_path}")
-        for i, bp in enumerate(breakpoints):
-            self.logger.info(f"   Breakpoint {i+1}: line {bp.get('line')}")
+        self.logger.info(f"Setting {len(requested_lines)} breakpoints in {source_path}")
 
-        # Store breakpoints
-        self.breakpoints[source_path] = breakpoints
+        previous = self.breakpoints.get(source_path, {})
+        current = {}
+        added = []
+        for line in requested_lines:
+            if line in current:
+                continue
+            record = previous.get(line)
+            if record is None:
+                record = self._new_breakpoint(source_path, line)
+                added.append(record)
+            current[line] = record
+        removed = [record for line, record in previous.items() if line not in current]
 
-        # Send breakpoints to Rust (with fake addresses for now)
-        if self.rust_bridge:
-            addresses = [0x1000 * (i + 1) for i, bp in enumerate(breakpoints)]
-            self.logger.info(f"Sending breakpoints to Rust: {addresses}")
-            try:
-                result = await self.rust_bridge.call_method("setBreakpoints", {
-                    "addresses": addresses
-                })
-                self.logger.info(f"Rust accepted breakpoints: {result}")
-            except Exception as e:
-                self.logger.warning(f"Error sending breakpoints to Rust: {e}")
+        if current:
+            self.breakpoints[source_path] = current
         else:
-            self.logger.warning("Rust bridge not available, breakpoints stored locally only")
-
-        # Acknowledge all breakpoints as verified
-        verified_breakpoints = []
-        for i, bp in enumerate(breakpoints):
-            line = bp.get("line")
-            verified_breakpoints.append({
-                "id": i + 1,
-                "verified": True,
-                "line": line
+            self.breakpoints.pop(source_path, None)
+
+        self.logger.info(
+            f"Breakpoints in {source_path}: {len(added)} added, {len(removed)} removed, "
+            f"{len(current) - len(added)} unchanged"
+        )
+        await self._update_rust_breakpoints(added, removed)
+
+        self.protocol.send_response(request, body={
+            "breakpoints": [self._breakpoint_body(current[line]) for line in requested_lines]
+        })
+
+    def _new_breakpoint(self, source_path: str, line: int) -> Dict[str, Any]:
+        """Create a breakpoint record, resolving it now if debug info is loaded."""
+        record = {
+            "id": self._next_breakpoint_id(),
+            "source": source_path,
+            "requested_line": line,
+            "line": None,
+            "addresses": [],
+            "resolved": False,
+            "installed": False,
+        }
+        if self.source_mapper.is_loaded:
+            self._resolve_breakpoint(record)
+        return record
+
+    def _resolve_breakpoint(self, record: Dict[str, Any]):
+        """Bind a breakpoint record to code through the source mapper."""
+        line, addresses = self.source_mapper.resolve_breakpoint(record["source"], record["requested_line"])
+        record["line"] = line
+        record["addresses"] = addresses
+        record["resolved"] = True
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                "Breakpoint %s:%s -> line %s, %d address(es): %s", record["source"], record["requested_line"],
+                line, len(addresses), " ".join(map(hex, addresses))
+            )
+
+    def _breakpoint_body(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """DAP Breakpoint object for a breakpoint record."""
+        if not record["resolved"]:
+            return {
+                "id": record["id"],
+                "verified": False,
+                "line": record["requested_line"],
+                "message": "Waiting for contract debug info",
+            }
+        if not record["addresses"]:
+            return {
+                "id": record["id"],
+                "verified": False,
+                "line": record["requested_line"],
+                "message": "No code at this line",
+            }
+        return {"id": record["id"], "verified": True, "line": record["line"]}
+
+    async def _update_rust_breakpoints(self, added: List[Dict[str, Any]], removed: List[Dict[str, Any]]):
+        """Send breakpoint additions and removals to Rust."""
+        if not self.rust_bridge or not self.rust_bridge.is_connected:
+            self.logger.debug("Rust bridge not connected, breakpoints will be installed on connect")
+            return
+
+        removed_ids = [record["id"] for record in removed if record["installed"]]
+        to_add = [record for record in added if record["addresses"] and not record["installed"]]
+
+        try:
+            if removed_ids:
+                await self.rust_bridge.call_method("removeBreakpoints", {"ids": removed_ids})
+                self.logger.info(f"Removed {len(removed_ids)} breakpoints in Rust")
+            if to_add:
+                await self.rust_bridge.call_method("addBreakpoints", {
+                    "breakpoints": [
+                        {"id": record["id"], "source": record["source"], "addresses": record["addresses"]}
+                        for record in to_add
+                    ]
+                })
+                for record in to_add:
+                    record["installed"] = True
+                self.logger.info(f"Added {len(to_add)} breakpoints in Rust")
+        except Exception as e:
+            self.logger.warning(f"Error updating breakpoints in Rust: {e}")
+
+    async def _resolve_pending_breakpoints(self):
+        """Resolve breakpoints set before debug info was loaded and report the changes."""
+        pending = [
+            record for records in self.breakpoints.values()
+            for record in records.values() if not record["resolved"]
+        ]
+        if not pending:
+            return
+
+        for record in pending:
+            self._resolve_breakpoint(record)
+            self.protocol.send_event("breakpoint", {
+                "reason": "changed",
+                "breakpoint": self._breakpoint_body(record),
             })
+        self.logger.info(f"Resolved {len(pending)} pending breakpoints")
+
+        await self._update_rust_breakpoints(pending, [])
+
+    async def _install_breakpoints(self):
+        """Install every resolved breakpoint that Rust does not have yet."""
+        records = [record for records in self.breakpoints.values() for record in records.values()]
+        await self._update_rust_breakpoints(records, [])
+
+    async def _handle_breakpoint_locations(self, request: Dict[str, Any]):
+        """Handle 'breakpointLocations' request."""
+        args = request.get("arguments", {})
+        source_path = args.get("source", {}).get("path", "")
+        line = args.get("line", 1)
+        end_line = args.get("endLine", line)
+        column = args.get("column")
+        end_column = args.get("endColumn")
 
-        self.logger.info(f"Verified {len(verified_breakpoints)} breakpoints")
+        breakpoints = []
+        for mapped_line, mapped_column in self.source_mapper.breakpoint_locations(source_path, line, end_line):
+            if mapped_column is not None:
+                if column is not None and mapped_line == line and mapped_column < column:
+                    continue
+                if end_column is not None and mapped_line == end_line and mapped_column > end_column:
+                    continue
+            location = {"line": mapped_line}
+            if mapped_column is not None:
+                location["column"] = mapped_column
+            breakpoints.append(location)
 
+        self.logger.info(f"Breakpoint locations in {source_path}:{line}-{end_line}: {len(breakpoints)}")
         self.protocol.send_response(request, body={
-            "breakpoints": verified_breakpoints
+            "breakpoints": breakpoints
         })
 
     async def _handle_configuration_done(self, request: Dict[str, Any]):
@@ -277,7 +603,7 @@ class DebugAdapter:
 
     async def _handle_threads(self, request: Dict[str, Any]):
         """Handle 'threads' request."""
-        self.logger.info("Returning thread information")
+        self.logger.debug("Returning thread information")
         # Ink! contracts are single-threaded
         self.protocol.send_response(request, body={
             "threads": [
@@ -286,37 +612,181 @@ class DebugAdapter:
         })
 
     async def _handle_stack_trace(self, request: Dict[str, Any]):
-        """Handle 'stackTrace' request."""
+        """
+        Handle 'stackTrace' request.
+
+        Frames come from the shadow call stack, innermost first: the
+        stopped PC, then the call instruction of each caller. Each of
+        these expands into the functions inlined there, innermost first,
+        and the function they were inlined into. Only the frames of the
+        requested page (startFrame, levels) are mapped to names and lines.
+        """
         args = request.get("arguments", {})
         thread_id = args.get("threadId", 1)
-        self.logger.info(f"Getting stack trace for thread {thread_id}")
+        self.logger.debug("Getting stack trace for thread %s", thread_id)
 
-        # TODO: Get actual stack trace from Rust
-        self.logger.info("Returning empty stack trace (not implemented)")
+        pcs = [self.stopped_pc] + self._call_sites()[::-1] if self.stopped_pc is not None else []
+        depths = [max(self.source_mapper.scope_index.depth_at(pc), 1) for pc in pcs]
+        total = sum(depths)
+        start = max(args.get("startFrame") or 0, 0)
+        end = min(start + args["levels"], total) if args.get("levels") else total
+
+        frames = []
+        first = 0
+        for pc, depth in zip(pcs, depths):
+            if first >= end:
+                break
+            if first + depth > start:
+                inlined = self.source_mapper.frames_at(pc) or [None]
+                for i in range(max(start - first, 0), min(end - first, len(inlined))):
+                    frames.append(self._stack_frame(first + i, pc, inlined[i]))
+            first += depth
         self.protocol.send_response(request, body={
-            "stackFrames": [],
-            "totalFrames": 0
+            "stackFrames": frames,
+            "totalFrames": total
         })
 
+    def _call_sites(self) -> List[int]:
+        """Call sites of the step being shown, outermost first."""
+        if self.cursor is None:
+            return self.call_sites
+        sites = self.history.call_sites_at(self.cursor, self.call_sites, self.live_step)
+        return sites if sites is not None else []
+
+    def _stack_frame(self, index: int, pc: int, scope: Optional[ScopeFrame]) -> Dict[str, Any]:
+        """DAP StackFrame of the frame index levels above the innermost, executing at pc."""
+        frame = {
+            "id": index + 1,
+            "name": scope.name if scope is not None and scope.name else f"0x{pc:x}",
+            "line": 0,
+            "column": 0,
+            "instructionPointerReference": f"0x{pc:x}",
+        }
+        if scope is not None and scope.path is not None:
+            path = self.source_mapper.source_path(scope.path)
+            frame["source"] = {"name": path.replace("\\", "/").rsplit("/", 1)[-1], "path": path}
+            frame["line"] = scope.line
+            frame["column"] = scope.column or 1
+        return frame
+
     async def _handle_scopes(self, request: Dict[str, Any]):
         """Handle 'scopes' request."""
-        self.logger.info("Getting variable scopes")
+        self.logger.debug("Getting variable scopes")
+        scopes = []
+        if self._registers() is not None:
+            scopes.append({"name": "Registers", "variablesReference": REGISTERS_REFERENCE, "expensive": False})
         self.protocol.send_response(request, body={
-            "scopes": []
+            "scopes": scopes
         })
 
     async def _handle_variables(self, request: Dict[str, Any]):
         """Handle 'variables' request."""
-        self.logger.info("Getting variables")
+        self.logger.debug("Getting variables")
+        variables = []
+        registers = self._registers()
+        if request.get("arguments", {}).get("variablesReference") == REGISTERS_REFERENCE and registers:
+            from tracing.history import REGISTERS
+            variables = [
+                {"name": name, "value": f"0x{value:x}", "variablesReference": 0}
+                for name, value in zip(REGISTERS, registers)
+            ]
         self.protocol.send_response(request, body={
-            "variables": []
+            "variables": variables
         })
 
+    async def _handle_evaluate(self, request: Dict[str, Any]):
+        """
+        Handle 'evaluate' request: Debug Console commands.
+
+        gas [N]           the N (default 10) most expensive lines, functions
+                          and host calls of the run so far, or of the last
+                          recorded trace once the run has ended
+        gas json <path>   the whole gas report as JSON, written to path
+        """
+        args = request.get("arguments", {})
+        words = args.get("expression", "").split()
+        if args.get("context") != "repl" or not words or words[0] != "gas":
+            self.protocol.send_response(request, success=False,
+                                        message="Expressions are not supported, try 'gas' in the Debug Console")
+            return
+        try:
+            # The history changes on this thread: the executor only gets copies
+            trace_path = self.trace_path if self.stopped_pc is None else None
+            steps = self._recorded_steps() if not trace_path else None
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(None, self._gas_report, words[1:], trace_path, steps)
+        except Exception as e:
+            self.logger.warning(f"Gas report failed: {e}")
+            self.protocol.send_response(request, success=False, message=f"Gas report failed: {e}")
+            return
+        self.protocol.send_response(request, body={"result": result, "variablesReference": 0})
+
+    def _recorded_steps(self) -> Optional[tuple]:
+        """
+        Copies of the (pcs, gas, host call markers) of the history up to the
+        step being shown, None if there is no gas to report.
+        """
+        step = self._history_position()
+        if step is None:
+            return None
+        start = self.history.start
+        gas = self.history.gas(start, step + 1)
+        if gas is None:
+            return None
+        host_calls = self.history.host_calls(start, step + 1)
+        return (self.history.pcs(start, step + 1).copy(), gas.copy(),
+                None if host_calls is None else host_calls.copy())
+
+    def _gas_report(self, args: List[str], trace_path: Optional[str], steps: Optional[tuple]) -> str:
+        """
+        Run the 'gas' console command (see _handle_evaluate), off the event loop.
+
+        Args:
+            args: Words after 'gas'
+            trace_path: Trace file to report on once the run has ended
+            steps: Otherwise the history copied by _recorded_steps()
+        """
+        from tracing.gas_report import GasAttribution
+
+        if args and args[0] == "json" and len(args) != 2:
+            raise ValueError("usage: gas json <path>")
+        names = {int(id_): name for id_, name in (self.gas_info.get("hostCallNames") or {}).items()}
+        if trace_path:
+            attribution = GasAttribution.from_trace(trace_path, self.source_mapper)
+        elif steps is not None:
+            # Up to the step being shown, as far back as the history goes
+            attribution = GasAttribution(self.source_mapper, self.gas_info.get("refTimePerFuel"), names)
+            attribution.add_steps(*steps)
+            attribution.finish()
+        else:
+            raise ValueError("no gas recorded, enable sandbox.trace with gas")
+
+        if args and args[0] == "json":
+            with open(args[1], "w") as f:
+                json.dump(attribution.to_json(), f, indent=2)
+            return f"Gas report of {attribution.step_count} steps written to {args[1]}"
+        return attribution.format(int(args[0]) if args else 10)
+
+    def _registers(self) -> Optional[List[int]]:
+        """Registers at the step being shown, None if unknown."""
+        if self.cursor is not None:
+            return self.history.registers_at(self.cursor)
+        return self.live_registers if self.stopped_pc is not None else None
+
     async def _handle_continue(self, request: Dict[str, Any]):
         """Handle 'continue' request."""
         self.logger.info("Continue execution")
+        if self.cursor is not None:
+            # Replay up to the next breakpoint; past the last one, run live
+            step = self.history.find_forward(self.cursor, self._breakpoint_addresses())
+            if step is not None:
+                self.protocol.send_response(request, body={"allThreadsContinued": True})
+                self._show_step(step, "breakpoint")
+                return
+            self.cursor = None
         if self.rust_bridge:
             try:
+                self.stopped_pc = None
                 await self.rust_bridge.call_method("continue", {})
                 self.logger.info("Continue sent to Rust")
             except Exception as e:
@@ -331,6 +801,11 @@ class DebugAdapter:
     async def _handle_next(self, request: Dict[str, Any]):
         """Handle 'next' (step over) request."""
         self.logger.info("Step over")
+        if self.cursor is not None:
+            step = self._next_line_step()
+            self.protocol.send_response(request)
+            self._show_step(step, "step")
+            return
         if self.rust_bridge:
             try:
                 await self.rust_bridge.call_method("next", {})
@@ -342,6 +817,11 @@ class DebugAdapter:
     async def _handle_step_in(self, request: Dict[str, Any]):
         """Handle 'stepIn' request."""
         self.logger.info("Step in")
+        if self.cursor is not None:
+            step = self._next_line_step()
+            self.protocol.send_response(request)
+            self._show_step(step, "step")
+            return
         if self.rust_bridge:
             try:
                 await self.rust_bridge.call_method("stepIn", {})
@@ -353,6 +833,11 @@ class DebugAdapter:
     async def _handle_step_out(self, request: Dict[str, Any]):
         """Handle 'stepOut' request."""
         self.logger.info("Step out")
+        if self.cursor is not None:
+            step = self._next_line_step()
+            self.protocol.send_response(request)
+            self._show_step(step, "step")
+            return
         if self.rust_bridge:
             try:
                 await self.rust_bridge.call_method("stepOut", {})
@@ -361,6 +846,82 @@ class DebugAdapter:
                 self.logger.warning(f"Error sending step out to Rust: {e}")
         self.protocol.send_response(request)
 
+    def _history_position(self) -> Optional[int]:
+        """Step being shown if the history covers it, else None."""
+        step = self.cursor if self.cursor is not None else self.live_step
+        if self.history is None or step is None or step not in self.history:
+            return None
+        return step
+
+    async def _handle_step_back(self, request: Dict[str, Any]):
+        """Handle 'stepBack' request: go to the previous line in the execution history."""
+        self.logger.info("Step back")
+        step = self._history_position()
+        if step is None:
+            self.protocol.send_response(request, success=False,
+                                        message="No execution history, enable sandbox.trace to step back")
+            return
+        previous = self.history.step_back(self.source_mapper, step)
+        self.protocol.send_response(request)
+        if previous is None:
+            self._show_step(self.history.start, "entry")
+        else:
+            self._show_step(previous, "step")
+
+    async def _handle_reverse_continue(self, request: Dict[str, Any]):
+        """Handle 'reverseContinue' request: run backwards to the previous breakpoint hit."""
+        self.logger.info("Reverse continue")
+        step = self._history_position()
+        if step is None:
+            self.protocol.send_response(request, success=False,
+                                        message="No execution history, enable sandbox.trace to step back")
+            return
+        previous = self.history.find_back(step, self._breakpoint_addresses())
+        self.protocol.send_response(request)
+        if previous is None:
+            self._show_step(self.history.start, "entry")
+        else:
+            self._show_step(previous, "breakpoint")
+
+    def _next_line_step(self) -> int:
+        """Step of the next line in the history, the live step past its end."""
+        step = self.history.step_forward(self.source_mapper, self.cursor)
+        return self.live_step if step is None else step
+
+    def _breakpoint_addresses(self) -> Dict[int, List[int]]:
+        """Ids of the breakpoints at each address."""
+        addresses = {}
+        for records in self.breakpoints.values():
+            for record in records.values():
+                for address in record["addresses"]:
+                    addresses.setdefault(address, []).append(record["id"])
+        return addresses
+
+    def _show_step(self, step: int, reason: str):
+        """Report a stop at a history step; the live step leaves history mode."""
+        self.cursor = None if step == self.live_step else step
+        self.stopped_pc = self.history.pc_at(step)
+        hit = self._breakpoint_addresses().get(self.stopped_pc, []) if reason == "breakpoint" else []
+        self.logger.info(f"Showing step {step} at PC 0x{self.stopped_pc:x} ({reason})")
+        self._send_stopped(reason, hit)
+
+    def _send_stopped(self, reason: str, hit_breakpoint_ids: List[int]):
+        """Send a 'stopped' event for the current stopped_pc."""
+        body = {
+            "reason": reason,
+            "threadId": self.current_thread_id,
+            "allThreadsStopped": True,
+        }
+        if hit_breakpoint_ids:
+            body["hitBreakpointIds"] = hit_breakpoint_ids
+        if self.stopped_pc is not None:
+            location = self.source_mapper.address_to_line(self.stopped_pc)
+            if location:
+                body["description"] = f"Paused at {location[0]}:{location[1]}"
+            if self.cursor is not None:
+                body["description"] = f"{body.get('description', 'Paused')} (step {self.cursor}, history)"
+        self.protocol.send_event("stopped", body)
+
     async def _handle_pause(self, request: Dict[str, Any]):
         """Handle 'pause' request."""
         self.logger.info("Pause execution")
@@ -376,7 +937,7 @@ class DebugAdapter:
         """Handle 'terminate' request."""
         self.logger.info("Terminating debuggee...")
 
-        if self.rust_bridge:
+        if self.rust_bridge and self.rust_bridge.is_connected:
             try:
                 # Tell Rust to terminate the contract execution
                 await self.rust_bridge.call_method("terminate", {})
@@ -396,7 +957,8 @@ class DebugAdapter:
 
         if self.rust_bridge:
             try:
-                await self.rust_bridge.call_method("disconnect", {})
+                if self.rust_bridge.is_connected:
+                    await self.rust_bridge.call_method("disconnect", {})
                 await self.rust_bridge.shutdown()
                 self.logger.info("Disconnected from Rust")
             except Exception as e:
@@ -405,8 +967,83 @@ class DebugAdapter:
         self.protocol.send_response(request)
         self.stop()
 
+    async def _on_rust_connected(self):
+        """Set up a new sandbox connection, already initialized by the bridge: install breakpoints."""
+        try:
+            self.logger.info(f"Rust initialized successfully: {self.rust_bridge.server_info}")
+
+            # A restarted sandbox has none of our breakpoints
+            for records in self.breakpoints.values():
+                for record in records.values():
+                    record["installed"] = False
+            await self._install_breakpoints()
+
+        except Exception as e:
+            self.logger.warning(f"Error setting up Rust connection: {e}")
+
+    def _on_rust_event(self, method: str, params: Dict[str, Any]):
+        """Forward a notification pushed by the sandbox to VS Code."""
+        self.logger.info("Event from Rust: %s", method)
+
+        if method == "connected":
+            return self._on_rust_connected()
+
+        if method == "stopped":
+            if self._launch_time is not None:
+                elapsed = (time.perf_counter() - self._launch_time) * 1000
+                self._launch_time = None
+                self.logger.info(f"Launch to first stop: {elapsed:.1f} ms")
+                self.log_to_console(f"Launch to first stop: {elapsed:.1f} ms")
+            self.stopped_pc = params.get("pc")
+            self.live_step = params.get("step")
+            self.live_registers = params.get("registers")
+            self.cursor = None
+            calls = params.get("calls")
+            if calls:
+                del self.call_sites[max(len(self.call_sites) - calls.get("pop", 0), 0):]
+                self.call_sites.extend(calls.get("push", []))
+            if "refTimePerFuel" in params:
+                self.gas_info = params
+            self._send_stopped(params.get("reason", "breakpoint"), params.get("hitBreakpointIds") or [])
+
+        elif method == "history":
+            if self.history is None:
+                # NumPy is only loaded once a recording sandbox needs it
+                from tracing.history import ExecutionHistory
+                self.history = ExecutionHistory()
+            self.history.append(params, params.get("data", b""))
+
+        elif method == "output":
+            self.protocol.send_output(params.get("output", ""), category=params.get("category", "stdout"))
+
+        elif method == "trace":
+            self.trace_path = params.get("path")
+            self.gas_info = params
+            self.log_to_console(f"Execution trace of {params.get('records', 0)} steps written to {self.trace_path}")
+
+        elif method == "terminated":
+            self.stopped_pc = None
+            self.cursor = None
+            self.call_sites = []
+            self.protocol.send_event("terminated")
+
+        elif method == "breakpoint":
+            self.protocol.send_event("breakpoint", params)
+
+        else:
+            self.logger.debug(f"Ignoring unknown Rust event: {method}")
+
+    def _next_breakpoint_id(self) -> int:
+        """Get next DAP breakpoint id."""
+        breakpoint_id = self._breakpoint_id
+        self._breakpoint_id += 1
+        return breakpoint_id
+
     def stop(self):
         """Stop the debug adapter."""
         self.is_running = False
+        # The reader may be waiting for a message that never comes
+        if self._reader_task is not None and self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
         self.logger.info("Debug adapter stopped")
 
@@ -0,0 +1,79 @@
+"""
+Debug Console output coalescing
+Buffers output event text per category and sends it in batches
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+
+# How long text may wait in the buffer, in seconds
+FLUSH_INTERVAL = 0.02
+# Buffered characters of one category that force a flush
+FLUSH_SIZE = 16 * 1024
+
+
+class OutputAggregator:
+    """
+    Collects Debug Console text and emits one output event per category.
+
+    Text is flushed FLUSH_INTERVAL after the first pending write, as soon as
+    a category holds FLUSH_SIZE characters, or when flush() is called
+    (DAPProtocol does so before any other event, so output is never
+    reported after the 'stopped' or 'terminated' that follows it).
+    """
+
+    def __init__(self, emit: Callable[[str, str], None], interval: float = FLUSH_INTERVAL,
+                 max_size: int = FLUSH_SIZE):
+        """
+        Args:
+            emit: Called with (category, text) for each batch
+            interval: Longest time text is held back, in seconds
+            max_size: Buffered characters of one category that trigger a flush
+        """
+        self.logger = logging.getLogger("InkDebugAdapter.Output")
+        self._emit = emit
+        self._interval = interval
+        self._max_size = max_size
+        # Pending text by category, in the order the categories were first written
+        self._chunks: Dict[str, List[str]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def pending(self) -> bool:
+        """Whether any text is waiting to be sent."""
+        return bool(self._chunks)
+
+    def write(self, text: str, category: str = "console"):
+        """Buffer text for category; flushes at once without a running event loop."""
+        if not text:
+            return
+
+        self._chunks.setdefault(category, []).append(text)
+        size = self._sizes.get(category, 0) + len(text)
+        self._sizes[category] = size
+
+        if size >= self._max_size:
+            self.flush()
+        elif self._timer is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            self._timer = loop.call_later(self._interval, self.flush)
+
+    def flush(self):
+        """Send everything buffered, one event per category."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        chunks, self._chunks, self._sizes = self._chunks, {}, {}
+        for category, parts in chunks.items():
+            try:
+                self._emit(category, "".join(parts))
+            except Exception as e:
+                self.logger.error(f"Error sending {category} output: {e}")
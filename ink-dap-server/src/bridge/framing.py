@@ -0,0 +1,106 @@
+"""
+Sandbox message framing
+Newline-delimited JSON, or length-prefixed msgpack once initialize negotiates it
+"""
+
+import asyncio
+import base64
+import json
+import struct
+from typing import Any, List, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Same limit as ink-debug-rpc wire.rs
+MAX_FRAME = 64 * 1024 * 1024
+
+# msgpack frames start with the body length, big-endian
+FRAME_HEADER = struct.Struct(">I")
+
+
+class JsonFraming:
+    """
+    One JSON-RPC message or batch per line; the fallback every sandbox speaks.
+
+    Raw payloads arrive base64-encoded with "encoding": "base64" next to
+    "data" and are decoded to bytes, so callers see the same messages as
+    with msgpack.
+    """
+
+    name = "json"
+
+    def encode(self, message: Any) -> bytes:
+        return json.dumps(message).encode() + b"\n"
+
+    async def read(self, reader: asyncio.StreamReader) -> Optional[Any]:
+        """Next message, None at end of stream. Raises ValueError on bad input."""
+        while True:
+            line = await reader.readline()
+            if not line:
+                return None
+            if line.strip():
+                break
+        message = json.loads(line.decode())
+        for item in message if isinstance(message, list) else [message]:
+            _decode_payload(item)
+        return message
+
+
+class MsgpackFraming:
+    """4-byte length, then one msgpack-encoded message or batch; payloads are bin."""
+
+    name = "msgpack"
+
+    def encode(self, message: Any) -> bytes:
+        body = msgpack.packb(message, use_bin_type=True)
+        return FRAME_HEADER.pack(len(body)) + body
+
+    async def read(self, reader: asyncio.StreamReader) -> Optional[Any]:
+        """Next message, None at end of stream. Raises ValueError on bad input."""
+        try:
+            header = await reader.readexactly(FRAME_HEADER.size)
+        except asyncio.IncompleteReadError:
+            return None
+        (size,) = FRAME_HEADER.unpack(header)
+        if size > MAX_FRAME:
+            # The stream cannot be resynchronized after this
+            raise ConnectionError(f"Frame of {size} bytes from Rust")
+        body = await reader.readexactly(size)
+        return msgpack.unpackb(body, raw=False)
+
+
+FRAMINGS = {framing.name: framing for framing in (JsonFraming, MsgpackFraming)}
+
+
+def supported_framings() -> List[str]:
+    """Framings to offer in initialize, preferred first."""
+    if msgpack is None:
+        return [JsonFraming.name]
+    return [MsgpackFraming.name, JsonFraming.name]
+
+
+def framing_by_name(name: str):
+    """
+    Framing instance for a name picked by the sandbox.
+
+    Raises:
+        ValueError: Unknown or unavailable framing
+    """
+    if name not in supported_framings():
+        raise ValueError(f"Unsupported framing: {name}")
+    return FRAMINGS[name]()
+
+
+def _decode_payload(message: Any):
+    """Turn a base64 "data" attachment of a JSON message back into bytes."""
+    if not isinstance(message, dict):
+        return
+    for key in ("params", "result"):
+        payload = message.get(key)
+        if isinstance(payload, dict) and payload.get("encoding") == "base64":
+            payload["data"] = base64.b64decode(payload.get("data", ""))
+            del payload["encoding"]
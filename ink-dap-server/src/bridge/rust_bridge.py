@@ -1,86 +1,362 @@
 """
 Rust Bridge
 Provides communication with PolkaVM-based Rust debugger
-With automatic reconnection every 5 seconds
+With automatic reconnection and exponential backoff
+Each connection starts with initialize, which also negotiates the message framing
 """
 
 import subprocess
-import json
 import asyncio
 import logging
-from typing import Dict, Any, Optional
+import os
+import random
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple, Union
 from pathlib import Path
 
+from .framing import JsonFraming, framing_by_name, supported_framings
+from .transport import Transport, TcpTransport
+
+
+# Reconnect delays: the first retry comes after a few milliseconds, then
+# doubles up to the cap; each delay is jittered down by up to half
+INITIAL_BACKOFF = 0.005
+MAX_BACKOFF = 0.25
+
+# How long start() and calls wait for the connection to become ready
+READY_TIMEOUT = 10.0
+
+# Response budget per sandbox method, DEFAULT_TIMEOUT for the rest. Run
+# control must fail fast; inspecting state may legitimately take a while.
+# Keyed by the names the adapter and the helpers below send (checked by
+# test_method_timeouts.py)
+DEFAULT_TIMEOUT = 10.0
+METHOD_TIMEOUTS = {
+    "initialize": READY_TIMEOUT,
+    "continue": 5.0,
+    "pause": 5.0,
+    "next": 5.0,
+    "stepOver": 5.0,
+    "stepIn": 5.0,
+    "stepOut": 5.0,
+    "addBreakpoints": 5.0,
+    "removeBreakpoints": 5.0,
+    "setBreakpoint": 5.0,
+    "setBreakpoints": 5.0,
+    "terminate": 2.0,
+    "disconnect": 2.0,
+    "shutdown": 2.0,
+    "getState": 30.0,
+}
+
+# Notification telling the sandbox a request's answer is no longer wanted
+CANCEL_METHOD = "$/cancelRequest"
+
+# Receives (method, params) of every notification from Rust
+EventHandler = Callable[[str, Dict[str, Any]], Union[None, Awaitable[None]]]
+
+
+class RustError(RuntimeError):
+    """Error object returned by the Rust side for a call."""
+
+    def __init__(self, error: Dict[str, Any]):
+        self.code = error.get("code") if isinstance(error, dict) else None
+        self.error = error
+        super().__init__(error)
+
+
+class RustTimeout(RuntimeError):
+    """No response within the method's budget; the connection stays up."""
+
 
 class RustBridge:
     """Manages interaction with Rust process"""
 
-    def __init__(self):
+    def __init__(self, transport: Optional[Transport] = None, initialize_params: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            transport: How to reach the sandbox, TCP by default
+            initialize_params: Sent with the initialize call that opens every
+                connection, e.g. {"path": program}
+        """
         self.logger = logging.getLogger("InkDebugAdapter.RustBridge")
+        self.transport = transport
+        self.initialize_params = dict(initialize_params or {})
+        # Result of initialize on the current connection
+        self.server_info: Dict[str, Any] = {}
+        self.framing = JsonFraming()
         self.process = None
+        self._output_tasks = []
         self.request_id = 1
         self.pending_requests = {}
         self.reader = None
         self.writer = None
-        self.is_connected = False
         self.connection_task = None
+        # Reads the current connection; stopped by shutdown()
+        self.reader_task: Optional[asyncio.Task] = None
+        # Why the connection loop gave up, for transports that cannot reconnect
+        self.connection_error: Optional[ConnectionError] = None
         self.host = "localhost"
         self.port = 9229
-
-    async def start(self, host: str = "localhost", port: int = 9229):
-        """Connect to Rust server via TCP with automatic reconnection."""
+        self._event_handlers: List[EventHandler] = []
+        self._event_tasks = set()
+
+        # Exactly one of the two is set at any time
+        self.connected = asyncio.Event()
+        self.disconnected = asyncio.Event()
+        self.disconnected.set()
+
+    @property
+    def is_connected(self) -> bool:
+        return self.connected.is_set()
+
+    async def start(self, host: str = "localhost", port: int = 9229, timeout: float = READY_TIMEOUT) -> bool:
+        """
+        Connect to Rust server with automatic reconnection.
+
+        Args:
+            host, port: TCP address, used when no transport was given
+            timeout: How long to wait for the first connection
+
+        Returns:
+            True if connected within timeout; the bridge keeps trying in
+            the background either way
+
+        Raises:
+            ConnectionError: The transport cannot reconnect and its only
+                connection failed
+        """
+        if self.transport is None:
+            self.transport = TcpTransport(host, port)
         self.host = host
         self.port = port
-        self.logger.info(f"Initializing connection to Rust server {host}:{port}")
+        self.logger.info(f"Initializing connection to Rust server {self.transport}")
 
         # Start background reconnection task
         self.connection_task = asyncio.create_task(self._connection_loop())
 
-        # Wait for first connection maximum 10 seconds
-        for i in range(20):  # 20 attempts * 0.5 seconds = 10 seconds
-            if self.is_connected:
-                self.logger.info("Initial connection to Rust server successful!")
-                return
-            await asyncio.sleep(0.5)
+        if await self.wait_ready(timeout):
+            self.logger.info("Initial connection to Rust server successful!")
+            return True
 
         self.logger.warning("Rust server is currently unavailable")
+        return False
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until connected; returns False on timeout.
+
+        Raises:
+            ConnectionError: The connection loop gave up, see connection_error
+        """
+        if self.connected.is_set():
+            return True
+        if self.connection_error is not None:
+            raise self.connection_error
+        waiter = asyncio.ensure_future(self.connected.wait())
+        # The loop only ends for good when the connection cannot come back
+        watched = {waiter} if self.connection_task is None else {waiter, self.connection_task}
+        try:
+            await asyncio.wait(watched, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        if self.connected.is_set():
+            return True
+        if self.connection_error is not None:
+            raise self.connection_error
+        return False
+
+    async def spawn(self, command: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None):
+        """
+        Start the sandbox process, telling it which transport to serve.
+
+        Its stdout and stderr are forwarded as 'output' events.
+
+        Args:
+            command: Program and arguments, e.g. ["cargo", "test", "flip"]
+            cwd: Working directory
+            env: Extra environment variables
+        """
+        if self.transport is None:
+            self.transport = TcpTransport(self.host, self.port)
+
+        process_env = dict(os.environ)
+        process_env.update(env or {})
+        process_env.update(self.transport.sandbox_env())
+
+        self.logger.info(f"Spawning sandbox: {command} ({self.transport})")
+        self.process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=cwd,
+            env=process_env,
+            pass_fds=self.transport.pass_fds(),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        self.transport.spawned()
+
+        self._output_tasks = [
+            asyncio.create_task(self._forward_output(self.process.stdout, "stdout")),
+            asyncio.create_task(self._forward_output(self.process.stderr, "stderr")),
+        ]
+
+    async def _forward_output(self, stream: asyncio.StreamReader, category: str):
+        """Pass the sandbox's output lines on as 'output' events."""
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            self._dispatch_event("output", {
+                "category": category,
+                "output": line.decode(errors="replace")
+            })
 
     async def _connection_loop(self):
-        """Reconnection loop every 5 seconds."""
+        """Connect whenever disconnected, backing off exponentially between failures."""
+        delay = INITIAL_BACKOFF
+        attempts = 0
+        connected_once = False
         while True:
-            if not self.is_connected:
-                try:
-                    self.logger.info(f"Attempting to connect to Rust server {self.host}:{self.port}...")
-                    self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
-
-                    # Start reading responses
-                    asyncio.create_task(self._read_responses())
-
-                    self.is_connected = True
-                    self.logger.info("Successfully connected to Rust server!")
-
-                except Exception as e:
-                    self.logger.warning(f"Failed to connect to Rust server: {e}")
-                    self.is_connected = False
-                    self.reader = None
-                    self.writer = None
-
-            # Wait 5 seconds before next attempt
-            await asyncio.sleep(5.0)
-
-    async def call_method(self, method: str, params: Dict[str, Any]) -> Any:
-        """Call method in Rust."""
-        if not self.is_connected or not self.writer:
-            self.logger.warning(f"Rust server unavailable for method '{method}', returning stub")
-            # Return stubs for different methods
-            if method == "initialize":
-                return {"status": "ok", "message": "Simulated response - Rust server not available"}
-            elif method == "setBreakpoints":
-                return {"breakpoints": [{"id": 1, "verified": True}]}
-            else:
-                return {"status": "pending", "message": f"Method '{method}' queued until Rust server is available"}
+            await self.disconnected.wait()
+            if connected_once and not self.transport.reconnectable:
+                self.logger.warning(f"Connection over {self.transport} cannot be re-established")
+                self.connection_error = ConnectionError(f"Connection over {self.transport} lost")
+                return
+            try:
+                reader, writer = await self.transport.connect()
+            except OSError as e:
+                if not self.transport.reconnectable:
+                    self._give_up(e)
+                    return
+                attempts += 1
+                # Retries come fast at first; only the first failure is worth a warning
+                log = self.logger.warning if attempts == 1 else self.logger.debug
+                log(f"Failed to connect to Rust server {self.transport}: {e}")
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, MAX_BACKOFF)
+                continue
 
+            try:
+                framing, self.server_info = await self._handshake(reader, writer)
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                self.logger.warning(f"Initialize failed on {self.transport}: {e}")
+                writer.close()
+                if not self.transport.reconnectable:
+                    self._give_up(e)
+                    return
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, MAX_BACKOFF)
+                continue
+
+            self.reader, self.writer = reader, writer
+            self.framing = framing
+            self.reader_task = asyncio.create_task(self._read_responses(reader, writer, framing))
+            self.disconnected.clear()
+            self.connected.set()
+            connected_once = True
+            self.logger.info(
+                f"Successfully connected to Rust server after {attempts + 1} attempt(s), "
+                f"{framing.name} framing"
+            )
+            delay = INITIAL_BACKOFF
+            attempts = 0
+
+            # Let subscribers set the new connection up (sandbox state does
+            # not survive a sandbox restart)
+            self._dispatch_event("connected", {})
+
+    def _give_up(self, error: Exception):
+        """End the connection loop of a transport that cannot reconnect after a failed attempt."""
+        self.logger.error(f"Connection over {self.transport} failed and cannot be retried: {error}")
+        # The loop returns next, which wakes wait_ready(): start() and
+        # waiting calls raise this at once instead of timing out
+        self.connection_error = ConnectionError(f"Could not connect over {self.transport}: {error}")
+
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Initialize a fresh connection and agree on its framing.
+
+        Nothing else is sent until the response arrives, since the sandbox
+        switches framing right after answering.
+
+        Returns:
+            (framing, initialize result)
+        """
+        framing = JsonFraming()
         request_id = self._next_id()
+        params = dict(self.initialize_params, framing=supported_framings())
+        writer.write(framing.encode({
+            "jsonrpc": "2.0",
+            "method": "initialize",
+            "params": params,
+            "id": request_id
+        }))
+        await writer.drain()
+
+        while True:
+            message = await asyncio.wait_for(framing.read(reader), READY_TIMEOUT)
+            if message is None:
+                raise ConnectionError("Rust server closed connection during initialize")
+            if isinstance(message, dict) and message.get("id") == request_id:
+                break
+            # Notifications pushed before our response
+            self._dispatch_message(message)
+
+        if "error" in message:
+            # Still usable, just without anything initialize sets up
+            self.logger.warning(f"Rust initialize failed: {message['error']}")
+            return framing, {}
+        result = message.get("result") or {}
+        # Sandboxes that predate framing negotiation do not answer it
+        return framing_by_name(result.get("framing", JsonFraming.name)), result
+
+    def _mark_disconnected(self, writer: Optional[asyncio.StreamWriter] = None):
+        """
+        Drop the current connection and wake the reconnection loop.
+
+        Args:
+            writer: Only drop the connection if it is still this one
+        """
+        if writer is not None and writer is not self.writer:
+            return
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+        self.connected.clear()
+        self.disconnected.set()
+        self._fail_pending(ConnectionError("Connection to Rust server lost"))
+
+    async def _ensure_connected(self, what: str):
+        """Wait for the connection before sending a call."""
+        if self.is_connected:
+            return
+        if self.connection_task is None:
+            raise ConnectionError(f"Rust bridge not started, cannot call {what}")
+        self.logger.debug(f"Waiting for Rust server before calling {what}")
+        if not await self.wait_ready(READY_TIMEOUT):
+            raise ConnectionError(f"Rust server unavailable for {what}")
+
+    async def call_method(self, method: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """
+        Call method in Rust.
+
+        Any number of calls may be in flight at once; responses are matched
+        to callers by request id. A call that times out or whose caller is
+        cancelled is cancelled in the sandbox too.
+
+        Args:
+            timeout: Seconds to wait for the response, METHOD_TIMEOUTS by default
+
+        Raises:
+            RustError: The sandbox answered with an error
+            RustTimeout: No answer in time
+            ConnectionError: The connection failed
+        """
+        await self._ensure_connected(method)
+        writer = self.writer
+
+        request_id, future = self._new_request()
         request = {
             "jsonrpc": "2.0",
             "method": method,
@@ -89,65 +365,234 @@ class RustBridge:
         }
 
         try:
-            # Send request
-            request_json = json.dumps(request) + "\n"
-            self.writer.write(request_json.encode())
-            await self.writer.drain()
-
-            self.logger.debug(f"Sent request: {request}")
-
-            # Wait for response
-            future = asyncio.Future()
-            self.pending_requests[request_id] = future
+            await self._send(request)
+            self.logger.debug("Sent request: %s", request)
 
             try:
-                response = await asyncio.wait_for(future, timeout=10.0)
-                return response
+                return await asyncio.wait_for(future, timeout=self._timeout_for([method], timeout))
             except asyncio.TimeoutError:
-                del self.pending_requests[request_id]
                 self.logger.warning(f"Timeout waiting for response to {method}")
-                # Consider connection broken
-                self.is_connected = False
-                raise RuntimeError(f"Timeout waiting for response to {method}")
+                self._cancel_remote([request_id], writer)
+                raise RustTimeout(f"Timeout waiting for response to {method}")
+
+        except asyncio.CancelledError:
+            self.logger.debug(f"Call to {method} cancelled")
+            self._cancel_remote([request_id], writer)
+            raise
+
+        except (RustError, RustTimeout) as e:
+            self.logger.error(f"Error calling {method}: {e}")
+            raise
 
         except Exception as e:
             self.logger.error(f"Error calling {method}: {e}")
             # Consider connection broken
-            self.is_connected = False
-            self.reader = None
-            self.writer = None
+            self._mark_disconnected(writer)
             raise
 
-    async def _read_responses(self):
-        """Read responses from Rust process."""
+        finally:
+            # Nothing may wait for this id any more, whatever happened
+            self.pending_requests.pop(request_id, None)
+
+    async def call_batch(
+        self,
+        calls: List[Tuple[str, Dict[str, Any]]],
+        return_exceptions: bool = False,
+        timeout: Optional[float] = None
+    ) -> List[Any]:
+        """
+        Call several methods in Rust with one JSON-RPC batch.
+
+        Args:
+            calls: (method, params) pairs
+            return_exceptions: Put failed calls' exceptions in the result
+                list instead of raising the first one, as asyncio.gather
+            timeout: Seconds to wait for all responses, by default the
+                largest budget of the methods in METHOD_TIMEOUTS
+
+        Returns:
+            Results in the order of calls
+        """
+        if not calls:
+            return []
+
+        methods = ", ".join(method for method, _ in calls)
+        await self._ensure_connected(methods)
+        writer = self.writer
+
+        batch = []
+        futures = []
+        for method, params in calls:
+            request_id, future = self._new_request()
+            batch.append({
+                "jsonrpc": "2.0",
+                "method": method,
+                "params": params,
+                "id": request_id
+            })
+            futures.append(future)
+
+        def unanswered() -> List[int]:
+            # Responses remove their id; cancelling gather marks every future done
+            return [request["id"] for request in batch if request["id"] in self.pending_requests]
+
         try:
-            while self.reader and self.is_connected:
-                try:
-                    line = await self.reader.readline()
-                    if not line:
-                        self.logger.warning("Rust server closed connection")
-                        break
+            await self._send(batch)
+            self.logger.debug("Sent batch: %s", batch)
 
-                    response = json.loads(line.decode())
-                    self.logger.debug(f"Received response: {response}")
+            try:
+                return await asyncio.wait_for(
+                    asyncio.gather(*futures, return_exceptions=return_exceptions),
+                    timeout=self._timeout_for([method for method, _ in calls], timeout)
+                )
+            except asyncio.TimeoutError:
+                self.logger.warning(f"Timeout waiting for batch response to {methods}")
+                self._cancel_remote(unanswered(), writer)
+                raise RustTimeout(f"Timeout waiting for batch response to {methods}")
+
+        except asyncio.CancelledError:
+            self.logger.debug(f"Batch {methods} cancelled")
+            self._cancel_remote(unanswered(), writer)
+            raise
 
-                    # Handle request responses
-                    request_id = response.get("id")
-                    if request_id and request_id in self.pending_requests:
-                        future = self.pending_requests.pop(request_id)
+        except (RustError, RustTimeout) as e:
+            self.logger.error(f"Error calling batch {methods}: {e}")
+            raise
+
+        except Exception as e:
+            self.logger.error(f"Error calling batch {methods}: {e}")
+            # Consider connection broken
+            self._mark_disconnected(writer)
+            raise
 
-                        if "error" in response:
-                            future.set_exception(RuntimeError(response["error"]))
-                        else:
-                            future.set_result(response.get("result"))
+        finally:
+            for request in batch:
+                self.pending_requests.pop(request["id"], None)
+
+    @staticmethod
+    def _timeout_for(methods: List[str], timeout: Optional[float]) -> float:
+        """Explicit timeout, else the largest budget among the methods."""
+        if timeout is not None:
+            return timeout
+        return max(METHOD_TIMEOUTS.get(method, DEFAULT_TIMEOUT) for method in methods)
+
+    def _cancel_remote(self, request_ids: List[int], writer: Optional[asyncio.StreamWriter]):
+        """
+        Tell the sandbox not to bother answering these requests.
+
+        Best effort and without waiting: it runs from cancelled tasks, and
+        a response that arrives anyway is dropped by _dispatch_response.
+        """
+        if not request_ids or writer is None or writer is not self.writer or writer.is_closing():
+            return
+        for request_id in request_ids:
+            writer.write(self.framing.encode({
+                "jsonrpc": "2.0",
+                "method": CANCEL_METHOD,
+                "params": {"id": request_id}
+            }))
+
+    def _new_request(self) -> Tuple[int, asyncio.Future]:
+        """
+        Allocate a request id and register its future.
+
+        The future is registered before the request is written, so a
+        response arriving while the write is still draining is not lost.
+        """
+        request_id = self._next_id()
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[request_id] = future
+        return request_id, future
+
+    async def _send(self, payload: Any):
+        """Write one JSON-RPC message (request or batch) in the connection's framing."""
+        self.writer.write(self.framing.encode(payload))
+        await self.writer.drain()
+
+    def _dispatch_response(self, response: Dict[str, Any]):
+        """Resolve the pending request a single JSON-RPC response belongs to."""
+        request_id = response.get("id")
+        future = self.pending_requests.pop(request_id, None) if request_id is not None else None
+        if future is not None:
+            if future.done():
+                return
+            if "error" in response:
+                future.set_exception(RustError(response["error"]))
+            else:
+                future.set_result(response.get("result"))
+
+        # Handle events (notifications without id)
+        elif "method" in response and "id" not in response:
+            self.logger.debug("Received event from Rust: %s", response)
+            # Queued behind the wake-ups of callers whose responses came
+            # first, so e.g. a continue is answered before the next stop
+            asyncio.get_running_loop().call_soon(
+                self._dispatch_event, response["method"], response.get("params") or {}
+            )
+
+        elif isinstance(request_id, int) and request_id < self.request_id:
+            # Answer to a call that timed out or was cancelled meanwhile
+            self.logger.debug("Dropping late response to request %s", request_id)
+
+        else:
+            self.logger.warning(f"Unmatched response from Rust: {response}")
+
+    def subscribe(self, handler: EventHandler) -> Callable[[], None]:
+        """
+        Receive notifications pushed by Rust (stopped, output, terminated, ...).
+
+        The handler is called on the event loop as soon as the notification
+        arrives; if it returns an awaitable, that is run as a task so the
+        reader is never blocked.
+
+        Returns:
+            Function that removes the subscription
+        """
+        self._event_handlers.append(handler)
+
+        def unsubscribe():
+            if handler in self._event_handlers:
+                self._event_handlers.remove(handler)
+
+        return unsubscribe
+
+    def _dispatch_event(self, method: str, params: Dict[str, Any]):
+        """Hand one notification to every subscriber."""
+        for handler in list(self._event_handlers):
+            try:
+                result = handler(method, params)
+                if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+                    task = asyncio.ensure_future(result)
+                    # Keep a reference until done, the loop only holds weak ones
+                    self._event_tasks.add(task)
+                    task.add_done_callback(self._event_tasks.discard)
+            except Exception as e:
+                self.logger.error(f"Error in handler for Rust event '{method}': {e}", exc_info=True)
+
+    def _dispatch_message(self, message: Any):
+        """Dispatch one decoded message: a response, a notification or a batch of responses."""
+        if isinstance(message, list):
+            for item in message:
+                if isinstance(item, dict):
+                    self._dispatch_response(item)
+        elif isinstance(message, dict):
+            self._dispatch_response(message)
+
+    async def _read_responses(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, framing):
+        """Read responses from Rust process on one connection."""
+        try:
+            while True:
+                try:
+                    response = await framing.read(reader)
+                    if response is None:
+                        self.logger.warning("Rust server closed connection")
+                        break
 
-                    # Handle events (notifications without id)
-                    elif "method" in response and "id" not in response:
-                        self.logger.info(f"Received event from Rust: {response}")
-                        # TODO: Forward event to DAP adapter
+                    self.logger.debug("Received response: %s", response)
+                    self._dispatch_message(response)
 
-                except json.JSONDecodeError as e:
-                    self.logger.error(f"JSON parsing error from Rust: {e}")
+                except ValueError as e:
+                    self.logger.error(f"{framing.name} parsing error from Rust: {e}")
                     continue
                 except Exception as e:
                     self.logger.error(f"Error reading response: {e}")
@@ -156,11 +601,17 @@ class RustBridge:
         except Exception as e:
             self.logger.error(f"Critical error in _read_responses: {e}")
         finally:
-            # Connection lost
-            self.is_connected = False
-            self.reader = None
-            self.writer = None
-            self.logger.warning("Connection to Rust server lost")
+            # Connection lost; a newer connection may already have replaced it
+            if writer is self.writer:
+                self.logger.warning("Connection to Rust server lost")
+                self._mark_disconnected(writer)
+
+    def _fail_pending(self, error: Exception):
+        """Fail every in-flight request, e.g. when the connection drops."""
+        pending, self.pending_requests = self.pending_requests, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
 
     async def set_breakpoint(self, address: int) -> bool:
         """Set breakpoint at specified address."""
@@ -219,10 +670,36 @@ class RustBridge:
             except Exception as e:
                 self.logger.error(f"Error during shutdown: {e}")
 
-        self.is_connected = False
-        if self.writer:
-            self.writer.close()
-            await self.writer.wait_closed()
+        writer = self.writer
+        self._mark_disconnected()
+        if writer:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+        reader_task, self.reader_task = self.reader_task, None
+        if reader_task is not None:
+            reader_task.cancel()
+            try:
+                await reader_task
+            except asyncio.CancelledError:
+                pass
+
+        if self.transport:
+            self.transport.close()
+
+        # Stop a sandbox we spawned
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout=5.0)
+            except asyncio.TimeoutError:
+                self.logger.warning("Sandbox did not exit, killing it")
+                self.process.kill()
+                await self.process.wait()
+        for task in self._output_tasks:
+            task.cancel()
 
     def _next_id(self) -> int:
         """Get next request ID"""
@@ -0,0 +1,195 @@
+"""
+Sandbox transports
+How RustBridge reaches the sandbox: TCP, Unix domain socket or an inherited pipe pair
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from typing import Any, Dict, Tuple
+
+
+# Environment variables read by the sandbox (ink-debug-rpc transport.rs)
+TRANSPORT_ENV = "INK_DEBUG_RPC_TRANSPORT"
+HOST_ENV = "INK_DEBUG_RPC_HOST"
+PORT_ENV = "INK_DEBUG_RPC_PORT"
+SOCKET_ENV = "INK_DEBUG_RPC_SOCKET"
+FDS_ENV = "INK_DEBUG_RPC_FDS"
+
+DEFAULT_HOST = "localhost"
+DEFAULT_PORT = 9229
+
+# Largest single response line; batches and variable dumps can be big.
+# The sandbox splits history notifications to stay under it
+# (MAX_PENDING_BYTES in ink-debug-rpc history.rs)
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class Transport:
+    """A way to open a stream connection to the sandbox."""
+
+    name = ""
+    # Whether connect() may be called again once the connection is lost
+    reconnectable = True
+
+    async def connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        raise NotImplementedError
+
+    def sandbox_env(self) -> Dict[str, str]:
+        """Environment telling a spawned sandbox to serve this transport."""
+        return {TRANSPORT_ENV: self.name}
+
+    def pass_fds(self) -> Tuple[int, ...]:
+        """File descriptors a spawned sandbox must inherit."""
+        return ()
+
+    def spawned(self):
+        """Called once the sandbox has been spawned with pass_fds()."""
+
+    def close(self):
+        """Release anything the transport still holds."""
+
+
+class TcpTransport(Transport):
+    """TCP connection, the default."""
+
+    name = "tcp"
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.host = host
+        self.port = port
+
+    async def connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.open_connection(self.host, self.port, limit=STREAM_LIMIT)
+
+    def sandbox_env(self) -> Dict[str, str]:
+        env = super().sandbox_env()
+        # The sandbox binds an address, not a name
+        env[HOST_ENV] = "127.0.0.1" if self.host == "localhost" else self.host
+        env[PORT_ENV] = str(self.port)
+        return env
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+class UnixTransport(Transport):
+    """Unix domain socket; avoids loopback TCP and port clashes between sessions."""
+
+    name = "unix"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.open_unix_connection(self.path, limit=STREAM_LIMIT)
+
+    def sandbox_env(self) -> Dict[str, str]:
+        env = super().sandbox_env()
+        env[SOCKET_ENV] = self.path
+        return env
+
+    def __str__(self) -> str:
+        return f"unix:{self.path}"
+
+
+class PipeTransport(Transport):
+    """
+    Pipe pair created before the sandbox is spawned and inherited by it.
+
+    There is exactly one connection: once either end closes it cannot be
+    re-established, so the sandbox must be spawned through RustBridge.
+    The sandbox serves every contract call it runs on this connection, so
+    the handshake and breakpoints of the first call stay in effect.
+    """
+
+    name = "pipe"
+    reconnectable = False
+
+    def __init__(self):
+        # (read end, write end) of each direction
+        self._to_sandbox = os.pipe()
+        self._from_sandbox = os.pipe()
+        self._connected = False
+
+    async def connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if self._connected:
+            raise ConnectionError("Sandbox pipe already used")
+        self._connected = True
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=STREAM_LIMIT)
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            open(self._from_sandbox[0], 'rb', buffering=0)
+        )
+        # StreamReaderProtocol rather than FlowControlMixin, so that
+        # StreamWriter.wait_closed() works on the write end too
+        transport, protocol = await loop.connect_write_pipe(
+            lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()),
+            open(self._to_sandbox[1], 'wb', buffering=0)
+        )
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        return reader, writer
+
+    def sandbox_env(self) -> Dict[str, str]:
+        env = super().sandbox_env()
+        env[FDS_ENV] = f"{self._to_sandbox[0]},{self._from_sandbox[1]}"
+        return env
+
+    def pass_fds(self) -> Tuple[int, ...]:
+        return (self._to_sandbox[0], self._from_sandbox[1])
+
+    def spawned(self):
+        # Only the sandbox keeps its ends open, so we see EOF when it exits
+        self._close_fds(self.pass_fds())
+
+    def close(self):
+        self._close_fds(self.pass_fds())
+        if not self._connected:
+            self._close_fds((self._from_sandbox[0], self._to_sandbox[1]))
+
+    @staticmethod
+    def _close_fds(fds: Tuple[int, ...]):
+        for fd in fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __str__(self) -> str:
+        return "inherited pipe pair"
+
+
+def default_socket_path() -> str:
+    """Per-adapter socket path, so concurrent sessions never collide."""
+    return os.path.join(tempfile.gettempdir(), f"ink-debug-{os.getpid()}.sock")
+
+
+def transport_from_config(config: Dict[str, Any]) -> Transport:
+    """
+    Build the transport selected in launch.json.
+
+    Args:
+        config: The launch configuration's "sandbox" object, e.g.
+            {"transport": "unix", "socket": "/tmp/ink.sock"}
+
+    Returns:
+        Transport instance
+
+    Raises:
+        ValueError: Unknown or unsupported transport
+    """
+    kind = config.get("transport", "tcp")
+    if kind == "tcp":
+        return TcpTransport(config.get("host", DEFAULT_HOST), int(config.get("port", DEFAULT_PORT)))
+
+    if kind in ("unix", "pipe") and sys.platform == "win32":
+        raise ValueError(f"Sandbox transport '{kind}' is not supported on Windows")
+    if kind == "unix":
+        return UnixTransport(config.get("socket") or default_socket_path())
+    if kind == "pipe":
+        return PipeTransport()
+
+    raise ValueError(f"Unknown sandbox transport: {kind}")
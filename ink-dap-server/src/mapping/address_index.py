@@ -0,0 +1,148 @@
+"""
+Address to line index
+Answers "which line table row covers this PC" with a binary search
+"""
+
+from array import array
+from bisect import bisect_right
+from typing import Iterable, List, Optional, Tuple
+
+from .line_table import FLAG_END_SEQUENCE, LineTable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# File index stored for address ranges not covered by any sequence
+NO_FILE = -1
+
+
+class AddressIndex:
+    """
+    Sorted row-start addresses with parallel file/line arrays.
+
+    Entry i covers [starts[i], starts[i + 1]). Entries created from
+    end_sequence rows carry NO_FILE and mark the gaps between sequences.
+    When several rows share an address, the last one in program order
+    wins, matching how debuggers attribute a PC to a line.
+    """
+
+    def __init__(self, table: LineTable):
+        self.file_names = table.file_names
+        # Added to every index address; see SourceMapper.apply_address_offset
+        self.offset = 0
+        # NumPy copies of starts/files, built on first find_many()
+        self._np_arrays = None
+
+        if np is not None and len(table):
+            self._build_numpy(table)
+        else:
+            self._build(table)
+
+    def _build(self, table: LineTable):
+        addresses = table.addresses
+        file_indexes = table.file_indexes
+        flags = table.flags
+
+        # End markers sort before real rows at the same address, so a
+        # sequence starting where another ends takes precedence
+        keys = [
+            address * 2 + (not flag & FLAG_END_SEQUENCE)
+            for address, flag in zip(addresses, flags)
+        ]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+
+        typecode = 'I' if not len(table) or max(addresses) < 1 << 32 else 'Q'
+        self.starts = array(typecode)
+        self.files = array('i')
+        self.lines = array('I')
+
+        starts, files, lines = self.starts, self.files, self.lines
+        for i in order:
+            address = addresses[i]
+            if flags[i] & FLAG_END_SEQUENCE:
+                file_index, line = NO_FILE, 0
+            else:
+                file_index, line = file_indexes[i], table.lines[i]
+
+            if starts and starts[-1] == address:
+                files[-1] = file_index
+                lines[-1] = line
+            else:
+                starts.append(address)
+                files.append(file_index)
+                lines.append(line)
+
+    def _build_numpy(self, table: LineTable):
+        """Same as _build(), with the sort and de-duplication done in NumPy."""
+        addresses = np.asarray(table.addresses, dtype=np.uint64)
+        real = (np.asarray(table.flags, dtype=np.uint8) & FLAG_END_SEQUENCE) == 0
+
+        # lexsort is stable, so equal addresses keep program order
+        order = np.lexsort((real, addresses))
+        sorted_addresses = addresses[order]
+        last_of_run = np.ones(len(order), dtype=bool)
+        last_of_run[:-1] = sorted_addresses[:-1] != sorted_addresses[1:]
+
+        chosen = order[last_of_run]
+        chosen_real = real[chosen]
+        starts = sorted_addresses[last_of_run]
+        files = np.where(chosen_real, np.asarray(table.file_indexes, dtype=np.int64)[chosen], NO_FILE)
+        lines = np.where(chosen_real, np.asarray(table.lines, dtype=np.int64)[chosen], 0)
+
+        typecode = 'I' if starts[-1] < 1 << 32 else 'Q'
+        self.starts = array(typecode, starts.astype(np.uint32 if typecode == 'I' else np.uint64).tobytes())
+        self.files = array('i', files.astype(np.int32).tobytes())
+        self.lines = array('I', lines.astype(np.uint32).tobytes())
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def find(self, pc: int) -> int:
+        """Index of the entry covering pc, or -1."""
+        i = bisect_right(self.starts, pc - self.offset) - 1
+        if i < 0 or self.files[i] == NO_FILE:
+            return -1
+        return i
+
+    def lookup(self, pc: int) -> Optional[Tuple[str, int]]:
+        """Source (file path, line) covering pc, or None."""
+        i = self.find(pc)
+        if i < 0:
+            return None
+        return self.file_names[self.files[i]], self.lines[i]
+
+    def find_many(self, pcs):
+        """
+        Vectorized find() over a stream of PCs.
+
+        With NumPy available this is a single searchsorted pass and
+        returns an int64 ndarray; otherwise it returns an array('q').
+        """
+        if np is not None:
+            if self._np_arrays is None:
+                self._np_arrays = (
+                    np.asarray(self.starts, dtype=np.int64),
+                    np.frombuffer(self.files, dtype=np.int32),
+                )
+            starts, files = self._np_arrays
+            pcs = np.asarray(pcs, dtype=np.int64) - self.offset
+            indexes = np.searchsorted(starts, pcs, side='right').astype(np.int64) - 1
+            valid = indexes >= 0
+            valid[valid] = files[indexes[valid]] != NO_FILE
+            indexes[~valid] = -1
+            return indexes
+
+        return array('q', (self.find(pc) for pc in pcs))
+
+    def lookup_many(self, pcs: Iterable[int]) -> List[Optional[Tuple[str, int]]]:
+        """lookup() for every PC in a stream."""
+        names = self.file_names
+        files = self.files
+        lines = self.lines
+        return [
+            (names[files[i]], lines[i]) if i >= 0 else None
+            for i in self.find_many(pcs).tolist()
+        ]
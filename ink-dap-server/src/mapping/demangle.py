@@ -0,0 +1,82 @@
+"""
+Rust symbol demangling
+Turns legacy-mangled Rust symbols (_ZN...E) back into paths, memoized
+"""
+
+import re
+from functools import lru_cache
+
+
+# Escapes of the legacy mangling inside path components
+_ESCAPES = {
+    "SP": "@",
+    "BP": "*",
+    "RF": "&",
+    "LT": "<",
+    "GT": ">",
+    "LP": "(",
+    "RP": ")",
+    "C": ",",
+}
+
+_ESCAPE = re.compile(r"\$([A-Z]{1,2}|u[0-9a-f]{2,6})\$")
+_HASH = re.compile(r"h[0-9a-f]{16}")
+
+
+@lru_cache(maxsize=None)
+def demangle(symbol: str) -> str:
+    """
+    Demangle a legacy Rust symbol, dropping its hash.
+
+    Args:
+        symbol: Symbol name as stored in the ELF or in DWARF
+
+    Returns:
+        The path (e.g. "flipper::Flipper::flip"), or symbol unchanged if
+        it is not a legacy Rust symbol (v0 "_R" symbols included)
+    """
+    name = symbol.split(".llvm.", 1)[0]
+    if name.startswith("__ZN"):
+        name = name[1:]
+    if name.startswith("_ZN"):
+        pos = 3
+    elif name.startswith("ZN"):
+        pos = 2
+    else:
+        return symbol
+
+    components = []
+    while pos < len(name) and name[pos] != "E":
+        digits = pos
+        while pos < len(name) and name[pos].isdigit():
+            pos += 1
+        if pos == digits:
+            return symbol
+        length = int(name[digits:pos])
+        if length == 0 or pos + length > len(name):
+            return symbol
+        components.append(name[pos:pos + length])
+        pos += length
+    # After the terminator only a ".suffix" may follow; anything else
+    # is a C++ signature, not Rust
+    if pos >= len(name) or not components or name[pos + 1:pos + 2] not in ("", "."):
+        return symbol
+
+    if len(components) > 1 and _HASH.fullmatch(components[-1]):
+        components.pop()
+    return "::".join(_unescape(component) for component in components)
+
+
+def _unescape(component: str) -> str:
+    if component.startswith("_$"):
+        component = component[1:]
+
+    def escape(match) -> str:
+        code = match.group(1)
+        if code in _ESCAPES:
+            return _ESCAPES[code]
+        if code.startswith("u"):
+            return chr(int(code[1:], 16))
+        return match.group(0)
+
+    return _ESCAPE.sub(escape, component.replace("..", "::"))
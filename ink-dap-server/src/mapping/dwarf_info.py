@@ -0,0 +1,726 @@
+"""
+DWARF .debug_info reader
+Extracts the address ranges of subprograms and inlined subroutines, with their call sites
+"""
+
+import struct
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .dwarf_line import DwarfError, _StringSections, _sleb, _uleb, line_program_files
+from .elf_file import ElfFile, Section
+
+
+# Tags
+DW_TAG_inlined_subroutine = 0x1d
+DW_TAG_compile_unit = 0x11
+DW_TAG_subprogram = 0x2e
+DW_TAG_partial_unit = 0x3c
+DW_TAG_skeleton_unit = 0x4a
+
+# Attributes
+DW_AT_name = 0x03
+DW_AT_stmt_list = 0x10
+DW_AT_low_pc = 0x11
+DW_AT_high_pc = 0x12
+DW_AT_abstract_origin = 0x31
+DW_AT_decl_file = 0x3a
+DW_AT_decl_line = 0x3b
+DW_AT_specification = 0x47
+DW_AT_ranges = 0x55
+DW_AT_call_column = 0x57
+DW_AT_call_file = 0x58
+DW_AT_call_line = 0x59
+DW_AT_linkage_name = 0x6e
+DW_AT_str_offsets_base = 0x72
+DW_AT_addr_base = 0x73
+DW_AT_rnglists_base = 0x74
+DW_AT_MIPS_linkage_name = 0x2007
+
+# Attribute forms
+DW_FORM_addr = 0x01
+DW_FORM_block2 = 0x03
+DW_FORM_block4 = 0x04
+DW_FORM_data2 = 0x05
+DW_FORM_data4 = 0x06
+DW_FORM_data8 = 0x07
+DW_FORM_string = 0x08
+DW_FORM_block = 0x09
+DW_FORM_block1 = 0x0a
+DW_FORM_data1 = 0x0b
+DW_FORM_flag = 0x0c
+DW_FORM_sdata = 0x0d
+DW_FORM_strp = 0x0e
+DW_FORM_udata = 0x0f
+DW_FORM_ref_addr = 0x10
+DW_FORM_ref1 = 0x11
+DW_FORM_ref2 = 0x12
+DW_FORM_ref4 = 0x13
+DW_FORM_ref8 = 0x14
+DW_FORM_ref_udata = 0x15
+DW_FORM_indirect = 0x16
+DW_FORM_sec_offset = 0x17
+DW_FORM_exprloc = 0x18
+DW_FORM_flag_present = 0x19
+DW_FORM_strx = 0x1a
+DW_FORM_addrx = 0x1b
+DW_FORM_ref_sup4 = 0x1c
+DW_FORM_strp_sup = 0x1d
+DW_FORM_data16 = 0x1e
+DW_FORM_line_strp = 0x1f
+DW_FORM_ref_sig8 = 0x20
+DW_FORM_implicit_const = 0x21
+DW_FORM_loclistx = 0x22
+DW_FORM_rnglistx = 0x23
+DW_FORM_ref_sup8 = 0x24
+DW_FORM_strx1 = 0x25
+DW_FORM_strx2 = 0x26
+DW_FORM_strx3 = 0x27
+DW_FORM_strx4 = 0x28
+DW_FORM_addrx1 = 0x29
+DW_FORM_addrx2 = 0x2a
+DW_FORM_addrx3 = 0x2b
+DW_FORM_addrx4 = 0x2c
+DW_FORM_GNU_addr_index = 0x1f01
+DW_FORM_GNU_str_index = 0x1f02
+DW_FORM_GNU_ref_alt = 0x1f20
+DW_FORM_GNU_strp_alt = 0x1f21
+
+# DWARF 5 unit types
+DW_UT_compile = 0x01
+DW_UT_type = 0x02
+DW_UT_partial = 0x03
+DW_UT_skeleton = 0x04
+DW_UT_split_compile = 0x05
+DW_UT_split_type = 0x06
+
+# Range list entries (.debug_rnglists)
+DW_RLE_end_of_list = 0
+DW_RLE_base_addressx = 1
+DW_RLE_startx_endx = 2
+DW_RLE_startx_length = 3
+DW_RLE_offset_pair = 4
+DW_RLE_base_address = 5
+DW_RLE_start_end = 6
+DW_RLE_start_length = 7
+
+# Size of forms whose size depends on nothing but the form
+_FIXED_SIZES = {
+    DW_FORM_data1: 1, DW_FORM_ref1: 1, DW_FORM_flag: 1, DW_FORM_strx1: 1, DW_FORM_addrx1: 1,
+    DW_FORM_data2: 2, DW_FORM_ref2: 2, DW_FORM_strx2: 2, DW_FORM_addrx2: 2,
+    DW_FORM_strx3: 3, DW_FORM_addrx3: 3,
+    DW_FORM_data4: 4, DW_FORM_ref4: 4, DW_FORM_ref_sup4: 4, DW_FORM_strx4: 4, DW_FORM_addrx4: 4,
+    DW_FORM_data8: 8, DW_FORM_ref8: 8, DW_FORM_ref_sig8: 8, DW_FORM_ref_sup8: 8,
+    DW_FORM_data16: 16,
+    DW_FORM_flag_present: 0, DW_FORM_implicit_const: 0,
+}
+# Forms holding a section offset
+_OFFSET_FORMS = (DW_FORM_strp, DW_FORM_line_strp, DW_FORM_sec_offset, DW_FORM_strp_sup,
+                 DW_FORM_GNU_ref_alt, DW_FORM_GNU_strp_alt)
+# Forms holding a LEB128
+_LEB_FORMS = (DW_FORM_udata, DW_FORM_sdata, DW_FORM_ref_udata, DW_FORM_strx, DW_FORM_addrx,
+              DW_FORM_loclistx, DW_FORM_rnglistx, DW_FORM_GNU_addr_index, DW_FORM_GNU_str_index)
+_STRX_FORMS = (DW_FORM_strx, DW_FORM_strx1, DW_FORM_strx2, DW_FORM_strx3, DW_FORM_strx4, DW_FORM_GNU_str_index)
+_ADDRX_FORMS = (DW_FORM_addrx, DW_FORM_addrx1, DW_FORM_addrx2, DW_FORM_addrx3, DW_FORM_addrx4,
+                DW_FORM_GNU_addr_index)
+# Unit-relative references
+_REF_FORMS = (DW_FORM_ref1, DW_FORM_ref2, DW_FORM_ref4, DW_FORM_ref8, DW_FORM_ref_udata)
+
+# struct format of unsigned integers by size
+_STRUCT_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+# Attributes read from scope DIEs; all others are skipped
+_SCOPE_ATTRIBUTES = frozenset((
+    DW_AT_name, DW_AT_low_pc, DW_AT_high_pc, DW_AT_ranges, DW_AT_abstract_origin, DW_AT_specification,
+    DW_AT_call_file, DW_AT_call_line, DW_AT_call_column, DW_AT_linkage_name, DW_AT_MIPS_linkage_name,
+    DW_AT_decl_file, DW_AT_decl_line,
+))
+_UNIT_ATTRIBUTES = frozenset((
+    DW_AT_name, DW_AT_stmt_list, DW_AT_low_pc, DW_AT_str_offsets_base, DW_AT_addr_base, DW_AT_rnglists_base,
+))
+
+
+class ScopeTable:
+    """
+    Subprograms and inlined subroutines as parallel arrays.
+
+    Scope i is names[i] (the linkage name when DWARF has one, still
+    mangled), nested in scope parents[i] (-1 for subprograms), and its
+    function is declared at file_names[decl_files[i]], decl_lines[i]
+    (decl_files[i] == -1 if unknown). An inlined scope was called from
+    file_names[call_files[i]] at call_lines[i], call_columns[i];
+    subprograms have call_files[i] == -1. Range j covers
+    [starts[j], ends[j]) for scope range_scopes[j]. Like LineTable, the
+    arrays are array.array instances, or memoryviews into the source-map
+    cache.
+    """
+
+    def __init__(self, names, parents, decl_files, decl_lines, call_files, call_lines, call_columns, file_names,
+                 starts, ends, range_scopes):
+        self.names: List[str] = names
+        self.parents = parents
+        self.decl_files = decl_files
+        self.decl_lines = decl_lines
+        self.call_files = call_files
+        self.call_lines = call_lines
+        self.call_columns = call_columns
+        self.file_names: List[str] = file_names
+        self.starts = starts
+        self.ends = ends
+        self.range_scopes = range_scopes
+
+    @classmethod
+    def empty(cls) -> "ScopeTable":
+        return cls([], array('i'), array('i'), array('I'), array('i'), array('I'), array('I'), [],
+                   array('Q'), array('Q'), array('I'))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class _Abbrev(NamedTuple):
+    tag: int
+    has_children: bool
+    # (attribute, form, implicit constant)
+    attributes: Tuple[Tuple[int, int, int], ...]
+
+
+class _Layout(NamedTuple):
+    """A DIE whose attributes all have a fixed size in its unit, read with one struct."""
+    record: struct.Struct
+    # Attribute and form of each field record unpacks
+    attributes: Tuple[int, ...]
+    forms: Tuple[int, ...]
+    # attribute -> (form, value) of the wanted attributes stored in the abbreviation
+    constants: Dict[int, Tuple[int, int]]
+
+
+class _Unit:
+    """Header fields and base offsets of one unit."""
+
+    def __init__(self, offset: int, version: int, address_size: int, offset_size: int):
+        self.offset = offset
+        self.version = version
+        self.address_size = address_size
+        self.offset_size = offset_size
+        self.low_pc = 0
+        self.stmt_list = None
+        self.str_offsets_base = 8 if offset_size == 4 else 16
+        self.addr_base = 8 if offset_size == 4 else 16
+        self.rnglists_base = 12 if offset_size == 4 else 20
+        self.files: Optional[List[str]] = None
+
+
+def read_scopes(elf_path: str) -> ScopeTable:
+    """
+    Read every subprogram and inlined subroutine with code from an ELF file.
+
+    Args:
+        elf_path: Path to ELF file
+
+    Returns:
+        The scopes and their address ranges
+    """
+    with ElfFile(elf_path) as elf:
+        return decode_scopes(elf)
+
+
+def decode_scopes(elf: ElfFile) -> ScopeTable:
+    """Read the scopes of an already opened ELF; empty if it has no .debug_info."""
+    debug_info = elf.section('.debug_info')
+    if debug_info is None:
+        return ScopeTable.empty()
+    return _ScopeReader(elf, debug_info).read()
+
+
+class _ScopeReader:
+    """One pass over .debug_info, collecting scopes and resolving their names."""
+
+    def __init__(self, elf: ElfFile, debug_info: Section):
+        self.elf = elf
+        self.info = debug_info
+        self.data = debug_info.data
+        self.endian = '<' if elf.little_endian else '>'
+        self.strings = _StringSections(elf)
+        self._sections: Dict[str, Optional[Section]] = {}
+        self._abbrevs: Dict[int, Dict[int, _Abbrev]] = {}
+        # Per abbreviation table and unit shape: code -> layout, None if variable-sized
+        self._layouts: Dict[Tuple[int, int, int, bool], Dict[int, Optional[_Layout]]] = {}
+        # Linkers resolve functions they discarded to address 0; when no
+        # code lives there, ranges starting at 0 are such leftovers
+        text = elf.section('.text')
+        self.zero_discarded = text is not None and text.address > 0
+
+        # Subprogram DIE offset -> (linkage name, name, referenced DIE offset,
+        # unit, decl file index in the unit, decl line)
+        self.entities: Dict[int, Tuple[Optional[str], Optional[str], Optional[int],
+                                       _Unit, Optional[int], int]] = {}
+        # Per scope: DIE offset its name comes from, parent, call file, line, column
+        self.scope_dies: List[int] = []
+        self.parents = array('i')
+        self.call_files = array('i')
+        self.call_lines = array('I')
+        self.call_columns = array('I')
+        self.file_ids: Dict[str, int] = {}
+        self.starts = array('Q')
+        self.ends = array('Q')
+        self.range_scopes = array('I')
+
+    def read(self) -> ScopeTable:
+        pos = self.info.offset
+        try:
+            while pos < self.info.end:
+                pos = self._read_unit(pos)
+        except (IndexError, KeyError, struct.error) as e:
+            raise DwarfError(f"truncated or invalid .debug_info at offset 0x{pos - self.info.offset:x}: {e!r}")
+
+        names = []
+        decl_files = array('i')
+        decl_lines = array('I')
+        for die in self.scope_dies:
+            name, decl_file, decl_line = self._resolve(die)
+            names.append(name)
+            decl_files.append(decl_file)
+            decl_lines.append(decl_line)
+        return ScopeTable(names, self.parents, decl_files, decl_lines, self.call_files, self.call_lines,
+                          self.call_columns, list(self.file_ids), self.starts, self.ends, self.range_scopes)
+
+    def _section(self, name: str) -> Section:
+        if name not in self._sections:
+            self._sections[name] = self.elf.section(name)
+        section = self._sections[name]
+        if section is None:
+            raise DwarfError(f".debug_info references missing {name}")
+        return section
+
+    def _uint(self, data, pos: int, size: int) -> int:
+        if size == 1:
+            return data[pos]
+        if size == 3:
+            return int.from_bytes(data[pos:pos + 3], 'little' if self.endian == '<' else 'big')
+        return struct.unpack_from(self.endian + {2: 'H', 4: 'I', 8: 'Q'}[size], data, pos)[0]
+
+    def _read_unit(self, start: int) -> int:
+        data = self.data
+        length = self._uint(data, start, 4)
+        pos = start + 4
+        offset_size = 4
+        if length == 0xffffffff:
+            length = self._uint(data, pos, 8)
+            pos += 8
+            offset_size = 8
+        unit_end = pos + length
+        if unit_end > self.info.end:
+            raise DwarfError(f"unit at 0x{start - self.info.offset:x} extends past section end")
+
+        version = self._uint(data, pos, 2)
+        pos += 2
+        if version < 2 or version > 5:
+            raise DwarfError(f"unsupported .debug_info version {version}")
+        if version >= 5:
+            unit_type = data[pos]
+            address_size = data[pos + 1]
+            abbrev_offset = self._uint(data, pos + 2, offset_size)
+            pos += 2 + offset_size
+            if unit_type in (DW_UT_type, DW_UT_split_type):
+                return unit_end
+            if unit_type in (DW_UT_skeleton, DW_UT_split_compile):
+                pos += 8
+        else:
+            abbrev_offset = self._uint(data, pos, offset_size)
+            address_size = data[pos + offset_size]
+            pos += offset_size + 1
+
+        unit = _Unit(start - self.info.offset, version, address_size, offset_size)
+        abbrevs = self._abbreviations(abbrev_offset)
+        self._read_dies(unit, abbrevs, pos, unit_end)
+        return unit_end
+
+    def _abbreviations(self, offset: int) -> Dict[int, _Abbrev]:
+        abbrevs = self._abbrevs.get(offset)
+        if abbrevs is not None:
+            return abbrevs
+        section = self._section('.debug_abbrev')
+        data = section.data
+        pos = section.offset + offset
+        abbrevs = {}
+        while True:
+            code, pos = _uleb(data, pos)
+            if code == 0:
+                break
+            tag, pos = _uleb(data, pos)
+            has_children = data[pos] != 0
+            pos += 1
+            attributes = []
+            while True:
+                name, pos = _uleb(data, pos)
+                form, pos = _uleb(data, pos)
+                if name == 0 and form == 0:
+                    break
+                value = 0
+                if form == DW_FORM_implicit_const:
+                    value, pos = _sleb(data, pos)
+                attributes.append((name, form, value))
+            abbrevs[code] = _Abbrev(tag, has_children, tuple(attributes))
+        self._abbrevs[offset] = abbrevs
+        return abbrevs
+
+    def _read_dies(self, unit: _Unit, abbrevs: Dict[int, _Abbrev], pos: int, end: int):
+        data = self.data
+        info_start = self.info.offset
+        layouts = self._layouts.setdefault(
+            (id(abbrevs), unit.address_size, unit.offset_size, unit.version == 2), {}
+        )
+        # Enclosing scope of the children of each open DIE
+        parents = [-1]
+        while pos < end:
+            die = pos - info_start
+            code = data[pos]
+            if code < 0x80:
+                pos += 1
+            else:
+                code, pos = _uleb(data, pos)
+            if code == 0:
+                if len(parents) > 1:
+                    parents.pop()
+                continue
+            abbrev = abbrevs[code]
+            tag = abbrev.tag
+            scope = parents[-1]
+            if code in layouts:
+                layout = layouts[code]
+            else:
+                layout = layouts[code] = self._layout(unit, abbrev)
+
+            if tag == DW_TAG_subprogram or tag == DW_TAG_inlined_subroutine:
+                if layout is not None:
+                    values = dict(zip(layout.attributes, zip(layout.forms, layout.record.unpack_from(data, pos))))
+                    values.update(layout.constants)
+                    pos += layout.record.size
+                else:
+                    values, pos = self._read_attributes(unit, abbrev, pos, _SCOPE_ATTRIBUTES)
+                if tag == DW_TAG_subprogram:
+                    linkage = values.get(DW_AT_linkage_name) or values.get(DW_AT_MIPS_linkage_name)
+                    self.entities[die] = (
+                        self._string(unit, linkage), self._string(unit, values.get(DW_AT_name)),
+                        self._reference(unit, values.get(DW_AT_specification) or values.get(DW_AT_abstract_origin)),
+                        unit, values[DW_AT_decl_file][1] if DW_AT_decl_file in values else None,
+                        values[DW_AT_decl_line][1] if DW_AT_decl_line in values else 0,
+                    )
+                ranges = self._ranges(unit, values)
+                if ranges:
+                    scope = self._add_scope(unit, tag, die, values, parents[-1], ranges)
+            elif tag in (DW_TAG_compile_unit, DW_TAG_partial_unit, DW_TAG_skeleton_unit):
+                values, pos = self._read_attributes(unit, abbrev, pos, _UNIT_ATTRIBUTES)
+                self._read_unit_attributes(unit, values)
+            elif layout is not None:
+                pos += layout.record.size
+            else:
+                pos = self._skip_attributes(unit, abbrev, pos)
+
+            if abbrev.has_children:
+                parents.append(scope)
+
+    def _layout(self, unit: _Unit, abbrev: _Abbrev) -> Optional[_Layout]:
+        """Struct reading the scope attributes of DIEs of abbrev, None unless all have a fixed size."""
+        if abbrev.tag in (DW_TAG_compile_unit, DW_TAG_partial_unit, DW_TAG_skeleton_unit):
+            return None
+        wanted = abbrev.tag == DW_TAG_subprogram or abbrev.tag == DW_TAG_inlined_subroutine
+        record = [self.endian]
+        attributes = []
+        forms = []
+        constants = {}
+        for attribute, form, implicit in abbrev.attributes:
+            if form == DW_FORM_implicit_const or form == DW_FORM_flag_present:
+                if wanted and attribute in _SCOPE_ATTRIBUTES:
+                    constants[attribute] = (form, implicit if form == DW_FORM_implicit_const else 1)
+                continue
+            size = _FIXED_SIZES.get(form)
+            if form == DW_FORM_addr:
+                size = unit.address_size
+            elif form in _OFFSET_FORMS:
+                size = unit.offset_size
+            elif form == DW_FORM_ref_addr:
+                size = unit.address_size if unit.version == 2 else unit.offset_size
+            if size is None or size == 3:
+                return None
+            if wanted and attribute in _SCOPE_ATTRIBUTES and size in _STRUCT_CODES:
+                record.append(_STRUCT_CODES[size])
+                attributes.append(attribute)
+                forms.append(form)
+            else:
+                record.append(f"{size}x")
+        return _Layout(struct.Struct(''.join(record)), tuple(attributes), tuple(forms), constants)
+
+    def _read_unit_attributes(self, unit: _Unit, values: Dict[int, Tuple[int, object]]):
+        # Bases first: the unit's own strx/addrx attributes need them
+        for attribute in (DW_AT_str_offsets_base, DW_AT_addr_base, DW_AT_rnglists_base):
+            if attribute in values:
+                setattr(unit, {DW_AT_str_offsets_base: 'str_offsets_base', DW_AT_addr_base: 'addr_base',
+                               DW_AT_rnglists_base: 'rnglists_base'}[attribute], values[attribute][1])
+        if DW_AT_stmt_list in values:
+            unit.stmt_list = values[DW_AT_stmt_list][1]
+        if DW_AT_low_pc in values:
+            unit.low_pc = self._address(unit, values[DW_AT_low_pc])
+
+    def _add_scope(self, unit: _Unit, tag: int, die: int, values, parent: int, ranges) -> int:
+        scope = len(self.scope_dies)
+        if tag == DW_TAG_inlined_subroutine:
+            self.scope_dies.append(self._reference(unit, values.get(DW_AT_abstract_origin)) or die)
+            self.parents.append(parent)
+            call_file = values.get(DW_AT_call_file)
+            self.call_files.append(self._file_id(unit, call_file[1]) if call_file else -1)
+            self.call_lines.append(values[DW_AT_call_line][1] if DW_AT_call_line in values else 0)
+            self.call_columns.append(values[DW_AT_call_column][1] if DW_AT_call_column in values else 0)
+        else:
+            self.scope_dies.append(die)
+            self.parents.append(-1)
+            self.call_files.append(-1)
+            self.call_lines.append(0)
+            self.call_columns.append(0)
+        for start, end in ranges:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.range_scopes.append(scope)
+        return scope
+
+    def _file_id(self, unit: _Unit, index: int) -> int:
+        if unit.files is None:
+            unit.files = []
+            if unit.stmt_list is not None:
+                unit.files = line_program_files(self.elf, unit.stmt_list, self.strings)
+        path = unit.files[index] if index < len(unit.files) else f"<file {index}>"
+        file_id = self.file_ids.get(path)
+        if file_id is None:
+            file_id = self.file_ids[path] = len(self.file_ids)
+        return file_id
+
+    def _resolve(self, die: int) -> Tuple[str, int, int]:
+        """
+        Linkage name, decl file id and decl line of a subprogram, through
+        specification/abstract_origin links; file id -1 if not declared.
+        """
+        linkage = name = decl = None
+        for _ in range(8):
+            entity = self.entities.get(die)
+            if entity is None:
+                break
+            entity_linkage, plain, die, unit, decl_file, decl_line = entity
+            linkage = linkage or entity_linkage
+            name = name or plain
+            if decl is None and decl_file is not None:
+                decl = (self._file_id(unit, decl_file), decl_line)
+            if die is None or (linkage and decl):
+                break
+        decl_file, decl_line = decl or (-1, 0)
+        return linkage or name or "<unknown>", decl_file, decl_line
+
+    def _read_attributes(self, unit: _Unit, abbrev: _Abbrev, pos: int, wanted) -> Tuple[Dict[int, Tuple[int, object]], int]:
+        """(form, raw value) of the wanted attributes of one DIE, and the position after it."""
+        values = {}
+        for attribute, form, implicit in abbrev.attributes:
+            if attribute in wanted:
+                value, pos = self._read_form(unit, form, pos, implicit)
+                values[attribute] = (form, value)
+            else:
+                pos = self._skip_form(unit, form, pos)
+        return values, pos
+
+    def _skip_attributes(self, unit: _Unit, abbrev: _Abbrev, pos: int) -> int:
+        for _, form, _ in abbrev.attributes:
+            pos = self._skip_form(unit, form, pos)
+        return pos
+
+    def _read_form(self, unit: _Unit, form: int, pos: int, implicit: int) -> Tuple[object, int]:
+        data = self.data
+        size = _FIXED_SIZES.get(form)
+        if size is not None:
+            if form == DW_FORM_implicit_const:
+                return implicit, pos
+            if form == DW_FORM_flag_present:
+                return 1, pos
+            if size == 16:
+                return None, pos + 16
+            return self._uint(data, pos, size), pos + size
+        if form == DW_FORM_addr:
+            return self._uint(data, pos, unit.address_size), pos + unit.address_size
+        if form in _OFFSET_FORMS:
+            return self._uint(data, pos, unit.offset_size), pos + unit.offset_size
+        if form == DW_FORM_ref_addr:
+            size = unit.address_size if unit.version == 2 else unit.offset_size
+            return self._uint(data, pos, size), pos + size
+        if form == DW_FORM_sdata:
+            return _sleb(data, pos)
+        if form in _LEB_FORMS:
+            return _uleb(data, pos)
+        if form == DW_FORM_string:
+            end = data.find(b'\0', pos)
+            if end < 0:
+                raise DwarfError("unterminated string")
+            return data[pos:end].decode('utf-8', errors='replace'), end + 1
+        if form == DW_FORM_indirect:
+            form, pos = _uleb(data, pos)
+            return self._read_form(unit, form, pos, implicit)
+        return None, self._skip_form(unit, form, pos)
+
+    def _skip_form(self, unit: _Unit, form: int, pos: int) -> int:
+        size = _FIXED_SIZES.get(form)
+        if size is not None:
+            return pos + size
+        data = self.data
+        if form == DW_FORM_addr:
+            return pos + unit.address_size
+        if form in _OFFSET_FORMS:
+            return pos + unit.offset_size
+        if form == DW_FORM_ref_addr:
+            return pos + (unit.address_size if unit.version == 2 else unit.offset_size)
+        if form in _LEB_FORMS:
+            while data[pos] & 0x80:
+                pos += 1
+            return pos + 1
+        if form == DW_FORM_string:
+            end = data.find(b'\0', pos)
+            if end < 0:
+                raise DwarfError("unterminated string")
+            return end + 1
+        if form == DW_FORM_exprloc or form == DW_FORM_block:
+            length, pos = _uleb(data, pos)
+            return pos + length
+        if form == DW_FORM_block1:
+            return pos + 1 + data[pos]
+        if form == DW_FORM_block2:
+            return pos + 2 + self._uint(data, pos, 2)
+        if form == DW_FORM_block4:
+            return pos + 4 + self._uint(data, pos, 4)
+        if form == DW_FORM_indirect:
+            form, pos = _uleb(data, pos)
+            return self._skip_form(unit, form, pos)
+        raise DwarfError(f"unsupported form 0x{form:x} in .debug_info")
+
+    def _string(self, unit: _Unit, value) -> Optional[str]:
+        if value is None:
+            return None
+        form, raw = value
+        if form == DW_FORM_string:
+            return raw
+        if form == DW_FORM_strp:
+            return self.strings.get('.debug_str', raw)
+        if form == DW_FORM_line_strp:
+            return self.strings.get('.debug_line_str', raw)
+        if form in _STRX_FORMS:
+            offsets = self._section('.debug_str_offsets')
+            offset = self._uint(offsets.data, offsets.offset + unit.str_offsets_base + raw * unit.offset_size,
+                                unit.offset_size)
+            return self.strings.get('.debug_str', offset)
+        # Strings in a supplementary file (dwz) are not available here
+        return None
+
+    def _reference(self, unit: _Unit, value) -> Optional[int]:
+        if value is None:
+            return None
+        form, raw = value
+        if form in _REF_FORMS:
+            return unit.offset + raw
+        if form == DW_FORM_ref_addr:
+            return raw
+        return None
+
+    def _address(self, unit: _Unit, value) -> int:
+        form, raw = value
+        if form in _ADDRX_FORMS:
+            return self._indexed_address(unit, raw)
+        return raw
+
+    def _indexed_address(self, unit: _Unit, index: int) -> int:
+        addresses = self._section('.debug_addr')
+        return self._uint(addresses.data, addresses.offset + unit.addr_base + index * unit.address_size,
+                          unit.address_size)
+
+    def _ranges(self, unit: _Unit, values) -> List[Tuple[int, int]]:
+        """Address ranges of a DIE, without empty and tombstoned ones."""
+        if DW_AT_ranges in values:
+            form, raw = values[DW_AT_ranges]
+            if unit.version >= 5:
+                ranges = self._rnglist(unit, form, raw)
+            else:
+                ranges = self._range_list(unit, raw)
+        elif DW_AT_low_pc in values and DW_AT_high_pc in values:
+            low = self._address(unit, values[DW_AT_low_pc])
+            form, high = values[DW_AT_high_pc]
+            if form == DW_FORM_addr or form in _ADDRX_FORMS:
+                high = self._address(unit, (form, high))
+            else:
+                high += low
+            ranges = [(low, high)]
+        else:
+            return []
+        tombstone = (1 << (8 * unit.address_size)) - 1
+        return [
+            (start, end) for start, end in ranges
+            if start < end and start != tombstone and not (start == 0 and self.zero_discarded)
+        ]
+
+    def _range_list(self, unit: _Unit, offset: int) -> List[Tuple[int, int]]:
+        """A DWARF 2-4 .debug_ranges list."""
+        section = self._section('.debug_ranges')
+        data = section.data
+        size = unit.address_size
+        largest = (1 << (8 * size)) - 1
+        base = unit.low_pc
+        pos = section.offset + offset
+        ranges = []
+        while True:
+            start = self._uint(data, pos, size)
+            end = self._uint(data, pos + size, size)
+            pos += 2 * size
+            if start == 0 and end == 0:
+                return ranges
+            if start == largest:
+                base = end
+            else:
+                ranges.append((base + start, base + end))
+
+    def _rnglist(self, unit: _Unit, form: int, value: int) -> List[Tuple[int, int]]:
+        """A DWARF 5 .debug_rnglists list."""
+        section = self._section('.debug_rnglists')
+        data = section.data
+        if form == DW_FORM_rnglistx:
+            table = section.offset + unit.rnglists_base
+            value = unit.rnglists_base + self._uint(data, table + value * unit.offset_size, unit.offset_size)
+        size = unit.address_size
+        base = unit.low_pc
+        pos = section.offset + value
+        ranges = []
+        while True:
+            kind = data[pos]
+            pos += 1
+            if kind == DW_RLE_end_of_list:
+                return ranges
+            if kind == DW_RLE_base_addressx:
+                index, pos = _uleb(data, pos)
+                base = self._indexed_address(unit, index)
+            elif kind == DW_RLE_startx_endx:
+                start, pos = _uleb(data, pos)
+                end, pos = _uleb(data, pos)
+                ranges.append((self._indexed_address(unit, start), self._indexed_address(unit, end)))
+            elif kind == DW_RLE_startx_length:
+                start, pos = _uleb(data, pos)
+                length, pos = _uleb(data, pos)
+                start = self._indexed_address(unit, start)
+                ranges.append((start, start + length))
+            elif kind == DW_RLE_offset_pair:
+                start, pos = _uleb(data, pos)
+                end, pos = _uleb(data, pos)
+                ranges.append((base + start, base + end))
+            elif kind == DW_RLE_base_address:
+                base = self._uint(data, pos, size)
+                pos += size
+            elif kind == DW_RLE_start_end:
+                ranges.append((self._uint(data, pos, size), self._uint(data, pos + size, size)))
+                pos += 2 * size
+            elif kind == DW_RLE_start_length:
+                start = self._uint(data, pos, size)
+                length, pos = _uleb(data, pos + size)
+                ranges.append((start, start + length))
+            else:
+                raise DwarfError(f"unknown range list entry kind {kind}")
@@ -0,0 +1,505 @@
+"""
+DWARF .debug_line decoder
+Runs the line-number programs of an ELF file and produces the decoded line table
+"""
+
+import posixpath
+import struct
+from typing import List, NamedTuple, Optional, Tuple
+
+from .elf_file import ElfFile, Section
+
+
+# Standard opcodes
+DW_LNS_copy = 1
+DW_LNS_advance_pc = 2
+DW_LNS_advance_line = 3
+DW_LNS_set_file = 4
+DW_LNS_set_column = 5
+DW_LNS_negate_stmt = 6
+DW_LNS_set_basic_block = 7
+DW_LNS_const_add_pc = 8
+DW_LNS_fixed_advance_pc = 9
+DW_LNS_set_prologue_end = 10
+DW_LNS_set_epilogue_begin = 11
+DW_LNS_set_isa = 12
+
+# Extended opcodes
+DW_LNE_end_sequence = 1
+DW_LNE_set_address = 2
+DW_LNE_define_file = 3
+DW_LNE_set_discriminator = 4
+
+# DWARF 5 line header entry content types
+DW_LNCT_path = 1
+DW_LNCT_directory_index = 2
+
+# Attribute forms that can appear in DWARF 5 line headers
+DW_FORM_block2 = 0x03
+DW_FORM_block4 = 0x04
+DW_FORM_data2 = 0x05
+DW_FORM_data4 = 0x06
+DW_FORM_data8 = 0x07
+DW_FORM_string = 0x08
+DW_FORM_block = 0x09
+DW_FORM_block1 = 0x0a
+DW_FORM_data1 = 0x0b
+DW_FORM_sdata = 0x0d
+DW_FORM_strp = 0x0e
+DW_FORM_udata = 0x0f
+DW_FORM_data16 = 0x1e
+DW_FORM_line_strp = 0x1f
+
+
+class DwarfError(Exception):
+    """Raised when DWARF data cannot be decoded."""
+
+
+class LineRow(NamedTuple):
+    """One row of the decoded line table."""
+    address: int
+    file: str
+    line: int
+    column: int
+    is_stmt: bool
+    discriminator: int
+    end_sequence: bool
+
+
+class DwarfCursor:
+    """Sequential reader over a section (or part of one)."""
+
+    def __init__(self, section: Section, pos: Optional[int] = None, little_endian: bool = True):
+        self.data = section.data
+        self.pos = section.offset if pos is None else pos
+        self.end = section.end
+        self.endian = '<' if little_endian else '>'
+
+    def u8(self) -> int:
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def s8(self) -> int:
+        value = self.u8()
+        return value - 0x100 if value & 0x80 else value
+
+    def u16(self) -> int:
+        (value,) = struct.unpack_from(self.endian + 'H', self.data, self.pos)
+        self.pos += 2
+        return value
+
+    def u32(self) -> int:
+        (value,) = struct.unpack_from(self.endian + 'I', self.data, self.pos)
+        self.pos += 4
+        return value
+
+    def u64(self) -> int:
+        (value,) = struct.unpack_from(self.endian + 'Q', self.data, self.pos)
+        self.pos += 8
+        return value
+
+    def uint(self, size: int) -> int:
+        if size == 1:
+            return self.u8()
+        if size == 2:
+            return self.u16()
+        if size == 4:
+            return self.u32()
+        if size == 8:
+            return self.u64()
+        value = int.from_bytes(self.data[self.pos:self.pos + size], 'little' if self.endian == '<' else 'big')
+        self.pos += size
+        return value
+
+    def uleb(self) -> int:
+        value, self.pos = _uleb(self.data, self.pos)
+        return value
+
+    def sleb(self) -> int:
+        value, self.pos = _sleb(self.data, self.pos)
+        return value
+
+    def cstring(self) -> str:
+        end = self.data.find(b'\0', self.pos)
+        if end < 0:
+            raise DwarfError("unterminated string")
+        value = self.data[self.pos:end].decode('utf-8', errors='replace')
+        self.pos = end + 1
+        return value
+
+    def unit_length(self) -> Tuple[int, int]:
+        """Read an initial length field, returning (length, offset_size)."""
+        length = self.u32()
+        if length == 0xffffffff:
+            return self.u64(), 8
+        if length >= 0xfffffff0:
+            raise DwarfError(f"reserved unit length 0x{length:x}")
+        return length, 4
+
+    def skip(self, count: int):
+        self.pos += count
+
+
+def read_line_table(elf_path: str) -> List[LineRow]:
+    """
+    Decode every line-number program in an ELF file.
+
+    Args:
+        elf_path: Path to ELF file
+
+    Returns:
+        Line table rows in program order, including end_sequence rows
+    """
+    with ElfFile(elf_path) as elf:
+        return decode_line_programs(elf)
+
+
+def decode_line_programs(elf: ElfFile) -> List[LineRow]:
+    """Decode all line-number programs of an already opened ELF."""
+    debug_line = elf.section('.debug_line')
+    if debug_line is None:
+        raise DwarfError(f"{elf.path} has no .debug_line section")
+
+    strings = _StringSections(elf)
+    rows: List[LineRow] = []
+    pos = debug_line.offset
+
+    try:
+        while pos < debug_line.end:
+            pos = _decode_unit(debug_line, pos, elf, strings, rows)
+    except (IndexError, struct.error) as e:
+        raise DwarfError(f"truncated line program at offset 0x{pos - debug_line.offset:x}: {e}")
+
+    return rows
+
+
+class _StringSections:
+    """Lazily resolved .debug_str / .debug_line_str lookups."""
+
+    def __init__(self, elf: ElfFile):
+        self._elf = elf
+        self._sections = {}
+
+    def get(self, name: str, offset: int) -> str:
+        section = self._sections.get(name)
+        if section is None:
+            section = self._elf.section(name)
+            if section is None:
+                raise DwarfError(f"string form references missing {name}")
+            self._sections[name] = section
+        start = section.offset + offset
+        end = section.data.find(b'\0', start, section.end)
+        if end < 0:
+            raise DwarfError(f"unterminated string in {name}")
+        return section.data[start:end].decode('utf-8', errors='replace')
+
+
+def _read_form(cursor: DwarfCursor, form: int, offset_size: int, strings: _StringSections):
+    """Read one attribute value of a DWARF 5 line header entry."""
+    if form == DW_FORM_string:
+        return cursor.cstring()
+    if form == DW_FORM_line_strp:
+        return strings.get('.debug_line_str', cursor.uint(offset_size))
+    if form == DW_FORM_strp:
+        return strings.get('.debug_str', cursor.uint(offset_size))
+    if form == DW_FORM_udata:
+        return cursor.uleb()
+    if form == DW_FORM_sdata:
+        return cursor.sleb()
+    if form == DW_FORM_data1:
+        return cursor.u8()
+    if form == DW_FORM_data2:
+        return cursor.u16()
+    if form == DW_FORM_data4:
+        return cursor.u32()
+    if form == DW_FORM_data8:
+        return cursor.u64()
+    if form == DW_FORM_data16:
+        cursor.skip(16)
+        return None
+    if form == DW_FORM_block:
+        cursor.skip(cursor.uleb())
+        return None
+    if form == DW_FORM_block1:
+        cursor.skip(cursor.u8())
+        return None
+    if form == DW_FORM_block2:
+        cursor.skip(cursor.u16())
+        return None
+    if form == DW_FORM_block4:
+        cursor.skip(cursor.u32())
+        return None
+    raise DwarfError(f"unsupported form 0x{form:x} in line header")
+
+
+def _read_entry_table(cursor: DwarfCursor, offset_size: int, strings: _StringSections) -> List[Tuple[str, int]]:
+    """Read a DWARF 5 directory or file name table as (path, directory index) pairs."""
+    formats = [(cursor.uleb(), cursor.uleb()) for _ in range(cursor.u8())]
+    entries = []
+    for _ in range(cursor.uleb()):
+        path, dir_index = "", 0
+        for content_type, form in formats:
+            value = _read_form(cursor, form, offset_size, strings)
+            if content_type == DW_LNCT_path:
+                path = value
+            elif content_type == DW_LNCT_directory_index:
+                dir_index = value
+        entries.append((path, dir_index))
+    return entries
+
+
+class _LineHeader(NamedTuple):
+    """Line-number program header fields the state machine needs."""
+    version: int
+    address_size: int
+    unit_end: int
+    program_start: int
+    min_inst_length: int
+    max_ops: int
+    default_is_stmt: bool
+    line_base: int
+    line_range: int
+    opcode_base: int
+    standard_lengths: List[int]
+    directories: List[str]
+    files: List[str]
+
+
+def line_program_files(elf: ElfFile, offset: int, strings: Optional[_StringSections] = None) -> List[str]:
+    """
+    File table of the line-number program at offset in .debug_line (a unit's
+    DW_AT_stmt_list), as full paths indexed by DWARF file number.
+    """
+    debug_line = elf.section('.debug_line')
+    if debug_line is None:
+        raise DwarfError(f"{elf.path} has no .debug_line section")
+    cursor = DwarfCursor(debug_line, debug_line.offset + offset, elf.little_endian)
+    try:
+        return _read_line_header(cursor, debug_line, elf, strings or _StringSections(elf)).files
+    except (IndexError, struct.error) as e:
+        raise DwarfError(f"truncated line program header at offset 0x{offset:x}: {e}")
+
+
+def _read_line_header(cursor: DwarfCursor, section: Section, elf: ElfFile, strings: _StringSections) -> _LineHeader:
+    """Read a line-number program header, leaving cursor at the end of it."""
+    pos = cursor.pos
+    unit_length, offset_size = cursor.unit_length()
+    unit_end = cursor.pos + unit_length
+    if unit_end > section.end:
+        raise DwarfError(f"line program at 0x{pos - section.offset:x} extends past section end")
+
+    version = cursor.u16()
+    if version < 2 or version > 5:
+        raise DwarfError(f"unsupported line table version {version}")
+
+    address_size = elf.address_size
+    if version >= 5:
+        address_size = cursor.u8()
+        cursor.u8()  # segment_selector_size
+
+    header_length = cursor.uint(offset_size)
+    program_start = cursor.pos + header_length
+
+    min_inst_length = cursor.u8()
+    max_ops = cursor.u8() if version >= 4 else 1
+    if max_ops == 0:
+        raise DwarfError("maximum_operations_per_instruction is 0")
+    default_is_stmt = cursor.u8() != 0
+    line_base = cursor.s8()
+    line_range = cursor.u8()
+    if line_range == 0:
+        raise DwarfError("line_range is 0")
+    opcode_base = cursor.u8()
+    standard_lengths = [0] + [cursor.u8() for _ in range(opcode_base - 1)]
+
+    # Build the file table as full paths
+    if version >= 5:
+        directories = [path for path, _ in _read_entry_table(cursor, offset_size, strings)]
+        file_entries = _read_entry_table(cursor, offset_size, strings)
+        files = [_join_path(directories, dir_index, name) for name, dir_index in file_entries]
+    else:
+        # Directory 0 is the compilation directory, which is not in the header
+        directories = [""]
+        while True:
+            directory = cursor.cstring()
+            if not directory:
+                break
+            directories.append(directory)
+        # File indexes start at 1 before DWARF 5
+        files = [""]
+        while True:
+            name = cursor.cstring()
+            if not name:
+                break
+            dir_index = cursor.uleb()
+            cursor.uleb()  # mtime
+            cursor.uleb()  # length
+            files.append(_join_path(directories, dir_index, name))
+
+    return _LineHeader(version, address_size, unit_end, program_start, min_inst_length, max_ops,
+                       default_is_stmt, line_base, line_range, opcode_base, standard_lengths,
+                       directories, files)
+
+
+def _decode_unit(section: Section, pos: int, elf: ElfFile, strings: _StringSections, rows: List[LineRow]) -> int:
+    """Decode one line-number program, appending to rows. Returns the next unit offset."""
+    cursor = DwarfCursor(section, pos, elf.little_endian)
+    (version, address_size, unit_end, program_start, min_inst_length, max_ops, default_is_stmt,
+     line_base, line_range, opcode_base, standard_lengths, directories, files) = _read_line_header(cursor, section, elf, strings)
+
+    data = section.data
+    endian = cursor.endian
+    append = rows.append
+
+    def file_name(index: int) -> str:
+        return files[index] if index < len(files) else f"<file {index}>"
+
+    # State machine registers
+    address = 0
+    op_index = 0
+    file_index = 1
+    file = file_name(file_index)
+    line = 1
+    column = 0
+    is_stmt = default_is_stmt
+    discriminator = 0
+
+    pos = program_start
+    while pos < unit_end:
+        opcode = data[pos]
+        pos += 1
+
+        if opcode >= opcode_base:
+            # Special opcode: advance address and line, then emit a row
+            adjusted = opcode - opcode_base
+            advance = adjusted // line_range
+            if max_ops == 1:
+                address += min_inst_length * advance
+            else:
+                address += min_inst_length * ((op_index + advance) // max_ops)
+                op_index = (op_index + advance) % max_ops
+            line += line_base + adjusted % line_range
+            append(LineRow(address, file, line, column, is_stmt, discriminator, False))
+            discriminator = 0
+
+        elif opcode == DW_LNS_advance_line:
+            delta, pos = _sleb(data, pos)
+            line += delta
+
+        elif opcode == DW_LNS_set_column:
+            column, pos = _uleb(data, pos)
+
+        elif opcode == DW_LNS_advance_pc:
+            advance, pos = _uleb(data, pos)
+            if max_ops == 1:
+                address += min_inst_length * advance
+            else:
+                address += min_inst_length * ((op_index + advance) // max_ops)
+                op_index = (op_index + advance) % max_ops
+
+        elif opcode == DW_LNS_copy:
+            append(LineRow(address, file, line, column, is_stmt, discriminator, False))
+            discriminator = 0
+
+        elif opcode == DW_LNS_set_file:
+            file_index, pos = _uleb(data, pos)
+            file = file_name(file_index)
+
+        elif opcode == DW_LNS_negate_stmt:
+            is_stmt = not is_stmt
+
+        elif opcode == DW_LNS_const_add_pc:
+            advance = (255 - opcode_base) // line_range
+            if max_ops == 1:
+                address += min_inst_length * advance
+            else:
+                address += min_inst_length * ((op_index + advance) // max_ops)
+                op_index = (op_index + advance) % max_ops
+
+        elif opcode == DW_LNS_fixed_advance_pc:
+            (advance,) = struct.unpack_from(endian + 'H', data, pos)
+            pos += 2
+            address += advance
+            op_index = 0
+
+        elif opcode in (DW_LNS_set_basic_block, DW_LNS_set_prologue_end, DW_LNS_set_epilogue_begin):
+            pass
+
+        elif opcode == 0:
+            length, pos = _uleb(data, pos)
+            if length == 0:
+                continue
+            next_pos = pos + length
+            sub_opcode = data[pos]
+            cursor.pos = pos + 1
+
+            if sub_opcode == DW_LNE_end_sequence:
+                append(LineRow(address, file, line, column, is_stmt, discriminator, True))
+                address = 0
+                op_index = 0
+                file_index = 1
+                file = file_name(file_index)
+                line = 1
+                column = 0
+                is_stmt = default_is_stmt
+                discriminator = 0
+            elif sub_opcode == DW_LNE_set_address:
+                address = cursor.uint(length - 1 if version < 5 else address_size)
+                op_index = 0
+            elif sub_opcode == DW_LNE_define_file:
+                name = cursor.cstring()
+                dir_index = cursor.uleb()
+                files.append(_join_path(directories, dir_index, name))
+                file = file_name(file_index)
+            elif sub_opcode == DW_LNE_set_discriminator:
+                discriminator = cursor.uleb()
+
+            pos = next_pos
+
+        else:
+            # Standard opcode unknown to us (DW_LNS_set_isa or newer): skip its operands
+            for _ in range(standard_lengths[opcode] if opcode < len(standard_lengths) else 0):
+                _, pos = _uleb(data, pos)
+
+    return unit_end
+
+
+def _uleb(data, pos: int) -> Tuple[int, int]:
+    """Decode an unsigned LEB128 at pos, returning (value, next pos)."""
+    byte = data[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result = byte & 0x7f
+    shift = 7
+    while True:
+        pos += 1
+        byte = data[pos]
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos + 1
+        shift += 7
+
+
+def _sleb(data, pos: int) -> Tuple[int, int]:
+    """Decode a signed LEB128 at pos, returning (value, next pos)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    if byte & 0x40:
+        result -= 1 << shift
+    return result, pos
+
+
+def _join_path(directories: List[str], dir_index: int, name: str) -> str:
+    """Combine a file name with its include directory."""
+    if name.startswith('/') or dir_index >= len(directories):
+        return name
+    directory = directories[dir_index]
+    return posixpath.join(directory, name) if directory else name
@@ -0,0 +1,226 @@
+"""
+Minimal ELF reader
+Locates sections of a contract ELF through mmap without copying the file
+"""
+
+import mmap
+import struct
+import zlib
+from typing import Dict, List, Optional, Tuple, Union
+
+
+# Section header flag for SHF_COMPRESSED sections
+SHF_COMPRESSED = 0x800
+# Elf_Chdr compression type for zlib
+ELFCOMPRESS_ZLIB = 1
+# Section index escapes used when the header table is large
+SHN_UNDEF = 0
+SHN_XINDEX = 0xffff
+# Symbol type of functions in st_info
+STT_FUNC = 2
+
+
+class ElfError(Exception):
+    """Raised when a file is not a readable ELF."""
+
+
+class Section:
+    """
+    One ELF section.
+
+    `data` is either the file mmap or, for compressed sections, the inflated
+    bytes; the section contents are data[offset:offset + size]. Both types
+    support indexing, slicing, find() and struct.unpack_from(), so decoders
+    can work on them without copying.
+    """
+
+    def __init__(self, name: str, address: int, data: Union[mmap.mmap, bytes], offset: int, size: int):
+        self.name = name
+        self.address = address
+        self.data = data
+        self.offset = offset
+        self.size = size
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.size
+
+    def __repr__(self) -> str:
+        return f"Section({self.name!r}, address=0x{self.address:x}, size={self.size})"
+
+
+class ElfFile:
+    """Read-only, memory-mapped view of an ELF file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ElfError(f"{path} is empty")
+
+        try:
+            self._parse_header()
+            self._parse_sections()
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            self.close()
+            raise ElfError(f"{path}: malformed ELF: {e}")
+        except ElfError:
+            self.close()
+            raise
+
+    def __enter__(self) -> "ElfFile":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Unmap the file. Sections obtained from it become invalid."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def section(self, name: str) -> Optional[Section]:
+        """
+        Get a section by name.
+
+        Compressed debug sections (SHF_COMPRESSED or legacy .zdebug_*) are
+        inflated on first access.
+        """
+        if name not in self._sections:
+            zname = '.z' + name[1:] if name.startswith('.debug_') else None
+            if zname is None or zname not in self._sections:
+                return None
+            name = zname
+
+        section = self._sections[name]
+        if isinstance(section, tuple):
+            section = self._load_section(name, *section)
+            self._sections[name] = section
+        return section
+
+    def function_symbols(self) -> List[Tuple[int, int, str]]:
+        """
+        List defined function symbols from .symtab.
+
+        Returns:
+            (start, end, name) tuples sorted by start address; names are
+            as stored in the ELF (still mangled)
+        """
+        symtab = self.section('.symtab')
+        strtab = self.section('.strtab')
+        if symtab is None or strtab is None:
+            return []
+
+        if self.is_64:
+            entry_format, entry_size = self.endian + 'IBBHQQ', 24
+        else:
+            entry_format, entry_size = self.endian + 'IIIBBH', 16
+
+        raw = symtab.data[symtab.offset:symtab.offset + symtab.size - symtab.size % entry_size]
+        strings = strtab.data
+        functions = []
+        for fields in struct.iter_unpack(entry_format, raw):
+            if self.is_64:
+                name_offset, info, _, shndx, value, size = fields
+            else:
+                name_offset, value, size, info, _, shndx = fields
+            if info & 0xf != STT_FUNC or shndx == SHN_UNDEF or size == 0:
+                continue
+            name_start = strtab.offset + name_offset
+            name = strings[name_start:strings.find(b'\0', name_start)].decode('utf-8', errors='replace')
+            functions.append((value, value + size, name))
+
+        functions.sort()
+        return functions
+
+    def _parse_header(self):
+        data = self._map
+        if data[:4] != b'\x7fELF':
+            raise ElfError(f"{self.path} is not an ELF file")
+
+        ei_class, ei_data = data[4], data[5]
+        if ei_class not in (1, 2) or ei_data not in (1, 2):
+            raise ElfError(f"{self.path}: unsupported ELF class/encoding {ei_class}/{ei_data}")
+
+        self.is_64 = ei_class == 2
+        self.little_endian = ei_data == 1
+        self.endian = '<' if self.little_endian else '>'
+        self.address_size = 8 if self.is_64 else 4
+
+        (self.machine,) = struct.unpack_from(self.endian + 'H', data, 18)
+        if self.is_64:
+            shoff, = struct.unpack_from(self.endian + 'Q', data, 40)
+            shentsize, shnum, shstrndx = struct.unpack_from(self.endian + 'HHH', data, 58)
+        else:
+            shoff, = struct.unpack_from(self.endian + 'I', data, 32)
+            shentsize, shnum, shstrndx = struct.unpack_from(self.endian + 'HHH', data, 46)
+
+        self._shoff = shoff
+        self._shentsize = shentsize
+        self._shnum = shnum
+        self._shstrndx = shstrndx
+
+    def _section_header(self, index: int):
+        """Return (name, type, flags, addr, offset, size, link) of a section header."""
+        pos = self._shoff + index * self._shentsize
+        if self.is_64:
+            name, sh_type, flags, addr, offset, size, link = struct.unpack_from(
+                self.endian + 'IIQQQQI', self._map, pos)
+        else:
+            name, sh_type, flags, addr, offset, size, link = struct.unpack_from(
+                self.endian + 'IIIIIII', self._map, pos)
+        return name, sh_type, flags, addr, offset, size, link
+
+    def _parse_sections(self):
+        self._sections: Dict[str, Union[Section, tuple]] = {}
+        if self._shoff == 0:
+            return
+
+        shnum, shstrndx = self._shnum, self._shstrndx
+        if shnum == 0 or shstrndx == SHN_XINDEX:
+            _, _, _, _, _, size0, link0 = self._section_header(0)
+            if shnum == 0:
+                shnum = size0
+            if shstrndx == SHN_XINDEX:
+                shstrndx = link0
+
+        if shstrndx == SHN_UNDEF or shstrndx >= shnum:
+            raise ElfError(f"{self.path}: no section name table")
+
+        _, _, _, _, strtab_offset, _, _ = self._section_header(shstrndx)
+        data = self._map
+
+        for index in range(1, shnum):
+            name_offset, sh_type, flags, addr, offset, size, _ = self._section_header(index)
+            name_start = strtab_offset + name_offset
+            name = data[name_start:data.find(b'\0', name_start)].decode('utf-8')
+            # SHT_NOBITS sections (.bss) occupy no file space
+            if sh_type == 8:
+                size = 0
+            self._sections[name] = (addr, flags, offset, size)
+
+    def _load_section(self, name: str, addr: int, flags: int, offset: int, size: int) -> Section:
+        data = self._map
+        if offset + size > len(data):
+            raise ElfError(f"{self.path}: section {name} extends past end of file")
+
+        if flags & SHF_COMPRESSED:
+            if self.is_64:
+                ch_type, _, ch_size = struct.unpack_from(self.endian + 'IIQ', data, offset)
+                header_size = 24
+            else:
+                ch_type, ch_size = struct.unpack_from(self.endian + 'II', data, offset)
+                header_size = 12
+            if ch_type != ELFCOMPRESS_ZLIB:
+                raise ElfError(f"{self.path}: section {name} uses unsupported compression {ch_type}")
+            inflated = zlib.decompress(data[offset + header_size:offset + size])
+            return Section(name, addr, inflated, 0, min(ch_size, len(inflated)))
+
+        if name.startswith('.zdebug_') and data[offset:offset + 4] == b'ZLIB':
+            inflated = zlib.decompress(data[offset + 12:offset + size])
+            return Section('.' + name[2:], addr, inflated, 0, len(inflated))
+
+        return Section(name, addr, data, offset, size)
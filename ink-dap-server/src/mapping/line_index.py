@@ -0,0 +1,194 @@
+"""
+Per-file line index
+Sorted line numbers of each source file with the breakpoint addresses of each line
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+
+from .line_table import FLAG_END_SEQUENCE, FLAG_IS_STMT, LineTable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FileLines:
+    """
+    Code-bearing lines of one source file.
+
+    lines is sorted and unique; the addresses (and columns) of lines[i]
+    are addresses[offsets[i]:offsets[i + 1]], sorted by address.
+
+    A line has one address per block of code generated for it: the first
+    is_stmt row of every run of consecutive rows for that line. Inlined,
+    monomorphized or split copies of a line therefore each contribute an
+    address, while a single block never yields more than one.
+    """
+
+    def __init__(self, path: str, lines: array, offsets: array, addresses: array, columns: array):
+        self.path = path
+        self.lines = lines
+        self.offsets = offsets
+        self.addresses = addresses
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def _position(self, line: int) -> int:
+        """Index of line in self.lines, or -1."""
+        i = bisect_left(self.lines, line)
+        if i < len(self.lines) and self.lines[i] == line:
+            return i
+        return -1
+
+    def addresses_for(self, line: int) -> List[int]:
+        """All breakpoint addresses of exactly this line."""
+        i = self._position(line)
+        if i < 0:
+            return []
+        return self.addresses[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+    def columns_for(self, line: int) -> List[int]:
+        """Distinct known (non-zero) columns of this line, ascending."""
+        i = self._position(line)
+        if i < 0:
+            return []
+        return sorted({c for c in self.columns[self.offsets[i]:self.offsets[i + 1]] if c})
+
+    def nearest_line(self, line: int) -> Optional[int]:
+        """Closest line that has code; on a tie the following line wins."""
+        lines = self.lines
+        if not lines:
+            return None
+        i = bisect_left(lines, line)
+        if i == len(lines):
+            return lines[-1]
+        if i == 0 or lines[i] == line:
+            return lines[i]
+        before, after = lines[i - 1], lines[i]
+        return before if line - before < after - line else after
+
+    def lines_between(self, start: int, end: int) -> List[int]:
+        """Lines with code in [start, end]."""
+        return self.lines[bisect_left(self.lines, start):bisect_right(self.lines, end)].tolist()
+
+
+def build_file_index(table: LineTable) -> Dict[str, FileLines]:
+    """Group a line table by file, keyed by the full path recorded in DWARF."""
+    if np is not None and len(table):
+        return _build_file_index_numpy(table)
+
+    addresses = table.addresses
+    file_indexes = table.file_indexes
+    lines = table.lines
+    columns = table.columns
+
+    # Pick the first is_stmt row of each run of rows with the same file and
+    # line, then sort those by (file, line, address) through one integer key
+    # per row. Line 0 means "no source line" (compiler-generated code).
+    keys = {}
+    run = None
+    taken = False
+    for i, (address, file_index, line, flags) in enumerate(zip(addresses, file_indexes, lines, table.flags)):
+        if flags & FLAG_END_SEQUENCE:
+            run = None
+            continue
+        if (file_index, line) != run:
+            run = (file_index, line)
+            taken = False
+        if taken or not flags & FLAG_IS_STMT or not line:
+            continue
+        taken = True
+        keys[i] = ((file_index << 32 | line) << 64) | address
+    order = sorted(keys, key=keys.__getitem__)
+
+    index = {}
+    current_file = None
+    file_lines = offsets = file_addresses = file_columns = None
+    previous_line = previous_address = None
+
+    def finish():
+        offsets.append(len(file_addresses))
+        path = table.file_names[current_file]
+        index[path] = FileLines(path, file_lines, offsets, file_addresses, file_columns)
+
+    for i in order:
+        file_index = file_indexes[i]
+        if file_index != current_file:
+            if current_file is not None:
+                finish()
+            current_file = file_index
+            file_lines, offsets = array('I'), array('I')
+            file_addresses, file_columns = array('Q'), array('I')
+            previous_line = previous_address = None
+
+        line = lines[i]
+        address = addresses[i]
+        if line != previous_line:
+            file_lines.append(line)
+            offsets.append(len(file_addresses))
+            previous_line = line
+        elif address == previous_address:
+            # Same address emitted twice for this line (e.g. column change)
+            continue
+        file_addresses.append(address)
+        file_columns.append(columns[i])
+        previous_address = address
+
+    if current_file is not None:
+        finish()
+
+    return index
+
+
+def _build_file_index_numpy(table: LineTable) -> Dict[str, FileLines]:
+    """Same as build_file_index(), with sorting and grouping done in NumPy."""
+    addresses = np.asarray(table.addresses, dtype=np.uint64)
+    file_indexes = np.asarray(table.file_indexes, dtype=np.uint32)
+    lines = np.asarray(table.lines, dtype=np.uint32)
+    columns = np.asarray(table.columns, dtype=np.uint32)
+    flags = np.asarray(table.flags, dtype=np.uint8)
+
+    # A run starts at every change of file or line and after end_sequence;
+    # keep the first is_stmt row of each run
+    end_sequence = (flags & FLAG_END_SEQUENCE) != 0
+    new_run = np.ones(len(flags), dtype=bool)
+    new_run[1:] = (file_indexes[1:] != file_indexes[:-1]) | (lines[1:] != lines[:-1]) | end_sequence[:-1]
+    run_ids = np.cumsum(new_run)
+
+    candidates = np.flatnonzero(~end_sequence & ((flags & FLAG_IS_STMT) != 0) & (lines != 0))
+    _, first = np.unique(run_ids[candidates], return_index=True)
+    rows = candidates[first]
+    if not len(rows):
+        return {}
+
+    rows = rows[np.lexsort((addresses[rows], lines[rows], file_indexes[rows]))]
+    files, lines, addresses, columns = file_indexes[rows], lines[rows], addresses[rows], columns[rows]
+
+    # Drop repeated (file, line, address) rows
+    keep = np.ones(len(rows), dtype=bool)
+    keep[1:] = (files[1:] != files[:-1]) | (lines[1:] != lines[:-1]) | (addresses[1:] != addresses[:-1])
+    files, lines, addresses, columns = files[keep], lines[keep], addresses[keep], columns[keep]
+
+    index = {}
+    bounds = np.concatenate(([0], np.flatnonzero(files[1:] != files[:-1]) + 1, [len(files)]))
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        file_lines = lines[start:end]
+        first_of_line = np.ones(end - start, dtype=bool)
+        first_of_line[1:] = file_lines[1:] != file_lines[:-1]
+        offsets = np.append(np.flatnonzero(first_of_line), end - start)
+
+        path = table.file_names[int(files[start])]
+        index[path] = FileLines(
+            path,
+            array('I', file_lines[first_of_line].tobytes()),
+            array('I', offsets.astype(np.uint32).tobytes()),
+            array('Q', addresses[start:end].tobytes()),
+            array('I', columns[start:end].tobytes()),
+        )
+
+    return index
@@ -0,0 +1,92 @@
+"""
+Compact line table storage
+Keeps decoded DWARF rows as parallel arrays instead of per-row objects
+"""
+
+from array import array
+from typing import Iterator, List, NamedTuple, Sequence
+
+from .dwarf_line import LineRow
+
+
+# Bits of LineTable.flags
+FLAG_IS_STMT = 0x1
+FLAG_END_SEQUENCE = 0x2
+
+
+class FunctionRange(NamedTuple):
+    """Address range [start, end) of a function in the contract ELF."""
+    start: int
+    end: int
+    name: str
+
+
+class LineTable:
+    """
+    Decoded line table as parallel arrays.
+
+    Row i covers addresses[i], file_names[file_indexes[i]], lines[i], ...
+    The arrays are array.array instances when built from DWARF, or
+    memoryviews into the source-map cache when loaded from it.
+    """
+
+    def __init__(
+        self,
+        file_names: List[str],
+        addresses: Sequence[int],
+        file_indexes: Sequence[int],
+        lines: Sequence[int],
+        columns: Sequence[int],
+        discriminators: Sequence[int],
+        flags: Sequence[int],
+    ):
+        self.file_names = file_names
+        self.addresses = addresses
+        self.file_indexes = file_indexes
+        self.lines = lines
+        self.columns = columns
+        self.discriminators = discriminators
+        self.flags = flags
+
+    @classmethod
+    def from_rows(cls, rows: List[LineRow]) -> "LineTable":
+        """Build a table from decoded rows, interning file names."""
+        file_ids = {}
+        addresses = array('Q')
+        file_indexes = array('I')
+        lines = array('I')
+        columns = array('I')
+        discriminators = array('I')
+        flags = array('B')
+
+        for row in rows:
+            file_id = file_ids.get(row.file)
+            if file_id is None:
+                file_id = file_ids[row.file] = len(file_ids)
+            addresses.append(row.address)
+            file_indexes.append(file_id)
+            lines.append(row.line)
+            columns.append(row.column)
+            discriminators.append(row.discriminator)
+            flags.append((FLAG_IS_STMT if row.is_stmt else 0) | (FLAG_END_SEQUENCE if row.end_sequence else 0))
+
+        return cls(list(file_ids), addresses, file_indexes, lines, columns, discriminators, flags)
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    def row(self, index: int) -> LineRow:
+        flags = self.flags[index]
+        return LineRow(
+            self.addresses[index],
+            self.file_names[self.file_indexes[index]],
+            self.lines[index],
+            self.columns[index],
+            bool(flags & FLAG_IS_STMT),
+            self.discriminators[index],
+            bool(flags & FLAG_END_SEQUENCE),
+        )
+
+    def rows(self) -> Iterator[LineRow]:
+        for index in range(len(self)):
+            yield self.row(index)
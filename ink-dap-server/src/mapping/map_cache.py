@@ -0,0 +1,283 @@
+"""
+Persistent source-map cache
+Stores decoded line tables and scopes keyed by the SHA-256 of the contract ELF,
+so an unchanged contract does not have to be re-parsed on every launch
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .dwarf_info import ScopeTable
+from .line_table import FunctionRange, LineTable
+
+
+CACHE_MAGIC = b'INKSMAP\0'
+CACHE_VERSION = 3
+CACHE_SUFFIX = '.smap'
+
+# magic, version, byte order, rows, files, functions, scopes, scope files,
+# scope ranges, string blob size
+HEADER = struct.Struct('<8sIIIIIIIII')
+BYTE_ORDER_LITTLE = 1
+BYTE_ORDER_BIG = 2
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def default_cache_dir() -> Path:
+    """Per-user cache directory for source maps."""
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        if sys.platform == 'win32':
+            base = os.environ.get('LOCALAPPDATA') or str(Path.home() / 'AppData' / 'Local')
+        else:
+            base = str(Path.home() / '.cache')
+    return Path(base) / 'ink-debugger' / 'source-maps'
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class SourceMapCache:
+    """
+    Content-addressed cache of decoded source maps.
+
+    Each entry is one file named after the ELF digest, holding the line
+    table and scope table as raw arrays that are memory-mapped back on load. Entries are
+    touched on every hit and the least recently used ones are evicted once
+    the directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.logger = logging.getLogger("InkDebugAdapter.SourceMapCache")
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key_for(elf_path: str) -> str:
+        """Content hash identifying an ELF file."""
+        with open(elf_path, 'rb') as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return hashlib.sha256(data).hexdigest()
+            except ValueError:
+                # Empty file, cannot be mapped
+                return hashlib.sha256(b'').hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{CACHE_SUFFIX}"
+
+    def load(self, key: str) -> Optional[Tuple[LineTable, List[FunctionRange], ScopeTable]]:
+        """
+        Load a cached source map.
+
+        Returns:
+            (line table, function ranges, scope table) or None on a miss.
+            The table arrays are views into the mapped cache file.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            entry = self._decode(data)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            self.logger.warning(f"Discarding corrupt cache entry {path.name}: {e}")
+            data.close()
+            self._remove(path)
+            return None
+
+        if entry is None:
+            data.close()
+            self._remove(path)
+            return None
+
+        # Record the hit for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.logger.debug(f"Source map cache hit: {path.name}")
+        return entry
+
+    def store(self, key: str, table: LineTable, functions: List[FunctionRange], scopes: ScopeTable):
+        """Write a source map to the cache and evict old entries if over the size cap."""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            payload = self._encode(table, functions, scopes)
+
+            # Write to a temporary file first so readers never see partial entries
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(payload)
+                os.replace(tmp_path, self._entry_path(key))
+            except BaseException:
+                self._remove(Path(tmp_path))
+                raise
+
+            self.logger.debug(f"Stored source map {key[:12]} ({len(payload)} bytes)")
+            self.evict()
+
+        except OSError as e:
+            self.logger.warning(f"Could not write source map cache: {e}")
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        try:
+            entries = []
+            for path in self.cache_dir.glob(f"*{CACHE_SUFFIX}"):
+                st = path.stat()
+                entries.append((st.st_mtime, st.st_size, path))
+        except OSError as e:
+            self.logger.warning(f"Could not scan source map cache: {e}")
+            return
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+                self.logger.debug(f"Evicted source map {path.name}")
+
+    def _remove(self, path: Path) -> bool:
+        try:
+            path.unlink()
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _encode(table: LineTable, functions: List[FunctionRange], scopes: ScopeTable) -> bytes:
+        """Serialize a source map as header, aligned arrays and a string blob."""
+        strings = bytearray()
+
+        def intern(text: str) -> int:
+            offset = len(strings)
+            strings.extend(text.encode('utf-8'))
+            strings.append(0)
+            return offset
+
+        file_offsets = array('I', (intern(name) for name in table.file_names))
+        func_starts = array('Q', (f.start for f in functions))
+        func_ends = array('Q', (f.end for f in functions))
+        func_names = array('I', (intern(f.name) for f in functions))
+        scope_names = array('I', (intern(name) for name in scopes.names))
+        scope_file_offsets = array('I', (intern(name) for name in scopes.file_names))
+
+        byte_order = BYTE_ORDER_LITTLE if sys.byteorder == 'little' else BYTE_ORDER_BIG
+        sections = [
+            array('Q', table.addresses),
+            func_starts,
+            func_ends,
+            array('I', table.file_indexes),
+            array('I', table.lines),
+            array('I', table.columns),
+            array('I', table.discriminators),
+            file_offsets,
+            func_names,
+            array('Q', scopes.starts),
+            array('Q', scopes.ends),
+            array('i', scopes.parents),
+            array('i', scopes.decl_files),
+            array('I', scopes.decl_lines),
+            array('i', scopes.call_files),
+            array('I', scopes.call_lines),
+            array('I', scopes.call_columns),
+            scope_names,
+            scope_file_offsets,
+            array('I', scopes.range_scopes),
+            array('B', table.flags),
+        ]
+
+        out = bytearray(HEADER.pack(
+            CACHE_MAGIC, CACHE_VERSION, byte_order,
+            len(table), len(table.file_names), len(functions),
+            len(scopes), len(scopes.file_names), len(scopes.starts), len(strings),
+        ))
+        for section in sections:
+            out.extend(bytes(_align(len(out)) - len(out)))
+            out.extend(section.tobytes())
+        out.extend(strings)
+        return bytes(out)
+
+    @staticmethod
+    def _decode(data: mmap.mmap) -> Optional[Tuple[LineTable, List[FunctionRange], ScopeTable]]:
+        """Map a cache file back into tables whose arrays view the mmap."""
+        (magic, version, byte_order, row_count, file_count, func_count,
+         scope_count, scope_file_count, range_count, strings_size) = HEADER.unpack_from(data, 0)
+        native = BYTE_ORDER_LITTLE if sys.byteorder == 'little' else BYTE_ORDER_BIG
+        if magic != CACHE_MAGIC or version != CACHE_VERSION or byte_order != native:
+            return None
+
+        view = memoryview(data)
+        offset = HEADER.size
+
+        def take(typecode: str, count: int):
+            nonlocal offset
+            offset = _align(offset)
+            size = count * array(typecode).itemsize
+            if offset + size > len(data):
+                raise ValueError("truncated cache entry")
+            part = view[offset:offset + size].cast(typecode)
+            offset += size
+            return part
+
+        addresses = take('Q', row_count)
+        func_starts = take('Q', func_count)
+        func_ends = take('Q', func_count)
+        file_indexes = take('I', row_count)
+        lines = take('I', row_count)
+        columns = take('I', row_count)
+        discriminators = take('I', row_count)
+        file_offsets = take('I', file_count)
+        func_names = take('I', func_count)
+        scope_starts = take('Q', range_count)
+        scope_ends = take('Q', range_count)
+        parents = take('i', scope_count)
+        decl_files = take('i', scope_count)
+        decl_lines = take('I', scope_count)
+        call_files = take('i', scope_count)
+        call_lines = take('I', scope_count)
+        call_columns = take('I', scope_count)
+        scope_names = take('I', scope_count)
+        scope_file_offsets = take('I', scope_file_count)
+        range_scopes = take('I', range_count)
+        flags = take('B', row_count)
+
+        if offset + strings_size > len(data):
+            raise ValueError("truncated string table")
+        strings_start = offset
+
+        def string_at(string_offset: int) -> str:
+            start = strings_start + string_offset
+            return data[start:data.find(b'\0', start)].decode('utf-8')
+
+        file_names = [string_at(o) for o in file_offsets]
+        functions = [
+            FunctionRange(start, end, string_at(name))
+            for start, end, name in zip(func_starts, func_ends, func_names)
+        ]
+
+        scopes = ScopeTable(
+            [string_at(o) for o in scope_names], parents, decl_files, decl_lines, call_files, call_lines, call_columns,
+            [string_at(o) for o in scope_file_offsets], scope_starts, scope_ends, range_scopes,
+        )
+
+        table = LineTable(file_names, addresses, file_indexes, lines, columns, discriminators, flags)
+        return table, functions, scopes
@@ -0,0 +1,169 @@
+"""
+Function scope index
+Answers "which functions, inlined ones included, cover this PC" from DWARF scopes
+"""
+
+import heapq
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .demangle import demangle
+from .dwarf_info import ScopeTable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ScopeFrame(NamedTuple):
+    """One frame at a PC, inlined or not, and the source location it is executing."""
+    # Demangled function name, None if unknown
+    name: Optional[str]
+    # DWARF file path, None if unmapped
+    path: Optional[str]
+    line: int
+    # 0 if unknown
+    column: int
+
+
+class ScopeIndex:
+    """
+    Interval index over the address ranges of a ScopeTable.
+
+    DWARF scopes nest: an inlined subroutine lies inside the function it
+    was inlined into, so the scopes covering any PC form one chain of
+    parents. The ranges are therefore flattened once, with a sweep over
+    their boundaries, into sorted segments that each record only the
+    innermost scope covering them. A point query is a binary search for
+    the segment plus a walk up the k parents (O(log n + k)), and a batch
+    query over a PC array is one searchsorted pass.
+
+    Names are demangled on first use and memoized.
+    """
+
+    def __init__(self, table: ScopeTable):
+        self.table = table
+        # Added to every index address; see SourceMapper.apply_address_offset
+        self.offset = 0
+        # Demangled name of each scope looked up so far
+        self._names: Dict[int, str] = {}
+        # NumPy copies of starts/scopes, built on first find_many()
+        self._np_arrays = None
+
+        parents = table.parents
+        # Per scope: frames from its subprogram down to it, and the subprogram
+        self.depths = array('I')
+        self.roots = array('i')
+        for scope, parent in enumerate(parents):
+            if parent < 0:
+                self.depths.append(1)
+                self.roots.append(scope)
+            else:
+                self.depths.append(self.depths[parent] + 1)
+                self.roots.append(self.roots[parent])
+        self._build(table)
+
+    def _build(self, table: ScopeTable):
+        starts, ends, range_scopes = table.starts, table.ends, table.range_scopes
+        depths = self.depths
+        typecode = 'I' if not len(ends) or max(ends) < 1 << 32 else 'Q'
+        # Segment i covers [starts[i], starts[i + 1]) and is innermost in scopes[i]
+        self.starts = array(typecode)
+        self.scopes = array('i')
+
+        order = sorted(range(len(starts)), key=starts.__getitem__)
+        boundaries = sorted(set(starts) | set(ends))
+        # Open ranges, deepest first, then the latest and shortest
+        active: List[Tuple[int, int, int, int]] = []
+        next_range = 0
+        for boundary in boundaries:
+            while next_range < len(order) and starts[order[next_range]] <= boundary:
+                i = order[next_range]
+                heapq.heappush(active, (-depths[range_scopes[i]], -starts[i], ends[i], i))
+                next_range += 1
+            # Ranges are closed lazily, once they reach the top
+            while active and active[0][2] <= boundary:
+                heapq.heappop(active)
+            scope = range_scopes[active[0][3]] if active else -1
+            if not len(self.scopes) or self.scopes[-1] != scope:
+                self.starts.append(boundary)
+                self.scopes.append(scope)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def find(self, pc: int) -> int:
+        """Innermost scope covering pc, or -1."""
+        i = bisect_right(self.starts, pc - self.offset) - 1
+        return self.scopes[i] if i >= 0 else -1
+
+    def find_many(self, pcs):
+        """
+        Vectorized find() over a stream of PCs.
+
+        With NumPy available this is a single searchsorted pass and
+        returns an int64 ndarray; otherwise it returns an array('q').
+        """
+        if np is not None:
+            if self._np_arrays is None:
+                self._np_arrays = (
+                    np.asarray(self.starts, dtype=np.int64),
+                    np.append(np.asarray(self.scopes, dtype=np.int64), -1),
+                )
+            starts, scopes = self._np_arrays
+            indexes = np.searchsorted(starts, np.asarray(pcs, dtype=np.int64) - self.offset, side='right') - 1
+            # Index -1 picks the trailing -1: before the first segment
+            return scopes[indexes]
+        return array('q', (self.find(pc) for pc in pcs))
+
+    def functions_many(self, pcs):
+        """Outermost scope (the subprogram) covering each PC, or -1; see find_many()."""
+        innermost = self.find_many(pcs)
+        if np is not None:
+            roots = np.append(np.asarray(self.roots, dtype=np.int64), -1)
+            return roots[innermost]
+        return array('q', (self.roots[scope] if scope >= 0 else -1 for scope in innermost))
+
+    def scopes_at(self, pc: int) -> List[int]:
+        """Scopes covering pc, innermost first: inlined subroutines, then their subprogram."""
+        scopes = []
+        scope = self.find(pc)
+        parents = self.table.parents
+        while scope >= 0:
+            scopes.append(scope)
+            scope = parents[scope]
+        return scopes
+
+    def depth_at(self, pc: int) -> int:
+        """Number of scopes covering pc."""
+        scope = self.find(pc)
+        return self.depths[scope] if scope >= 0 else 0
+
+    def name(self, scope: int) -> str:
+        """Demangled name of a scope."""
+        name = self._names.get(scope)
+        if name is None:
+            name = self._names[scope] = demangle(self.table.names[scope])
+        return name
+
+    def declaration(self, scope: int) -> Optional[Tuple[str, int]]:
+        """(file path, line) the function of a scope is declared at, None if DWARF does not say."""
+        file = self.table.decl_files[scope]
+        if file < 0:
+            return None
+        return self.table.file_names[file], self.table.decl_lines[scope]
+
+    def call_site(self, scope: int) -> Optional[Tuple[str, int, int]]:
+        """(file path, line, column) an inlined scope was called from, None for subprograms."""
+        file = self.table.call_files[scope]
+        if file < 0:
+            return None
+        return self.table.file_names[file], self.table.call_lines[scope], self.table.call_columns[scope]
+
+    def entry(self, scope: int) -> Optional[int]:
+        """Lowest address of a scope, offset applied."""
+        table = self.table
+        starts = [start for start, owner in zip(table.starts, table.range_scopes) if owner == scope]
+        return min(starts) + self.offset if starts else None
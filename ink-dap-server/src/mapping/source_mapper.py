@@ -3,171 +3,390 @@ Source code to instructions mapping
 Maps source file lines to PolkaVM instruction addresses
 """
 
-import subprocess
-import re
 import logging
+from bisect import bisect_right
 from typing import Dict, Tuple, Optional, List
-from pathlib import Path
+from pathlib import PurePosixPath
+
+from .demangle import demangle
+from .dwarf_info import ScopeTable, decode_scopes
+from .dwarf_line import DwarfError, decode_line_programs
+from .elf_file import ElfError, ElfFile
+from .line_index import FileLines, build_file_index
+from .line_table import FunctionRange, LineTable
+from .address_index import AddressIndex
+from .map_cache import SourceMapCache
+from .scope_index import ScopeFrame, ScopeIndex
 
 
 class SourceMapper:
     """Maps source code lines to instruction addresses."""
 
-    def __init__(self):
+    def __init__(self, cache: Optional[SourceMapCache] = None):
         self.logger = logging.getLogger("InkDebugAdapter.SourceMapper")
-        # Mapping: (file, line) -> instruction_address
-        self.mappings: Dict[Tuple[str, int], int] = {}
-        # Reverse mapping: instruction_address -> (file, line)
-        self.reverse_mappings: Dict[int, Tuple[str, int]] = {}
+        # Per-file index: DWARF file path -> lines with code and their addresses
+        self.file_index: Dict[str, FileLines] = {}
+        # File name -> DWARF file paths with that name
+        self._paths_by_name: Dict[str, List[str]] = {}
+        # Requested source path -> resolved FileLines (or None)
+        self._resolved: Dict[str, Optional[FileLines]] = {}
+        # Runtime address minus ELF address
+        self.address_offset = 0
+        # Range index: instruction_address -> covering line table row
+        self.address_index = AddressIndex(LineTable([], [], [], [], [], [], []))
+        # Decoded DWARF line table, in program order
+        self.line_table: LineTable = LineTable([], [], [], [], [], [], [])
+        # Function address ranges from the ELF symbol table
+        self.functions: List[FunctionRange] = []
+        # Subprograms and inlined subroutines from .debug_info
+        self.scopes: ScopeTable = ScopeTable.empty()
+        # Interval index: instruction_address -> covering scopes
+        self.scope_index = ScopeIndex(self.scopes)
+        # Optional persistent cache of decoded source maps
+        self.cache = cache
+        # File path -> file name, shared by the lookups below
+        self._basenames: Dict[str, str] = {}
+        # functions sorted by start, and their starts, for function_at()
+        self._sorted_functions: List[FunctionRange] = []
+        self._function_starts: List[int] = []
 
     def load_debug_info(self, elf_path: str):
         """
-        Load debug information from ELF file using readelf.
+        Load debug information from ELF file.
+
+        The DWARF line-number programs and function scopes are decoded
+        in-process from a memory-mapped view of the file. If a cache is
+        configured, the decoded tables are looked up by ELF content hash
+        first. Scopes are optional: without usable .debug_info, frames are
+        named from the ELF symbol table alone.
 
         Args:
             elf_path: Path to ELF file
         """
         self.logger.info(f"Loading debug information from: {elf_path}")
 
-        try:
-            # Run readelf to get debug line information
-            result = subprocess.run(
-                ["readelf", "--debug-dump=decodedline", elf_path],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-
-            # Parse output
-            self._parse_readelf_output(result.stdout)
-
-            self.logger.info(f"Loaded {len(self.mappings)} line mappings")
+        key = None
+        if self.cache is not None:
+            try:
+                key = self.cache.key_for(elf_path)
+                cached = self.cache.load(key)
+            except OSError as e:
+                self.logger.error(f"Failed to read {elf_path}: {e}")
+                raise
+            if cached is not None:
+                self.line_table, self.functions, self.scopes = cached
+                self._build_indexes()
+                self.logger.info(f"Loaded {self._line_count()} mapped lines from cache")
+                return
 
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Failed to run readelf: {e}")
-            raise
-        except FileNotFoundError:
-            self.logger.error("readelf not found. Please install binutils.")
+        try:
+            with ElfFile(elf_path) as elf:
+                rows = decode_line_programs(elf)
+                functions = [FunctionRange(*f) for f in elf.function_symbols()]
+                try:
+                    scopes = decode_scopes(elf)
+                except DwarfError as e:
+                    self.logger.warning(f"Ignoring unreadable function scopes: {e}")
+                    scopes = ScopeTable.empty()
+        except (OSError, ElfError, DwarfError) as e:
+            self.logger.error(f"Failed to read debug line info: {e}")
             raise
 
-    def _parse_readelf_output(self, output: str):
-        """Parse readelf output to extract line mappings."""
-        # Example readelf output:
-        # lib.rs                                        8           0x12f1e       48
-        # lib.rs                                       30           0x12f32       51
-
-        # Pattern to match readelf output lines
-        pattern = r'(\S+\.rs)\s+(\d+)\s+0x([0-9a-fA-F]+)'
+        self.line_table = LineTable.from_rows(rows)
+        self.functions = functions
+        self.scopes = scopes
+        self._build_indexes()
+        self.logger.info(
+            f"Loaded {self._line_count()} mapped lines from {len(rows)} line table rows, {len(scopes)} function scopes"
+        )
+
+        if key is not None:
+            self.cache.store(key, self.line_table, self.functions, self.scopes)
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether debug info has been loaded."""
+        return len(self.line_table) > 0
+
+    def _build_indexes(self):
+        """Build the lookup indexes once from the decoded line table."""
+        table = self.line_table
+        self.address_index = AddressIndex(table)
+        self.address_index.offset = self.address_offset
+        self.file_index = build_file_index(table)
+        self._resolved = {}
+        self._sorted_functions = sorted(self.functions, key=lambda function: function.start)
+        self._function_starts = [function.start for function in self._sorted_functions]
+        self.scope_index = ScopeIndex(self.scopes)
+        self.scope_index.offset = self.address_offset
+
+        self._paths_by_name = {}
+        for path in self.file_index:
+            self._paths_by_name.setdefault(self._basename(path), []).append(path)
+
+    def _line_count(self) -> int:
+        return sum(len(lines) for lines in self.file_index.values())
+
+    def resolve_file(self, file: str) -> Optional[FileLines]:
+        """
+        Find the DWARF file that a source path refers to.
 
-        for line in output.split('\n'):
-            match = re.search(pattern, line)
-            if match:
-                filename = match.group(1)
-                line_num = int(match.group(2))
-                address = int(match.group(3), 16)
+        Paths from VS Code are workspace paths while DWARF records build
+        paths, so files are matched by name and, among files sharing a
+        name, by the longest common trailing path.
 
-                # Store mapping
-                self.mappings[(filename, line_num)] = address
-                self.reverse_mappings[address] = (filename, line_num)
+        Args:
+            file: Source file path (or just a file name)
 
-                self.logger.debug(f"Mapped {filename}:{line_num} → 0x{address:x}")
+        Returns:
+            The file's line index or None if the file has no code
+        """
+        if file in self._resolved:
+            return self._resolved[file]
+
+        parts = file.replace('\\', '/').split('/')
+        candidates = self._paths_by_name.get(parts[-1], [])
+
+        best, best_score = None, 0
+        for path in candidates:
+            score = 0
+            for a, b in zip(reversed(parts), reversed(path.split('/'))):
+                if a != b:
+                    break
+                score += 1
+            if score > best_score:
+                best, best_score = path, score
+
+        result = self.file_index[best] if best is not None else None
+        self._resolved[file] = result
+        return result
 
     def line_to_address(self, file: str, line: int) -> Optional[int]:
         """
         Convert source line to instruction address.
 
         Args:
-            file: Source file name
+            file: Source file path
             line: Line number
 
         Returns:
-            Instruction address or None if not found
+            Lowest instruction address of the line or None if not found
         """
-        # Try using only filename (not full path)
-        filename = Path(file).name
-        address = self.mappings.get((filename, line))
+        file_lines = self.resolve_file(file)
+        addresses = file_lines.addresses_for(line) if file_lines else []
 
-        if address is not None:
-            self.logger.debug(f"Mapped {filename}:{line} → 0x{address:x}")
-        else:
-            self.logger.warning(f"No mapping found for {filename}:{line}")
+        if not addresses:
+            self.logger.warning(f"No mapping found for {file}:{line}")
+            return None
 
+        address = addresses[0] + self.address_offset
+        self.logger.debug("Mapped %s:%s → 0x%x", file, line, address)
         return address
 
     def address_to_line(self, address: int) -> Optional[Tuple[str, int]]:
         """
         Convert instruction address to source line.
 
+        Any address inside a line table row resolves to that row, not only
+        the row's first instruction.
+
         Args:
             address: Instruction address
 
         Returns:
             Tuple of (filename, line) or None if not found
         """
-        return self.reverse_mappings.get(address)
+        location = self.address_index.lookup(address)
+        if location is None:
+            return None
+        return self._basename(location[0]), location[1]
 
-    def find_nearest_address(self, file: str, line: int) -> Optional[int]:
+    def addresses_to_lines(self, addresses) -> List[Optional[Tuple[str, int]]]:
         """
-        Find nearest mapped address for given line.
-        Useful when exact line mapping doesn't exist.
+        Convert a whole stream of instruction addresses to source lines.
 
         Args:
-            file: Source file name
-            line: Line number
+            addresses: Iterable of addresses (list, array or NumPy array)
 
         Returns:
-            Nearest instruction address or None
+            (filename, line) or None for each address
+        """
+        return [
+            (self._basename(location[0]), location[1]) if location is not None else None
+            for location in self.address_index.lookup_many(addresses)
+        ]
+
+    def function_at(self, address: int) -> Optional[FunctionRange]:
         """
-        filename = Path(file).name
+        Find the function holding an instruction address.
+
+        Args:
+            address: Instruction address
+
+        Returns:
+            The function's range (ELF addresses) or None
+        """
+        address -= self.address_offset
+        i = bisect_right(self._function_starts, address) - 1
+        if i < 0 or address >= self._sorted_functions[i].end:
+            return None
+        return self._sorted_functions[i]
+
+    def frames_at(self, address: int) -> List[ScopeFrame]:
+        """
+        Frames executing at an instruction address, innermost first.
+
+        These are the functions inlined at the address, then the function
+        they were inlined into. The innermost frame is located at the
+        address itself, every other frame at the call site of the frame
+        inlined into it. Without DWARF scopes covering the address, the
+        single frame is named from the symbol table.
 
-        # Find all lines for this file
-        file_lines = [
-            (l, addr) for (f, l), addr in self.mappings.items()
-            if f == filename
+        Args:
+            address: Instruction address
+
+        Returns:
+            Frames with demangled names; empty if the address is in no
+            known function and maps to no line
+        """
+        index = self.scope_index
+        location = self.address_index.lookup(address)
+        path, line = location if location is not None else (None, 0)
+        column = 0
+        frames = []
+        for scope in index.scopes_at(address):
+            frames.append(ScopeFrame(index.name(scope), path, line, column))
+            call_site = index.call_site(scope)
+            if call_site is not None:
+                path, line, column = call_site
+        if not frames:
+            function = self.function_at(address)
+            if function is not None or location is not None:
+                frames.append(ScopeFrame(demangle(function.name) if function else None, path, line, column))
+        return frames
+
+    def source_path(self, path: str) -> str:
+        """
+        Client path of a DWARF file: the longest source path that was
+        resolved to it (see resolve_file), else the DWARF path itself.
+        """
+        requested = [
+            file for file, file_lines in self._resolved.items()
+            if file_lines is not None and file_lines.path == path
         ]
+        return max(requested, key=len) if requested else path
+
+    def _basename(self, path: str) -> str:
+        name = self._basenames.get(path)
+        if name is None:
+            name = self._basenames[path] = PurePosixPath(path).name
+        return name
+
+    def line_to_addresses(self, file: str, line: int) -> List[int]:
+        """
+        Convert source line to every instruction address generated for it.
+
+        Args:
+            file: Source file path
+            line: Line number
 
+        Returns:
+            Breakpoint addresses of the line, ascending (empty if none)
+        """
+        file_lines = self.resolve_file(file)
         if not file_lines:
-            return None
+            return []
+        return [address + self.address_offset for address in file_lines.addresses_for(line)]
+
+    def resolve_breakpoint(self, file: str, line: int) -> Tuple[Optional[int], List[int]]:
+        """
+        Resolve a source breakpoint to the line it binds to and its addresses.
+
+        Lines without code bind to the nearest line that has code.
+
+        Args:
+            file: Source file path
+            line: Requested line number
+
+        Returns:
+            (bound line, addresses); (None, []) if the file has no code
+        """
+        bound_line = self.find_nearest_line(file, line)
+        if bound_line is None:
+            return None, []
+        return bound_line, self.line_to_addresses(file, bound_line)
+
+    def find_nearest_line(self, file: str, line: int) -> Optional[int]:
+        """
+        Find the closest line with code to the given line.
 
-        # Sort by line number
-        file_lines.sort(key=lambda x: x[0])
+        Args:
+            file: Source file path
+            line: Line number
 
-        # Find nearest line
-        best_line = None
-        best_addr = None
-        min_diff = float('inf')
+        Returns:
+            Nearest mapped line number or None if the file has no code
+        """
+        file_lines = self.resolve_file(file)
+        return file_lines.nearest_line(line) if file_lines else None
+
+    def find_nearest_address(self, file: str, line: int) -> Optional[int]:
+        """
+        Find nearest mapped address for given line.
+        Useful when exact line mapping doesn't exist.
 
-        for mapped_line, addr in file_lines:
-            diff = abs(mapped_line - line)
-            if diff < min_diff:
-                min_diff = diff
-                best_line = mapped_line
-                best_addr = addr
+        Args:
+            file: Source file path
+            line: Line number
 
-        if best_addr:
-            self.logger.debug(
-                f"Nearest mapping for {filename}:{line} is "
-                f"{filename}:{best_line} → 0x{best_addr:x}"
-            )
+        Returns:
+            Nearest instruction address or None
+        """
+        best_line = self.find_nearest_line(file, line)
+        if best_line is None:
+            return None
 
-        return best_addr
+        address = self.resolve_file(file).addresses_for(best_line)[0] + self.address_offset
+        self.logger.debug("Nearest mapping for %s:%s is line %s → 0x%x", file, line, best_line, address)
+        return address
 
     def get_file_lines(self, file: str) -> List[int]:
         """
         Get all mapped line numbers for a file.
 
         Args:
-            file: Source file name
+            file: Source file path
 
         Returns:
             List of line numbers that have mappings
         """
-        filename = Path(file).name
-        lines = [
-            line for (f, line) in self.mappings.keys()
-            if f == filename
-        ]
-        return sorted(lines)
+        file_lines = self.resolve_file(file)
+        return file_lines.lines.tolist() if file_lines else []
+
+    def breakpoint_locations(self, file: str, line: int, end_line: Optional[int] = None) -> List[Tuple[int, Optional[int]]]:
+        """
+        Get possible breakpoint positions in a line range.
+
+        Args:
+            file: Source file path
+            line: First line of the range
+            end_line: Last line of the range (defaults to line)
+
+        Returns:
+            (line, column) pairs; column is None when DWARF has no column
+        """
+        file_lines = self.resolve_file(file)
+        if not file_lines:
+            return []
+
+        locations = []
+        for mapped_line in file_lines.lines_between(line, end_line if end_line is not None else line):
+            columns = file_lines.columns_for(mapped_line)
+            if columns:
+                locations.extend((mapped_line, column) for column in columns)
+            else:
+                locations.append((mapped_line, None))
+        return locations
 
     def apply_address_offset(self, offset: int):
         """
@@ -178,15 +397,6 @@ class SourceMapper:
             offset: Offset to apply (can be negative)
         """
         self.logger.info(f"Applying address offset: {offset:#x}")
-
-        # Create new mappings with offset
-        new_mappings = {}
-        new_reverse = {}
-
-        for (file, line), addr in self.mappings.items():
-            new_addr = addr + offset
-            new_mappings[(file, line)] = new_addr
-            new_reverse[new_addr] = (file, line)
-
-        self.mappings = new_mappings
-        self.reverse_mappings = new_reverse
\ No newline at end of file
+        self.address_offset += offset
+        self.address_index.offset = self.address_offset
+        self.scope_index.offset = self.address_offset
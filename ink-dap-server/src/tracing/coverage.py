@@ -0,0 +1,212 @@
+"""
+Line coverage from execution traces
+Maps recorded PC streams to source lines and writes lcov and Cobertura reports
+"""
+
+import logging
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from mapping.demangle import demangle
+
+from .trace_store import iter_pcs
+
+
+class FunctionCoverage(NamedTuple):
+    """A function (demangled), the line it is declared at and how often it was entered."""
+    name: str
+    line: int
+    hits: int
+
+
+class FileCoverage(NamedTuple):
+    """Hit count of every code-bearing line of one source file."""
+    path: str
+    lines: Dict[int, int]
+    functions: List[FunctionCoverage]
+
+    @property
+    def lines_hit(self) -> int:
+        return sum(1 for hits in self.lines.values() if hits)
+
+
+class CoverageCollector:
+    """
+    Aggregates the PCs of any number of traces against one contract.
+
+    Each chunk of PCs is reduced to (unique PC, count) with np.unique
+    before it is merged, so the cost of mapping to lines depends on the
+    code size, not on the trace length: report() maps the unique PCs to
+    line table entries in a single searchsorted pass over the
+    SourceMapper's address index.
+    """
+
+    def __init__(self, mapper):
+        """
+        Args:
+            mapper: SourceMapper with the contract's debug info loaded
+        """
+        self.logger = logging.getLogger("InkDebugAdapter.Coverage")
+        self.mapper = mapper
+        self.pcs = np.zeros(0, dtype=np.uint32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.steps = 0
+        self.traces = 0
+
+    def add_pcs(self, pcs: np.ndarray):
+        """Count one chunk of executed PCs."""
+        if not len(pcs):
+            return
+        unique, counts = np.unique(pcs, return_counts=True)
+        self.steps += len(pcs)
+        if not len(self.pcs):
+            self.pcs, self.counts = unique, counts.astype(np.int64)
+            return
+        merged, inverse = np.unique(np.concatenate((self.pcs, unique)), return_inverse=True)
+        totals = np.zeros(len(merged), dtype=np.int64)
+        np.add.at(totals, inverse, np.concatenate((self.counts, counts)))
+        self.pcs, self.counts = merged, totals
+
+    def add_trace(self, path: str):
+        """Count every step of a trace file."""
+        start = time.perf_counter()
+        steps = self.steps
+        for chunk in iter_pcs(path):
+            self.add_pcs(chunk)
+        self.traces += 1
+        self.logger.info(
+            f"Counted {self.steps - steps} steps of {path} in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+    def report(self) -> List[FileCoverage]:
+        """
+        Coverage of every source file with code, sorted by path.
+
+        A line's hit count is the execution count of its most executed
+        instruction, so a line run once counts 1 however many
+        instructions it compiled to. A function's count is the number of
+        times its first instruction was executed; it is reported at the
+        file and line of its DWARF subprogram, or of its first instruction
+        when the subprogram has no declaration.
+        """
+        index = self.mapper.address_index
+        names = index.file_names
+        files = {
+            path: FileCoverage(path, dict.fromkeys(file_lines.lines.tolist(), 0), [])
+            for path, file_lines in self.mapper.file_index.items()
+        }
+
+        entries = np.asarray(index.find_many(self.pcs))
+        mapped = entries >= 0
+        if mapped.any():
+            entries = entries[mapped]
+            entry_files = np.frombuffer(index.files, dtype=np.int32)[entries].astype(np.int64)
+            entry_lines = np.frombuffer(index.lines, dtype=np.uint32)[entries].astype(np.int64)
+            keys, inverse = np.unique((entry_files << 32) | entry_lines, return_inverse=True)
+            hits = np.zeros(len(keys), dtype=np.int64)
+            np.maximum.at(hits, inverse, self.counts[mapped])
+
+            for key, count in zip(keys.tolist(), hits.tolist()):
+                path, line = names[key >> 32], key & 0xFFFFFFFF
+                if not line:
+                    continue
+                coverage = files.get(path)
+                if coverage is None:
+                    coverage = files[path] = FileCoverage(path, {}, [])
+                coverage.lines[line] = count
+
+        scopes = self.mapper.scope_index
+        for function in self.mapper.functions:
+            start = function.start + self.mapper.address_offset
+            # The subprogram, not an inlined callee that starts at the same address
+            scope = scopes.find(start)
+            location = scopes.declaration(scopes.roots[scope]) if scope >= 0 else None
+            if location is None:
+                location = index.lookup(start)
+            if location is None or location[0] not in files:
+                continue
+            i = np.searchsorted(self.pcs, start)
+            entered = int(self.counts[i]) if i < len(self.pcs) and self.pcs[i] == start else 0
+            files[location[0]].functions.append(FunctionCoverage(demangle(function.name), location[1], entered))
+
+        return [files[path] for path in sorted(files)]
+
+
+def summary(report: List[FileCoverage]) -> Tuple[int, int]:
+    """(lines hit, lines with code) over a whole report."""
+    return sum(f.lines_hit for f in report), sum(len(f.lines) for f in report)
+
+
+def to_lcov(report: List[FileCoverage], test_name: str = "") -> str:
+    """The report as an lcov tracefile (genhtml, Codecov, coverage gutters)."""
+    out = []
+    for coverage in report:
+        out.append(f"TN:{test_name}")
+        out.append(f"SF:{coverage.path}")
+        for function in coverage.functions:
+            out.append(f"FN:{function.line},{function.name}")
+        for function in coverage.functions:
+            out.append(f"FNDA:{function.hits},{function.name}")
+        out.append(f"FNF:{len(coverage.functions)}")
+        out.append(f"FNH:{sum(1 for function in coverage.functions if function.hits)}")
+        for line in sorted(coverage.lines):
+            out.append(f"DA:{line},{coverage.lines[line]}")
+        out.append(f"LF:{len(coverage.lines)}")
+        out.append(f"LH:{coverage.lines_hit}")
+        out.append("end_of_record")
+    return "\n".join(out) + "\n"
+
+
+def to_cobertura(report: List[FileCoverage]) -> str:
+    """The report as Cobertura XML (GitLab, Jenkins, Azure DevOps)."""
+    hit, valid = summary(report)
+    root = ET.Element("coverage", {
+        "line-rate": _rate(hit, valid),
+        "branch-rate": "0",
+        "lines-covered": str(hit),
+        "lines-valid": str(valid),
+        "branches-covered": "0",
+        "branches-valid": "0",
+        "complexity": "0",
+        "version": "1",
+        "timestamp": str(int(time.time())),
+    })
+    ET.SubElement(root, "sources")
+    packages = ET.SubElement(ET.SubElement(root, "packages"), "package", {
+        "name": "contract",
+        "line-rate": _rate(hit, valid),
+        "branch-rate": "0",
+        "complexity": "0",
+    })
+    classes = ET.SubElement(packages, "classes")
+    for coverage in report:
+        cls = ET.SubElement(classes, "class", {
+            "name": coverage.path.rsplit("/", 1)[-1],
+            "filename": coverage.path,
+            "line-rate": _rate(coverage.lines_hit, len(coverage.lines)),
+            "branch-rate": "0",
+            "complexity": "0",
+        })
+        methods = ET.SubElement(cls, "methods")
+        for function in coverage.functions:
+            method = ET.SubElement(methods, "method", {
+                "name": function.name,
+                "signature": "",
+                "line-rate": "1" if function.hits else "0",
+                "branch-rate": "0",
+            })
+            ET.SubElement(ET.SubElement(method, "lines"), "line", {
+                "number": str(function.line), "hits": str(function.hits),
+            })
+        lines = ET.SubElement(cls, "lines")
+        for line in sorted(coverage.lines):
+            ET.SubElement(lines, "line", {"number": str(line), "hits": str(coverage.lines[line]), "branch": "false"})
+    ET.indent(root)
+    return '<?xml version="1.0" ?>\n' + ET.tostring(root, encoding="unicode") + "\n"
+
+
+def _rate(hit: int, total: int) -> str:
+    return f"{hit / total:.4f}" if total else "1"
@@ -0,0 +1,226 @@
+"""
+Gas attribution for execution traces
+Charges the gas drop between recorded steps to source lines, functions and host calls
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from .profiler import FunctionTable
+from .trace_store import TraceError, iter_steps, read_trace_info
+
+
+class LineGas(NamedTuple):
+    """Gas charged while executing one source line."""
+    path: str
+    line: int
+    gas: int
+    steps: int
+
+
+class FunctionGas(NamedTuple):
+    """Gas charged while a function was the innermost frame."""
+    name: str
+    gas: int
+    steps: int
+
+
+class HostCallGas(NamedTuple):
+    """Gas charged by the calls of one host function (ecalli index)."""
+    id: int
+    name: str
+    calls: int
+    gas: int
+
+
+class GasAttribution:
+    """
+    Attributes the gas a run consumed to what it executed.
+
+    The gas charged for step i is the drop in gas left between step i and
+    step i + 1: the instruction at pcs[i] and, for a step stopped at an
+    ecalli, the host function it called (pallet-revive charges host
+    functions to the executor before the next step runs). The last step
+    of a run is charged nothing. Steps are grouped by PC with np.unique
+    first, so lines and functions are looked up once per PC.
+    """
+
+    def __init__(self, mapper, ref_time_per_fuel: Optional[int] = None,
+                 host_call_names: Optional[Dict[int, str]] = None):
+        """
+        Args:
+            mapper: SourceMapper with the contract's debug info loaded
+            ref_time_per_fuel: Weight ref_time per unit of gas, if known
+            host_call_names: Import name of each ecalli index, if known
+        """
+        self.logger = logging.getLogger("InkDebugAdapter.Gas")
+        self.mapper = mapper
+        self.ref_time_per_fuel = ref_time_per_fuel
+        self.host_call_names = dict(host_call_names or {})
+        self.pcs = np.zeros(0, dtype=np.uint32)
+        self.gas = np.zeros(0, dtype=np.int64)
+        self.steps = np.zeros(0, dtype=np.int64)
+        # Per ecalli index + 1: calls and gas
+        self.host_calls = np.zeros(0, dtype=np.int64)
+        self.host_gas = np.zeros(0, dtype=np.int64)
+        self.total = 0
+        self.step_count = 0
+        # Last step of the previous chunk, charged once the next one arrives
+        self._carry = None
+
+    @classmethod
+    def from_trace(cls, path: str, mapper) -> "GasAttribution":
+        """Attribute a whole trace file, with the run description recorded next to it."""
+        info = read_trace_info(path)
+        names = {int(id_): name for id_, name in (info.get("hostCallNames") or {}).items()}
+        attribution = cls(mapper, info.get("refTimePerFuel"), names)
+        attribution.add_trace(path)
+        return attribution
+
+    def add_trace(self, path: str):
+        """Attribute every step of a trace file recorded with gas."""
+        start = time.perf_counter()
+        steps = self.step_count
+        for pcs, host_calls, gas in iter_steps(path):
+            if gas is None:
+                raise TraceError(f"{path} was recorded without gas")
+            self.add_steps(pcs, gas, host_calls)
+        self.finish()
+        self.logger.info(
+            f"Attributed {self.step_count - steps} steps of {path} in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+    def add_steps(self, pcs: np.ndarray, gas: np.ndarray, host_calls: Optional[np.ndarray] = None):
+        """Attribute one chunk of consecutive steps of a run."""
+        if host_calls is None:
+            host_calls = np.zeros(len(pcs), dtype=np.uint32)
+        if self._carry is not None:
+            pcs = np.concatenate((self._carry[0], pcs))
+            gas = np.concatenate((self._carry[1], gas))
+            host_calls = np.concatenate((self._carry[2], host_calls))
+        if len(pcs) < 2:
+            self._carry = (pcs, gas, host_calls)
+            return
+        self._carry = (pcs[-1:], gas[-1:], host_calls[-1:])
+        self._charge(pcs[:-1], gas[:-1].astype(np.int64) - gas[1:], host_calls[:-1])
+
+    def finish(self):
+        """End the run: its last step is charged nothing."""
+        if self._carry is not None:
+            pcs, _, host_calls = self._carry
+            self._charge(pcs, np.zeros(len(pcs), dtype=np.int64), host_calls)
+            self._carry = None
+
+    def _charge(self, pcs: np.ndarray, charged: np.ndarray, host_calls: np.ndarray):
+        self.step_count += len(pcs)
+        self.total += int(charged.sum())
+
+        unique, inverse = np.unique(np.concatenate((self.pcs, pcs)), return_inverse=True)
+        gas = np.zeros(len(unique), dtype=np.int64)
+        steps = np.zeros(len(unique), dtype=np.int64)
+        previous = len(self.pcs)
+        np.add.at(gas, inverse[:previous], self.gas)
+        np.add.at(steps, inverse[:previous], self.steps)
+        np.add.at(gas, inverse[previous:], charged)
+        np.add.at(steps, inverse[previous:], 1)
+        self.pcs, self.gas, self.steps = unique, gas, steps
+
+        marked = np.flatnonzero(host_calls)
+        if len(marked):
+            markers = host_calls[marked].astype(np.int64)
+            size = max(len(self.host_calls), int(markers.max()) + 1)
+            self.host_calls = np.concatenate((self.host_calls, np.zeros(size - len(self.host_calls), np.int64)))
+            self.host_gas = np.concatenate((self.host_gas, np.zeros(size - len(self.host_gas), np.int64)))
+            np.add.at(self.host_calls, markers, 1)
+            np.add.at(self.host_gas, markers, charged[marked])
+
+    def lines(self) -> List[LineGas]:
+        """Gas per source line, most expensive first."""
+        index = self.mapper.address_index
+        entries = np.asarray(index.find_many(self.pcs))
+        mapped = entries >= 0
+        if not mapped.any():
+            return []
+        entries = entries[mapped]
+        files = np.frombuffer(index.files, dtype=np.int32)[entries].astype(np.int64)
+        lines = np.frombuffer(index.lines, dtype=np.uint32)[entries].astype(np.int64)
+        keys, inverse = np.unique((files << 32) | lines, return_inverse=True)
+        gas = np.zeros(len(keys), dtype=np.int64)
+        steps = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(gas, inverse, self.gas[mapped])
+        np.add.at(steps, inverse, self.steps[mapped])
+        order = np.argsort(-gas, kind="stable")
+        return [
+            LineGas(index.file_names[int(keys[i]) >> 32], int(keys[i]) & 0xFFFFFFFF, int(gas[i]), int(steps[i]))
+            for i in order.tolist() if int(keys[i]) & 0xFFFFFFFF
+        ]
+
+    def functions(self) -> List[FunctionGas]:
+        """Gas per function, most expensive first."""
+        table = FunctionTable(self.mapper)
+        functions = table.innermost_of(self.pcs)
+        gas = np.bincount(functions, weights=self.gas, minlength=len(table)).astype(np.int64)
+        steps = np.bincount(functions, weights=self.steps, minlength=len(table)).astype(np.int64)
+        ran = np.flatnonzero(steps)
+        ran = ran[np.argsort(-gas[ran], kind="stable")]
+        return [FunctionGas(table.names[i], int(gas[i]), int(steps[i])) for i in ran.tolist()]
+
+    def host_call_costs(self) -> List[HostCallGas]:
+        """Gas per host function, most expensive first."""
+        called = np.flatnonzero(self.host_calls)
+        called = called[np.argsort(-self.host_gas[called], kind="stable")]
+        return [
+            HostCallGas(i - 1, self.host_call_names.get(i - 1, f"ecalli {i - 1}"),
+                        int(self.host_calls[i]), int(self.host_gas[i]))
+            for i in called.tolist()
+        ]
+
+    def ref_time(self, gas: int) -> Optional[int]:
+        """gas in Weight ref_time, if the scale is known."""
+        return gas * self.ref_time_per_fuel if self.ref_time_per_fuel else None
+
+    def to_json(self, top: Optional[int] = None) -> Dict[str, Any]:
+        """
+        The report as JSON-serializable data.
+
+        Args:
+            top: Entries per table, all if None
+        """
+        def entry(row) -> Dict[str, Any]:
+            data = row._asdict()
+            ref_time = self.ref_time(row.gas)
+            if ref_time is not None:
+                data["refTime"] = ref_time
+            return data
+
+        return {
+            "steps": self.step_count,
+            "gas": self.total,
+            "refTime": self.ref_time(self.total),
+            "refTimePerFuel": self.ref_time_per_fuel,
+            "lines": [entry(row) for row in self.lines()[:top]],
+            "functions": [entry(row) for row in self.functions()[:top]],
+            "hostCalls": [entry(row) for row in self.host_call_costs()[:top]],
+        }
+
+    def format(self, top: int = 10) -> str:
+        """The most expensive lines, functions and host calls as text tables."""
+        total = self.total or 1
+        unit = "ref_time" if self.ref_time_per_fuel else "gas"
+        scale = self.ref_time_per_fuel or 1
+        out = [f"{self.step_count} steps, {self.total * scale} {unit}"]
+        out.append(f"\n{unit:>14} {'%':>6} {'steps':>9}  line")
+        for row in self.lines()[:top]:
+            out.append(f"{row.gas * scale:>14} {100 * row.gas / total:6.2f} {row.steps:>9}  {row.path}:{row.line}")
+        out.append(f"\n{unit:>14} {'%':>6} {'steps':>9}  function")
+        for row in self.functions()[:top]:
+            out.append(f"{row.gas * scale:>14} {100 * row.gas / total:6.2f} {row.steps:>9}  {row.name}")
+        host_calls = self.host_call_costs()[:top]
+        if host_calls:
+            out.append(f"\n{unit:>14} {'%':>6} {'calls':>9}  host function")
+            for row in host_calls:
+                out.append(f"{row.gas * scale:>14} {100 * row.gas / total:6.2f} {row.calls:>9}  {row.name}")
+        return "\n".join(out)
@@ -0,0 +1,367 @@
+"""
+Execution history for time-travel debugging
+Steps, register writes and checkpoints pushed by the sandbox before every stop
+"""
+
+import logging
+from bisect import bisect_right
+from typing import Any, Collection, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+
+# Register names in the order of polkavm's Reg::ALL
+REGISTERS = ("ra", "sp", "t0", "t1", "t2", "s0", "s1", "a0", "a1", "a2", "a3", "a4", "a5")
+
+# Register write records of a "history" payload (see ink-debug-rpc history.rs)
+REGISTER_WRITE = np.dtype([("step", "<u8"), ("reg", "<u4"), ("value", "<u8")])
+# Call and return records: the step landed on, the call instruction's PC
+# and CALL or RETURN
+CALL_EVENT = np.dtype([("step", "<u8"), ("pc", "<u4"), ("kind", "<u4")])
+CALL = 1
+RETURN = 2
+
+# Steps kept; older ones are dropped a checkpoint at a time
+MAX_STEPS = 16 * 1024 * 1024
+# Steps mapped to lines at a time while searching for a line boundary
+SCAN_WINDOW = 4096
+
+# Line key of steps without a source line
+NO_LINE = -1
+
+
+class Checkpoint(NamedTuple):
+    """All registers at one step."""
+    step: int
+    registers: tuple
+
+
+class ExecutionHistory:
+    """
+    Every step the contract executed since recording started, for stepping
+    backwards and forwards without re-running it.
+
+    Steps carry the numbers of the trace file. PCs and register writes are
+    kept in NumPy arrays, so the registers at any step are the nearest
+    checkpoint at or before it plus at most one checkpoint interval of
+    writes, and line boundaries are found by mapping a window of PCs at
+    once through the SourceMapper's address index.
+    """
+
+    def __init__(self, max_steps: int = MAX_STEPS):
+        self.logger = logging.getLogger("InkDebugAdapter.History")
+        self.max_steps = max_steps
+        # Step number of pcs[0]
+        self.start = 0
+        self._pcs = np.zeros(0, dtype=np.uint32)
+        # Gas left and host call markers per step, when the sandbox records them
+        self._gas = None
+        self._host_calls = None
+        self._size = 0
+        self._writes = np.zeros(0, dtype=REGISTER_WRITE)
+        self._write_count = 0
+        self._calls = np.zeros(0, dtype=CALL_EVENT)
+        self._call_count = 0
+        self._checkpoints: List[Checkpoint] = []
+        self._checkpoint_steps: List[int] = []
+        # Line key per address-index entry, see _line_keys()
+        self._entry_keys = None
+        self._entry_index = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def end(self) -> int:
+        """Number of the step after the last one recorded."""
+        return self.start + self._size
+
+    def __contains__(self, step: int) -> bool:
+        return self.start <= step < self.end
+
+    def clear(self, start: int = 0):
+        self.start = start
+        self._gas = None
+        self._host_calls = None
+        self._size = 0
+        self._write_count = 0
+        self._call_count = 0
+        self._checkpoints = []
+        self._checkpoint_steps = []
+
+    def append(self, params: Dict[str, Any], data: bytes):
+        """
+        Add the steps of one "history" notification.
+
+        Args:
+            params: start, steps, gas, hostCalls, writes, calls and
+                checkpoints of the notification
+            data: PCs, host call markers, gas left, register writes, then
+                calls and returns
+        """
+        start = params.get("start", 0)
+        steps = params.get("steps", 0)
+        writes = params.get("writes", 0)
+        calls = params.get("calls", 0)
+        if start != self.end or not self._size:
+            # First notification, or steps were recorded with nobody listening
+            if self._size:
+                self.logger.info(f"History gap at step {self.end}..{start}, starting over")
+            self.clear(start)
+            if params.get("gas"):
+                self._gas = np.zeros(0, dtype=np.int64)
+            if params.get("hostCalls"):
+                self._host_calls = np.zeros(0, dtype=np.uint32)
+
+        offset = 0
+        self._pcs = _reserve(self._pcs, self._size + steps)
+        self._pcs[self._size:self._size + steps] = np.frombuffer(data, dtype="<u4", count=steps)
+        offset += steps * 4
+        if params.get("hostCalls"):
+            self._host_calls = _reserve(self._host_calls, self._size + steps)
+            self._host_calls[self._size:self._size + steps] = np.frombuffer(
+                data, dtype="<u4", count=steps, offset=offset)
+            offset += steps * 4
+        if params.get("gas"):
+            self._gas = _reserve(self._gas, self._size + steps)
+            self._gas[self._size:self._size + steps] = np.frombuffer(data, dtype="<i8", count=steps, offset=offset)
+            offset += steps * 8
+        self._size += steps
+        self._writes = _reserve(self._writes, self._write_count + writes)
+        self._writes[self._write_count:self._write_count + writes] = np.frombuffer(
+            data, dtype=REGISTER_WRITE, count=writes, offset=offset)
+        self._write_count += writes
+        offset += writes * REGISTER_WRITE.itemsize
+        self._calls = _reserve(self._calls, self._call_count + calls)
+        self._calls[self._call_count:self._call_count + calls] = np.frombuffer(
+            data, dtype=CALL_EVENT, count=calls, offset=offset)
+        self._call_count += calls
+
+        for checkpoint in params.get("checkpoints", []):
+            self._checkpoints.append(Checkpoint(checkpoint["step"], tuple(checkpoint["registers"])))
+            self._checkpoint_steps.append(checkpoint["step"])
+
+        if self._size > self.max_steps:
+            self._drop_before(self.end - self.max_steps // 2)
+
+    def _drop_before(self, step: int):
+        """Forget the steps before the first checkpoint at or after step."""
+        i = bisect_right(self._checkpoint_steps, step - 1)
+        if i >= len(self._checkpoints):
+            return
+        new_start = self._checkpoint_steps[i]
+        dropped = new_start - self.start
+        self._pcs = self._pcs[dropped:self._size].copy()
+        if self._gas is not None:
+            self._gas = self._gas[dropped:self._size].copy()
+        if self._host_calls is not None:
+            self._host_calls = self._host_calls[dropped:self._size].copy()
+        self._size -= dropped
+        writes = self._writes[:self._write_count]
+        kept = writes[writes["step"] >= new_start]
+        self._writes = kept.copy()
+        self._write_count = len(kept)
+        calls = self._calls[:self._call_count]
+        kept = calls[calls["step"] >= new_start]
+        self._calls = kept.copy()
+        self._call_count = len(kept)
+        self._checkpoints = self._checkpoints[i:]
+        self._checkpoint_steps = self._checkpoint_steps[i:]
+        self.start = new_start
+        self.logger.debug(f"History now starts at step {new_start}")
+
+    def pc_at(self, step: int) -> int:
+        return int(self._pcs[step - self.start])
+
+    def pcs(self, start: int, stop: int) -> np.ndarray:
+        """PCs of steps start..stop, clipped to the history."""
+        start = max(start, self.start)
+        stop = min(stop, self.end)
+        return self._pcs[start - self.start:max(start, stop) - self.start]
+
+    def gas(self, start: int, stop: int) -> Optional[np.ndarray]:
+        """Gas left at steps start..stop, None if the sandbox does not record gas."""
+        if self._gas is None:
+            return None
+        start = max(start, self.start)
+        stop = min(stop, self.end)
+        return self._gas[start - self.start:max(start, stop) - self.start]
+
+    def host_calls(self, start: int, stop: int) -> Optional[np.ndarray]:
+        """Host call markers (ecalli index + 1) of steps start..stop, None if not recorded."""
+        if self._host_calls is None:
+            return None
+        start = max(start, self.start)
+        stop = min(stop, self.end)
+        return self._host_calls[start - self.start:max(start, stop) - self.start]
+
+    def checkpoint_at(self, step: int) -> Optional[Checkpoint]:
+        """The last checkpoint at or before step."""
+        i = bisect_right(self._checkpoint_steps, step) - 1
+        return self._checkpoints[i] if i >= 0 else None
+
+    def call_sites_at(self, step: int, live_sites: List[int], live_step: int) -> Optional[List[int]]:
+        """
+        Call instruction PCs of the frames on the stack at step, outermost
+        first, worked back from those at the live step by undoing the
+        calls and returns in between.
+
+        Args:
+            step: Step number inside the history, at or before live_step
+            live_sites: Call sites at live_step
+            live_step: Step the sandbox is stopped at
+
+        Returns:
+            The call sites, or None if step is outside the history
+        """
+        if step not in self or step > live_step:
+            return None
+        sites = list(live_sites)
+        calls = self._calls[:self._call_count]
+        lo, hi = np.searchsorted(calls["step"], [step + 1, live_step + 1])
+        for pc, kind in zip(calls["pc"][lo:hi][::-1].tolist(), calls["kind"][lo:hi][::-1].tolist()):
+            if kind == RETURN:
+                sites.append(pc)
+            elif sites:
+                sites.pop()
+        return sites
+
+    def registers_at(self, step: int) -> Optional[List[int]]:
+        """
+        Register values when step was about to execute, in REGISTERS order.
+
+        Args:
+            step: Step number inside the history
+
+        Returns:
+            The 13 values, or None if no checkpoint precedes step
+        """
+        checkpoint = self.checkpoint_at(step)
+        if checkpoint is None or step not in self:
+            return None
+        registers = list(checkpoint.registers)
+
+        writes = self._writes[:self._write_count]
+        lo, hi = np.searchsorted(writes["step"], [checkpoint.step + 1, step + 1])
+        if hi > lo:
+            # Last write of each register up to step
+            regs = writes["reg"][lo:hi][::-1]
+            values = writes["value"][lo:hi][::-1]
+            written, first = np.unique(regs, return_index=True)
+            for reg, value in zip(written.tolist(), values[first].tolist()):
+                registers[reg] = value
+        return registers
+
+    def _line_keys(self, mapper, pcs: np.ndarray) -> np.ndarray:
+        """
+        One int per PC identifying its source (file, line), NO_LINE if it has none.
+
+        Built on the address index's vectorized find_many(); the per-entry
+        keys are computed once per loaded index.
+        """
+        index = mapper.address_index
+        if self._entry_index is not index:
+            files = np.frombuffer(index.files, dtype=np.int32).astype(np.int64)
+            lines = np.frombuffer(index.lines, dtype=np.uint32).astype(np.int64)
+            self._entry_keys = np.where(files >= 0, (files << 32) | lines, NO_LINE)
+            self._entry_index = index
+        if not len(self._entry_keys):
+            return np.full(len(pcs), NO_LINE, dtype=np.int64)
+        entries = np.asarray(index.find_many(pcs))
+        return np.where(entries >= 0, self._entry_keys[entries], NO_LINE)
+
+    def line_key_at(self, mapper, step: int) -> int:
+        return int(self._line_keys(mapper, self.pcs(step, step + 1))[0])
+
+    def _windows_back(self, mapper, step: int):
+        """(first step, line keys) of the windows before step, newest first."""
+        stop = step
+        while stop > self.start:
+            first = max(self.start, stop - SCAN_WINDOW)
+            yield first, self._line_keys(mapper, self.pcs(first, stop))
+            stop = first
+
+    def _windows_forward(self, mapper, step: int):
+        """(first step, line keys) of the windows after step."""
+        first = step + 1
+        while first < self.end:
+            stop = min(self.end, first + SCAN_WINDOW)
+            yield first, self._line_keys(mapper, self.pcs(first, stop))
+            first = stop
+
+    def step_back(self, mapper, step: int) -> Optional[int]:
+        """
+        First step of the previous source line executed before step.
+
+        The rest of step's own line and steps without a line are skipped;
+        the previous line's run may span several windows.
+
+        Returns:
+            The step, or None if no earlier line is in the history
+        """
+        current = self.line_key_at(mapper, step)
+        target = found = None
+        for first, keys in self._windows_back(mapper, step):
+            if target is None:
+                other = np.flatnonzero((keys != current) & (keys != NO_LINE))
+                if not len(other):
+                    continue
+                last = int(other[-1])
+                target, found = keys[last], first + last
+                keys = keys[:last + 1]
+            # The run began right after the last step on some third line
+            outside = np.flatnonzero((keys != target) & (keys != NO_LINE))
+            if len(outside):
+                after = int(outside[-1]) + 1
+                run = np.flatnonzero(keys[after:] == target)
+                return first + after + int(run[0]) if len(run) else found
+            run = np.flatnonzero(keys == target)
+            if len(run):
+                found = first + int(run[0])
+        return found
+
+    def step_forward(self, mapper, step: int) -> Optional[int]:
+        """First later step on a source line other than step's, None if there is none."""
+        current = self.line_key_at(mapper, step)
+        for first, keys in self._windows_forward(mapper, step):
+            other = np.flatnonzero((keys != current) & (keys != NO_LINE))
+            if len(other):
+                return first + int(other[0])
+        return None
+
+    def find_back(self, step: int, addresses: Collection[int]) -> Optional[int]:
+        """Last step before step that executed one of addresses."""
+        if not addresses:
+            return None
+        targets = np.fromiter(addresses, dtype=np.int64)
+        stop = step
+        while stop > self.start:
+            first = max(self.start, stop - SCAN_WINDOW * 16)
+            hits = np.flatnonzero(np.isin(self.pcs(first, stop), targets))
+            if len(hits):
+                return first + int(hits[-1])
+            stop = first
+        return None
+
+    def find_forward(self, step: int, addresses: Collection[int]) -> Optional[int]:
+        """First step after step that executed one of addresses."""
+        if not addresses:
+            return None
+        targets = np.fromiter(addresses, dtype=np.int64)
+        first = step + 1
+        while first < self.end:
+            stop = min(self.end, first + SCAN_WINDOW * 16)
+            hits = np.flatnonzero(np.isin(self.pcs(first, stop), targets))
+            if len(hits):
+                return first + int(hits[0])
+            first = stop
+        return None
+
+
+def _reserve(array: np.ndarray, size: int) -> np.ndarray:
+    """array, or a copy with room for at least size items."""
+    if len(array) >= size:
+        return array
+    grown = np.zeros(max(size, len(array) * 2, 1024), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
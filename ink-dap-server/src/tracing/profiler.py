@@ -0,0 +1,350 @@
+"""
+Instruction profiler for execution traces
+Per-line and per-function instruction counts, collapsed stacks and speedscope profiles
+"""
+
+import json
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from mapping.demangle import demangle
+
+from .trace_store import iter_pcs
+
+
+# Frame name of steps outside every known function
+UNKNOWN_FUNCTION = "[unknown]"
+
+
+class FunctionCost(NamedTuple):
+    """Instructions executed in a function itself, and including its callees."""
+    name: str
+    exclusive: int
+    inclusive: int
+    calls: int
+
+
+class LineCost(NamedTuple):
+    """Instructions executed on one source line."""
+    path: str
+    line: int
+    instructions: int
+
+
+class FunctionTable:
+    """
+    Function address ranges of the contract, for vectorized PC lookups.
+
+    Functions are the ELF symbols, with demangled names. Functions
+    inlined into them are only known from the DWARF scopes; each gets a
+    name after UNKNOWN_FUNCTION the first time a lookup lands in it.
+    """
+
+    def __init__(self, mapper):
+        """
+        Args:
+            mapper: SourceMapper with the contract's debug info loaded
+        """
+        functions = sorted(mapper.functions, key=lambda function: function.start)
+        offset = mapper.address_offset
+        self.names = [demangle(function.name) for function in functions] + [UNKNOWN_FUNCTION]
+        # Index of UNKNOWN_FUNCTION in names
+        self.unknown = len(functions)
+        self.starts = np.array([function.start + offset for function in functions], dtype=np.int64)
+        self.ends = np.array([function.end + offset for function in functions], dtype=np.int64)
+        self.scope_index = mapper.scope_index
+        self._parents = np.asarray(self.scope_index.table.parents, dtype=np.int64)
+        # Inlined scope -> index in names, and the reverse for names after unknown
+        self._inlined: Dict[int, int] = {}
+        self.inlined_scopes: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def function_of(self, pcs: np.ndarray) -> np.ndarray:
+        """Index into names of the function holding each PC."""
+        pcs = np.asarray(pcs, dtype=np.int64)
+        indexes = np.searchsorted(self.starts, pcs, side="right") - 1
+        inside = indexes >= 0
+        inside[inside] = pcs[inside] < self.ends[indexes[inside]]
+        return np.where(inside, indexes, self.unknown)
+
+    def innermost_of(self, pcs: np.ndarray) -> np.ndarray:
+        """Index into names of the innermost function at each PC, inlined ones included."""
+        functions = self.function_of(pcs)
+        if not len(self.scope_index):
+            return functions
+        scopes = np.asarray(self.scope_index.find_many(pcs))
+        inlined = scopes >= 0
+        inlined[inlined] = self._parents[scopes[inlined]] >= 0
+        if inlined.any():
+            unique, inverse = np.unique(scopes[inlined], return_inverse=True)
+            names = np.array([self.inlined_name(scope) for scope in unique.tolist()], dtype=np.int64)
+            functions[inlined] = names[inverse]
+        return functions
+
+    def inlined_name(self, scope: int) -> int:
+        """Index into names of an inlined scope."""
+        index = self._inlined.get(scope)
+        if index is None:
+            index = self._inlined[scope] = len(self.names)
+            self.names.append(self.scope_index.name(scope))
+            self.inlined_scopes.append(scope)
+        return index
+
+    def inlined_chain(self, scope: int) -> List[int]:
+        """Indexes into names of the inlined scopes from the outermost one down to scope."""
+        chain = []
+        while scope >= 0 and self._parents[scope] >= 0:
+            chain.append(self.inlined_name(scope))
+            scope = int(self._parents[scope])
+        return chain[::-1]
+
+
+class Profiler:
+    """
+    Attributes every step of one or more traces to its source line and to
+    a reconstructed call stack.
+
+    Steps are mapped to functions with one searchsorted pass per chunk;
+    only the points where the function changes are walked in Python. At
+    such a point, landing on a function's first instruction is a call,
+    landing inside a function already on the stack is a return to it, and
+    anything else replaces the top frame (a tail call or jump). Stacks are
+    interned as nodes of a call tree, so a call or return is O(1) and each
+    run of steps is charged to one node.
+
+    Inlined functions never show up as calls, so with DWARF scopes the
+    steps of each node are further split by the innermost scope covering
+    them, and stacks() appends the inlined frames of that scope.
+    """
+
+    def __init__(self, mapper):
+        """
+        Args:
+            mapper: SourceMapper with the contract's debug info loaded
+        """
+        self.logger = logging.getLogger("InkDebugAdapter.Profiler")
+        self.mapper = mapper
+        self.table = FunctionTable(mapper)
+        self.names = self.table.names
+        self.starts = self.table.starts
+        self.calls = np.zeros(len(self.names), dtype=np.int64)
+        # Call tree nodes are the functions before the inlined ones in names
+        self.width = 2 * (self.table.unknown + 1)
+
+        # Call tree: node 0 is the root, every other node one frame
+        self.parents = [0]
+        self.functions = [-1]
+        self.children: Dict[Tuple[int, int], int] = {}
+        self.costs = np.zeros(1, dtype=np.int64)
+        self.node = 0
+        # Instructions per node * scopes + innermost scope + 1, if there are scopes
+        self.scopes = len(self.table.scope_index) + 1
+        self.leaf_costs: Optional[Dict[int, int]] = {} if self.scopes > 1 else None
+        # Memoized _move() results by (node, function, entry)
+        self._moves: Dict[int, int] = {}
+
+        # Instructions per PC, merged chunk by chunk
+        self.pcs = np.zeros(0, dtype=np.uint32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.steps = 0
+
+    def add_trace(self, path: str):
+        """Profile every step of a trace file."""
+        start = time.perf_counter()
+        steps = self.steps
+        for chunk in iter_pcs(path):
+            self.add_pcs(chunk)
+        self.logger.info(
+            f"Profiled {self.steps - steps} steps of {path} in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+    def add_pcs(self, pcs: np.ndarray):
+        """Profile one chunk of consecutive steps."""
+        if not len(pcs):
+            return
+        self._count_pcs(pcs)
+
+        functions = self.table.function_of(pcs)
+        changes = np.flatnonzero(functions[1:] != functions[:-1]) + 1
+        if self.node == 0 or self.functions[self.node] != functions[0]:
+            changes = np.concatenate(([0], changes)).astype(np.int64)
+        bounds = np.concatenate((changes, [len(pcs)]))
+
+        # A move depends only on the node, the function and whether the
+        # step is its entry, so each distinct one is worked out once
+        moves = self._moves
+        width = self.width
+        codes = functions[changes] * 2 + np.isin(pcs[changes].astype(np.int64), self.starts)
+        node = self.node
+        nodes = [node * 2]
+        for code in codes.tolist():
+            key = node * width + code
+            move = moves.get(key)
+            if move is None:
+                move = moves[key] = self._move(node, code >> 1, code & 1)
+            node = move >> 1
+            nodes.append(move)
+        self.node = node
+
+        moved = np.array(nodes, dtype=np.int64)
+        # The steps before the first change continue the current frame
+        lengths = np.diff(np.concatenate(([0], bounds)))
+        costs = np.bincount(moved >> 1, weights=lengths, minlength=len(self.parents))
+        self.costs = _pad(self.costs, len(self.parents)) + costs.astype(np.int64)
+        pushed = moved[1:][(moved[1:] & 1) == 1] >> 1
+        self.calls = _pad(self.calls, len(self.names))
+        self.calls += np.bincount(np.asarray(self.functions)[pushed], minlength=len(self.names))
+        self.steps += len(pcs)
+        if self.leaf_costs is not None:
+            self._count_leaves(np.repeat(moved >> 1, lengths), pcs)
+
+    def _move(self, node: int, function: int, entry: bool) -> int:
+        """
+        Node after a step landing in function, times two, plus one if a
+        frame was pushed.
+        """
+        if not entry:
+            caller = node
+            while caller and self.functions[caller] != function:
+                caller = self.parents[caller]
+            if caller:
+                return caller * 2
+            # Not on the stack: the top frame is replaced
+            node = self.parents[node]
+        key = (node, function)
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = len(self.parents)
+            self.parents.append(node)
+            self.functions.append(function)
+        return child * 2 + 1
+
+    def _count_leaves(self, nodes: np.ndarray, pcs: np.ndarray):
+        """Charge each step to its node and the innermost scope at its PC."""
+        scopes = np.asarray(self.table.scope_index.find_many(pcs))
+        keys, counts = np.unique(nodes * self.scopes + scopes + 1, return_counts=True)
+        leaf_costs = self.leaf_costs
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            leaf_costs[key] = leaf_costs.get(key, 0) + count
+
+    def _count_pcs(self, pcs: np.ndarray):
+        unique, counts = np.unique(pcs, return_counts=True)
+        if not len(self.pcs):
+            self.pcs, self.counts = unique, counts.astype(np.int64)
+            return
+        merged, inverse = np.unique(np.concatenate((self.pcs, unique)), return_inverse=True)
+        totals = np.zeros(len(merged), dtype=np.int64)
+        np.add.at(totals, inverse, np.concatenate((self.counts, counts)))
+        self.pcs, self.counts = merged, totals
+
+    def stacks(self) -> List[Tuple[List[int], int]]:
+        """(function indexes root first, instructions) of every stack that executed code."""
+        if self.leaf_costs is not None:
+            return [
+                (self._frames(key // self.scopes) + self.table.inlined_chain(key % self.scopes - 1), cost)
+                for key, cost in self.leaf_costs.items() if key >= self.scopes
+            ]
+        return [(self._frames(node), cost) for node, cost in enumerate(self.costs.tolist()) if cost and node]
+
+    def _frames(self, node: int) -> List[int]:
+        """Function indexes of a call tree node and its callers, root first."""
+        frames = []
+        while node:
+            frames.append(self.functions[node])
+            node = self.parents[node]
+        return frames[::-1]
+
+    def function_costs(self) -> List[FunctionCost]:
+        """Cost of every function that ran, most inclusive first. Recursion counts once."""
+        stacks = self.stacks()
+        exclusive = np.zeros(len(self.names), dtype=np.int64)
+        inclusive = np.zeros(len(self.names), dtype=np.int64)
+        self.calls = _pad(self.calls, len(self.names))
+        for frames, cost in stacks:
+            exclusive[frames[-1]] += cost
+            inclusive[list(set(frames))] += cost
+        ran = np.flatnonzero(inclusive)
+        ran = ran[np.argsort(-inclusive[ran], kind="stable")]
+        return [
+            FunctionCost(self.names[i], int(exclusive[i]), int(inclusive[i]), int(self.calls[i]))
+            for i in ran.tolist()
+        ]
+
+    def line_costs(self) -> List[LineCost]:
+        """Instructions per source line, most expensive first."""
+        index = self.mapper.address_index
+        entries = np.asarray(index.find_many(self.pcs))
+        mapped = entries >= 0
+        if not mapped.any():
+            return []
+        entries = entries[mapped]
+        files = np.frombuffer(index.files, dtype=np.int32)[entries].astype(np.int64)
+        lines = np.frombuffer(index.lines, dtype=np.uint32)[entries].astype(np.int64)
+        keys, inverse = np.unique((files << 32) | lines, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.counts[mapped]).astype(np.int64)
+        order = np.argsort(-totals, kind="stable")
+        return [
+            LineCost(index.file_names[int(keys[i]) >> 32], int(keys[i]) & 0xFFFFFFFF, int(totals[i]))
+            for i in order.tolist() if int(keys[i]) & 0xFFFFFFFF
+        ]
+
+
+def _pad(array: np.ndarray, size: int) -> np.ndarray:
+    """array, zero-extended to size items."""
+    if len(array) >= size:
+        return array
+    return np.concatenate((array, np.zeros(size - len(array), dtype=array.dtype)))
+
+
+def to_collapsed(profiler: Profiler) -> str:
+    """Collapsed stacks, one "root;...;leaf count" line each (flamegraph.pl, inferno)."""
+    names = profiler.names
+    lines = [
+        ";".join(names[frame] for frame in frames) + f" {cost}"
+        for frames, cost in profiler.stacks()
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(profiler: Profiler, name: str = "contract") -> str:
+    """A sampled speedscope profile weighted by instructions (https://www.speedscope.app)."""
+    # Names inlined functions on the way, so it comes first
+    stacks = profiler.stacks()
+    table = profiler.table
+    index = profiler.mapper.address_index
+    locations: Dict[int, Optional[Tuple[str, int]]] = {}
+    for i, start in enumerate(profiler.starts.tolist()):
+        locations[i] = index.lookup(start)
+    for i, scope in enumerate(table.inlined_scopes, table.unknown + 1):
+        entry = table.scope_index.entry(scope)
+        locations[i] = index.lookup(entry) if entry is not None else None
+    shared = []
+    for i, frame_name in enumerate(profiler.names):
+        frame = {"name": frame_name}
+        location = locations.get(i)
+        if location is not None:
+            frame["file"], frame["line"] = location
+        shared.append(frame)
+
+    total = sum(cost for _, cost in stacks)
+    return json.dumps({
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "exporter": "ink-dap-server",
+        "name": name,
+        "activeProfileIndex": 0,
+        "shared": {"frames": shared},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "none",
+            "startValue": 0,
+            "endValue": total,
+            "samples": [frames for frames, _ in stacks],
+            "weights": [cost for _, cost in stacks],
+        }],
+    })
@@ -0,0 +1,343 @@
+"""
+Block-compressed execution traces
+Vectorized decoding (and encoding) of the delta + varint trace format with a block index
+"""
+
+import struct
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# Format version 2 of the trace file (see ink-debug-rpc trace.rs): blocks
+# of zig-zag varint deltas, then the block index, then FOOTER
+BLOCKS_VERSION = 2
+BLOCK_STEPS = 4096
+INDEX_MAGIC = b"INKTRIDX"
+FOOTER = struct.Struct("<QQQ8s")
+
+# One entry per block, everything needed to decode the block on its own
+INDEX_ENTRY = np.dtype([
+    ("step", "<u8"),
+    ("pc", "<u4"),
+    ("host_calls", "<u4"),
+    ("gas", "<i8"),
+    ("offset", "<u8"),
+    ("pc_bytes", "<u4"),
+    ("gas_bytes", "<u4"),
+    ("host_bytes", "<u4"),
+    ("steps", "<u4"),
+])
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """
+    Decode consecutive LEB128 varints.
+
+    Args:
+        data: uint8 array holding whole varints only
+
+    Returns:
+        uint64 array of the values
+    """
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    continued = data >= 0x80
+    if not continued.any():
+        # Every value fits in one byte, the common case for PC deltas
+        return data.astype(np.uint64)
+    if continued[-1]:
+        raise ValueError("truncated varint")
+
+    ends = np.flatnonzero(~continued)
+    lengths = np.diff(ends, prepend=-1)
+    # The last byte of a varint holds its highest bits
+    values = (data[ends] & 0x7f).astype(np.uint64) << (7 * (lengths - 1)).astype(np.uint64)
+    # OR in the few continuation bytes
+    positions = np.flatnonzero(continued)
+    owners = np.searchsorted(ends, positions)
+    shifts = 7 * (positions - (ends[owners] - lengths[owners] + 1))
+    np.bitwise_or.at(values, owners, (data[positions] & 0x7f).astype(np.uint64) << shifts.astype(np.uint64))
+    return values
+
+
+def encode_varints(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode uint64 values as LEB128 varints.
+
+    Returns:
+        (bytes as a uint8 array, encoded length of each value)
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+
+    out = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    positions = np.cumsum(lengths) - lengths
+    for k in range(int(lengths.max(initial=0))):
+        has = lengths > k
+        byte = (values[has] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        more = (lengths[has] > k + 1).astype(np.uint8) << 7
+        out[positions[has] + k] = byte.astype(np.uint8) | more
+    return out, lengths
+
+
+def zigzag_decode(values: np.ndarray) -> np.ndarray:
+    """uint64 zig-zag values to int64."""
+    values = values.view(np.int64)
+    signs = values & 1
+    np.negative(signs, out=signs)
+    decoded = values >> 1
+    # Logical shift: clear the sign bit the arithmetic shift copied
+    decoded &= np.int64(0x7fffffffffffffff)
+    decoded ^= signs
+    return decoded
+
+
+def zigzag_encode(values: np.ndarray) -> np.ndarray:
+    """int64 values to uint64 zig-zag."""
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _segment_starts(counts: np.ndarray) -> np.ndarray:
+    """Index of the first element of each segment of the given lengths."""
+    return np.cumsum(counts) - counts
+
+
+def _segmented_cumsum(values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Running sum of values that restarts at every segment of the given lengths."""
+    sums = np.cumsum(values)
+    nonempty = counts > 0
+    starts = _segment_starts(counts)[nonempty]
+    return sums - np.repeat(sums[starts] - values[starts], counts[nonempty])
+
+
+def _gather(data: np.ndarray, offsets: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenate data[offset:offset + length] for every block."""
+    lengths = lengths.astype(np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.uint8)
+    positions = np.arange(total, dtype=np.int64)
+    positions += np.repeat(offsets.astype(np.int64) - _segment_starts(lengths), lengths)
+    return data[positions]
+
+
+def _scatter(out: np.ndarray, data: np.ndarray, offsets: np.ndarray, lengths: np.ndarray):
+    """Inverse of _gather: write consecutive segments of data to out at offsets."""
+    lengths = lengths.astype(np.int64)
+    if len(data) == 0:
+        return
+    positions = np.arange(len(data), dtype=np.int64)
+    positions += np.repeat(offsets.astype(np.int64) - _segment_starts(lengths), lengths)
+    out[positions] = data
+
+
+def _undelta(firsts: np.ndarray, deltas: np.ndarray, steps: np.ndarray) -> np.ndarray:
+    """
+    Rebuild the absolute values of consecutive blocks.
+
+    Block i has steps[i] values: firsts[i] followed by steps[i] - 1 deltas;
+    the deltas of all the blocks are concatenated in `deltas`.
+    """
+    steps = steps.astype(np.int64)
+    starts = _segment_starts(steps)
+    values = np.zeros(int(steps.sum()), dtype=np.int64)
+    if len(values) - len(starts) != len(deltas):
+        raise ValueError("block delta count does not match its step count")
+    is_delta = np.ones(len(values), dtype=bool)
+    is_delta[starts] = False
+    values[is_delta] = deltas
+
+    # One running sum over all blocks: each block starts with the step from
+    # the previous block's last value to its own first value
+    firsts = firsts.astype(np.int64)
+    block_sums = np.add.reduceat(values, starts)
+    values[starts[1:]] = firsts[1:] - (firsts[:-1] + block_sums[:-1])
+    values[0] = firsts[0]
+    return np.cumsum(values, out=values)
+
+
+def _deltas(values: np.ndarray, block_steps: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Differences to the previous step, for every step but the first of a block.
+
+    Returns:
+        (int64 deltas, block of each delta)
+    """
+    steps = np.arange(1, len(values), dtype=np.int64)
+    keep = steps % block_steps != 0
+    values = values.astype(np.int64)
+    # Gas may wrap around in theory; the decoder wraps the same way
+    deltas = (values[1:] - values[:-1])[keep]
+    return deltas, steps[keep] // block_steps
+
+
+def encode_blocks(pcs: np.ndarray, host_calls: Optional[np.ndarray], gas: Optional[np.ndarray],
+                  block_steps: int = BLOCK_STEPS, base_offset: int = 0) -> bytes:
+    """
+    Encode a trace in the block format: blocks, index and footer.
+
+    Args:
+        pcs: PC of every step
+        host_calls: Host call marker of every step (0 for none), or None
+        gas: Gas left after every step, or None
+        block_steps: Steps per block
+        base_offset: File offset the returned bytes will be written at
+            (the header size), block offsets in the index are absolute
+
+    Returns:
+        Everything that follows the file header
+    """
+    count = len(pcs)
+    blocks = (count + block_steps - 1) // block_steps
+    block_ids = np.arange(blocks, dtype=np.int64)
+    first_steps = block_ids * block_steps
+    steps = np.minimum(count - first_steps, block_steps)
+
+    no_deltas = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    columns = [_deltas(pcs, block_steps), _deltas(gas, block_steps) if gas is not None else no_deltas]
+
+    # Host calls: (step - previous host call step in the block, marker) pairs
+    marked = np.flatnonzero(host_calls) if host_calls is not None else np.zeros(0, dtype=np.int64)
+    host_blocks = marked // block_steps
+    local = marked - host_blocks * block_steps
+    previous = np.zeros(len(local), dtype=np.int64)
+    if len(local) > 1:
+        same_block = host_blocks[1:] == host_blocks[:-1]
+        previous[1:] = np.where(same_block, local[:-1], 0)
+    host_counts = np.bincount(host_blocks, minlength=blocks)
+
+    encoded = []
+    for deltas, owners in columns:
+        data, lengths = encode_varints(zigzag_encode(deltas))
+        encoded.append((data, np.bincount(owners, weights=lengths, minlength=blocks).astype(np.int64)))
+    pairs = np.empty(2 * len(marked), dtype=np.uint64)
+    pairs[0::2] = local - previous
+    if len(marked):
+        pairs[1::2] = host_calls[marked]
+    data, lengths = encode_varints(pairs)
+    encoded.append((data, np.bincount(np.repeat(host_blocks, 2), weights=lengths, minlength=blocks).astype(np.int64)))
+
+    sizes = sum(lengths for _, lengths in encoded)
+    offsets = base_offset + _segment_starts(sizes)
+    body = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    column_offsets = offsets - base_offset
+    for data, lengths in encoded:
+        _scatter(body, data, column_offsets, lengths)
+        column_offsets = column_offsets + lengths
+
+    index = np.zeros(blocks, dtype=INDEX_ENTRY)
+    index["step"] = first_steps
+    index["pc"] = pcs[first_steps]
+    index["host_calls"] = host_counts
+    if gas is not None:
+        index["gas"] = gas[first_steps]
+    index["offset"] = offsets
+    for field, (_, lengths) in zip(("pc_bytes", "gas_bytes", "host_bytes"), encoded):
+        index[field] = lengths
+    index["steps"] = steps
+
+    footer = FOOTER.pack(base_offset + len(body), blocks, count, INDEX_MAGIC)
+    return body.tobytes() + index.tobytes() + footer
+
+
+class BlockTraceReader:
+    """
+    Random access to a block-compressed trace.
+
+    Only the index is read up front; read() decodes just the blocks that
+    cover the requested steps, all of them in one vectorized pass.
+    """
+
+    def __init__(self, data: np.ndarray, block_steps: int, gas: bool, host_calls: bool):
+        """
+        Args:
+            data: The whole trace file as a uint8 array (usually a memmap)
+            block_steps: Steps per block, from the file header
+            gas: Whether the trace has a gas column
+            host_calls: Whether the trace has host call markers
+        """
+        self.data = data
+        self.block_steps = block_steps
+        self.gas = gas
+        self.host_calls = host_calls
+
+        if len(data) < FOOTER.size:
+            raise ValueError("truncated block trace")
+        index_offset, blocks, self.steps, magic = FOOTER.unpack(bytes(data[-FOOTER.size:]))
+        if magic != INDEX_MAGIC:
+            raise ValueError("block index missing, the run did not finish writing the trace")
+        index_end = index_offset + blocks * INDEX_ENTRY.itemsize
+        if index_end != len(data) - FOOTER.size:
+            raise ValueError("block index does not match the file size")
+        self.index = np.frombuffer(data[index_offset:index_end], dtype=INDEX_ENTRY)
+
+    def __len__(self) -> int:
+        return self.steps
+
+    def block_of(self, step: int) -> int:
+        """Block holding step; every block but the last has block_steps steps."""
+        if not 0 <= step < self.steps:
+            raise IndexError(f"step {step} out of range")
+        return step // self.block_steps
+
+    def pc_at(self, step: int) -> int:
+        """PC executed at step, decoding the PC column of a single block."""
+        entry = self.index[self.block_of(step)]
+        offset = int(step - entry["step"])
+        if offset == 0:
+            return int(entry["pc"])
+        start = int(entry["offset"])
+        deltas = zigzag_decode(decode_varints(self.data[start:start + int(entry["pc_bytes"])]))
+        return int(entry["pc"]) + int(deltas[:offset].sum())
+
+    def read(self, start: int = 0, stop: Optional[int] = None
+             ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Decode steps [start, stop).
+
+        Returns:
+            (pcs uint32, host_calls uint32, gas int64 or None)
+        """
+        stop = self.steps if stop is None else min(stop, self.steps)
+        if start >= stop:
+            empty = np.zeros(0, dtype=np.uint32)
+            return empty, empty, np.zeros(0, dtype=np.int64) if self.gas else None
+
+        entries = self.index[self.block_of(start):self.block_of(stop - 1) + 1]
+        pcs, host_calls, gas = self._decode(entries)
+        skip = start - int(entries["step"][0])
+        end = skip + stop - start
+        return pcs[skip:end], host_calls[skip:end], gas[skip:end] if gas is not None else None
+
+    def _decode(self, entries: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """Decode consecutive blocks."""
+        steps = entries["steps"]
+        offsets = entries["offset"]
+
+        pc_deltas = zigzag_decode(decode_varints(_gather(self.data, offsets, entries["pc_bytes"])))
+        pcs = _undelta(entries["pc"], pc_deltas, steps).astype(np.uint32)
+
+        gas = None
+        if self.gas:
+            gas_offsets = offsets + entries["pc_bytes"]
+            gas_deltas = zigzag_decode(decode_varints(_gather(self.data, gas_offsets, entries["gas_bytes"])))
+            gas = _undelta(entries["gas"], gas_deltas, steps)
+
+        host_calls = np.zeros(len(pcs), dtype=np.uint32)
+        counts = entries["host_calls"].astype(np.int64)
+        if counts.any():
+            host_offsets = offsets + entries["pc_bytes"] + entries["gas_bytes"]
+            pairs = decode_varints(_gather(self.data, host_offsets, entries["host_bytes"])).reshape(-1, 2)
+            # Steps are deltas from the previous host call of the same block
+            steps_in_block = _segmented_cumsum(pairs[:, 0].astype(np.int64), counts)
+            block_starts = np.repeat(_segment_starts(steps.astype(np.int64)), counts)
+            host_calls[block_starts + steps_in_block] = pairs[:, 1]
+
+        return pcs, host_calls, gas
+
@@ -0,0 +1,34 @@
+"""
+Execution trace settings
+Turns the launch.json "sandbox.trace" object into the sandbox's INK_DEBUG_TRACE* variables
+"""
+
+from typing import Any, Dict
+
+
+# Read by the sandbox (ink-debug-rpc trace.rs)
+TRACE_ENV = "INK_DEBUG_TRACE"
+TRACE_GAS_ENV = "INK_DEBUG_TRACE_GAS"
+TRACE_HOST_CALLS_ENV = "INK_DEBUG_TRACE_HOST_CALLS"
+
+
+def trace_env(config: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Environment that makes a spawned sandbox record an execution trace.
+
+    Args:
+        config: {"path": trace file, "gas": bool, "hostCalls": bool}; the
+            sandbox numbers the files of calls after the first, see
+            TraceConfig::next_call() in ink-debug-rpc trace.rs
+
+    Returns:
+        The variables to set; empty if config has no path
+    """
+    path = config.get("path")
+    if not path:
+        return {}
+    return {
+        TRACE_ENV: str(path),
+        TRACE_GAS_ENV: "1" if config.get("gas") else "0",
+        TRACE_HOST_CALLS_ENV: "1" if config.get("hostCalls") else "0",
+    }
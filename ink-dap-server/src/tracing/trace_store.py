@@ -0,0 +1,249 @@
+"""
+Execution trace storage
+Loads the step trace written by the sandbox (INK_DEBUG_TRACE) into NumPy arrays
+"""
+
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .trace_blocks import BLOCK_STEPS, BLOCKS_VERSION, BlockTraceReader, encode_blocks
+
+
+# File header: magic, version, flags, then the record size of raw traces or
+# the steps per block of block traces (see ink-debug-rpc trace.rs)
+MAGIC = b"INKTRACE"
+RAW_VERSION = 1
+HEADER = struct.Struct("<8sHHI")
+FLAG_GAS = 0x1
+FLAG_HOST_CALLS = 0x2
+
+# Record layouts; host_call is the ecalli index + 1, 0 for an ordinary step
+RECORD = np.dtype([("pc", "<u4"), ("host_call", "<u4")])
+RECORD_WITH_GAS = np.dtype([("pc", "<u4"), ("host_call", "<u4"), ("gas", "<i8")])
+
+# Steps decoded at a time by iter_pcs()
+CHUNK_STEPS = 4 * 1024 * 1024
+
+# Appended to a trace path for the sandbox's description of the run
+INFO_SUFFIX = ".json"
+
+
+class TraceError(Exception):
+    """Raised when a file is not a readable execution trace."""
+
+
+class TraceStore:
+    """
+    One contract run, step by step, as parallel NumPy arrays.
+
+    Step i executed pcs[i]; host_calls[i] is the ecalli index + 1 if the
+    step stopped at a host call (0 otherwise) and gas[i] the gas left
+    after it, when the trace was recorded with those. Raw trace files are
+    memory-mapped, so only the pages that are looked at are read.
+    """
+
+    def __init__(self, pcs: np.ndarray, host_calls: Optional[np.ndarray] = None,
+                 gas: Optional[np.ndarray] = None, path: Optional[str] = None):
+        self.pcs = pcs
+        self.host_calls = host_calls if host_calls is not None else np.zeros(len(pcs), dtype=np.uint32)
+        self.gas = gas
+        self.path = path
+
+    @classmethod
+    def load(cls, path: str) -> "TraceStore":
+        """
+        Load a trace file.
+
+        Raw traces are memory-mapped, block traces are decoded in one
+        vectorized pass.
+
+        Args:
+            path: Trace file written by the sandbox
+
+        Returns:
+            TraceStore over the file's steps
+        """
+        version, flags, layout = read_header(path)
+        if version == BLOCKS_VERSION:
+            pcs, host_calls, gas = open_block_trace(path).read()
+            return cls(pcs, host_calls if flags & FLAG_HOST_CALLS else None, gas, path)
+
+        dtype = RECORD_WITH_GAS if flags & FLAG_GAS else RECORD
+        if layout != dtype.itemsize:
+            raise TraceError(f"{path}: unexpected record size {layout}")
+
+        size = os.path.getsize(path) - HEADER.size
+        count = size // dtype.itemsize
+        if count == 0:
+            records = np.zeros(0, dtype=dtype)
+        else:
+            # A run that was killed mid-chunk may end in a partial record
+            records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(count,))
+
+        gas = records["gas"] if flags & FLAG_GAS else None
+        host_calls = records["host_call"] if flags & FLAG_HOST_CALLS else None
+        return cls(records["pc"], host_calls, gas, path)
+
+    def save(self, path: str, blocks: bool = True, block_steps: int = BLOCK_STEPS):
+        """
+        Write the trace in the block format, or as raw records.
+
+        Args:
+            path: File to write
+            blocks: False for raw records
+            block_steps: Steps per block
+        """
+        flags = FLAG_HOST_CALLS | (FLAG_GAS if self.gas is not None else 0)
+        with open(path, "wb") as f:
+            if blocks:
+                f.write(HEADER.pack(MAGIC, BLOCKS_VERSION, flags, block_steps))
+                f.write(encode_blocks(self.pcs, self.host_calls, self.gas, block_steps, HEADER.size))
+                return
+
+            dtype = RECORD_WITH_GAS if self.gas is not None else RECORD
+            f.write(HEADER.pack(MAGIC, RAW_VERSION, flags, dtype.itemsize))
+            records = np.empty(len(self), dtype=dtype)
+            records["pc"] = self.pcs
+            records["host_call"] = self.host_calls
+            if self.gas is not None:
+                records["gas"] = self.gas
+            records.tofile(f)
+
+    def __len__(self) -> int:
+        return len(self.pcs)
+
+    @property
+    def has_gas(self) -> bool:
+        return self.gas is not None
+
+    def steps_at(self, pc: int) -> np.ndarray:
+        """Indexes of the steps that executed pc."""
+        return np.flatnonzero(self.pcs == pc)
+
+    def pc_counts(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        How often each PC was executed.
+
+        Returns:
+            (pcs, counts), pcs sorted ascending
+        """
+        return np.unique(self.pcs, return_counts=True)
+
+    def host_call_steps(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Steps that stopped at a host call.
+
+        Returns:
+            (step indexes, ecalli indexes)
+        """
+        steps = np.flatnonzero(self.host_calls)
+        return steps, self.host_calls[steps].astype(np.int64) - 1
+
+    def gas_used(self) -> np.ndarray:
+        """
+        Gas consumed by each step: the drop in gas left since the step
+        before (for step 0, 0). Requires a trace recorded with gas.
+        """
+        if self.gas is None:
+            raise TraceError("trace was recorded without gas")
+        used = np.zeros(len(self.gas), dtype=np.int64)
+        if len(self.gas) > 1:
+            np.subtract(self.gas[:-1], self.gas[1:], out=used[1:])
+        return used
+
+
+def read_header(path: str):
+    """
+    Check a trace file's header.
+
+    Returns:
+        (version, flags, record size or steps per block)
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise TraceError(f"{path}: truncated trace header")
+
+    magic, version, flags, layout = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise TraceError(f"{path} is not an execution trace")
+    if version not in (RAW_VERSION, BLOCKS_VERSION):
+        raise TraceError(f"{path}: unsupported trace version {version}")
+    return version, flags, layout
+
+
+def read_trace_info(path: str) -> Dict[str, Any]:
+    """
+    The sandbox's description of a recorded run (refTimePerFuel,
+    hostCallNames, ...), written next to the trace when recording ended.
+
+    Returns:
+        The description, empty if there is none
+    """
+    try:
+        with open(path + INFO_SUFFIX, encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return info if isinstance(info, dict) else {}
+
+
+def open_block_trace(path: str) -> BlockTraceReader:
+    """
+    Random access to a block trace without decoding it.
+
+    Args:
+        path: Trace file in the block format
+
+    Returns:
+        Reader over the memory-mapped file
+    """
+    version, flags, block_steps = read_header(path)
+    if version != BLOCKS_VERSION:
+        raise TraceError(f"{path} is not a block trace")
+    with open(path, "rb") as f:
+        # A plain ndarray over the mapping; np.memmap slices are much slower
+        data = np.frombuffer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), dtype=np.uint8)
+    try:
+        return BlockTraceReader(data, block_steps,
+                                gas=bool(flags & FLAG_GAS), host_calls=bool(flags & FLAG_HOST_CALLS))
+    except ValueError as e:
+        raise TraceError(f"{path}: {e}")
+
+
+def iter_steps(path: str, chunk_steps: int = CHUNK_STEPS
+               ) -> Iterator[Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]]:
+    """
+    A trace file chunk_steps steps at a time, so traces larger than
+    memory can be aggregated.
+
+    Args:
+        path: Trace file, raw or in the block format
+        chunk_steps: Steps per yielded chunk
+
+    Yields:
+        (pcs, host_calls, gas or None) of consecutive steps, as in TraceStore
+    """
+    version, _, _ = read_header(path)
+    if version == BLOCKS_VERSION:
+        reader = open_block_trace(path)
+        for start in range(0, len(reader), chunk_steps):
+            yield reader.read(start, start + chunk_steps)
+        return
+
+    store = TraceStore.load(path)
+    for start in range(0, len(store), chunk_steps):
+        stop = start + chunk_steps
+        yield (np.asarray(store.pcs[start:stop]), np.asarray(store.host_calls[start:stop]),
+               np.asarray(store.gas[start:stop]) if store.gas is not None else None)
+
+
+def iter_pcs(path: str, chunk_steps: int = CHUNK_STEPS) -> Iterator[np.ndarray]:
+    """The PC column of iter_steps()."""
+    for pcs, _, _ in iter_steps(path, chunk_steps):
+        yield pcs
@@ -1,29 +1,79 @@
 """
 Debug adapter logging configuration
-Logs go to both stdout and debug_adapter.log file
+Logs go to debug_adapter.log (and optionally stderr), written from a background thread
 """
 
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 import sys
 from pathlib import Path
+from typing import Optional, Union
 
 
-def setup_logger(name: str, level: int = logging.DEBUG) -> logging.Logger:
+# Initial log level, e.g. "debug" or "warning"; launch.json "logLevel" overrides it
+LEVEL_ENV = "INK_DEBUG_LOG_LEVEL"
+# Set to 1 to copy the log to stderr. Never stdout: it carries the DAP frames
+STDERR_ENV = "INK_DEBUG_LOG_STDERR"
+
+DEFAULT_LEVEL = logging.INFO
+
+# Accepted level names besides the standard ones
+OFF = logging.CRITICAL + 10
+LEVEL_NAMES = {"off": OFF, "none": OFF, "warn": logging.WARNING}
+
+# Writes queued records to the real handlers, see setup_logger
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_level(level: Union[int, str, None]) -> Optional[int]:
     """
-    Setup logger with output to stdout and file.
+    Logging level from a number or a name such as "debug" or "off".
+
+    Returns:
+        The level, or None if it is not a valid one
+    """
+    if isinstance(level, int):
+        return level
+    if not level:
+        return None
+    name = str(level).strip().lower()
+    if name in LEVEL_NAMES:
+        return LEVEL_NAMES[name]
+    value = logging.getLevelName(name.upper())
+    return value if isinstance(value, int) else None
+
+
+def setup_logger(name: str, level: Union[int, str, None] = None) -> logging.Logger:
+    """
+    Setup logger with output to debug_adapter.log, off the calling thread.
+
+    Records are handed to a QueueHandler; a QueueListener thread formats
+    and writes them, so the event loop never waits on file I/O.
 
     Args:
         name: Logger name
-        level: Logging level
+        level: Logging level or level name; INK_DEBUG_LOG_LEVEL, else INFO
 
     Returns:
         Configured logger instance
     """
+    global _listener
+
+    resolved = parse_level(level)
+    if resolved is None:
+        resolved = parse_level(os.environ.get(LEVEL_ENV))
+    if resolved is None:
+        resolved = DEFAULT_LEVEL
+
     logger = logging.getLogger(name)
-    logger.setLevel(level)
+    logger.setLevel(resolved)
 
     # Remove existing handlers
     logger.handlers.clear()
+    shutdown_logging()
 
     # Create formatter
     formatter = logging.Formatter(
@@ -31,13 +81,15 @@ def setup_logger(name: str, level: int = logging.DEBUG) -> logging.Logger:
         datefmt="%Y-%m-%d %H:%M:%S"
     )
 
-    # Console handler (stdout)
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(level)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = []
+    if os.environ.get(STDERR_ENV) == "1":
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
 
     # File handler
+    log_file = None
+    file_error = None
     try:
         # Log file path in project root (ink-sandbox-trace/)
         # utils/logger.py -> src -> ink-dap-server -> ink-sandbox-trace
@@ -45,15 +97,44 @@ def setup_logger(name: str, level: int = logging.DEBUG) -> logging.Logger:
 
         # Create file handler (overwrites file on each startup)
         file_handler = logging.FileHandler(log_file, mode='w', encoding='utf-8')
-        file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-
-        # Log successful file creation
-        logger.info(f"Logs are also saved to file: {log_file}")
+        handlers.append(file_handler)
 
     except Exception as e:
-        # If file creation fails - continue with console logging only
-        logger.warning(f"Could not create log file: {e}")
+        # If file creation fails - continue with whatever else is configured
+        file_error = e
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    if file_error is None:
+        logger.info("Logs are also saved to file: %s", log_file)
+    else:
+        logger.warning("Could not create log file: %s", file_error)
+
+    return logger
+
+
+def set_log_level(name: str, level: Union[int, str, None]) -> bool:
+    """
+    Change the level of a logger set up by setup_logger, e.g. from launch.json.
+
+    Returns:
+        False if level is not a valid level
+    """
+    resolved = parse_level(level)
+    if resolved is None:
+        return False
+    logging.getLogger(name).setLevel(resolved)
+    return True
+
 
-    return logger
\ No newline at end of file
+def shutdown_logging():
+    """Write out every queued record and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
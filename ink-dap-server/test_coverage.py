@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Regression check: line coverage from PC streams
+Counts random runs whole, one step at a time and in random chunks, and
+compares line hits and function entries with a step-by-step reference.
+Functions must be reported demangled, at the line their DWARF subprogram
+is declared at (or their first instruction's line without one), also
+when an inlined subroutine starts at their entry.
+
+Usage: python test_coverage.py
+"""
+
+import sys
+from array import array
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping.dwarf_info import ScopeTable
+from mapping.line_table import FunctionRange
+from trace_fixtures import CODE, chunkings, feed, mapper
+from tracing.coverage import CoverageCollector, to_lcov
+
+FILES = ["/src/lib.rs", "/src/util.rs"]
+# (file, line) of each instruction from CODE on, 4 bytes apart (line 0: no line)
+ROWS = ((0, 12), (0, 12), (0, 13), (0, 0), (0, 14), (0, 13),
+        (0, 21), (0, 22), (0, 22), (0, 23), (1, 5), (1, 5), (1, 6))
+FUNCTIONS = [
+    FunctionRange(CODE, CODE + 24, "_ZN4flip7Flipper4flip17h0123456789abcdefE"),
+    FunctionRange(CODE + 24, CODE + 40, "_ZN4flip4main17hfedcba9876543210E"),
+    FunctionRange(CODE + 40, CODE + 52, "helper"),
+]
+# Reported name, file and line of each function
+EXPECTED_FUNCTIONS = {
+    "_ZN4flip7Flipper4flip17h0123456789abcdefE": ("flip::Flipper::flip", "/src/lib.rs", 10),
+    "_ZN4flip4main17hfedcba9876543210E": ("flip::main", "/src/lib.rs", 20),
+    # No subprogram: the line of its first instruction
+    "helper": ("helper", "/src/util.rs", 5),
+}
+# Executed PCs outside the line table
+UNMAPPED = (0x10, CODE + 4 * len(ROWS))
+
+
+def scopes() -> ScopeTable:
+    """flip and main, and a function inlined at flip's entry declared elsewhere."""
+    return ScopeTable(
+        ["_ZN4flip7Flipper4flip17h0123456789abcdefE", "_ZN4flip4main17hfedcba9876543210E", "_ZN4flip5inner17h0E"],
+        array('i', [-1, -1, 0]), array('i', [0, 0, 1]), array('I', [10, 20, 99]),
+        array('i', [-1, -1, 0]), array('I', [0, 0, 12]), array('I', [0, 0, 0]), FILES,
+        array('Q', [CODE, CODE + 24, CODE]), array('Q', [CODE + 24, CODE + 40, CODE + 8]), array('I', [0, 1, 2]),
+    )
+
+
+def reference(pcs: np.ndarray):
+    """path -> (line hits, {function: entries}), one step at a time."""
+    counts = Counter(pcs.tolist())
+    report = {}
+    for i, (file, line) in enumerate(ROWS):
+        if not line:
+            continue
+        lines, _ = report.setdefault(FILES[file], ({}, {}))
+        # A line counts its most executed instruction
+        lines[line] = max(lines.get(line, 0), counts[CODE + 4 * i])
+    for function in FUNCTIONS:
+        name, path, line = EXPECTED_FUNCTIONS[function.name]
+        report[path][1][(name, line)] = counts[function.start]
+    return report
+
+
+def collect(source, pcs: np.ndarray, chunk_sizes):
+    """The same figures from a CoverageCollector fed pcs in chunks of the given sizes."""
+    collector = CoverageCollector(source)
+    feed(collector.add_pcs, chunk_sizes, pcs)
+    report = collector.report()
+    return {
+        coverage.path: (coverage.lines, {(f.name, f.line): f.hits for f in coverage.functions})
+        for coverage in report
+    }, to_lcov(report)
+
+
+def main() -> int:
+    rng = np.random.default_rng(0)
+    source = mapper(ROWS, FUNCTIONS, scopes(), FILES)
+    failures = 0
+    pcs = rng.choice([CODE + 4 * i for i in range(len(ROWS))] + list(UNMAPPED), 5000).astype(np.uint32)
+    # Never executed, still reported with 0 hits
+    pcs = pcs[pcs != CODE + 4 * 9]
+    expected = reference(pcs)
+    for chunking, chunk_sizes in chunkings(rng).items():
+        got, lcov = collect(source, pcs, chunk_sizes)
+        problems = [] if got == expected else [f"report {got}, expected {expected}"]
+        for name, _, line in EXPECTED_FUNCTIONS.values():
+            if f"FN:{line},{name}\n" not in lcov:
+                problems.append(f"no FN:{line},{name} in lcov")
+        failures += bool(problems)
+        print(f"{'FAIL' if problems else 'ok  '} {chunking}" + "".join(f"\n     {p}" for p in problems))
+    print("OK" if not failures else f"{failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
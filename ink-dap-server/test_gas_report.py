@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Regression check: gas attribution does not depend on how a run is chunked
+Feeds the same runs to GasAttribution whole, one step at a time and in
+random chunks (empty ones included), and compares the totals per line,
+function and host call with a step-by-step reference.
+
+Usage: python test_gas_report.py
+"""
+
+import sys
+from bisect import bisect_right
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping.line_table import FunctionRange
+from trace_fixtures import CODE, chunkings, feed, mapper
+from tracing.gas_report import GasAttribution
+from tracing.profiler import UNKNOWN_FUNCTION
+
+# Line of each instruction from CODE on, 4 bytes apart (0: no line)
+LINES = (1, 1, 2, 3, 0, 3, 4, 5, 5, 6, 2, 7)
+FUNCTIONS = [FunctionRange(CODE, CODE + 24, "call"), FunctionRange(CODE + 24, CODE + 40, "deploy")]
+# Executed PCs outside the line table and the functions
+UNMAPPED = (0x10, CODE + 4 * len(LINES))
+
+
+def random_run(rng, steps: int):
+    """(pcs, gas left, host call markers) of one run."""
+    pcs = rng.choice([CODE + 4 * i for i in range(len(LINES))] + list(UNMAPPED), steps).astype(np.uint32)
+    host_calls = np.where(rng.random(steps) < 0.05, rng.integers(1, 5, steps), 0).astype(np.uint32)
+    cost = rng.integers(0, 20, steps) + 300 * (host_calls > 0)
+    gas = (1 << 40) - np.concatenate(([0], np.cumsum(cost[:-1]))).astype(np.int64)
+    return pcs, gas, host_calls
+
+
+def reference(runs, index):
+    """Total, steps, and gas and steps per line, function and host call, one step at a time."""
+    total = steps = 0
+    lines, functions, hosts = Counter(), Counter(), Counter()
+    line_steps, function_steps, host_calls = Counter(), Counter(), Counter()
+    starts = [function.start for function in FUNCTIONS]
+    for pcs, gas, markers in runs:
+        for i, pc in enumerate(pcs.tolist()):
+            charged = int(gas[i] - gas[i + 1]) if i + 1 < len(pcs) else 0
+            total += charged
+            steps += 1
+            location = index.lookup(pc)
+            if location is not None and location[1]:
+                lines[location] += charged
+                line_steps[location] += 1
+            f = bisect_right(starts, pc) - 1
+            name = FUNCTIONS[f].name if f >= 0 and pc < FUNCTIONS[f].end else UNKNOWN_FUNCTION
+            functions[name] += charged
+            function_steps[name] += 1
+            if markers[i]:
+                hosts[int(markers[i]) - 1] += charged
+                host_calls[int(markers[i]) - 1] += 1
+    return (total, steps,
+            {key: (lines[key], line_steps[key]) for key in line_steps},
+            {key: (functions[key], function_steps[key]) for key in function_steps},
+            {key: (host_calls[key], hosts[key]) for key in host_calls})
+
+
+def attribute(source, runs, chunk_sizes):
+    """The same figures from GasAttribution, each run fed in chunks of the given sizes."""
+    attribution = GasAttribution(source)
+    for pcs, gas, host_calls in runs:
+        feed(attribution.add_steps, chunk_sizes, pcs, gas, host_calls)
+        attribution.finish()
+    return (attribution.total, attribution.step_count,
+            {(row.path, row.line): (row.gas, row.steps) for row in attribution.lines()},
+            {row.name: (row.gas, row.steps) for row in attribution.functions()},
+            {row.id: (row.calls, row.gas) for row in attribution.host_call_costs()})
+
+
+def main() -> int:
+    rng = np.random.default_rng(0)
+    source = mapper([(0, line) for line in LINES], FUNCTIONS)
+    failures = 0
+    for name, runs in (("one run", [random_run(rng, 5000)]),
+                       ("three runs", [random_run(rng, steps) for steps in (1, 3000, 2)])):
+        expected = reference(runs, source.address_index)
+        for chunking, chunk_sizes in chunkings(rng).items():
+            got = attribute(source, runs, chunk_sizes)
+            ok = got == expected
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name}, {chunking}: total {got[0]}, {got[1]} steps")
+            if not ok:
+                for label, a, b in zip(("total", "steps", "lines", "functions", "host calls"), got, expected):
+                    if a != b:
+                        print(f"     {label}: {a}, expected {b}")
+    print("OK" if not failures else f"{failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Regression check: stepping through the execution history by source line
+Compares ExecutionHistory.step_back and step_forward with a step-by-step
+reference on histories whose line runs (and runs of steps without a line)
+span several scan windows.
+
+Usage: python test_history.py
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from trace_fixtures import CODE, mapper
+from tracing.history import SCAN_WINDOW, ExecutionHistory
+
+# Line of each instruction from CODE on, 4 bytes apart; file 1 from LINES_A on
+LINES = (1, 1, 2, 3, 3, 3, 4, 5, 5, 6, 2, 7, 7, 8, 1, 9)
+LINES_A = 12
+# Executed PCs outside the line table
+UNMAPPED = (0x10, CODE + 4 * len(LINES), 0x8000)
+
+
+def random_pcs(rng, steps: int) -> np.ndarray:
+    """Runs of one line or of unmapped PCs, mostly short, some longer than a scan window."""
+    by_line = {}
+    for i, line in enumerate(LINES):
+        by_line.setdefault((i >= LINES_A, line), []).append(CODE + 4 * i)
+    choices = list(by_line.values()) + [list(UNMAPPED)]
+    pcs = []
+    while len(pcs) < steps:
+        run = rng.integers(1, 4) if rng.random() < 0.8 else rng.integers(SCAN_WINDOW // 2, 2 * SCAN_WINDOW)
+        pcs.extend(rng.choice(choices[rng.integers(len(choices))], run))
+    return np.array(pcs[:steps], dtype=np.uint32)
+
+
+def reference_back(keys, step):
+    """First step of the previous line's run before step, walked one step at a time."""
+    current = keys[step]
+    i = step - 1
+    while i >= 0 and keys[i] in (current, None):
+        i -= 1
+    if i < 0:
+        return None
+    target, first = keys[i], i
+    while i >= 0 and keys[i] in (target, None):
+        if keys[i] == target:
+            first = i
+        i -= 1
+    return first
+
+
+def reference_forward(keys, step):
+    """First later step on another line, walked one step at a time."""
+    current = keys[step]
+    for i in range(step + 1, len(keys)):
+        if keys[i] not in (current, None):
+            return i
+    return None
+
+
+def main() -> int:
+    rng = np.random.default_rng(0)
+    source = mapper([(int(i >= LINES_A), line) for i, line in enumerate(LINES)], files=["/src/lib.rs", "/src/a.rs"])
+    failures = checked = 0
+    for case in range(3):
+        case_failures = 0
+        start = int(rng.integers(0, 10_000))
+        pcs = random_pcs(rng, int(rng.integers(3, 6) * SCAN_WINDOW + rng.integers(SCAN_WINDOW)))
+        keys = [source.address_index.lookup(int(pc)) for pc in pcs]
+
+        history = ExecutionHistory()
+        split = len(pcs) // 3
+        for first, stop in ((0, split), (split, len(pcs))):
+            history.append({
+                "start": start + first, "steps": stop - first,
+                "checkpoints": [{"step": start + first, "registers": [0] * 13}],
+            }, pcs[first:stop].tobytes())
+
+        steps = set(rng.integers(0, len(pcs), 300).tolist()) | {0, split, len(pcs) - 1}
+        # Steps whose scan windows start or end right at a change of line
+        changes = [i for i in range(1, len(keys)) if keys[i] != keys[i - 1]]
+        for change in rng.choice(changes, 100):
+            steps.update(s for s in (change + SCAN_WINDOW - 1, change + SCAN_WINDOW, change + SCAN_WINDOW + 1,
+                                     change - SCAN_WINDOW) if 0 <= s < len(pcs))
+        for step in sorted(steps):
+            for name, method, reference in (("step_back", history.step_back, reference_back),
+                                            ("step_forward", history.step_forward, reference_forward)):
+                got = method(source, start + step)
+                expected = reference(keys, step)
+                expected = None if expected is None else start + expected
+                checked += 1
+                if got != expected:
+                    case_failures += 1
+                    print(f"FAIL case {case} {name}({start + step}): {got}, expected {expected}")
+        failures += case_failures
+        print(f"{'FAIL' if case_failures else 'ok  '} case {case}: {len(pcs)} steps from {start}, "
+              f"{len(steps)} steps checked each way")
+    print(f"{checked} checks")
+    print("OK" if not failures else f"{failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Regression check: the NumPy and pure-Python file index builders agree
+Runs both builders of mapping.line_index on line tables with and without
+rows that have a source line, including tables where no row qualifies
+(no is_stmt rows, only end_sequence or line 0 rows).
+
+Usage: python test_line_index.py
+"""
+
+import sys
+from array import array
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping import line_index
+from mapping.line_table import FLAG_END_SEQUENCE, FLAG_IS_STMT, LineTable
+
+
+def table(rows):
+    """LineTable of (address, file, line, flags) rows over files a.rs and b.rs."""
+    return LineTable(
+        ["/src/a.rs", "/src/b.rs"],
+        array('Q', (row[0] for row in rows)),
+        array('I', (row[1] for row in rows)),
+        array('I', (row[2] for row in rows)),
+        array('I', (1 for _ in rows)),
+        array('I', (0 for _ in rows)),
+        array('B', (row[3] for row in rows)),
+    )
+
+
+def both_builders(line_table):
+    """(NumPy result, pure-Python result) of build_file_index."""
+    numpy = line_index.np
+    if numpy is None:
+        raise SystemExit("NumPy is not installed, only one builder can run")
+    try:
+        with_numpy = line_index.build_file_index(line_table)
+        line_index.np = None
+        without_numpy = line_index.build_file_index(line_table)
+    finally:
+        line_index.np = numpy
+    return with_numpy, without_numpy
+
+
+def summary(index):
+    """Plain data of an index: path -> (line -> addresses)."""
+    return {
+        path: {line: list(file_lines.addresses_for(line)) for line in file_lines.lines}
+        for path, file_lines in index.items()
+    }
+
+
+CASES = {
+    "no is_stmt rows": [(0x10, 0, 3, 0), (0x14, 0, 4, 0), (0x18, 0, 4, FLAG_END_SEQUENCE)],
+    "only end_sequence rows": [(0x10, 0, 3, FLAG_END_SEQUENCE | FLAG_IS_STMT)],
+    "only line 0 rows": [(0x10, 0, 0, FLAG_IS_STMT), (0x14, 1, 0, FLAG_IS_STMT),
+                         (0x18, 1, 0, FLAG_END_SEQUENCE | FLAG_IS_STMT)],
+    "mapped rows": [(0x10, 0, 3, FLAG_IS_STMT), (0x14, 0, 3, FLAG_IS_STMT), (0x18, 1, 7, FLAG_IS_STMT),
+                    (0x1c, 0, 0, FLAG_IS_STMT), (0x20, 0, 3, FLAG_IS_STMT),
+                    (0x24, 0, 3, FLAG_END_SEQUENCE | FLAG_IS_STMT)],
+}
+
+EXPECTED = {
+    "no is_stmt rows": {},
+    "only end_sequence rows": {},
+    "only line 0 rows": {},
+    "mapped rows": {"/src/a.rs": {3: [0x10, 0x20]}, "/src/b.rs": {7: [0x18]}},
+}
+
+
+def main() -> int:
+    failures = 0
+    for name, rows in CASES.items():
+        with_numpy, without_numpy = both_builders(table(rows))
+        results = (summary(with_numpy), summary(without_numpy))
+        ok = results[0] == results[1] == EXPECTED[name]
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: numpy {results[0]}, python {results[1]}")
+    print("OK" if not failures else f"{failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
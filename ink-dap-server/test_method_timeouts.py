@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Regression check: every sandbox method the adapter sends has a response budget
+Finds the call_method("...") calls in src/ and fails for method names
+missing from METHOD_TIMEOUTS, which would silently fall back to
+DEFAULT_TIMEOUT.
+
+Usage: python test_method_timeouts.py
+"""
+
+import ast
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).parent / "src"
+
+# Add src to Python path
+sys.path.insert(0, str(SRC))
+
+from bridge.rust_bridge import METHOD_TIMEOUTS
+
+
+def sent_methods():
+    """(method, file:line) of every call_method call with a literal name under src/."""
+    for path in sorted(SRC.rglob("*.py")):
+        tree = ast.parse(path.read_text(encoding="utf-8"), str(path))
+        for node in ast.walk(tree):
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr == "call_method" and node.args
+                    and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+                yield node.args[0].value, f"{path.relative_to(SRC)}:{node.lineno}"
+
+
+def main() -> int:
+    sent = list(sent_methods())
+    missing = [(method, where) for method, where in sent if method not in METHOD_TIMEOUTS]
+    for method, where in missing:
+        print(f"FAIL {where}: {method!r} is not in METHOD_TIMEOUTS")
+    print(f"{len(sent)} calls, {len({method for method, _ in sent})} methods checked")
+    print("OK" if not missing else f"{len(missing)} failed")
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Regression check: 'pause' is answered promptly while a slow request is in flight
+Runs the debug adapter over stdin/stdout pipes with a 'variables' handler that
+takes a second (as a slow sandbox round trip would) and times a 'pause' sent
+while it is pending. Exits non-zero if pause takes 10 ms or more, or waits
+for the variables response.
+
+Usage: python test_pause_latency.py
+"""
+
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+# Slow handler duration and the pause deadline, in seconds
+VARIABLES_DELAY = 1.0
+PAUSE_DEADLINE = 0.010
+
+
+def run_adapter():
+    """Debug adapter whose 'variables' handler is slow."""
+    from adapter.debug_adapter import DebugAdapter
+
+    class SlowVariablesAdapter(DebugAdapter):
+        async def _handle_variables(self, request):
+            await asyncio.sleep(VARIABLES_DELAY)
+            await super()._handle_variables(request)
+
+    asyncio.run(SlowVariablesAdapter().run())
+
+
+def encode(seq: int, command: str, arguments=None) -> bytes:
+    body = json.dumps({
+        "seq": seq,
+        "type": "request",
+        "command": command,
+        "arguments": arguments or {}
+    }).encode()
+    return f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+async def read_message(stdout: asyncio.StreamReader) -> dict:
+    length = 0
+    while True:
+        line = await stdout.readline()
+        if not line:
+            raise EOFError("Debug adapter exited")
+        if line.startswith(b"Content-Length:"):
+            length = int(line.split(b":")[1])
+        elif line == b"\r\n":
+            return json.loads(await stdout.readexactly(length))
+
+
+async def wait_response(stdout: asyncio.StreamReader, request_seq: int, received: dict) -> float:
+    """
+    Read until the response to request_seq; returns its arrival time.
+
+    received maps request seq to (command, arrival time) of every response
+    read so far, in arrival order.
+    """
+    while request_seq not in received:
+        message = await read_message(stdout)
+        if message.get("type") == "response":
+            received[message["request_seq"]] = (message["command"], time.perf_counter())
+    return received[request_seq][1]
+
+
+async def check() -> bool:
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, __file__, "--adapter",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    received = {}
+    try:
+        process.stdin.write(encode(1, "initialize", {"adapterID": "ink"}))
+        await wait_response(process.stdout, 1, received)
+
+        process.stdin.write(encode(2, "variables", {"variablesReference": 1}))
+        await process.stdin.drain()
+        # Make sure the slow handler is running before pausing
+        await asyncio.sleep(0.1)
+
+        sent = time.perf_counter()
+        process.stdin.write(encode(3, "pause", {"threadId": 1}))
+        await process.stdin.drain()
+        answered = await wait_response(process.stdout, 3, received)
+        latency = answered - sent
+
+        await wait_response(process.stdout, 2, received)
+        process.stdin.write(encode(4, "disconnect"))
+        await wait_response(process.stdout, 4, received)
+    finally:
+        process.stdin.close()
+        try:
+            await asyncio.wait_for(process.wait(), 5.0)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+    print(f"pause answered in {latency * 1000:.2f} ms with variables in flight")
+    order = [command for command, _ in received.values()]
+    print(f"response order: {', '.join(order)}")
+    ok = latency < PAUSE_DEADLINE and order.index("pause") < order.index("variables")
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--adapter"]:
+        run_adapter()
+        sys.exit(0)
+
+    sys.exit(0 if asyncio.run(check()) else 1)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Regression check: profiler stacks match a step-by-step call stack walk
+Profiles random runs whole, one step at a time and in random chunks,
+with and without inlined scopes, and compares the stacks, function costs
+and line costs with a reference that applies the profiler's rules to one
+step at a time: landing on a function's first instruction is a call,
+landing inside a function on the stack a return to it, anything else
+replaces the top frame.
+
+Usage: python test_profiler.py
+"""
+
+import sys
+from array import array
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping.dwarf_info import ScopeTable
+from mapping.line_table import FunctionRange
+from trace_fixtures import CODE, chunkings, feed, mapper
+from tracing.profiler import UNKNOWN_FUNCTION, Profiler
+
+# Line of each instruction from CODE on, 4 bytes apart (0: no line)
+LINES = (1, 1, 2, 3, 0, 3, 4, 5, 5, 6, 2, 7, 8, 8)
+FUNCTIONS = [
+    FunctionRange(CODE, CODE + 24, "call"),
+    FunctionRange(CODE + 24, CODE + 44, "deploy"),
+    FunctionRange(CODE + 44, CODE + 56, "helper"),
+]
+# Executed PCs outside the functions
+UNMAPPED = (0x10, 0x2000)
+# Inlined into "call": inner at [CODE + 8, CODE + 16), nested in outer at [CODE + 4, CODE + 20)
+INLINED = {CODE + 4: ["outer"], CODE + 8: ["outer", "inner"], CODE + 12: ["outer", "inner"], CODE + 16: ["outer"]}
+
+
+def inlined_scopes() -> ScopeTable:
+    """The scopes of INLINED."""
+    return ScopeTable(
+        ["call", "outer", "inner"], array('i', [-1, 0, 1]), array('i', [-1] * 3), array('I', [0] * 3),
+        array('i', [-1, 0, 0]), array('I', [0, 3, 5]), array('I', [0] * 3), ["/src/lib.rs"],
+        array('Q', [CODE, CODE + 4, CODE + 8]), array('Q', [CODE + 24, CODE + 20, CODE + 16]),
+        array('I', [0, 1, 2]),
+    )
+
+
+def random_run(rng, steps: int) -> np.ndarray:
+    """Runs of steps inside one function, entering a function now and then."""
+    bodies = [list(range(f.start + 4, f.end, 4)) for f in FUNCTIONS] + [list(UNMAPPED)]
+    pcs = []
+    while len(pcs) < steps:
+        function = int(rng.integers(len(bodies)))
+        if function < len(FUNCTIONS) and rng.random() < 0.3:
+            pcs.append(FUNCTIONS[function].start)
+        pcs.extend(rng.choice(bodies[function], int(rng.integers(1, 6))))
+    return np.array(pcs[:steps], dtype=np.uint32)
+
+
+def function_name(pc: int) -> str:
+    for function in FUNCTIONS:
+        if function.start <= pc < function.end:
+            return function.name
+    return UNKNOWN_FUNCTION
+
+
+def reference(pcs: np.ndarray, index, inlined: bool):
+    """Stacks, function costs and line costs, walking the call stack one step at a time."""
+    entries = {function.start for function in FUNCTIONS}
+    stack = []
+    stacks, calls, lines = Counter(), Counter(), Counter()
+    for pc in pcs.tolist():
+        name = function_name(pc)
+        if not stack or stack[-1] != name:
+            if pc in entries:
+                stack.append(name)
+                calls[name] += 1
+            elif name in stack:
+                del stack[len(stack) - stack[::-1].index(name):]
+            else:
+                stack[-1:] = [name]
+                calls[name] += 1
+        stacks[tuple(stack + (INLINED.get(pc, []) if inlined else []))] += 1
+        location = index.lookup(pc)
+        if location is not None and location[1]:
+            lines[location] += 1
+
+    exclusive, inclusive = Counter(), Counter()
+    for frames, cost in stacks.items():
+        exclusive[frames[-1]] += cost
+        for frame in set(frames):
+            inclusive[frame] += cost
+    functions = {name: (exclusive[name], inclusive[name], calls[name]) for name in inclusive}
+    return dict(stacks), functions, dict(lines)
+
+
+def profile(source, pcs: np.ndarray, chunk_sizes):
+    """The same figures from a Profiler fed pcs in chunks of the given sizes."""
+    profiler = Profiler(source)
+    feed(profiler.add_pcs, chunk_sizes, pcs)
+    stacks = Counter()
+    for frames, cost in profiler.stacks():
+        stacks[tuple(profiler.names[frame] for frame in frames)] += cost
+    functions = {row.name: (row.exclusive, row.inclusive, row.calls) for row in profiler.function_costs()}
+    lines = {(row.path, row.line): row.instructions for row in profiler.line_costs()}
+    return dict(stacks), functions, lines
+
+
+def main() -> int:
+    rng = np.random.default_rng(0)
+    failures = 0
+    for inlined in (False, True):
+        source = mapper([(0, line) for line in LINES], FUNCTIONS, inlined_scopes() if inlined else None)
+        pcs = random_run(rng, 6000)
+        expected = reference(pcs, source.address_index, inlined)
+        for chunking, chunk_sizes in chunkings(rng).items():
+            got = profile(source, pcs, chunk_sizes)
+            ok = got == expected
+            failures += not ok
+            name = f"{'inlined scopes' if inlined else 'no scopes'}, {chunking}"
+            print(f"{'ok  ' if ok else 'FAIL'} {name}: {len(got[0])} stacks, {len(got[1])} functions")
+            if not ok:
+                for label, a, b in zip(("stacks", "functions", "lines"), got, expected):
+                    if a != b:
+                        print(f"     {label}: {a}, expected {b}")
+    print("OK" if not failures else f"{failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
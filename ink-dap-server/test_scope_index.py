@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Regression check: ScopeIndex finds the innermost scope at every PC
+Builds random scope trees (functions with several ranges, inlined
+subroutines nested in them, overlapping functions) and compares find(),
+find_many() and functions_many() at every address with the deepest
+covering range found by brute force.
+
+Usage: python test_scope_index.py
+"""
+
+import sys
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping import scope_index
+from mapping.dwarf_info import ScopeTable
+from mapping.scope_index import ScopeIndex
+
+
+def random_table(rng, functions: int) -> ScopeTable:
+    """Scopes whose ranges lie inside their parent's, as DWARF nests them; functions may overlap."""
+    parents = array('i')
+    starts, ends, range_scopes = array('Q'), array('Q'), array('I')
+
+    def add(parent, ranges, depth):
+        scope = len(parents)
+        parents.append(parent)
+        for start, end in ranges:
+            starts.append(start)
+            ends.append(end)
+            range_scopes.append(scope)
+        if depth == 4:
+            return
+        for _ in range(rng.integers(0, 4)):
+            start, end = ranges[rng.integers(len(ranges))]
+            if end - start < 2:
+                continue
+            child_start = int(rng.integers(start, end - 1))
+            child_end = int(rng.integers(child_start + 1, end + 1))
+            child = [(child_start, child_end)]
+            # Inlined code split around the caller's
+            if rng.random() < 0.3 and child_end < end - 1:
+                gap = int(rng.integers(child_end + 1, end))
+                child.append((gap, int(rng.integers(gap + 1, end + 1))))
+            add(scope, child, depth + 1)
+
+    position = 16
+    for _ in range(functions):
+        size = int(rng.integers(1, 200))
+        # Some functions overlap the previous one, like identical code folded by the linker
+        start = max(0, position - int(rng.integers(0, 40))) if rng.random() < 0.2 else position
+        ranges = [(start, start + size)]
+        if rng.random() < 0.2:
+            ranges.append((start + size + 8, start + size + 8 + int(rng.integers(1, 50))))
+        add(-1, ranges, 0)
+        position = ranges[-1][1] + int(rng.integers(0, 10))
+
+    count = len(parents)
+    return ScopeTable([f"f{i}" for i in range(count)], parents, array('i', [-1] * count), array('I', [0] * count),
+                      array('i', [-1] * count), array('I', [0] * count), array('I', [0] * count), [],
+                      starts, ends, range_scopes)
+
+
+def brute_force(table: ScopeTable, depths, pc: int) -> int:
+    """Scope of the deepest range covering pc; ties go to the latest start, then the shortest range."""
+    best = None
+    for i, (start, end, scope) in enumerate(zip(table.starts, table.ends, table.range_scopes)):
+        if start <= pc < end:
+            key = (depths[scope], start, -end, -i)
+            if best is None or key > best[0]:
+                best = (key, scope)
+    return best[1] if best else -1
+
+
+def check(table: ScopeTable, offset: int):
+    """Addresses where the index disagrees with brute force, as (address, found, expected)."""
+    index = ScopeIndex(table)
+    index.offset = offset
+    pcs = list(range(offset, offset + max(table.ends, default=0) + 3))
+    expected = [brute_force(table, index.depths, pc - offset) for pc in pcs]
+    roots = [index.roots[scope] if scope >= 0 else -1 for scope in expected]
+    wrong = [(pc, index.find(pc), want) for pc, want in zip(pcs, expected) if index.find(pc) != want]
+    found = list(index.find_many(pcs))
+    wrong += [(pc, got, want) for pc, got, want in zip(pcs, found, expected) if got != want]
+    functions = list(index.functions_many(pcs))
+    wrong += [(pc, got, want) for pc, got, want in zip(pcs, functions, roots) if got != want]
+    return wrong
+
+
+def main() -> int:
+    rng = np.random.default_rng(0)
+    failures = 0
+    numpy = scope_index.np
+    for case in range(12):
+        table = random_table(rng, int(rng.integers(1, 30)))
+        offset = 0 if case % 2 else 0x10000
+        try:
+            wrong = check(table, offset)
+            # The pure-Python find_many()
+            scope_index.np = None
+            wrong += check(table, offset)
+        finally:
+            scope_index.np = numpy
+        failures += bool(wrong)
+        print(f"{'FAIL' if wrong else 'ok  '} case {case}: {len(table)} scopes, {len(table.starts)} ranges"
+              + "".join(f"\n     0x{pc:x}: scope {got}, expected {want}" for pc, got, want in wrong[:5]))
+    print("OK" if not failures else f"{failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
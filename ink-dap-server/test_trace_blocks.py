@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Regression check: block-compressed traces round-trip
+Writes traces of 0, 1, about one and several blocks of steps in the
+block format and reads them back whole, in slices, step by step and in
+chunks, with and without a gas column.
+
+Usage: python test_trace_blocks.py
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from tracing.trace_blocks import BLOCK_STEPS
+from tracing.trace_store import TraceStore, iter_steps, open_block_trace
+
+STEP_COUNTS = (0, 1, BLOCK_STEPS - 1, BLOCK_STEPS, BLOCK_STEPS + 1, 3 * BLOCK_STEPS + 7)
+
+
+def random_trace(steps: int, gas: bool, seed: int) -> TraceStore:
+    """Short forward PC deltas with long jumps either way, sparse host calls, falling gas."""
+    rng = np.random.default_rng(seed)
+    pcs = rng.integers(0, 1 << 32, steps, dtype=np.uint64)
+    short = rng.random(steps) < 0.8
+    pcs[1:][short[1:]] = 0
+    pcs = np.cumsum(pcs + np.where(short, rng.integers(1, 8, steps, dtype=np.uint64), 0)).astype(np.uint32)
+    host_calls = np.where(rng.random(steps) < 0.05, rng.integers(1, 300, steps), 0).astype(np.uint32)
+    gas_left = None
+    if gas:
+        gas_left = (1 << 40) - np.cumsum(rng.integers(0, 5000, steps)).astype(np.int64)
+    return TraceStore(pcs, host_calls, gas_left)
+
+
+def check(trace: TraceStore, path: str):
+    """Problems reading back trace as saved at path, empty if none."""
+    problems = []
+    trace.save(path)
+
+    def same(what, got, expected):
+        if (got is None) != (expected is None) or (got is not None and not np.array_equal(got, expected)):
+            problems.append(what)
+
+    loaded = TraceStore.load(path)
+    same("pcs", loaded.pcs, trace.pcs)
+    same("host calls", loaded.host_calls, trace.host_calls)
+    same("gas", loaded.gas, trace.gas)
+
+    reader = open_block_trace(path)
+    if len(reader) != len(trace):
+        problems.append(f"{len(reader)} steps")
+    steps = len(trace)
+    bounds = {0, steps, steps // 2, BLOCK_STEPS - 1, BLOCK_STEPS, BLOCK_STEPS + 1, 2 * BLOCK_STEPS + 3}
+    for start in sorted(bounds):
+        for stop in sorted(bounds):
+            if start > steps or stop < start:
+                continue
+            pcs, host_calls, gas = reader.read(start, stop)
+            expected_gas = trace.gas[start:stop] if trace.gas is not None else None
+            same(f"read({start}, {stop}) pcs", pcs, trace.pcs[start:stop])
+            same(f"read({start}, {stop}) host calls", host_calls, trace.host_calls[start:stop])
+            same(f"read({start}, {stop}) gas", gas, expected_gas)
+    for step in sorted(bounds - {steps}):
+        if step < steps and reader.pc_at(step) != trace.pcs[step]:
+            problems.append(f"pc_at({step})")
+
+    chunks = list(iter_steps(path, chunk_steps=1000))
+    same("chunked pcs", np.concatenate([c[0] for c in chunks]) if chunks else trace.pcs, trace.pcs)
+    if len(chunks) != -(-steps // 1000):
+        problems.append(f"{len(chunks)} chunks")
+    return problems
+
+
+def main() -> int:
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for seed, steps in enumerate(STEP_COUNTS):
+            for gas in (False, True):
+                problems = check(random_trace(steps, gas, seed), str(Path(directory) / "run.trace"))
+                failures += bool(problems)
+                name = f"{steps} steps{' with gas' if gas else ''}"
+                print(f"{'FAIL' if problems else 'ok  '} {name}{': ' + ', '.join(problems) if problems else ''}")
+    print("OK" if not failures else f"{failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Shared fixtures of the trace regression checks
+A contract whose code is one instruction every 4 bytes from CODE on, a
+SourceMapper stand-in for it, and the ways of feeding a recorded run to
+a consumer in chunks.
+"""
+
+import sys
+from array import array
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from mapping.address_index import AddressIndex
+from mapping.dwarf_info import ScopeTable
+from mapping.line_index import build_file_index
+from mapping.line_table import FLAG_END_SEQUENCE, FLAG_IS_STMT, LineTable
+from mapping.scope_index import ScopeIndex
+
+CODE = 0x1000
+FILES = ["/src/lib.rs"]
+
+
+def line_table(rows, files=FILES) -> LineTable:
+    """One sequence: rows are the (file, line) of each instruction, line 0 for none."""
+    entries = [(CODE + 4 * i, file, line, FLAG_IS_STMT) for i, (file, line) in enumerate(rows)]
+    entries.append((CODE + 4 * len(rows), 0, 0, FLAG_END_SEQUENCE | FLAG_IS_STMT))
+    return LineTable(
+        list(files),
+        array('Q', (entry[0] for entry in entries)),
+        array('I', (entry[1] for entry in entries)),
+        array('I', (entry[2] for entry in entries)),
+        array('I', (1 for _ in entries)),
+        array('I', (0 for _ in entries)),
+        array('B', (entry[3] for entry in entries)),
+    )
+
+
+def mapper(rows, functions=(), scopes: ScopeTable = None, files=FILES):
+    """The parts of a SourceMapper the trace consumers use."""
+    table = line_table(rows, files)
+    return SimpleNamespace(address_index=AddressIndex(table), file_index=build_file_index(table),
+                           functions=list(functions), address_offset=0,
+                           scope_index=ScopeIndex(scopes if scopes is not None else ScopeTable.empty()))
+
+
+def feed(add, chunk_sizes, *arrays):
+    """Call add with consecutive slices of the arrays, as long as chunk_sizes says."""
+    start = 0
+    for size in chunk_sizes(len(arrays[0])):
+        add(*(values[start:start + size] for values in arrays))
+        start += size
+
+
+def chunkings(rng):
+    """Ways of splitting a run: whole, one step at a time and in random chunks."""
+    return {
+        "whole": lambda steps: [steps],
+        "single steps": lambda steps: [1] * steps,
+        "random chunks": random_chunks(rng),
+    }
+
+
+def random_chunks(rng):
+    """Chunk sizes from 0 (an empty chunk) to a few thousand steps."""
+    def sizes(steps):
+        left = steps
+        while left > 0:
+            size = int(min(left, rng.choice([0, 1, 2, rng.integers(1, 2000)])))
+            left -= size
+            yield size
+    return sizes
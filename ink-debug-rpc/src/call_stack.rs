@@ -0,0 +1,309 @@
+use serde_json::{Value, json};
+
+/// Bytes between an instruction and the next one at most: a step further
+/// from the previous PC than this (or backwards) is a jump
+const MAX_INSTRUCTION_LENGTH: u32 = 16;
+
+/// A call or return, reported for the step it lands on.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub(crate) enum CallEvent {
+    /// Made by the call instruction at this PC
+    Call(u32),
+    /// Back to just after the call instruction at this PC
+    Return(u32),
+}
+
+impl CallEvent {
+    /// Kind as sent in the history: 1 call, 2 return.
+    pub(crate) fn kind(&self) -> u32 {
+        match self {
+            CallEvent::Call(_) => 1,
+            CallEvent::Return(_) => 2,
+        }
+    }
+
+    pub(crate) fn pc(&self) -> u32 {
+        match self {
+            CallEvent::Call(pc) | CallEvent::Return(pc) => *pc,
+        }
+    }
+}
+
+/// A call still waiting for its return.
+#[derive(Debug, Clone, Copy)]
+struct Frame {
+    /// PC of the call instruction
+    call: u32,
+    /// RA as the call set it
+    ra: u64,
+}
+
+/// Shadow call stack, kept from the step stream alone.
+///
+/// No guest memory is walked: a step that jumps and finds RA changed by
+/// the instruction before it follows a call made there, and a jump back
+/// to just after the innermost call with RA still holding the return
+/// address it set is the return from it. Tail calls replace the callee
+/// without a trace, so the innermost frame is named by its PC, not by
+/// the call that created it.
+///
+/// Clients only receive what changed since the last stop (see
+/// take_changes()), so a stop costs the calls made and returned from
+/// since, not the whole depth.
+#[derive(Debug, Default)]
+pub(crate) struct CallStack {
+    frames: Vec<Frame>,
+    /// Depth the clients were last sent
+    reported: usize,
+    /// Depth the stack has not been below since then
+    unchanged: usize,
+    /// PC and RA of the previous step
+    previous: Option<(u32, u64)>,
+}
+
+impl CallStack {
+    /// Follow one step to pc, with ra the RA register before it executes.
+    pub(crate) fn record(&mut self, pc: u32, ra: u64) -> Option<CallEvent> {
+        let (previous_pc, previous_ra) = self.previous.replace((pc, ra))?;
+        if pc > previous_pc && pc - previous_pc <= MAX_INSTRUCTION_LENGTH {
+            return None;
+        }
+        if let Some(frame) = self.frames.last() {
+            if frame.ra == ra && pc > frame.call && pc - frame.call <= MAX_INSTRUCTION_LENGTH {
+                let call = frame.call;
+                self.frames.pop();
+                self.unchanged = self.unchanged.min(self.frames.len());
+                return Some(CallEvent::Return(call));
+            }
+        }
+        if ra != previous_ra {
+            self.frames.push(Frame {
+                call: previous_pc,
+                ra,
+            });
+            return Some(CallEvent::Call(previous_pc));
+        }
+        None
+    }
+
+    /// Calls since the last report as "calls" params: how many of the
+    /// call sites the clients hold to drop ("pop"), then the ones to add
+    /// ("push", outermost first).
+    pub(crate) fn take_changes(&mut self) -> Value {
+        let changes = json!({
+            "pop": self.reported - self.unchanged,
+            "push": self.frames[self.unchanged..].iter().map(|frame| frame.call).collect::<Vec<_>>(),
+            "depth": self.frames.len(),
+        });
+        self.reported = self.frames.len();
+        self.unchanged = self.frames.len();
+        changes
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// Record (pc, RA before the step) pairs, returning the events.
+    fn run(stack: &mut CallStack, steps: &[(u32, u64)]) -> Vec<Option<CallEvent>> {
+        steps.iter().map(|&(pc, ra)| stack.record(pc, ra)).collect()
+    }
+
+    /// The call sites a client holds after applying changes, as the adapter does.
+    fn apply(sites: &mut Vec<u32>, changes: &Value) {
+        let pop = changes["pop"].as_u64().unwrap() as usize;
+        sites.truncate(sites.len() - pop);
+        for call in changes["push"].as_array().unwrap() {
+            sites.push(call.as_u64().unwrap() as u32);
+        }
+        assert_eq!(sites.len() as u64, changes["depth"], "{changes}");
+    }
+
+    fn calls(stack: &CallStack) -> Vec<u32> {
+        stack.frames.iter().map(|frame| frame.call).collect()
+    }
+
+    #[test]
+    fn call_and_return() {
+        let mut stack = CallStack::default();
+        let events = run(
+            &mut stack,
+            &[
+                // main: jal at 0x104 sets RA to 0x108
+                (0x100, 0),
+                (0x104, 0),
+                (0x200, 0x108),
+                (0x204, 0x108),
+                // ret back to just after the call
+                (0x108, 0x108),
+                (0x10c, 0x108),
+            ],
+        );
+        assert_eq!(
+            events,
+            [
+                None,
+                None,
+                Some(CallEvent::Call(0x104)),
+                None,
+                Some(CallEvent::Return(0x104)),
+                None
+            ]
+        );
+        assert!(stack.frames.is_empty());
+    }
+
+    #[test]
+    fn nested_calls_return_innermost_first() {
+        let mut stack = CallStack::default();
+        let events = run(
+            &mut stack,
+            &[
+                (0x100, 0),
+                // main calls f at 0x100, f calls g at 0x204
+                (0x200, 0x104),
+                (0x204, 0x104),
+                (0x300, 0x208),
+                // g returns, f reloads RA and returns
+                (0x208, 0x208),
+                (0x20c, 0x208),
+                (0x104, 0x104),
+            ],
+        );
+        assert_eq!(
+            events,
+            [
+                None,
+                Some(CallEvent::Call(0x100)),
+                None,
+                Some(CallEvent::Call(0x204)),
+                Some(CallEvent::Return(0x204)),
+                None,
+                Some(CallEvent::Return(0x100)),
+            ]
+        );
+        assert!(stack.frames.is_empty());
+    }
+
+    #[test]
+    fn tail_jump_keeps_the_frame() {
+        let mut stack = CallStack::default();
+        let events = run(
+            &mut stack,
+            &[
+                (0x100, 0),
+                (0x200, 0x104),
+                // f jumps to h without touching RA, backwards and forwards
+                (0x180, 0x104),
+                (0x400, 0x104),
+                (0x404, 0x104),
+                // h returns to f's caller
+                (0x104, 0x104),
+            ],
+        );
+        assert_eq!(
+            events,
+            [
+                None,
+                Some(CallEvent::Call(0x100)),
+                None,
+                None,
+                None,
+                Some(CallEvent::Return(0x100)),
+            ]
+        );
+        assert!(stack.frames.is_empty());
+    }
+
+    #[test]
+    fn repeated_pc_of_an_ecalli_step() {
+        let mut stack = CallStack::default();
+        let events = run(
+            &mut stack,
+            &[
+                (0x100, 0),
+                // The call target is an ecalli, stepped twice
+                (0x200, 0x104),
+                (0x200, 0x104),
+                (0x204, 0x104),
+                // So is the instruction returned to
+                (0x104, 0x104),
+                (0x104, 0x104),
+                (0x108, 0x104),
+            ],
+        );
+        assert_eq!(
+            events,
+            [
+                None,
+                Some(CallEvent::Call(0x100)),
+                None,
+                None,
+                Some(CallEvent::Return(0x100)),
+                None,
+                None,
+            ]
+        );
+        assert!(stack.frames.is_empty());
+    }
+
+    #[test]
+    fn take_changes_across_stops() {
+        let mut stack = CallStack::default();
+        let mut sites = Vec::new();
+        let mut stop = |stack: &mut CallStack, pop: usize, push: &[u32]| {
+            let changes = stack.take_changes();
+            assert_eq!(changes["pop"], pop, "{changes}");
+            assert_eq!(changes["push"], json!(push), "{changes}");
+            apply(&mut sites, &changes);
+            assert_eq!(sites, calls(stack));
+        };
+
+        // Nothing called yet
+        run(&mut stack, &[(0x100, 0), (0x104, 0)]);
+        stop(&mut stack, 0, &[]);
+
+        // main calls f, f calls g
+        run(
+            &mut stack,
+            &[(0x200, 0x108), (0x204, 0x108), (0x300, 0x208)],
+        );
+        stop(&mut stack, 0, &[0x104, 0x204]);
+
+        // Still in g
+        run(&mut stack, &[(0x304, 0x208)]);
+        stop(&mut stack, 0, &[]);
+
+        // g returns and f calls g' from the same depth
+        run(
+            &mut stack,
+            &[(0x208, 0x208), (0x20c, 0x208), (0x500, 0x210)],
+        );
+        stop(&mut stack, 1, &[0x20c]);
+
+        // g' and f return, main calls k
+        run(
+            &mut stack,
+            &[
+                (0x210, 0x210),
+                (0x214, 0x210),
+                (0x108, 0x108),
+                (0x10c, 0x108),
+                (0x600, 0x110),
+            ],
+        );
+        stop(&mut stack, 2, &[0x10c]);
+
+        // A call and its return between two stops change nothing
+        run(
+            &mut stack,
+            &[(0x604, 0x110), (0x700, 0x608), (0x608, 0x608)],
+        );
+        stop(&mut stack, 0, &[]);
+
+        // Back in main
+        run(&mut stack, &[(0x110, 0x110)]);
+        stop(&mut stack, 1, &[]);
+    }
+}
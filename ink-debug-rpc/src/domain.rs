@@ -30,6 +30,37 @@ pub struct JsonRpcError {
     pub data: Option<Value>,
 }
 
+#[derive(Debug, Deserialize, Clone)]
+pub struct BreakpointParams {
+    pub id: u64,
+    pub addresses: Vec<u32>,
+}
+
+#[derive(Debug, Deserialize, Clone)]
+pub struct SetBreakpointsParams {
+    pub source: String,
+    #[serde(default)]
+    pub breakpoints: Vec<BreakpointParams>,
+}
+
+#[derive(Debug, Deserialize, Clone)]
+pub struct AddBreakpointsParams {
+    pub breakpoints: Vec<SourceBreakpointParams>,
+}
+
+#[derive(Debug, Deserialize, Clone)]
+pub struct SourceBreakpointParams {
+    pub id: u64,
+    #[serde(default)]
+    pub source: Option<String>,
+    pub addresses: Vec<u32>,
+}
+
+#[derive(Debug, Deserialize, Clone)]
+pub struct RemoveBreakpointsParams {
+    pub ids: Vec<u64>,
+}
+
 impl JsonRpcResponse {
     pub(crate) fn new(result: Option<Value>, error: Option<JsonRpcError>, id: usize) -> JsonRpcResponse {
         JsonRpcResponse {
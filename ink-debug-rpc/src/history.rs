@@ -0,0 +1,223 @@
+use crate::call_stack::CallEvent;
+use crate::trace::TraceConfig;
+use polkavm::{RawInstance, Reg};
+use serde_json::{Value, json};
+
+/// Steps between two register checkpoints
+pub const CHECKPOINT_INTERVAL: u64 = 4096;
+/// Payload bytes held back before they are sent to the clients without a
+/// stop. JSON framing sends the payload as base64, a third larger, which
+/// keeps every notification well under the adapter's 16 MiB line limit
+const MAX_PENDING_BYTES: usize = 8 * 1024 * 1024;
+
+/// Register state at a checkpoint step.
+#[derive(Debug)]
+struct Checkpoint {
+    step: u64,
+    registers: [u64; 13],
+}
+
+/// Execution history kept for time-travel debugging (DAP stepBack and
+/// reverseContinue).
+///
+/// Every step records its PC and the registers it changed; every
+/// CHECKPOINT_INTERVAL steps (and at the start of each segment) all
+/// registers are captured, so a client rebuilds the registers at any step
+/// from the checkpoint before it and at most CHECKPOINT_INTERVAL register
+/// writes. Pending steps go out in a "history" notification before every
+/// stop, or once their payload reaches MAX_PENDING_BYTES.
+///
+/// Payload: the PCs (u32 each), the host call markers (u32 each, as in
+/// the trace) if "hostCalls", the gas left (i64 each) if "gas", then the
+/// register writes (step u64, register index u32, value u64), then the
+/// calls and returns (step u64, call instruction PC u32, kind u32, see
+/// CallEvent::kind()), all little-endian. Step numbers are those of the
+/// trace file.
+#[derive(Debug, Default)]
+pub(crate) struct History {
+    /// Step number of the next recorded step
+    steps: u64,
+    /// Step number of pcs[0]
+    start: u64,
+    pcs: Vec<u32>,
+    /// Recorded like the trace, when the trace has them
+    record_gas: bool,
+    record_host_calls: bool,
+    gas: Vec<i64>,
+    host_calls: Vec<u32>,
+    host_call: Option<u32>,
+    writes: Vec<u8>,
+    write_count: usize,
+    calls: Vec<u8>,
+    call_count: usize,
+    checkpoints: Vec<Checkpoint>,
+    /// Registers as of the last recorded step
+    registers: [u64; 13],
+}
+
+impl History {
+    /// History with the same columns as the trace.
+    pub(crate) fn new(config: &TraceConfig) -> History {
+        History {
+            record_gas: config.gas,
+            record_host_calls: config.host_calls,
+            ..History::default()
+        }
+    }
+
+    /// Mark the next step as host call `id`.
+    pub(crate) fn host_call(&mut self, id: u32) {
+        if self.record_host_calls {
+            self.host_call = Some(id);
+        }
+    }
+
+    /// Append one step, with the instance about to execute pc and the
+    /// call or return that led to it.
+    pub(crate) fn record(&mut self, pc: u32, instance: &RawInstance, call: Option<CallEvent>) {
+        let registers = Reg::ALL.map(|reg| instance.reg(reg));
+        self.push(pc, registers, instance.gas(), call);
+    }
+
+    /// record() with the instance state already read.
+    fn push(&mut self, pc: u32, registers: [u64; 13], gas: i64, call: Option<CallEvent>) {
+        let step = self.steps;
+        self.steps += 1;
+
+        if self.pcs.is_empty() || step % CHECKPOINT_INTERVAL == 0 {
+            self.registers = registers;
+            self.checkpoints.push(Checkpoint { step, registers });
+        } else {
+            for (i, &value) in registers.iter().enumerate() {
+                if value != self.registers[i] {
+                    self.registers[i] = value;
+                    self.writes.extend_from_slice(&step.to_le_bytes());
+                    self.writes.extend_from_slice(&(i as u32).to_le_bytes());
+                    self.writes.extend_from_slice(&value.to_le_bytes());
+                    self.write_count += 1;
+                }
+            }
+        }
+        self.pcs.push(pc);
+        if self.record_gas {
+            self.gas.push(gas);
+        }
+        if self.record_host_calls {
+            let marker = self.host_call.take().map_or(0, |id| id.saturating_add(1));
+            self.host_calls.push(marker);
+        }
+        if let Some(call) = call {
+            self.calls.extend_from_slice(&step.to_le_bytes());
+            self.calls.extend_from_slice(&call.pc().to_le_bytes());
+            self.calls.extend_from_slice(&call.kind().to_le_bytes());
+            self.call_count += 1;
+        }
+    }
+
+    /// Step number of the last recorded step.
+    pub(crate) fn last_step(&self) -> Option<u64> {
+        self.steps.checked_sub(1)
+    }
+
+    /// Size of the pending payload.
+    fn pending_bytes(&self) -> usize {
+        self.pcs.len() * 4
+            + self.host_calls.len() * 4
+            + self.gas.len() * 8
+            + self.writes.len()
+            + self.calls.len()
+    }
+
+    /// Pending payload too large: take() should be sent without waiting for a stop.
+    pub(crate) fn is_full(&self) -> bool {
+        self.pending_bytes() >= MAX_PENDING_BYTES
+    }
+
+    /// The pending steps as "history" params and payload. The next step
+    /// starts a new segment with a checkpoint.
+    pub(crate) fn take(&mut self) -> (Value, Vec<u8>) {
+        let checkpoints: Vec<Value> = self
+            .checkpoints
+            .iter()
+            .map(|checkpoint| {
+                json!({
+                    "step": checkpoint.step,
+                    "registers": checkpoint.registers,
+                })
+            })
+            .collect();
+        let params = json!({
+            "start": self.start,
+            "steps": self.pcs.len(),
+            "gas": self.record_gas,
+            "hostCalls": self.record_host_calls,
+            "writes": self.write_count,
+            "calls": self.call_count,
+            "checkpoints": checkpoints,
+        });
+
+        let mut data = Vec::with_capacity(self.pending_bytes());
+        for pc in &self.pcs {
+            data.extend_from_slice(&pc.to_le_bytes());
+        }
+        for marker in &self.host_calls {
+            data.extend_from_slice(&marker.to_le_bytes());
+        }
+        for gas in &self.gas {
+            data.extend_from_slice(&gas.to_le_bytes());
+        }
+        data.extend_from_slice(&self.writes);
+        data.extend_from_slice(&self.calls);
+
+        self.start = self.steps;
+        self.pcs.clear();
+        self.host_calls.clear();
+        self.gas.clear();
+        self.writes.clear();
+        self.write_count = 0;
+        self.calls.clear();
+        self.call_count = 0;
+        self.checkpoints.clear();
+        (params, data)
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::wire::{Framing, Outgoing};
+
+    /// Line limit of the adapter's JSON reader (STREAM_LIMIT in transport.py)
+    const JSON_LINE_LIMIT: usize = 16 * 1024 * 1024;
+
+    #[test]
+    fn full_history_fits_a_json_line() {
+        let mut history = History {
+            record_gas: true,
+            record_host_calls: true,
+            ..History::default()
+        };
+        // Worst case: every register changes and every step calls
+        let mut step = 0u64;
+        while !history.is_full() {
+            history.host_call(1);
+            history.push(
+                step as u32 * 4,
+                [step; 13].map(|value| value ^ u64::MAX),
+                -1,
+                Some(CallEvent::Call(8)),
+            );
+            step += 1;
+        }
+        let (params, data) = history.take();
+        assert_eq!(params["steps"], step);
+        assert!(data.len() >= MAX_PENDING_BYTES);
+
+        let body = json!({"jsonrpc": "2.0", "method": "history", "params": params});
+        let line = Framing::Json.encode(&Outgoing {
+            body,
+            data: Some(data),
+        });
+        assert!(line.len() < JSON_LINE_LIMIT, "{} bytes", line.len());
+    }
+}
@@ -1,7 +1,14 @@
+mod call_stack;
 mod domain;
+mod history;
 mod methods;
 pub mod sandbox_rpc;
+pub mod trace;
+pub mod transport;
+mod wire;
 pub use sandbox_rpc::SandboxRpc;
+pub use trace::{TraceConfig, TraceFormat};
+pub use transport::Transport;
 
 // #[tokio::main]
 // async fn main() -> SandboxResult<()> {
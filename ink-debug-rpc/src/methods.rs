@@ -1,20 +1,47 @@
 use serde_json::json;
 
-use crate::domain::{JsonRpcError, JsonRpcRequest, JsonRpcResponse};
+use crate::domain::{
+    AddBreakpointsParams, JsonRpcError, JsonRpcRequest, JsonRpcResponse, RemoveBreakpointsParams,
+    SetBreakpointsParams,
+};
+use crate::sandbox_rpc::Session;
+use crate::wire::Framing;
 
 #[derive(Debug)]
 pub(crate) enum Methods {
     Initialize(JsonRpcRequest),
+    SetBreakpoints(JsonRpcRequest),
+    AddBreakpoints(JsonRpcRequest),
+    RemoveBreakpoints(JsonRpcRequest),
+    Continue(JsonRpcRequest),
+    Pause(JsonRpcRequest),
 }
 
 fn match_request(request: JsonRpcRequest) -> Option<Methods> {
     match request.method.as_str() {
         "initialize" => Some(Methods::Initialize(request)),
+        "setBreakpoints" => Some(Methods::SetBreakpoints(request)),
+        "addBreakpoints" => Some(Methods::AddBreakpoints(request)),
+        "removeBreakpoints" => Some(Methods::RemoveBreakpoints(request)),
+        "continue" => Some(Methods::Continue(request)),
+        "pause" => Some(Methods::Pause(request)),
         _ => None,
     }
 }
 
-pub(crate) fn handle(request: JsonRpcRequest) -> JsonRpcResponse {
+fn invalid_params(id: usize, message: String) -> JsonRpcResponse {
+    JsonRpcResponse::new(
+        None,
+        Some(JsonRpcError {
+            code: 400,
+            message,
+            data: None,
+        }),
+        id,
+    )
+}
+
+pub(crate) fn handle(request: JsonRpcRequest, session: &Session) -> JsonRpcResponse {
     log::info!("Method call: {:?}", request);
     let method = match_request(request.clone());
     if let None = method {
@@ -31,11 +58,77 @@ pub(crate) fn handle(request: JsonRpcRequest) -> JsonRpcResponse {
     match method.unwrap() {
         Methods::Initialize(req) => {
             log::info!("Params: {:#?}", req.params);
+            let mut result = json!({"status": "initialized", "version": "0.1.0"});
+            // The connection switches to this framing after the response
+            if let Some(framing) = Framing::negotiate(&req.params) {
+                result["framing"] = json!(framing.name());
+            }
             JsonRpcResponse::new(
-                Some(json!({"status": "initialized", "version": "0.1.0"})),
+                Some(result),
                 None,
                 req.id,
             )
         }
+        Methods::SetBreakpoints(req) => {
+            let params = match serde_json::from_value::<SetBreakpointsParams>(req.params) {
+                Ok(params) => params,
+                Err(e) => return invalid_params(req.id, format!("Invalid setBreakpoints params: {e}")),
+            };
+            let ids: Vec<u64> = params.breakpoints.iter().map(|bp| bp.id).collect();
+            let mut state = session.state.lock().unwrap();
+            state.set_breakpoints(params.source, params.breakpoints);
+            log::info!("Breakpoints armed at {} PCs", state.breakpoint_pcs.len());
+            let breakpoints: Vec<_> = ids
+                .into_iter()
+                .map(|id| json!({"id": id, "verified": true}))
+                .collect();
+            JsonRpcResponse::new(Some(json!({ "breakpoints": breakpoints })), None, req.id)
+        }
+        Methods::AddBreakpoints(req) => {
+            let params = match serde_json::from_value::<AddBreakpointsParams>(req.params) {
+                Ok(params) => params,
+                Err(e) => return invalid_params(req.id, format!("Invalid addBreakpoints params: {e}")),
+            };
+            let ids: Vec<u64> = params.breakpoints.iter().map(|bp| bp.id).collect();
+            let mut state = session.state.lock().unwrap();
+            for bp in params.breakpoints {
+                if let Some(source) = bp.source {
+                    state.track_source(source, bp.id);
+                }
+                state.add_breakpoint(bp.id, bp.addresses);
+            }
+            log::info!("Breakpoints armed at {} PCs", state.breakpoint_pcs.len());
+            let breakpoints: Vec<_> = ids
+                .into_iter()
+                .map(|id| json!({"id": id, "verified": true}))
+                .collect();
+            JsonRpcResponse::new(Some(json!({ "breakpoints": breakpoints })), None, req.id)
+        }
+        Methods::RemoveBreakpoints(req) => {
+            let params = match serde_json::from_value::<RemoveBreakpointsParams>(req.params) {
+                Ok(params) => params,
+                Err(e) => return invalid_params(req.id, format!("Invalid removeBreakpoints params: {e}")),
+            };
+            let mut state = session.state.lock().unwrap();
+            let removed: Vec<u64> = params
+                .ids
+                .into_iter()
+                .filter(|id| state.remove_breakpoint(*id))
+                .collect();
+            log::info!("Breakpoints armed at {} PCs", state.breakpoint_pcs.len());
+            JsonRpcResponse::new(Some(json!({ "removed": removed })), None, req.id)
+        }
+        Methods::Continue(req) => {
+            session.resume();
+            JsonRpcResponse::new(Some(json!({"allThreadsContinued": true})), None, req.id)
+        }
+        Methods::Pause(req) => {
+            let mut state = session.state.lock().unwrap();
+            let already_paused = state.paused;
+            if !already_paused {
+                state.pause_requested = true;
+            }
+            JsonRpcResponse::new(Some(json!({"paused": already_paused})), None, req.id)
+        }
     }
 }
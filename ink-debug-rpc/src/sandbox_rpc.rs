@@ -1,24 +1,205 @@
 use crate::{
-    domain::{JsonRpcError, JsonRpcRequest},
+    call_stack::CallStack,
+    domain::{BreakpointParams, JsonRpcError, JsonRpcRequest, JsonRpcResponse},
+    history::History,
     methods,
+    trace::{TraceConfig, TraceRecorder},
+    transport::{Listener, Transport},
+    wire::{Framing, Outgoing},
 };
 use object::{Object, ObjectSection};
-use polkavm::{ArcBytes, Module, ProgramBlob, RawInstance};
-use serde_json::{to_value, Value};
+use polkavm::{ArcBytes, Module, ProgramBlob, RawInstance, Reg};
+use serde_json::{json, to_value, Value};
+use std::collections::{HashMap, HashSet};
+#[cfg(unix)]
+use std::os::fd::RawFd;
 use std::path::{Path, PathBuf};
-use std::{borrow, error, io::{Error, ErrorKind}, net::SocketAddr, path};
+#[cfg(unix)]
+use std::sync::LazyLock;
+#[cfg(unix)]
+use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::{Arc, Condvar, Mutex, OnceLock};
+use std::{borrow, error, io::Error, path};
 use tokio::io::AsyncSeekExt;
 use tokio::{
-    io::{AsyncReadExt, AsyncWriteExt},
-    net::{TcpListener, TcpSocket},
+    io::{AsyncRead, AsyncWrite, AsyncWriteExt, BufReader},
+    sync::{broadcast, mpsc},
 };
 
+/// Debugger state shared between the RPC connections and the executing contract.
+#[derive(Debug, Default)]
+pub(crate) struct DebugState {
+    /// Every PC of each breakpoint, by DAP breakpoint id
+    pub(crate) breakpoints: HashMap<u64, Vec<u32>>,
+    /// Breakpoint ids per source file, for whole-file replacement
+    pub(crate) sources: HashMap<String, Vec<u64>>,
+    /// Number of breakpoints armed at each PC, checked on every step
+    pub(crate) breakpoint_pcs: HashMap<u32, usize>,
+    /// The contract is stopped in step() until a continue request
+    pub(crate) paused: bool,
+    /// Stop at the next step, set by a pause request
+    pub(crate) pause_requested: bool,
+}
+
+impl DebugState {
+    /// Arm one breakpoint, replacing any breakpoint with the same id.
+    pub(crate) fn add_breakpoint(&mut self, id: u64, addresses: Vec<u32>) {
+        self.remove_breakpoint(id);
+        for pc in &addresses {
+            *self.breakpoint_pcs.entry(*pc).or_insert(0) += 1;
+        }
+        self.breakpoints.insert(id, addresses);
+    }
+
+    /// Disarm one breakpoint. Returns false if the id is unknown.
+    pub(crate) fn remove_breakpoint(&mut self, id: u64) -> bool {
+        let Some(addresses) = self.breakpoints.remove(&id) else {
+            return false;
+        };
+        self.sources.retain(|_, ids| {
+            ids.retain(|other| *other != id);
+            !ids.is_empty()
+        });
+        for pc in addresses {
+            if let Some(count) = self.breakpoint_pcs.get_mut(&pc) {
+                *count -= 1;
+                if *count == 0 {
+                    self.breakpoint_pcs.remove(&pc);
+                }
+            }
+        }
+        true
+    }
+
+    /// Record that a breakpoint belongs to a source file.
+    pub(crate) fn track_source(&mut self, source: String, id: u64) {
+        let ids = self.sources.entry(source).or_default();
+        if !ids.contains(&id) {
+            ids.push(id);
+        }
+    }
+
+    /// Ids of the breakpoints armed at a PC.
+    pub(crate) fn breakpoints_at(&self, pc: u32) -> Vec<u64> {
+        let mut ids: Vec<u64> = self
+            .breakpoints
+            .iter()
+            .filter(|(_, addresses)| addresses.contains(&pc))
+            .map(|(id, _)| *id)
+            .collect();
+        ids.sort_unstable();
+        ids
+    }
+
+    /// Replace the breakpoints of one source file.
+    pub(crate) fn set_breakpoints(&mut self, source: String, breakpoints: Vec<BreakpointParams>) {
+        for id in self.sources.remove(&source).unwrap_or_default() {
+            self.remove_breakpoint(id);
+        }
+        for bp in breakpoints {
+            self.track_source(source.clone(), bp.id);
+            self.add_breakpoint(bp.id, bp.addresses);
+        }
+    }
+}
+
+/// State and channels shared by the RPC connections and the executing contract.
+#[derive(Debug)]
+pub(crate) struct Session {
+    pub(crate) state: Mutex<DebugState>,
+    /// Signalled when a paused contract may run again
+    pub(crate) resumed: Condvar,
+    /// JSON-RPC notifications pushed to every connected client, encoded
+    /// per connection in whatever framing it negotiated
+    pub(crate) events: broadcast::Sender<Arc<Outgoing>>,
+}
+
+impl Default for Session {
+    fn default() -> Self {
+        let (events, _) = broadcast::channel(EVENT_CAPACITY);
+        Session {
+            state: Mutex::new(DebugState::default()),
+            resumed: Condvar::new(),
+            events,
+        }
+    }
+}
+
+impl Session {
+    /// Push a notification to every connected client.
+    pub(crate) fn notify(&self, method: &str, params: Value) {
+        self.send_event(method, params, None);
+    }
+
+    /// Push a notification carrying a raw payload as `params.data`.
+    pub(crate) fn notify_data(&self, method: &str, params: Value, data: Vec<u8>) {
+        self.send_event(method, params, Some(data));
+    }
+
+    fn send_event(&self, method: &str, params: Value, data: Option<Vec<u8>>) {
+        let body = json!({"jsonrpc": "2.0", "method": method, "params": params});
+        // No receivers just means no client is connected
+        let _ = self.events.send(Arc::new(Outgoing { body, data }));
+    }
+
+    /// Let a paused contract run again.
+    pub(crate) fn resume(&self) {
+        let mut state = self.state.lock().unwrap();
+        state.paused = false;
+        self.resumed.notify_all();
+    }
+}
+
+/// Notifications buffered per client before a slow client starts losing them
+const EVENT_CAPACITY: usize = 256;
+
+/// Session and runtime of an inherited pipe pair. The pipe has a single
+/// client for the life of the process, so one connection on it serves the
+/// SandboxRpc of every contract call: the client's breakpoints carry over
+/// and nothing it sent is lost between calls.
+#[cfg(unix)]
+#[derive(Debug, Default)]
+struct PipeServer {
+    session: Arc<Session>,
+    runtime: Arc<OnceLock<tokio::runtime::Runtime>>,
+    /// Set once some call has started serving the connection
+    serving: AtomicBool,
+}
+
+#[cfg(unix)]
+static PIPE_SERVERS: LazyLock<Mutex<HashMap<(RawFd, RawFd), Arc<PipeServer>>>> =
+    LazyLock::new(Default::default);
+
+#[cfg(unix)]
+impl PipeServer {
+    /// The server of a pipe pair, created by the first call that uses it.
+    fn of(read_fd: RawFd, write_fd: RawFd) -> Arc<PipeServer> {
+        PIPE_SERVERS
+            .lock()
+            .unwrap()
+            .entry((read_fd, write_fd))
+            .or_default()
+            .clone()
+    }
+}
+
 #[derive(Debug, Clone)]
 pub struct SandboxRpc {
-    host: String,
-    port: String,
+    transport: Transport,
     max_connections: u8,
     buf_capacity: usize,
+    session: Arc<Session>,
+    /// Runtime driving serve_async(), kept for as long as the sandbox lives
+    runtime: Arc<OnceLock<tokio::runtime::Runtime>>,
+    /// Execution trace recording, see with_trace()
+    trace: Option<Arc<Mutex<TraceRecorder>>>,
+    /// Steps since the last stop, for stepping back; kept while tracing
+    history: Option<Arc<Mutex<History>>>,
+    /// Calls made by the contract, reported with every stop
+    call_stack: Arc<Mutex<CallStack>>,
+    /// Shared session of a pipe transport, see PipeServer
+    #[cfg(unix)]
+    pipe: Option<Arc<PipeServer>>,
 }
 
 impl Default for SandboxRpc {
@@ -26,76 +207,121 @@ impl Default for SandboxRpc {
         if let Err(e) = simple_logger::init_with_level(log::Level::Debug) {
             log::warn!("Logger error: {e}");
         };
-        SandboxRpc {
-            host: String::from("127.0.0.1"),
-            port: String::from("9229"),
+        let transport = Transport::from_env().unwrap_or_else(|e| {
+            log::warn!("Invalid transport settings, using TCP: {e}");
+            Transport::default()
+        });
+        let sandbox = SandboxRpc {
+            transport,
             max_connections: 5,
             buf_capacity: 1024,
+            session: Arc::new(Session::default()),
+            runtime: Arc::new(OnceLock::new()),
+            trace: None,
+            history: None,
+            call_stack: Arc::new(Mutex::new(CallStack::default())),
+            #[cfg(unix)]
+            pipe: None,
+        }
+        .share_pipe();
+        match TraceConfig::from_env() {
+            Some(config) => sandbox.with_trace(config),
+            None => sandbox,
         }
     }
 }
 
 impl SandboxRpc {
-    pub(crate) fn url(&self) -> Result<SocketAddr, Error> {
-        let url = format!("{}:{}", self.host, self.port);
-        url.parse::<SocketAddr>()
-            .map_err(|_| Error::new(ErrorKind::InvalidInput, "invalid addr"))
+    /// Serve over the given transport instead of the one from the environment.
+    pub fn with_transport(mut self, transport: Transport) -> Self {
+        self.transport = transport;
+        self.share_pipe()
     }
 
-    pub(crate) fn socket(&self) -> Result<TcpSocket, Error> {
-        let socket = TcpSocket::new_v4()?;
-        socket.set_keepalive(false)?;
-        socket.set_reuseaddr(true)?;
-        socket.set_reuseport(true)?;
-        socket.bind(self.url()?)?;
-        Ok(socket)
+    /// Use the process-wide session of a pipe transport, a session of our
+    /// own with any other transport.
+    fn share_pipe(mut self) -> Self {
+        #[cfg(unix)]
+        match self.transport {
+            Transport::Pipe { read_fd, write_fd } => {
+                let pipe = PipeServer::of(read_fd, write_fd);
+                self.session = pipe.session.clone();
+                self.runtime = pipe.runtime.clone();
+                self.pipe = Some(pipe);
+            }
+            _ => {
+                if self.pipe.take().is_some() {
+                    self.session = Arc::new(Session::default());
+                    self.runtime = Arc::new(OnceLock::new());
+                }
+            }
+        }
+        self
     }
 
-    pub(crate) fn listener(&self) -> Result<TcpListener, Error> {
-        let socket = self.socket()?;
-        let listener = socket.listen(self.max_connections as u32)?;
-        Ok(listener)
+    /// False if an earlier call already serves our pipe; otherwise the
+    /// caller is the one to serve it.
+    fn claim_pipe(&self) -> bool {
+        #[cfg(unix)]
+        if let Some(pipe) = &self.pipe {
+            return !pipe.serving.swap(true, Ordering::SeqCst);
+        }
+        true
+    }
+
+    /// Let a later call serve our pipe after this one failed to.
+    fn release_pipe(&self) {
+        #[cfg(unix)]
+        if let Some(pipe) = &self.pipe {
+            pipe.serving.store(false, Ordering::SeqCst);
+        }
+    }
+
+    /// Record every step to a trace file instead of the one from the
+    /// environment. Recording stays off if the file cannot be created.
+    /// While recording, the clients also receive the execution history
+    /// they need to step backwards.
+    pub fn with_trace(mut self, config: TraceConfig) -> Self {
+        let history = History::new(&config);
+        self.trace = match TraceRecorder::create(config) {
+            Ok(recorder) => Some(Arc::new(Mutex::new(recorder))),
+            Err(e) => {
+                log::error!("[Sandbox Rpc] Could not start trace recording: {e}");
+                None
+            }
+        };
+        self.history = self.trace.as_ref().map(|_| Arc::new(Mutex::new(history)));
+        self
+    }
+
+    pub(crate) fn listener(&self) -> Result<Listener, Error> {
+        self.transport.bind(self.max_connections as u32)
     }
 
     pub async fn serve(&self) -> Result<(), std::io::Error> {
-        let listener = self.listener()?;
-        loop {
-            let (mut stream, addr) = listener.accept().await?;
-            log::info!("Incoming from client: {addr}");
-            let buf_capacity = self.buf_capacity;
-            tokio::spawn(async move {
-                let mut buf = vec![0u8; buf_capacity];
-                loop {
-                    match stream.read(&mut buf).await {
-                        Ok(n) if n > 0 => {
-                            let request = std::str::from_utf8(&buf[..n])
-                                .map(|s| s.trim_end())
-                                .unwrap_or("");
-                            log::debug!("Incoming request string: {request}");
-                            let response = dispatch_request(request).await;
-                            let response = format!("{}\n", response.to_string());
-                            if let Err(e) = stream.write_all(response.as_bytes()).await {
-                                log::error!("Write error: {e}");
-                            }
-                        }
-                        Ok(_) => {
-                            log::warn!("Closed");
-                            break;
-                        }
-                        Err(e) => log::error!("Read error: {e}"),
-                    }
-                }
-            });
+        if !self.claim_pipe() {
+            return Ok(());
         }
+        let listener = self.listener().inspect_err(|_| self.release_pipe())?;
+        listener.run(self.buf_capacity, self.session.clone()).await
     }
 
+    /// Serve in the background. With a pipe transport only the first call
+    /// starts the connection; later calls keep using it.
     pub fn serve_async(&self) -> Result<(), std::io::Error> {
-        let this = self.clone();
-        let rt = tokio::runtime::Runtime::new().unwrap();
+        if !self.claim_pipe() {
+            log::debug!("[Sandbox Rpc] Pipe already served");
+            return Ok(());
+        }
+        let listener = self
+            .bind_in_runtime()
+            .inspect_err(|_| self.release_pipe())?;
+        let buf_capacity = self.buf_capacity;
+        let session = self.session.clone();
 
         log::info!("[Rpc Sandbox starting]");
-        rt.spawn(async move {
-            if let Err(e) = this.serve().await {
+        self.runtime.get().unwrap().spawn(async move {
+            if let Err(e) = listener.run(buf_capacity, session).await {
                 log::error!("Serve failed: {e}");
             }
         });
@@ -103,29 +329,477 @@ impl SandboxRpc {
         Ok(())
     }
 
+    /// Bind the transport inside our runtime, starting the runtime if needed.
+    fn bind_in_runtime(&self) -> Result<Listener, Error> {
+        let runtime = match self.runtime.get() {
+            Some(runtime) => runtime,
+            None => {
+                let _ = self.runtime.set(tokio::runtime::Runtime::new()?);
+                self.runtime.get().unwrap()
+            }
+        };
+        // The listener must be created inside the runtime it is polled by
+        let _guard = runtime.enter();
+        self.listener()
+    }
+
     pub fn step(&self, instance: &RawInstance) {
-        let p: PathBuf = "contract.pvm".into();
-        log::debug!("[Sandbox Rpc] Step");
         let pc = instance
             .program_counter()
             .expect("[Sandbox Rpc] PC not found");
-        log::info!("[Sandbox Rpc] [PC: {}]", pc);
-        println!("[Sandbox Rpc] [PC: {}]", pc);
+        log::trace!("[Sandbox Rpc] [PC: {}]", pc);
+        if let Some(trace) = &self.trace {
+            trace.lock().unwrap().record(pc.0, instance.gas());
+        }
+        let call = self.call_stack.lock().unwrap().record(pc.0, instance.reg(Reg::RA));
+        if let Some(history) = &self.history {
+            let mut history = history.lock().unwrap();
+            history.record(pc.0, instance, call);
+            if history.is_full() {
+                let (params, data) = history.take();
+                self.session.notify_data("history", params, data);
+            }
+        }
+
+        let session = &self.session;
+        let mut state = session.state.lock().unwrap();
+        let hit = if state.breakpoint_pcs.contains_key(&pc.0) {
+            state.breakpoints_at(pc.0)
+        } else {
+            Vec::new()
+        };
+        let reason = if !hit.is_empty() {
+            "breakpoint"
+        } else if state.pause_requested {
+            "pause"
+        } else {
+            return;
+        };
+        state.pause_requested = false;
+
+        // Nobody could ever resume the contract
+        if session.events.receiver_count() == 0 {
+            log::warn!("[Sandbox Rpc] Not stopping at PC {}: no client connected", pc);
+            return;
+        }
+
+        log::info!("[Sandbox Rpc] Stopped at PC {} ({reason})", pc);
+        state.paused = true;
+        let registers = Reg::ALL.map(|reg| instance.reg(reg));
+        let calls = self.call_stack.lock().unwrap().take_changes();
+        let mut stopped = json!({
+            "reason": reason,
+            "pc": pc.0,
+            "hitBreakpointIds": hit,
+            "registers": registers,
+            "calls": calls,
+        });
+        if let Some(history) = &self.history {
+            // The history up to this step arrives before the stop itself
+            let mut history = history.lock().unwrap();
+            stopped["step"] = json!(history.last_step());
+            let (params, data) = history.take();
+            session.notify_data("history", params, data);
+        }
+        if let Some(trace) = &self.trace {
+            // What the gas of the history so far is worth, for live gas reports
+            let recorder = trace.lock().unwrap();
+            stopped["refTimePerFuel"] = json!(recorder.ref_time_per_fuel());
+            stopped["hostCallNames"] = json!(recorder.host_call_names());
+        }
+        session.notify("stopped", stopped);
+        while state.paused {
+            state = session.resumed.wait(state).unwrap();
+        }
+    }
+
+    /// Mark the next step in the trace as host call `id` (the ecalli
+    /// index), a call of the import named `symbol`.
+    pub fn host_call(&self, id: u32, symbol: Option<&[u8]>) {
+        if let Some(trace) = &self.trace {
+            trace.lock().unwrap().host_call(id, symbol);
+        }
+        if let Some(history) = &self.history {
+            history.lock().unwrap().host_call(id);
+        }
+    }
+
+    /// Weight ref_time per unit of the gas in the trace, reported with it
+    /// so the gas can be attributed as ref_time.
+    pub fn set_ref_time_per_fuel(&self, ref_time_per_fuel: u64) {
+        if let Some(trace) = &self.trace {
+            trace.lock().unwrap().set_ref_time_per_fuel(ref_time_per_fuel);
+        }
+    }
+
+    /// Send program output to the connected clients.
+    pub fn output(&self, category: &str, output: &str) {
+        self.session
+            .notify("output", json!({"category": category, "output": output}));
+    }
+
+    /// Send a chunk of raw bytes (memory, trace data) to the connected
+    /// clients; cheapest over msgpack framing, base64 in JSON.
+    pub fn notify_data(&self, method: &str, params: Value, data: Vec<u8>) {
+        self.session.notify_data(method, params, data);
+    }
+
+    /// Tell the connected clients that contract execution has ended.
+    pub fn finish(&self) {
+        log::info!("[Sandbox Rpc] Execution finished");
+        if let Some(trace) = &self.trace {
+            let mut recorder = trace.lock().unwrap();
+            match recorder.finish() {
+                Ok(records) => {
+                    let config = recorder.config();
+                    log::info!("[Sandbox Rpc] Trace of {records} steps written to {}", config.path.display());
+                    let info = json!({
+                        "path": config.path,
+                        "records": records,
+                        "gas": config.gas,
+                        "hostCalls": config.host_calls,
+                        "refTimePerFuel": recorder.ref_time_per_fuel(),
+                        "hostCallNames": recorder.host_call_names(),
+                    });
+                    if let Err(e) = recorder.write_info(&info) {
+                        log::error!("[Sandbox Rpc] Could not write trace info: {e}");
+                    }
+                    self.session.notify("trace", info);
+                }
+                Err(e) => log::error!("[Sandbox Rpc] Could not write trace: {e}"),
+            }
+        }
+        *self.call_stack.lock().unwrap() = CallStack::default();
+        self.session.notify("terminated", json!({}));
+    }
+}
+
+/// Serve one client: requests or batches in, responses and notifications out.
+/// The framing negotiated by the client lasts as long as its connection,
+/// which over a pipe spans every contract call (see PipeServer).
+pub(crate) async fn serve_connection<R, W>(reader: R, mut writer: W, buf_capacity: usize, session: Arc<Session>)
+where
+    R: AsyncRead + Unpin + Send + 'static,
+    W: AsyncWrite + Unpin,
+{
+    let mut events = session.events.subscribe();
+    // Reading happens in its own task so a partially received frame is
+    // never dropped when a notification wins the select below
+    let (requests_tx, mut requests) = mpsc::channel(REQUEST_QUEUE);
+    let inflight = Arc::new(Mutex::new(Inflight::default()));
+    let read_task = tokio::spawn(read_requests(reader, buf_capacity, requests_tx, inflight.clone()));
+
+    // A client may pipeline several requests without waiting for the
+    // responses; notifications are interleaved between responses
+    let mut framing = Framing::Json;
+    loop {
+        let (message, next_framing) = tokio::select! {
+            request = requests.recv() => match request {
+                Some(request) => {
+                    let next_framing = Framing::requested_by(&request);
+                    let response = dispatch_request(request, &session, &inflight).await;
+                    (Arc::new(Outgoing::from(response)), next_framing)
+                }
+                None => break,
+            },
+            event = events.recv() => match event {
+                Ok(event) => (event, None),
+                Err(broadcast::error::RecvError::Lagged(n)) => {
+                    log::warn!("Client lagging, dropped {n} notifications");
+                    continue;
+                }
+                Err(broadcast::error::RecvError::Closed) => break,
+            },
+        };
+        if let Err(e) = writer.write_all(&framing.encode(&message)).await {
+            log::error!("Write error: {e}");
+            break;
+        }
+        // The initialize response itself still goes out in the old framing
+        if let Some(next) = next_framing {
+            if next != framing {
+                log::info!("Switching to {} framing", next.name());
+                framing = next;
+            }
+        }
+    }
+
+    read_task.abort();
+    // Do not leave the contract stopped with no client to resume it
+    drop(events);
+    if session.events.receiver_count() == 0 {
+        session.resume();
+    }
+}
+
+/// Requests read ahead of dispatch per connection
+const REQUEST_QUEUE: usize = 64;
+
+/// Notification by which a client withdraws one of its requests
+const CANCEL_METHOD: &str = "$/cancelRequest";
+/// Error answered to a request cancelled before it was handled
+const REQUEST_CANCELLED: i32 = -32800;
+
+/// Requests read from one client but not handled yet, and which of those
+/// the client has cancelled meanwhile.
+#[derive(Debug, Default)]
+pub(crate) struct Inflight {
+    queued: HashSet<u64>,
+    cancelled: HashSet<u64>,
+}
+
+impl Inflight {
+    /// Track a request or every request of a batch.
+    fn queue(&mut self, request: &Value) {
+        let items = match request {
+            Value::Array(batch) => batch.iter().collect(),
+            single => vec![single],
+        };
+        self.queued
+            .extend(items.into_iter().filter_map(|item| item.get("id")?.as_u64()));
+    }
+
+    /// Mark a queued request cancelled. False if it is no longer queued,
+    /// i.e. already answered or being handled.
+    fn cancel(&mut self, id: u64) -> bool {
+        self.queued.contains(&id) && self.cancelled.insert(id)
+    }
+
+    /// Take a request off the queue before handling it; true if the
+    /// client cancelled it.
+    fn take(&mut self, id: u64) -> bool {
+        self.queued.remove(&id);
+        self.cancelled.remove(&id)
+    }
+}
+
+/// The request id a cancel notification refers to.
+fn cancel_target(message: &Value) -> Option<u64> {
+    if message.get("id").is_some() || message.get("method")?.as_str()? != CANCEL_METHOD {
+        return None;
+    }
+    message.get("params")?.get("id")?.as_u64()
+}
+
+/// Read messages from one client until it disconnects. Cancel
+/// notifications take effect here, ahead of the requests still queued.
+async fn read_requests<R: AsyncRead + Unpin>(
+    reader: R,
+    buf_capacity: usize,
+    requests: mpsc::Sender<Value>,
+    inflight: Arc<Mutex<Inflight>>,
+) {
+    let mut reader = BufReader::with_capacity(buf_capacity, reader);
+    let mut line = String::new();
+    let mut framing = Framing::Json;
+    loop {
+        match framing.read(&mut reader, &mut line).await {
+            Ok(Some(request)) => {
+                if let Some(id) = cancel_target(&request) {
+                    let cancelled = inflight.lock().unwrap().cancel(id);
+                    log::debug!("Cancel of request {id}: {}", if cancelled { "dropped" } else { "too late" });
+                    continue;
+                }
+                // The client sends nothing more until it has the
+                // initialize response, so the switch can happen right away
+                if let Some(next) = Framing::requested_by(&request) {
+                    framing = next;
+                }
+                inflight.lock().unwrap().queue(&request);
+                if requests.send(request).await.is_err() {
+                    break;
+                }
+            }
+            Ok(None) => {
+                log::warn!("Closed");
+                break;
+            }
+            Err(e) => {
+                log::error!("Read error: {e}");
+                break;
+            }
+        }
     }
 }
 
-pub(crate) async fn dispatch_request(request: &str) -> Value {
-    let request_value = serde_json::from_str::<JsonRpcRequest>(request);
-    let response = match request_value {
+/// Handle one incoming message: a single JSON-RPC request or a batch array.
+/// Messages that could not be decoded arrive as null.
+pub(crate) async fn dispatch_request(request: Value, session: &Session, inflight: &Mutex<Inflight>) -> Value {
+    match request {
+        Value::Array(batch) if !batch.is_empty() => {
+            log::info!("Batch of {} requests", batch.len());
+            Value::Array(
+                batch
+                    .into_iter()
+                    .map(|item| dispatch_value(item, session, inflight))
+                    .collect(),
+            )
+        }
+        Value::Null => bad_request(),
+        value => dispatch_value(value, session, inflight),
+    }
+}
+
+fn dispatch_value(value: Value, session: &Session, inflight: &Mutex<Inflight>) -> Value {
+    let id = value.get("id").and_then(Value::as_u64);
+    if let Some(id) = id {
+        if inflight.lock().unwrap().take(id) {
+            log::info!("Request {id} cancelled before it was handled");
+            return to_value(JsonRpcResponse::new(
+                None,
+                Some(JsonRpcError {
+                    code: REQUEST_CANCELLED,
+                    message: "Request cancelled".to_string(),
+                    data: None,
+                }),
+                id as usize,
+            ))
+            .unwrap();
+        }
+    }
+    let response = match serde_json::from_value::<JsonRpcRequest>(value) {
         Ok(req) => {
             log::info!("Resuest: {:#?}", req);
-            to_value(methods::handle(req))
+            to_value(methods::handle(req, session))
         }
-        Err(_) => to_value(JsonRpcError {
-            code: 400,
-            message: "Request error. Bad request.".to_string(),
-            data: None,
-        }),
+        // Keep the id when there is one so the client can match the error
+        Err(_) => match id {
+            Some(id) => to_value(JsonRpcResponse::new(
+                None,
+                Some(JsonRpcError {
+                    code: 400,
+                    message: "Request error. Bad request.".to_string(),
+                    data: None,
+                }),
+                id as usize,
+            )),
+            None => return bad_request(),
+        },
     };
     response.unwrap()
 }
+
+fn bad_request() -> Value {
+    to_value(JsonRpcError {
+        code: 400,
+        message: "Request error. Bad request.".to_string(),
+        data: None,
+    })
+    .unwrap()
+}
+
+#[cfg(all(test, unix))]
+mod tests {
+    use super::*;
+    use std::os::fd::{AsRawFd, OwnedFd};
+    use tokio::io::BufReader;
+    use tokio::net::unix::pipe;
+
+    /// The debug adapter's end of a pipe transport.
+    struct Client {
+        runtime: tokio::runtime::Runtime,
+        reader: BufReader<pipe::Receiver>,
+        writer: pipe::Sender,
+        framing: Framing,
+        next_id: usize,
+    }
+
+    impl Client {
+        fn new(read: OwnedFd, write: OwnedFd) -> Client {
+            let runtime = tokio::runtime::Builder::new_current_thread()
+                .enable_all()
+                .build()
+                .unwrap();
+            let _guard = runtime.enter();
+            Client {
+                reader: BufReader::new(pipe::Receiver::from_owned_fd(read).unwrap()),
+                writer: pipe::Sender::from_owned_fd(write).unwrap(),
+                runtime,
+                framing: Framing::Json,
+                next_id: 1,
+            }
+        }
+
+        /// Send a request and wait for its response, skipping notifications.
+        fn request(&mut self, method: &str, params: Value) -> Value {
+            let id = self.next_id;
+            self.next_id += 1;
+            let message = Outgoing::from(
+                json!({"jsonrpc": "2.0", "method": method, "params": params, "id": id}),
+            );
+            let frame = self.framing.encode(&message);
+            self.runtime
+                .block_on(self.writer.write_all(&frame))
+                .unwrap();
+            loop {
+                let message = self.receive();
+                if message["id"] == id {
+                    return message;
+                }
+            }
+        }
+
+        /// Wait for a notification, skipping any other.
+        fn notification(&mut self, method: &str) -> Value {
+            loop {
+                let message = self.receive();
+                if message["method"] == method {
+                    return message["params"].clone();
+                }
+            }
+        }
+
+        fn receive(&mut self) -> Value {
+            let mut line = String::new();
+            let read = self.framing.read(&mut self.reader, &mut line);
+            self.runtime.block_on(read).unwrap().expect("pipe closed")
+        }
+    }
+
+    #[test]
+    fn pipe_serves_every_contract_call() {
+        let (sandbox_read, client_write) = std::io::pipe().unwrap();
+        let (client_read, sandbox_write) = std::io::pipe().unwrap();
+        let transport = Transport::Pipe {
+            read_fd: sandbox_read.as_raw_fd(),
+            write_fd: sandbox_write.as_raw_fd(),
+        };
+        let mut client = Client::new(client_read.into(), client_write.into());
+
+        // First contract call: the client connects, switches to msgpack
+        // and sets a breakpoint
+        let first = SandboxRpc::default().with_transport(transport.clone());
+        first.serve_async().unwrap();
+        let initialize = json!({"path": "contract.polkavm", "framing": ["msgpack", "json"]});
+        let response = client.request("initialize", initialize);
+        assert_eq!(response["result"]["framing"], "msgpack");
+        client.framing = Framing::Msgpack;
+        let breakpoints =
+            json!({"source": "lib.rs", "breakpoints": [{"id": 1, "addresses": [8, 12]}]});
+        let response = client.request("setBreakpoints", breakpoints);
+        assert_eq!(response["result"]["breakpoints"][0]["verified"], true);
+        first.finish();
+        client.notification("terminated");
+        let session = first.session.clone();
+        drop(first);
+
+        // Second contract call: same connection, still msgpack, breakpoints
+        // still armed
+        let second = SandboxRpc::default().with_transport(transport);
+        second.serve_async().unwrap();
+        assert!(Arc::ptr_eq(&session, &second.session));
+        assert_eq!(
+            second.session.state.lock().unwrap().breakpoints_at(12),
+            vec![1]
+        );
+        let response = client.request(
+            "addBreakpoints",
+            json!({"breakpoints": [{"id": 2, "addresses": [16]}]}),
+        );
+        assert!(response.get("error").is_none(), "{response}");
+        second.output("stdout", "second call");
+        assert_eq!(client.notification("output")["output"], "second call");
+
+        drop((sandbox_read, sandbox_write));
+    }
+}
@@ -0,0 +1,517 @@
+use std::collections::BTreeMap;
+use std::fs::File;
+use std::io::{BufWriter, Error, ErrorKind, Write};
+use std::path::PathBuf;
+use std::sync::{Mutex, mpsc};
+use std::thread::JoinHandle;
+
+/// Path of the trace file; recording is off without it. Every contract
+/// call gets a file of its own, see TraceConfig::next_call()
+pub const TRACE_ENV: &str = "INK_DEBUG_TRACE";
+/// "1" records the gas left after every step
+pub const TRACE_GAS_ENV: &str = "INK_DEBUG_TRACE_GAS";
+/// "1" marks the steps that stopped at a host call (ecalli)
+pub const TRACE_HOST_CALLS_ENV: &str = "INK_DEBUG_TRACE_HOST_CALLS";
+/// "blocks" (default) or "raw", see TraceFormat
+pub const TRACE_FORMAT_ENV: &str = "INK_DEBUG_TRACE_FORMAT";
+
+/// File header: magic, version (u16), flags (u16) and a u32 (record size
+/// for raw traces, steps per block for block traces), all little-endian.
+///
+/// Raw (version 1): fixed-size records up to the end of the file. A record
+/// is pc (u32) and host call (u32: ecalli index + 1, 0 for none), then gas
+/// left (i64) with FLAG_GAS.
+///
+/// Blocks (version 2): blocks of BLOCK_STEPS steps (the last one may be
+/// shorter), then the block index, then the footer. A block holds the PC
+/// deltas of its steps 1.., then with FLAG_GAS the gas deltas, then
+/// (step - previous host call step, host call) pairs, all as zig-zag LEB128
+/// varints. Its index entry (INDEX_ENTRY_SIZE bytes) holds what is needed
+/// to decode it alone: first step (u64), its pc (u32), host call count
+/// (u32), its gas left (i64), file offset (u64), the byte length of the
+/// three columns (3 x u32) and the step count (u32). The footer is the
+/// index offset, block count and step count (3 x u64) and INDEX_MAGIC.
+pub const MAGIC: &[u8; 8] = b"INKTRACE";
+pub const RAW_VERSION: u16 = 1;
+pub const BLOCKS_VERSION: u16 = 2;
+pub const FLAG_GAS: u16 = 1;
+pub const FLAG_HOST_CALLS: u16 = 2;
+pub const BLOCK_STEPS: usize = 4096;
+pub const INDEX_ENTRY_SIZE: usize = 48;
+pub const INDEX_MAGIC: &[u8; 8] = b"INKTRIDX";
+const HEADER_SIZE: u64 = 16;
+/// Appended to the trace path for the JSON file describing the run (gas
+/// to ref_time conversion, host call names), written by finish()
+pub const INFO_SUFFIX: &str = ".json";
+
+/// Replaced by the call number in a trace path
+pub const CALL_PLACEHOLDER: &str = "{n}";
+
+/// Contract calls recorded so far, per configured trace path
+static CALLS: Mutex<BTreeMap<PathBuf, u64>> = Mutex::new(BTreeMap::new());
+
+/// Records per chunk handed to the writer thread
+const CHUNK_RECORDS: usize = 64 * 1024;
+/// Chunks in the ring; the contract only waits when all of them are queued
+/// for writing
+const CHUNKS: usize = 4;
+// A chunk is split into whole blocks
+const _: () = assert!(CHUNK_RECORDS % BLOCK_STEPS == 0);
+
+/// Layout of the trace file.
+#[derive(Debug, Clone, Copy, PartialEq, Eq, Default)]
+pub enum TraceFormat {
+    /// Fixed-size records, can be memory-mapped as is
+    Raw,
+    /// Delta-encoded blocks with an index for random access
+    #[default]
+    Blocks,
+}
+
+/// What to record and where.
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub struct TraceConfig {
+    pub path: PathBuf,
+    pub gas: bool,
+    pub host_calls: bool,
+    pub format: TraceFormat,
+}
+
+impl TraceConfig {
+    /// Recording chosen by the INK_DEBUG_TRACE* environment variables.
+    pub fn from_env() -> Option<TraceConfig> {
+        let path = std::env::var_os(TRACE_ENV).filter(|path| !path.is_empty())?;
+        let enabled = |name| std::env::var(name).is_ok_and(|value| value == "1");
+        let format = match std::env::var(TRACE_FORMAT_ENV).unwrap_or_default().as_str() {
+            "raw" => TraceFormat::Raw,
+            "" | "blocks" => TraceFormat::Blocks,
+            other => {
+                log::warn!("Unsupported {TRACE_FORMAT_ENV}: {other}, using blocks");
+                TraceFormat::Blocks
+            }
+        };
+        Some(TraceConfig {
+            path: path.into(),
+            gas: enabled(TRACE_GAS_ENV),
+            host_calls: enabled(TRACE_HOST_CALLS_ENV),
+            format,
+        })
+    }
+
+    fn flags(&self) -> u16 {
+        let mut flags = 0;
+        if self.gas {
+            flags |= FLAG_GAS;
+        }
+        if self.host_calls {
+            flags |= FLAG_HOST_CALLS;
+        }
+        flags
+    }
+
+    pub fn record_size(&self) -> usize {
+        if self.gas { 16 } else { 8 }
+    }
+
+    /// The configuration for the next contract call of this process.
+    ///
+    /// DRink runs every call (instantiate, then each message) in a sandbox
+    /// of its own, so each one needs its own file: CALL_PLACEHOLDER in the
+    /// path is replaced by the call number (0, 1, ...); without it the
+    /// first call writes to the path itself and call n to "<path>.<n>".
+    pub fn next_call(&self) -> TraceConfig {
+        let call = {
+            let mut calls = CALLS.lock().unwrap_or_else(|e| e.into_inner());
+            let count = calls.entry(self.path.clone()).or_insert(0);
+            *count += 1;
+            *count - 1
+        };
+        let pattern = self.path.to_string_lossy();
+        let path = if pattern.contains(CALL_PLACEHOLDER) {
+            PathBuf::from(pattern.replace(CALL_PLACEHOLDER, &call.to_string()))
+        } else if call == 0 {
+            self.path.clone()
+        } else {
+            let mut path = self.path.clone().into_os_string();
+            path.push(format!(".{call}"));
+            PathBuf::from(path)
+        };
+        TraceConfig {
+            path,
+            ..self.clone()
+        }
+    }
+}
+
+/// Records steps into a ring of fixed-size chunks. Full chunks are written
+/// to the trace file by a background thread and come back empty, so the
+/// contract thread only copies a few bytes per step.
+#[derive(Debug)]
+pub(crate) struct TraceRecorder {
+    config: TraceConfig,
+    chunk: Vec<u8>,
+    chunk_size: usize,
+    /// Full chunks to the writer, dropped to stop it
+    full: Option<mpsc::SyncSender<Vec<u8>>>,
+    /// Written chunks back from the writer
+    free: mpsc::Receiver<Vec<u8>>,
+    writer: Option<JoinHandle<Result<(), Error>>>,
+    /// Host call to mark on the next record
+    host_call: Option<u32>,
+    records: u64,
+    /// Import name of each host call seen, by ecalli index
+    host_call_names: BTreeMap<u32, String>,
+    /// Conversion of the recorded gas to weight ref_time, if the runtime gave it
+    ref_time_per_fuel: Option<u64>,
+}
+
+impl TraceRecorder {
+    /// Create the trace file of the next call (see TraceConfig::next_call())
+    /// and start its writer thread.
+    pub(crate) fn create(config: TraceConfig) -> Result<TraceRecorder, Error> {
+        let config = config.next_call();
+        let mut file = TraceWriter::create(&config)?;
+
+        let chunk_size = CHUNK_RECORDS * config.record_size();
+        let (full_tx, full_rx) = mpsc::sync_channel::<Vec<u8>>(CHUNKS);
+        let (free_tx, free_rx) = mpsc::channel();
+        for _ in 1..CHUNKS {
+            let _ = free_tx.send(Vec::with_capacity(chunk_size));
+        }
+
+        let writer = std::thread::Builder::new()
+            .name("ink-trace-writer".into())
+            .spawn(move || {
+                for mut chunk in full_rx {
+                    file.write_chunk(&chunk)?;
+                    chunk.clear();
+                    // The recorder may be gone already
+                    let _ = free_tx.send(chunk);
+                }
+                file.finish()
+            })?;
+
+        log::info!(
+            "[Sandbox Rpc] Recording execution trace to {}",
+            config.path.display()
+        );
+        Ok(TraceRecorder {
+            config,
+            chunk: Vec::with_capacity(chunk_size),
+            chunk_size,
+            full: Some(full_tx),
+            free: free_rx,
+            writer: Some(writer),
+            host_call: None,
+            records: 0,
+            host_call_names: BTreeMap::new(),
+            ref_time_per_fuel: None,
+        })
+    }
+
+    pub(crate) fn config(&self) -> &TraceConfig {
+        &self.config
+    }
+
+    /// Mark the next record as a host call, remembering the name of the
+    /// import it calls.
+    pub(crate) fn host_call(&mut self, id: u32, symbol: Option<&[u8]>) {
+        if !self.config.host_calls {
+            return;
+        }
+        self.host_call = Some(id);
+        if let Some(symbol) = symbol {
+            if !self.host_call_names.contains_key(&id) {
+                self.host_call_names
+                    .insert(id, String::from_utf8_lossy(symbol).into_owned());
+            }
+        }
+    }
+
+    pub(crate) fn host_call_names(&self) -> &BTreeMap<u32, String> {
+        &self.host_call_names
+    }
+
+    pub(crate) fn set_ref_time_per_fuel(&mut self, ref_time_per_fuel: u64) {
+        self.ref_time_per_fuel = Some(ref_time_per_fuel);
+    }
+
+    pub(crate) fn ref_time_per_fuel(&self) -> Option<u64> {
+        self.ref_time_per_fuel
+    }
+
+    /// Write the description of the run next to the trace (INFO_SUFFIX).
+    pub(crate) fn write_info(&self, info: &serde_json::Value) -> Result<(), Error> {
+        let mut path = self.config.path.clone().into_os_string();
+        path.push(INFO_SUFFIX);
+        let file = BufWriter::new(File::create(path)?);
+        serde_json::to_writer_pretty(file, info).map_err(Error::other)
+    }
+
+    /// Append one step.
+    pub(crate) fn record(&mut self, pc: u32, gas: i64) {
+        if self.full.is_none() {
+            return;
+        }
+        let marker = self.host_call.take().map_or(0, |id| id.saturating_add(1));
+        self.chunk.extend_from_slice(&pc.to_le_bytes());
+        self.chunk.extend_from_slice(&marker.to_le_bytes());
+        if self.config.gas {
+            self.chunk.extend_from_slice(&gas.to_le_bytes());
+        }
+        self.records += 1;
+
+        if self.chunk.len() >= self.chunk_size {
+            self.flush_chunk();
+        }
+    }
+
+    /// Hand the current chunk to the writer and continue in a free one.
+    fn flush_chunk(&mut self) {
+        let Some(full) = &self.full else {
+            return;
+        };
+        let next = match self.free.try_recv() {
+            Ok(chunk) => Ok(chunk),
+            // Every chunk is queued: wait for the writer to catch up
+            Err(mpsc::TryRecvError::Empty) => self.free.recv().map_err(|_| ()),
+            Err(mpsc::TryRecvError::Disconnected) => Err(()),
+        };
+        let chunk = std::mem::take(&mut self.chunk);
+        match next {
+            Ok(next) if full.send(chunk).is_ok() => self.chunk = next,
+            _ => {
+                // The writer failed; finish() reports why
+                log::error!("[Sandbox Rpc] Trace writer stopped, recording disabled");
+                self.full = None;
+            }
+        }
+    }
+
+    /// Write out everything recorded and close the file.
+    ///
+    /// Returns the number of records.
+    pub(crate) fn finish(&mut self) -> Result<u64, Error> {
+        if !self.chunk.is_empty() {
+            if let Some(full) = &self.full {
+                let _ = full.send(std::mem::take(&mut self.chunk));
+            }
+        }
+        self.full = None;
+
+        let Some(writer) = self.writer.take() else {
+            return Err(Error::new(ErrorKind::Other, "trace already finished"));
+        };
+        writer
+            .join()
+            .map_err(|_| Error::new(ErrorKind::Other, "trace writer panicked"))??;
+        Ok(self.records)
+    }
+}
+
+/// Writes recorded chunks to the trace file in the configured format; runs
+/// on the writer thread.
+struct TraceWriter {
+    file: BufWriter<File>,
+    format: TraceFormat,
+    gas: bool,
+    record_size: usize,
+    /// Blocks format: bytes and steps written so far, the index entries
+    offset: u64,
+    steps: u64,
+    blocks: u64,
+    index: Vec<u8>,
+    /// Column buffers, reused for every block
+    pcs: Vec<u8>,
+    gas_deltas: Vec<u8>,
+    host_calls: Vec<u8>,
+}
+
+impl TraceWriter {
+    fn create(config: &TraceConfig) -> Result<TraceWriter, Error> {
+        let mut file = BufWriter::new(File::create(&config.path)?);
+        let (version, layout) = match config.format {
+            TraceFormat::Raw => (RAW_VERSION, config.record_size()),
+            TraceFormat::Blocks => (BLOCKS_VERSION, BLOCK_STEPS),
+        };
+        file.write_all(MAGIC)?;
+        file.write_all(&version.to_le_bytes())?;
+        file.write_all(&config.flags().to_le_bytes())?;
+        file.write_all(&(layout as u32).to_le_bytes())?;
+        Ok(TraceWriter {
+            file,
+            format: config.format,
+            gas: config.gas,
+            record_size: config.record_size(),
+            offset: HEADER_SIZE,
+            steps: 0,
+            blocks: 0,
+            index: Vec::new(),
+            pcs: Vec::new(),
+            gas_deltas: Vec::new(),
+            host_calls: Vec::new(),
+        })
+    }
+
+    fn write_chunk(&mut self, chunk: &[u8]) -> Result<(), Error> {
+        match self.format {
+            TraceFormat::Raw => self.file.write_all(chunk),
+            TraceFormat::Blocks => {
+                // Chunks hold a whole number of blocks, except the last one
+                for block in chunk.chunks(BLOCK_STEPS * self.record_size) {
+                    self.write_block(block)?;
+                }
+                Ok(())
+            }
+        }
+    }
+
+    /// (pc, host call, gas) of record i of a chunk.
+    fn record(&self, records: &[u8], i: usize) -> (u32, u32, i64) {
+        let record = &records[i * self.record_size..];
+        let pc = u32::from_le_bytes(record[0..4].try_into().unwrap());
+        let host_call = u32::from_le_bytes(record[4..8].try_into().unwrap());
+        let gas = if self.gas {
+            i64::from_le_bytes(record[8..16].try_into().unwrap())
+        } else {
+            0
+        };
+        (pc, host_call, gas)
+    }
+
+    fn write_block(&mut self, records: &[u8]) -> Result<(), Error> {
+        let steps = records.len() / self.record_size;
+        if steps == 0 {
+            return Ok(());
+        }
+        self.pcs.clear();
+        self.gas_deltas.clear();
+        self.host_calls.clear();
+
+        let (first_pc, _, first_gas) = self.record(records, 0);
+        let (mut pc, mut gas) = (first_pc, first_gas);
+        let mut host_call_count = 0u32;
+        let mut last_host_call = 0;
+        for i in 0..steps {
+            let (next_pc, host_call, next_gas) = self.record(records, i);
+            if i > 0 {
+                put_varint(&mut self.pcs, zigzag(next_pc as i64 - pc as i64));
+                if self.gas {
+                    put_varint(&mut self.gas_deltas, zigzag(next_gas.wrapping_sub(gas)));
+                }
+            }
+            if host_call != 0 {
+                put_varint(&mut self.host_calls, (i - last_host_call) as u64);
+                put_varint(&mut self.host_calls, host_call as u64);
+                last_host_call = i;
+                host_call_count += 1;
+            }
+            (pc, gas) = (next_pc, next_gas);
+        }
+
+        let entry = &mut self.index;
+        entry.extend_from_slice(&self.steps.to_le_bytes());
+        entry.extend_from_slice(&first_pc.to_le_bytes());
+        entry.extend_from_slice(&host_call_count.to_le_bytes());
+        entry.extend_from_slice(&first_gas.to_le_bytes());
+        entry.extend_from_slice(&self.offset.to_le_bytes());
+        for column in [&self.pcs, &self.gas_deltas, &self.host_calls] {
+            entry.extend_from_slice(&(column.len() as u32).to_le_bytes());
+        }
+        entry.extend_from_slice(&(steps as u32).to_le_bytes());
+
+        for column in [&self.pcs, &self.gas_deltas, &self.host_calls] {
+            self.file.write_all(column)?;
+            self.offset += column.len() as u64;
+        }
+        self.steps += steps as u64;
+        self.blocks += 1;
+        Ok(())
+    }
+
+    fn finish(mut self) -> Result<(), Error> {
+        if self.format == TraceFormat::Blocks {
+            self.file.write_all(&self.index)?;
+            self.file.write_all(&self.offset.to_le_bytes())?;
+            self.file.write_all(&self.blocks.to_le_bytes())?;
+            self.file.write_all(&self.steps.to_le_bytes())?;
+            self.file.write_all(INDEX_MAGIC)?;
+        }
+        self.file.flush()
+    }
+}
+
+fn zigzag(value: i64) -> u64 {
+    ((value << 1) ^ (value >> 63)) as u64
+}
+
+fn put_varint(out: &mut Vec<u8>, mut value: u64) {
+    while value >= 0x80 {
+        out.push(value as u8 | 0x80);
+        value >>= 7;
+    }
+    out.push(value as u8);
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn config(name: &str) -> TraceConfig {
+        let dir = std::env::temp_dir().join(format!("ink-trace-test-{}", std::process::id()));
+        std::fs::create_dir_all(&dir).unwrap();
+        TraceConfig {
+            path: dir.join(name),
+            gas: true,
+            host_calls: false,
+            format: TraceFormat::Blocks,
+        }
+    }
+
+    /// Record one call of `steps` steps, as SandboxRpc does for each call.
+    fn record_call(config: &TraceConfig, steps: u32) -> PathBuf {
+        let mut recorder = TraceRecorder::create(config.clone()).unwrap();
+        for step in 0..steps {
+            recorder.record(step * 4, 1000 - step as i64);
+        }
+        assert_eq!(recorder.finish().unwrap(), steps as u64);
+        recorder
+            .write_info(&serde_json::json!({ "records": steps }))
+            .unwrap();
+        recorder.config().path.clone()
+    }
+
+    fn read(path: &PathBuf, suffix: &str) -> Vec<u8> {
+        let mut path = path.clone().into_os_string();
+        path.push(suffix);
+        std::fs::read(path).unwrap()
+    }
+
+    #[test]
+    fn every_call_keeps_its_trace() {
+        let config = config("calls.trace");
+        let first = record_call(&config, 3);
+        let second = record_call(&config, 5);
+
+        assert_eq!(first, config.path);
+        assert_eq!(second, config.path.with_file_name("calls.trace.1"));
+        for (path, steps) in [(&first, 3), (&second, 5)] {
+            let trace = read(path, "");
+            assert_eq!(&trace[..8], MAGIC);
+            let info: serde_json::Value = serde_json::from_slice(&read(path, INFO_SUFFIX)).unwrap();
+            assert_eq!(info["records"], steps);
+        }
+    }
+
+    #[test]
+    fn call_placeholder_numbers_every_call() {
+        let config = config("call-{n}.trace");
+        let first = record_call(&config, 1);
+        let second = record_call(&config, 2);
+
+        assert_eq!(first, config.path.with_file_name("call-0.trace"));
+        assert_eq!(second, config.path.with_file_name("call-1.trace"));
+        assert_eq!(&read(&first, "")[..8], MAGIC);
+        assert_eq!(&read(&second, "")[..8], MAGIC);
+    }
+}
@@ -0,0 +1,176 @@
+use crate::sandbox_rpc::{serve_connection, Session};
+use std::io::{Error, ErrorKind};
+use std::net::SocketAddr;
+use std::sync::Arc;
+use tokio::net::{TcpListener, TcpSocket};
+#[cfg(unix)]
+use std::os::fd::{BorrowedFd, OwnedFd, RawFd};
+#[cfg(unix)]
+use std::path::PathBuf;
+#[cfg(unix)]
+use tokio::net::{unix::pipe, UnixListener};
+
+/// Selects the transport: "tcp" (default), "unix" or "pipe"
+pub const TRANSPORT_ENV: &str = "INK_DEBUG_RPC_TRANSPORT";
+/// TCP host and port, default 127.0.0.1:9229
+pub const HOST_ENV: &str = "INK_DEBUG_RPC_HOST";
+pub const PORT_ENV: &str = "INK_DEBUG_RPC_PORT";
+/// Unix domain socket path
+pub const SOCKET_ENV: &str = "INK_DEBUG_RPC_SOCKET";
+/// "<read fd>,<write fd>" of a pipe pair inherited from the debug adapter
+pub const FDS_ENV: &str = "INK_DEBUG_RPC_FDS";
+
+/// How the debug adapter reaches the sandbox.
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub enum Transport {
+    Tcp { host: String, port: String },
+    #[cfg(unix)]
+    Unix(PathBuf),
+    /// Pipe pair set up by the process that spawned us; one client only
+    #[cfg(unix)]
+    Pipe { read_fd: RawFd, write_fd: RawFd },
+}
+
+impl Default for Transport {
+    fn default() -> Self {
+        Transport::Tcp {
+            host: String::from("127.0.0.1"),
+            port: String::from("9229"),
+        }
+    }
+}
+
+impl Transport {
+    /// Transport chosen by the INK_DEBUG_RPC_* environment variables.
+    pub fn from_env() -> Result<Transport, Error> {
+        let kind = std::env::var(TRANSPORT_ENV).unwrap_or_default();
+        match kind.as_str() {
+            "" | "tcp" => {
+                let Transport::Tcp { mut host, mut port } = Transport::default() else {
+                    unreachable!()
+                };
+                if let Ok(value) = std::env::var(HOST_ENV) {
+                    host = value;
+                }
+                if let Ok(value) = std::env::var(PORT_ENV) {
+                    port = value;
+                }
+                Ok(Transport::Tcp { host, port })
+            }
+            #[cfg(unix)]
+            "unix" => std::env::var(SOCKET_ENV)
+                .map(|path| Transport::Unix(path.into()))
+                .map_err(|_| invalid(format!("{TRANSPORT_ENV}=unix requires {SOCKET_ENV}"))),
+            #[cfg(unix)]
+            "pipe" => {
+                let fds = std::env::var(FDS_ENV)
+                    .map_err(|_| invalid(format!("{TRANSPORT_ENV}=pipe requires {FDS_ENV}")))?;
+                let parsed: Vec<RawFd> = fds
+                    .split(',')
+                    .map(|fd| fd.trim().parse::<RawFd>())
+                    .collect::<Result<_, _>>()
+                    .map_err(|_| invalid(format!("invalid {FDS_ENV}: {fds}")))?;
+                match parsed[..] {
+                    [read_fd, write_fd] => Ok(Transport::Pipe { read_fd, write_fd }),
+                    _ => Err(invalid(format!("invalid {FDS_ENV}: {fds}"))),
+                }
+            }
+            other => Err(invalid(format!("unsupported {TRANSPORT_ENV}: {other}"))),
+        }
+    }
+
+    /// Start listening. Must be called inside the runtime that polls the result.
+    pub(crate) fn bind(&self, max_connections: u32) -> Result<Listener, Error> {
+        match self {
+            Transport::Tcp { host, port } => {
+                let addr = format!("{host}:{port}")
+                    .parse::<SocketAddr>()
+                    .map_err(|_| Error::new(ErrorKind::InvalidInput, "invalid addr"))?;
+                let socket = if addr.is_ipv4() {
+                    TcpSocket::new_v4()?
+                } else {
+                    TcpSocket::new_v6()?
+                };
+                socket.set_keepalive(false)?;
+                socket.set_reuseaddr(true)?;
+                #[cfg(unix)]
+                socket.set_reuseport(true)?;
+                socket.bind(addr)?;
+                Ok(Listener::Tcp(socket.listen(max_connections)?))
+            }
+            #[cfg(unix)]
+            Transport::Unix(path) => {
+                // A socket file left behind by an earlier session
+                match std::fs::remove_file(path) {
+                    Err(e) if e.kind() != ErrorKind::NotFound => return Err(e),
+                    _ => {}
+                }
+                Ok(Listener::Unix(UnixListener::bind(path)?, path.clone()))
+            }
+            #[cfg(unix)]
+            Transport::Pipe { read_fd, write_fd } => {
+                // Work on duplicates so the inherited descriptors stay
+                // valid; the pipe is bound once per process and serves
+                // every contract call (see PipeServer)
+                let read = dup(*read_fd)?;
+                let write = dup(*write_fd)?;
+                Ok(Listener::Pipe(
+                    pipe::Receiver::from_owned_fd(read)?,
+                    pipe::Sender::from_owned_fd(write)?,
+                ))
+            }
+        }
+    }
+}
+
+fn invalid(message: String) -> Error {
+    Error::new(ErrorKind::InvalidInput, message)
+}
+
+#[cfg(unix)]
+fn dup(fd: RawFd) -> Result<OwnedFd, Error> {
+    // Safety: the fd number comes from our spawner and is only borrowed
+    // long enough to duplicate it
+    unsafe { BorrowedFd::borrow_raw(fd) }.try_clone_to_owned()
+}
+
+/// A bound transport, ready to serve clients.
+#[derive(Debug)]
+pub(crate) enum Listener {
+    Tcp(TcpListener),
+    #[cfg(unix)]
+    Unix(UnixListener, PathBuf),
+    #[cfg(unix)]
+    Pipe(pipe::Receiver, pipe::Sender),
+}
+
+impl Listener {
+    /// Serve clients until the listener fails (or the pipe closes).
+    pub(crate) async fn run(self, buf_capacity: usize, session: Arc<Session>) -> Result<(), Error> {
+        match self {
+            Listener::Tcp(listener) => loop {
+                let (stream, addr) = listener.accept().await?;
+                log::info!("Incoming from client: {addr}");
+                // Responses are small; do not hold them back waiting for ACKs
+                if let Err(e) = stream.set_nodelay(true) {
+                    log::warn!("Could not set TCP_NODELAY: {e}");
+                }
+                let (reader, writer) = stream.into_split();
+                tokio::spawn(serve_connection(reader, writer, buf_capacity, session.clone()));
+            },
+            #[cfg(unix)]
+            Listener::Unix(listener, path) => loop {
+                let (stream, _) = listener.accept().await?;
+                log::info!("Incoming from client on {}", path.display());
+                let (reader, writer) = stream.into_split();
+                tokio::spawn(serve_connection(reader, writer, buf_capacity, session.clone()));
+            },
+            #[cfg(unix)]
+            Listener::Pipe(reader, writer) => {
+                log::info!("Serving the inherited pipe pair");
+                serve_connection(reader, writer, buf_capacity, session).await;
+                Ok(())
+            }
+        }
+    }
+}
@@ -0,0 +1,362 @@
+//! Message framing on a client connection.
+//!
+//! Connections start with newline-delimited JSON. The `initialize` request
+//! may offer `"framing": ["msgpack", "json"]`; the first format we support
+//! is echoed back in the response, after which both sides switch to it
+//! for the rest of the connection, however many contract calls it serves.
+//! msgpack frames are a 4-byte big-endian length followed by one msgpack
+//! encoded request, response, notification or batch.
+//!
+//! Raw payloads (memory pages, trace chunks) are attached to a message as
+//! `data` in its `params` or `result` object: msgpack `bin` in msgpack
+//! frames, a base64 string with `"encoding": "base64"` in JSON.
+
+use base64::Engine;
+use serde_json::{Map, Number, Value};
+use std::io::{Error, ErrorKind};
+use tokio::io::{AsyncBufRead, AsyncBufReadExt, AsyncReadExt};
+
+/// Largest accepted msgpack frame
+const MAX_FRAME: usize = 64 * 1024 * 1024;
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub(crate) enum Framing {
+    Json,
+    Msgpack,
+}
+
+impl Framing {
+    pub(crate) fn name(self) -> &'static str {
+        match self {
+            Framing::Json => "json",
+            Framing::Msgpack => "msgpack",
+        }
+    }
+
+    /// The first framing offered in `initialize` params that we support,
+    /// JSON if none is. None if the params offer nothing, which leaves the
+    /// connection as it is.
+    pub(crate) fn negotiate(params: &Value) -> Option<Framing> {
+        let offered = params.get("framing")?.as_array()?;
+        let framing = offered.iter().find_map(|name| match name.as_str()? {
+            "msgpack" => Some(Framing::Msgpack),
+            "json" => Some(Framing::Json),
+            _ => None,
+        });
+        Some(framing.unwrap_or(Framing::Json))
+    }
+
+    /// The framing a connection switches to once this message is answered:
+    /// only an `initialize` request offering framings changes it.
+    pub(crate) fn requested_by(message: &Value) -> Option<Framing> {
+        if message.get("method").and_then(Value::as_str) != Some("initialize") {
+            return None;
+        }
+        Framing::negotiate(message.get("params")?)
+    }
+
+    /// Read the next message; Ok(None) at end of stream.
+    pub(crate) async fn read<R: AsyncBufRead + Unpin>(
+        self,
+        reader: &mut R,
+        line: &mut String,
+    ) -> Result<Option<Value>, Error> {
+        match self {
+            Framing::Json => loop {
+                line.clear();
+                if reader.read_line(line).await? == 0 {
+                    return Ok(None);
+                }
+                let request = line.trim_end();
+                if request.is_empty() {
+                    continue;
+                }
+                log::debug!("Incoming request string: {request}");
+                return Ok(Some(
+                    serde_json::from_str(request).unwrap_or(Value::Null),
+                ));
+            },
+            Framing::Msgpack => {
+                let mut header = [0u8; 4];
+                match reader.read_exact(&mut header).await {
+                    Ok(_) => {}
+                    Err(e) if e.kind() == ErrorKind::UnexpectedEof => return Ok(None),
+                    Err(e) => return Err(e),
+                }
+                let size = u32::from_be_bytes(header) as usize;
+                if size > MAX_FRAME {
+                    return Err(Error::new(ErrorKind::InvalidData, format!("frame of {size} bytes")));
+                }
+                let mut body = vec![0u8; size];
+                reader.read_exact(&mut body).await?;
+                let mut decoder = Decoder { data: &body, pos: 0 };
+                Ok(Some(decoder.value().unwrap_or(Value::Null)))
+            }
+        }
+    }
+
+    /// Serialize one outgoing message.
+    pub(crate) fn encode(self, message: &Outgoing) -> Vec<u8> {
+        match self {
+            Framing::Json => {
+                let mut text = match &message.data {
+                    None => message.body.to_string(),
+                    Some(data) => {
+                        let mut body = message.body.clone();
+                        if let Some(object) = payload_object_mut(&mut body) {
+                            let encoded = base64::engine::general_purpose::STANDARD.encode(data);
+                            object.insert("data".to_string(), Value::String(encoded));
+                            object.insert("encoding".to_string(), Value::String("base64".to_string()));
+                        }
+                        body.to_string()
+                    }
+                };
+                text.push('\n');
+                text.into_bytes()
+            }
+            Framing::Msgpack => {
+                let mut out = vec![0u8; 4];
+                encode_message(&message.body, message.data.as_deref(), &mut out);
+                let size = (out.len() - 4) as u32;
+                out[..4].copy_from_slice(&size.to_be_bytes());
+                out
+            }
+        }
+    }
+}
+
+/// A response or notification with an optional raw payload.
+#[derive(Debug, Clone)]
+pub(crate) struct Outgoing {
+    pub(crate) body: Value,
+    pub(crate) data: Option<Vec<u8>>,
+}
+
+impl From<Value> for Outgoing {
+    fn from(body: Value) -> Self {
+        Outgoing { body, data: None }
+    }
+}
+
+/// The object a payload is attached to: "params" of a notification or
+/// "result" of a response.
+fn payload_object_mut(body: &mut Value) -> Option<&mut Map<String, Value>> {
+    let object = body.as_object_mut()?;
+    let key = if object.contains_key("params") { "params" } else { "result" };
+    object.get_mut(key)?.as_object_mut()
+}
+
+fn encode_message(body: &Value, data: Option<&[u8]>, out: &mut Vec<u8>) {
+    let (Some(data), Value::Object(object)) = (data, body) else {
+        encode_value(body, out);
+        return;
+    };
+    let payload_key = if object.contains_key("params") { "params" } else { "result" };
+    write_len(out, object.len(), 0x80, 0xde);
+    for (key, value) in object {
+        encode_str(key, out);
+        match value {
+            Value::Object(payload) if key == payload_key => {
+                // The attachment replaces any "data" already in the payload
+                let extra = usize::from(!payload.contains_key("data"));
+                write_len(out, payload.len() + extra, 0x80, 0xde);
+                for (key, value) in payload {
+                    if key != "data" {
+                        encode_str(key, out);
+                        encode_value(value, out);
+                    }
+                }
+                encode_str("data", out);
+                encode_bin(data, out);
+            }
+            _ => encode_value(value, out),
+        }
+    }
+}
+
+fn encode_value(value: &Value, out: &mut Vec<u8>) {
+    match value {
+        Value::Null => out.push(0xc0),
+        Value::Bool(false) => out.push(0xc2),
+        Value::Bool(true) => out.push(0xc3),
+        Value::Number(number) => encode_number(number, out),
+        Value::String(text) => encode_str(text, out),
+        Value::Array(items) => {
+            write_len(out, items.len(), 0x90, 0xdc);
+            for item in items {
+                encode_value(item, out);
+            }
+        }
+        Value::Object(object) => {
+            write_len(out, object.len(), 0x80, 0xde);
+            for (key, value) in object {
+                encode_str(key, out);
+                encode_value(value, out);
+            }
+        }
+    }
+}
+
+fn encode_number(number: &Number, out: &mut Vec<u8>) {
+    if let Some(n) = number.as_u64() {
+        match n {
+            0..=0x7f => out.push(n as u8),
+            0x80..=0xff => out.extend_from_slice(&[0xcc, n as u8]),
+            0x100..=0xffff => {
+                out.push(0xcd);
+                out.extend_from_slice(&(n as u16).to_be_bytes());
+            }
+            0x1_0000..=0xffff_ffff => {
+                out.push(0xce);
+                out.extend_from_slice(&(n as u32).to_be_bytes());
+            }
+            _ => {
+                out.push(0xcf);
+                out.extend_from_slice(&n.to_be_bytes());
+            }
+        }
+    } else if let Some(n) = number.as_i64() {
+        // Negative: as_u64 failed
+        if n >= -32 {
+            out.push(n as i8 as u8);
+        } else if n >= i8::MIN as i64 {
+            out.extend_from_slice(&[0xd0, n as i8 as u8]);
+        } else if n >= i16::MIN as i64 {
+            out.push(0xd1);
+            out.extend_from_slice(&(n as i16).to_be_bytes());
+        } else if n >= i32::MIN as i64 {
+            out.push(0xd2);
+            out.extend_from_slice(&(n as i32).to_be_bytes());
+        } else {
+            out.push(0xd3);
+            out.extend_from_slice(&n.to_be_bytes());
+        }
+    } else {
+        out.push(0xcb);
+        out.extend_from_slice(&number.as_f64().unwrap_or(0.0).to_be_bytes());
+    }
+}
+
+fn encode_str(text: &str, out: &mut Vec<u8>) {
+    let len = text.len();
+    if len < 32 {
+        out.push(0xa0 | len as u8);
+    } else if len <= 0xff {
+        out.extend_from_slice(&[0xd9, len as u8]);
+    } else if len <= 0xffff {
+        out.push(0xda);
+        out.extend_from_slice(&(len as u16).to_be_bytes());
+    } else {
+        out.push(0xdb);
+        out.extend_from_slice(&(len as u32).to_be_bytes());
+    }
+    out.extend_from_slice(text.as_bytes());
+}
+
+fn encode_bin(data: &[u8], out: &mut Vec<u8>) {
+    let len = data.len();
+    if len <= 0xff {
+        out.extend_from_slice(&[0xc4, len as u8]);
+    } else if len <= 0xffff {
+        out.push(0xc5);
+        out.extend_from_slice(&(len as u16).to_be_bytes());
+    } else {
+        out.push(0xc6);
+        out.extend_from_slice(&(len as u32).to_be_bytes());
+    }
+    out.extend_from_slice(data);
+}
+
+/// Array or map header: fix form below 16 entries, then 16 or 32 bit.
+fn write_len(out: &mut Vec<u8>, len: usize, fix: u8, marker16: u8) {
+    if len < 16 {
+        out.push(fix | len as u8);
+    } else if len <= 0xffff {
+        out.push(marker16);
+        out.extend_from_slice(&(len as u16).to_be_bytes());
+    } else {
+        out.push(marker16 + 1);
+        out.extend_from_slice(&(len as u32).to_be_bytes());
+    }
+}
+
+/// msgpack to serde_json::Value. `bin` becomes an array of byte values.
+struct Decoder<'a> {
+    data: &'a [u8],
+    pos: usize,
+}
+
+impl Decoder<'_> {
+    fn take(&mut self, n: usize) -> Option<&[u8]> {
+        let bytes = self.data.get(self.pos..self.pos.checked_add(n)?)?;
+        self.pos += n;
+        Some(bytes)
+    }
+
+    fn be(&mut self, n: usize) -> Option<u64> {
+        Some(self.take(n)?.iter().fold(0u64, |acc, b| acc << 8 | *b as u64))
+    }
+
+    fn value(&mut self) -> Option<Value> {
+        let marker = *self.take(1)?.first()?;
+        Some(match marker {
+            0x00..=0x7f => Value::from(marker),
+            0x80..=0x8f => self.map((marker & 0x0f) as usize)?,
+            0x90..=0x9f => self.array((marker & 0x0f) as usize)?,
+            0xa0..=0xbf => self.string((marker & 0x1f) as usize)?,
+            0xc0 => Value::Null,
+            0xc2 => Value::Bool(false),
+            0xc3 => Value::Bool(true),
+            0xc4..=0xc6 => {
+                let len = self.be(1 << (marker - 0xc4))? as usize;
+                Value::Array(self.take(len)?.iter().map(|b| Value::from(*b)).collect())
+            }
+            0xca => Value::from(f32::from_bits(self.be(4)? as u32) as f64),
+            0xcb => Value::from(f64::from_bits(self.be(8)?)),
+            0xcc..=0xcf => Value::from(self.be(1 << (marker - 0xcc))?),
+            0xd0 => Value::from(self.be(1)? as u8 as i8),
+            0xd1 => Value::from(self.be(2)? as u16 as i16),
+            0xd2 => Value::from(self.be(4)? as u32 as i32),
+            0xd3 => Value::from(self.be(8)? as i64),
+            0xd9..=0xdb => {
+                let len = self.be(1 << (marker - 0xd9))? as usize;
+                self.string(len)?
+            }
+            0xdc | 0xdd => {
+                let len = self.be(2 << (marker - 0xdc))? as usize;
+                self.array(len)?
+            }
+            0xde | 0xdf => {
+                let len = self.be(2 << (marker - 0xde))? as usize;
+                self.map(len)?
+            }
+            0xe0..=0xff => Value::from(marker as i8),
+            // ext types and the unused 0xc1
+            _ => return None,
+        })
+    }
+
+    fn string(&mut self, len: usize) -> Option<Value> {
+        let bytes = self.take(len)?;
+        Some(Value::String(std::str::from_utf8(bytes).ok()?.to_string()))
+    }
+
+    fn array(&mut self, len: usize) -> Option<Value> {
+        let mut items = Vec::with_capacity(len.min(1024));
+        for _ in 0..len {
+            items.push(self.value()?);
+        }
+        Some(Value::Array(items))
+    }
+
+    fn map(&mut self, len: usize) -> Option<Value> {
+        let mut object = Map::new();
+        for _ in 0..len {
+            let Value::String(key) = self.value()? else {
+                return None;
+            };
+            object.insert(key, self.value()?);
+        }
+        Some(Value::Object(object))
+    }
+}
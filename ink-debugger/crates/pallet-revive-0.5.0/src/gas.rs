@@ -38,7 +38,7 @@ impl ChargedAmount {
 
 /// Meter for syncing the gas between the executor and the gas meter.
 #[derive(DefaultNoBound)]
-struct EngineMeter<T: Config> {
+pub(crate) struct EngineMeter<T: Config> {
 	fuel: u64,
 	_phantom: PhantomData<T>,
 }
@@ -72,7 +72,7 @@ impl<T: Config> EngineMeter<T> {
 	}
 
 	/// How much ref time does each PolkaVM gas correspond to.
-	fn ref_time_per_fuel() -> u64 {
+	pub(crate) fn ref_time_per_fuel() -> u64 {
 		let loop_iteration =
 			T::WeightInfo::instr(1).saturating_sub(T::WeightInfo::instr(0)).ref_time();
 		let empty_loop_iteration = T::WeightInfo::instr_empty_loop(1)
@@ -302,8 +302,14 @@ where
 			log::error!("failed to start sandbox rpc server: {:?}", e);
 			panic!("failed to start sandbox rpc server");
 		}
+		// Lets the trace report gas as ref_time
+		sandbox.set_ref_time_per_fuel(crate::gas::EngineMeter::<E::T>::ref_time_per_fuel());
 		let exec_result = loop {
 			let interrupt = self.instance.run();
+			if let Ok(polkavm::InterruptKind::Ecalli(id)) = &interrupt {
+				let symbol = self.module.imports().get(*id);
+				sandbox.host_call(*id, symbol.as_ref().map(|symbol| symbol.as_bytes()));
+			}
 			sandbox.step(&self.instance);
 
 			let program_counter = &mut self.instance.program_counter();
@@ -313,6 +319,7 @@ where
 				break exec_result
 			}
 		};
+		sandbox.finish();
 		let _ = self.runtime.ext().gas_meter_mut().sync_from_executor(self.instance.gas())?;
 		exec_result
 	}